@@ -1,22 +1,85 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Request, Response, render_template, request, jsonify, send_file
+import io
 import re
+import bisect
+import itertools
 import openpyxl
 from openpyxl.styles import PatternFill, Font, Alignment
 from datetime import datetime
 import os
 import logging
-from difflib import SequenceMatcher
 import tempfile
-import threading
+import time
+import json
 import uuid
 import shutil
 import socket
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+from translation_table import TranslationTable
+from result_cache import ResultCache, make_cache_key, file_sha256
+from job_scheduler import JobScheduler, JobCancelled, QueueFullError, report_progress
+from similarity import get_engine
+from report_writer import StreamingSheet, SidecarWriter, available_sidecar_formats
+from c_lexer import iter_definitions
+from upload_manager import UploadManager, UploadError
+from lang_headers import LanguageHeaderRecognizer
+from compare_engine import (BulkComparison, EQUAL, DIFFERENT, BOTH_EMPTY, MISSING_KEY, MISSING_COLUMN,
+                            RESULT_LABELS, align_keys)
+from storage_manager import StorageManager
+from batch_compare import BatchError, CompareBatch, extract_archive, pair_files
+from metrics import MetricsRegistry, TaskMetrics, task_metrics
+from loop_log import LoopLog
+from snapshot_store import SnapshotStore, CompareSnapshot, key_signatures, CHANGE_ADDED, CHANGE_REMOVED
+
+
+class ToolRequest(Request):
+    """按接口放宽上传大小限制：代码转换流式解析上传内容，可接受大于 16MB 的语言头文件"""
+
+    @property
+    def max_content_length(self):
+        limits = app.config['ENDPOINT_MAX_CONTENT_LENGTH']
+        return limits.get(self.endpoint, app.config['MAX_CONTENT_LENGTH'])
+
 
 app = Flask(__name__)
+app.request_class = ToolRequest
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['ENDPOINT_MAX_CONTENT_LENGTH'] = {  # 按接口覆盖上传大小限制
+    'convert_code': 256 * 1024 * 1024,
+    'compare_batch': 256 * 1024 * 1024,
+}
 app.config['UPLOAD_FOLDER'] = os.path.join(tempfile.gettempdir(), 'multilang_tool')
 app.config['MAX_FILES'] = 100  # 最大保留文件数
+app.config['STORAGE_MAX_BYTES'] = 2 * 1024 * 1024 * 1024  # 生成文件最大占用空间
+app.config['STORAGE_MAX_AGE'] = 24 * 3600  # 生成文件的保留时间（秒）
+app.config['STORAGE_REAP_INTERVAL'] = 60  # 后台清理过期文件的间隔（秒）
+app.config['STORAGE_PRECOMPRESS'] = ('.csv',)  # 生成时额外保存 gzip 版本的文件类型（xlsx/parquet 本身已压缩）
+app.config['RESULT_CACHE_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'result_cache')
+app.config['RESULT_CACHE_MAX_ENTRIES'] = 200  # 结果缓存最大条目数
+app.config['RESULT_CACHE_MAX_BYTES'] = 500 * 1024 * 1024  # 结果缓存最大占用空间
+app.config['JOB_WORKERS'] = None  # 后台工作进程数，None 表示 CPU 核数-1
+app.config['JOB_QUEUE_LIMIT'] = 20  # 排队+运行中任务上限
+app.config['TASK_TTL'] = 3600  # 已结束任务的保留时间（秒）
+app.config['SSE_HEARTBEAT'] = 15  # 进度事件流的心跳间隔（秒）
+app.config['CHUNKED_UPLOAD_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'uploads')
+app.config['UPLOAD_CHUNK_SIZE'] = 4 * 1024 * 1024  # 分块上传的建议块大小
+app.config['UPLOAD_MAX_BYTES'] = 1024 * 1024 * 1024  # 分块上传的单个文件上限
+app.config['UPLOAD_TTL'] = 3600  # 空闲上传会话的保留时间（秒）
+app.config['UPLOAD_STALL_TIMEOUT'] = 120  # 边上传边解析时等待新数据的超时（秒）
+app.config['BATCH_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'batches')
+app.config['BATCH_MAX_PAIRS'] = 100  # 批量对比的文件对上限
+app.config['BATCH_MAX_BYTES'] = 1024 * 1024 * 1024  # 批量对比压缩包解压后的上限
+app.config['BATCH_PARALLEL'] = None  # 每个批量任务同时提交的对比数，None 表示工作进程数
+app.config['SNAPSHOT_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'snapshots')
+app.config['SNAPSHOT_MAX_LINEAGES'] = 50  # 增量对比保留快照的谱系数
+app.config['LINEAGE_MAX_LENGTH'] = 200  # 增量对比谱系名称的最大长度
+# 逐条处理循环中的日志详细程度：off / summary（只输出汇总，默认）/ sample（抽样输出）/ all
+app.config['HOT_LOG_VERBOSITY'] = os.environ.get('MUTI_WEB_HOT_LOG', 'summary')
+app.config['ASGI_THREADS'] = 32  # ASGI 入口处理请求的线程数
+app.config['ASGI_STREAM_THREADS'] = 64  # ASGI 入口发送响应体（下载、进度事件流）的线程数
+app.config['ASGI_SPOOL_SIZE'] = 1024 * 1024  # ASGI 入口接收请求体时超过该大小改写临时文件
 
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -36,8 +99,117 @@ LANGUAGE_ORDER = [
     "南非语（AF）Afrikaans", "印地语 （HI）Hindi"
 ]
 
-# 存储任务状态
-tasks = {}
+# 表头语言识别器（由标准语言顺序编译，按表头行缓存识别结果）
+header_recognizer = LanguageHeaderRecognizer(LANGUAGE_ORDER)
+
+# Excel对比结果使用的命名样式
+COMPARE_STYLES = {
+    'compare_header': {
+        'font': Font(bold=True, size=12),
+        'fill': PatternFill(start_color='FFD3D3D3', end_color='FFD3D3D3', fill_type='solid'),
+        'alignment': Alignment(horizontal='center')
+    },
+    'compare_title': {'font': Font(bold=True, size=12)},
+    'compare_key': {'font': Font(bold=True), 'alignment': Alignment(vertical='center')},
+    'compare_match': {'fill': PatternFill(start_color='8FBC8F', end_color='8FBC8F', fill_type='solid')},
+    'compare_diff': {'fill': PatternFill(start_color='CD0000', end_color='CD0000', fill_type='solid')},
+    'compare_missing': {'fill': PatternFill(start_color='FFF68F', end_color='FFF68F', fill_type='solid')},
+}
+
+# 代码转Excel结果使用的命名样式
+CONVERT_STYLES = {
+    'convert_header': {
+        'font': Font(bold=True),
+        'fill': PatternFill(start_color='FFD3D3D3', end_color='FFD3D3D3', fill_type='solid'),
+        'alignment': Alignment(horizontal='center')
+    },
+}
+
+# 下载文件的 MIME 类型
+DOWNLOAD_MIMETYPES = {
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.csv': 'text/csv',
+    '.parquet': 'application/vnd.apache.parquet',
+}
+
+# 性能指标：各任务的阶段耗时和计数在任务结束时汇总，/metrics 接口输出
+metrics_registry = MetricsRegistry()
+
+# 以下服务对象只在服务进程中由 init_server() 创建。工作进程会导入本模块以反序列化任务函数，
+# 不应各自建立存储索引、启动清理线程；后台任务函数所需的目录和对象都通过参数传入。
+scheduler = None  # 后台任务调度器
+tasks = {}  # 任务状态（即 scheduler.tasks）
+uploads = None  # 分块上传会话
+storage = None  # 生成文件的索引与配额，后台线程定期清理过期文件
+snapshots = None  # 增量对比的快照（按谱系保存上次对比的键签名和结果代码）
+result_cache = None  # 对比结果缓存（按文件内容哈希 + 参数）
+
+# 进行中的批量对比：批量任务 ID -> CompareBatch
+batches = {}
+
+
+def init_server():
+    """创建服务进程的调度器、上传会话、存储、快照和结果缓存，启动存储清理线程（重复调用时不再创建）"""
+    global scheduler, tasks, uploads, storage, snapshots, result_cache
+    if scheduler is not None:
+        return
+    scheduler = JobScheduler(
+        max_workers=app.config['JOB_WORKERS'],
+        max_queue=app.config['JOB_QUEUE_LIMIT'],
+        task_ttl=app.config['TASK_TTL'],
+        metrics=metrics_registry
+    )
+    tasks = scheduler.tasks
+    uploads = UploadManager(
+        app.config['CHUNKED_UPLOAD_FOLDER'],
+        ttl=app.config['UPLOAD_TTL'],
+        max_bytes=app.config['UPLOAD_MAX_BYTES']
+    )
+    storage = StorageManager(
+        app.config['UPLOAD_FOLDER'],
+        max_files=app.config['MAX_FILES'],
+        max_bytes=app.config['STORAGE_MAX_BYTES'],
+        max_age=app.config['STORAGE_MAX_AGE'],
+        reap_interval=app.config['STORAGE_REAP_INTERVAL'],
+        precompress=app.config['STORAGE_PRECOMPRESS']
+    )
+    storage.start_reaper()
+    snapshots = SnapshotStore(app.config['SNAPSHOT_FOLDER'], max_lineages=app.config['SNAPSHOT_MAX_LINEAGES'])
+    result_cache = ResultCache(
+        app.config['RESULT_CACHE_FOLDER'],
+        max_entries=app.config['RESULT_CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['RESULT_CACHE_MAX_BYTES']
+    )
+    metrics_registry.add_collector(collect_server_metrics)
+
+
+def collect_server_metrics():
+    """/metrics 抓取时采集的即时值：任务队列、工作进程利用率、存储和缓存占用"""
+    queue = scheduler.stats()
+    storage_stats = storage.stats()
+    cache_stats = result_cache.stats()
+    return [
+        ('queue_depth', 'gauge', '排队等待执行的任务数', {}, queue['queued']),
+        ('queue_limit', 'gauge', '排队+运行中任务上限', {}, queue['max_queue']),
+        ('tasks_running', 'gauge', '运行中的任务数', {}, queue['running']),
+        ('workers', 'gauge', '工作进程数', {}, queue['workers']),
+        ('worker_utilization', 'gauge', '忙碌的工作进程比例', {}, round(queue['running'] / queue['workers'], 4)),
+        ('batches_active', 'gauge', '进行中的批量对比', {}, len(batches)),
+        ('uploads_active', 'gauge', '进行中的分块上传会话', {}, len(uploads)),
+        ('storage_files', 'gauge', '生成文件数', {}, storage_stats['files']),
+        ('storage_bytes', 'gauge', '生成文件占用字节数', {}, storage_stats['bytes']),
+        ('storage_held', 'gauge', '下载中的文件数', {}, storage_stats['held']),
+        ('result_cache_entries', 'gauge', '结果缓存条目数', {}, cache_stats['entries']),
+        ('result_cache_bytes', 'gauge', '结果缓存占用字节数', {}, cache_stats['bytes']),
+    ]
+
+
+def lookup_result_cache(kind, cache_key):
+    """查询结果缓存并计入命中/未命中次数"""
+    cached = result_cache.get(cache_key)
+    metrics_registry.inc('result_cache_requests_total', help_text='结果缓存查询次数',
+                         kind=kind, result='hit' if cached else 'miss')
+    return cached
 
 
 def get_local_ip():
@@ -53,31 +225,81 @@ def get_local_ip():
         return '127.0.0.1'
 
 
-def cleanup_old_files():
-    """清理旧文件，避免占用太多空间"""
+def remove_files(*paths):
+    """删除临时文件，忽略不存在或删除失败的文件"""
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"删除临时文件失败: {e}")
+
+
+def save_upload(field, prefix):
+    """保存一个上传文件，返回 (保存路径, SHA-256)；未上传时路径为 None
+
+    支持普通表单文件和已完成的分块上传（表单字段 <field>_upload_id）。
+    分块上传的 SHA-256 在接收时已经算好，普通表单文件返回 None。
+    """
+    upload_id = request.form.get(f'{field}_upload_id')
+    if upload_id:
+        filename = secure_filename(uploads.get(upload_id).filename)
+        path = os.path.join(app.config['UPLOAD_FOLDER'], f"{prefix}_{uuid.uuid4().hex}_{filename}")
+        return path, uploads.take(upload_id, path)
+
+    file = request.files.get(field)
+    if file is None or file.filename == '':
+        return None, None
+    path = os.path.join(app.config['UPLOAD_FOLDER'], f"{prefix}_{uuid.uuid4().hex}_{secure_filename(file.filename)}")
+    file.save(path)
+    return path, None
+
+
+def save_upload_pair(prefix=''):
+    """保存源文件和翻译文件，返回 (源文件路径, 翻译文件路径, {路径: SHA-256})
+
+    任一文件缺失时两个路径都为 None，已保存的文件会被删除。
+    """
+    saved = []
+    digests = {}
     try:
-        if not os.path.exists(app.config['UPLOAD_FOLDER']):
-            return
-
-        files = [os.path.join(app.config['UPLOAD_FOLDER'], f)
-                 for f in os.listdir(app.config['UPLOAD_FOLDER'])]
-
-        # 过滤出文件（排除目录）
-        files = [f for f in files if os.path.isfile(f)]
-        files.sort(key=os.path.getctime)
-
-        # 如果文件数量超过限制，删除最旧的
-        while len(files) > app.config['MAX_FILES']:
-            try:
-                oldest_file = files.pop(0)
-                os.remove(oldest_file)
-                logger.info(f"已清理旧文件: {os.path.basename(oldest_file)}")
-            except Exception as e:
-                logger.warning(f"清理文件失败: {e}")
-                continue
-
-    except Exception as e:
-        logger.error(f"清理文件过程出错: {e}")
+        for field, name in (('source_file', 'source'), ('trans_file', 'trans')):
+            path, digest = save_upload(field, f"{prefix}{name}")
+            if path is None:
+                remove_files(*saved)
+                return None, None, {}
+            saved.append(path)
+            if digest:
+                digests[path] = digest
+    except Exception:
+        remove_files(*saved)
+        raise
+    return saved[0], saved[1], digests
+
+
+def create_cached_task(entry, metrics=None):
+    """缓存命中时直接创建一个已完成的任务，metrics 为请求中已记录的指标（如上传耗时）"""
+    task_id = uuid.uuid4().hex
+    meta = entry.get('meta', {})
+    metrics = TaskMetrics(metrics)
+    metrics.count('cache_hits')
+    fields = {
+        'progress': 100,
+        'status': 'completed',
+        'message': meta.get('message', '对比完成'),
+        'filename': entry['filename'],
+        'download_url': f'/download/{entry["filename"]}',
+        'cached': True,
+        'metrics': metrics.to_dict()
+    }
+    if 'result' in meta:
+        fields['result'] = meta['result']
+    if entry.get('companions'):
+        fields['sidecar_filename'] = entry['companions'][0]
+        fields['sidecar_url'] = f'/download/{entry["companions"][0]}'
+    scheduler.finish(task_id, fields)
+    logger.info(f"命中结果缓存: {entry['filename']}")
+    return task_id
 
 
 @app.route('/')
@@ -90,773 +312,477 @@ def index():
 def convert_code():
     """功能一：代码转Excel"""
     temp_file = None
+    upload_id = request.form.get('upload_id')
+    metrics = TaskMetrics()
     try:
-        if 'code_file' not in request.files:
-            return jsonify({'error': '没有上传文件'}), 400
-
-        file = request.files['code_file']
-        if file.filename == '':
-            return jsonify({'error': '未选择文件'}), 400
-
-        # 保存上传的文件
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{uuid.uuid4().hex}_{filename}")
-        file.save(temp_path)
-
-        # 读取文件内容
-        with open(temp_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+        if upload_id:
+            # 分块上传：可以在上传过程中发起转换，解析读到尚未到达的数据时等待
+            source_stream = uploads.get(upload_id).reader(app.config['UPLOAD_STALL_TIMEOUT'])
+        else:
+            if 'code_file' not in request.files:
+                return jsonify({'error': '没有上传文件'}), 400
 
-        # 创建Excel工作簿
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Translations"
+            file = request.files['code_file']
+            if file.filename == '':
+                return jsonify({'error': '未选择文件'}), 400
+            source_stream = file.stream
 
-        # 添加表头
         headers = ["Key"] + LANGUAGE_ORDER
-        ws.append(headers)
-
-        # 设置表头样式
-        for col in range(1, len(headers) + 1):
-            cell = ws.cell(row=1, column=col)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color='FFD3D3D3', end_color='FFD3D3D3', fill_type='solid')
-            cell.alignment = Alignment(horizontal='center')
-
-        # 设置列宽
-        ws.column_dimensions['A'].width = 30
-        for col in range(2, len(headers) + 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 20
-
-        # 改进的多语言数组匹配模式
-        # 匹配: const char *key[MAX_LANGUAGE] = {"值1", "值2", ...};
-        pattern = re.compile(
-            r'const\s+char\s*\*\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\[\s*MAX_LANGUAGE\s*\]\s*=\s*\{([^}]*)\}\s*;',
-            re.DOTALL | re.MULTILINE
-        )
-
-        # 匹配单字符串数组（需要排除的）
-        # 匹配: const char *key[MAX_LANGUAGE] = "值";
-        single_pattern = re.compile(
-            r'const\s+char\s*\*\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\[\s*MAX_LANGUAGE\s*\]\s*=\s*"([^"]*)"\s*;',
-            re.DOTALL | re.MULTILINE
-        )
-
-        # 记录所有匹配
-        matches = []
-        single_matches = []
-
-        # 先找出所有单字符串定义（要排除的）
-        for single_match in single_pattern.finditer(content):
-            key = single_match.group(1).strip()
-            single_matches.append(key)
-            logger.info(f"排除单字符串定义: {key} = {single_match.group(2)}")
-
-        # 找出多语言数组定义
-        for match in pattern.finditer(content):
-            key = match.group(1).strip()
-
-            # 跳过单字符串定义
-            if key in single_matches:
-                logger.info(f"跳过 {key} (已定义为单字符串)")
+        value_count = len(LANGUAGE_ORDER)
+
+        def fit(values):
+            """语言值数量与表头对齐：不足补空字符串，多余截断"""
+            return (values + [''] * value_count)[:value_count]
+
+        # 转换结果先写入列式翻译表（单字符串定义可能出现在同名数组之后），最后流式写出
+        table = TranslationTable(headers)
+        table.lang_columns = {lang: col for col, lang in enumerate(LANGUAGE_ORDER, 2)}
+        single_keys = set()
+        fallback = []  # 数组大小为数字的定义，仅在没有 MAX_LANGUAGE 数组时使用
+        definition_log = LoopLog(logger, "代码转换", app.config['HOT_LOG_VERBOSITY'])
+
+        # 直接从上传流中单遍解析，不把整个文件读入内存
+        stream = io.TextIOWrapper(source_stream, encoding='utf-8', errors='ignore')
+        for definition in iter_definitions(stream):
+            key = definition.name
+            values = definition.values
+            if definition.size != 'MAX_LANGUAGE':
+                # 备选模式：匹配更通用的多语言数组定义
+                if definition.kind == 'array' and definition.commas and len(values) > 1:
+                    fallback.append((key, fit(values)))
                 continue
 
-            values_block = match.group(2).strip()
-
-            # 检查是否真的包含多个值（至少有一个逗号分隔）
-            if ',' not in values_block:
-                # 只有一个值的情况，可能是误匹配
-                # 进一步检查是否包含多个引号字符串
-                values = re.findall(r'"([^"\\]*(?:\\.[^"\\]*)*)"', values_block)
-                if len(values) <= 1:
-                    logger.info(f"跳过 {key} (只有一个值)")
-                    continue
-
-            matches.append(match)
-
-        converted_count = 0
+            if definition.kind == 'single':
+                # 单字符串定义（需要排除的）
+                single_keys.add(key)
+                definition_log.event("排除单字符串", "排除单字符串定义: %s = %s", key, values[0])
+                continue
 
-        for i, match in enumerate(matches):
-            key = match.group(1).strip()
-            values_block = match.group(2)
+            # 只有一个值的情况，可能是误匹配
+            if not definition.commas and len(values) <= 1:
+                definition_log.event("只有一个值", "跳过 %s (只有一个值)", key)
+                continue
 
-            # 更精确地提取各语言字符串（处理转义字符）
-            values = re.findall(r'"((?:[^"\\]|\\.)*)"', values_block)
+            table.append(key, fit(values))
+            definition_log.event("已转换", "已转换: %s -> %d 个语言值", key, len(values))
 
-            # 如果提取的值少于预期，补充空字符串
-            if len(values) < len(headers) - 1:
-                values.extend([''] * (len(headers) - 1 - len(values)))
-            elif len(values) > len(headers) - 1:
-                values = values[:len(headers) - 1]
+        metrics.lap('parse')  # 包含接收上传数据的时间
+        definition_log.summary()
+        rows = [row for row in table.rows() if row[0] not in single_keys]
+        if not rows:
+            rows = [[key] + values for key, values in fallback]
+            if rows:
+                logger.info(f"未找到 MAX_LANGUAGE 数组，按备选模式转换 {len(rows)} 个条目")
+        converted_count = len(rows)
 
-            # 写入Excel行
-            row = [key] + values
-            ws.append(row)
-            converted_count += 1
-
-            logger.info(f"已转换: {key} -> {len(values)} 个语言值")
-
-        # 如果没有找到任何多语言数组，尝试另一种模式
-        if converted_count == 0:
-            # 备选模式：匹配更通用的多语言数组定义
-            alt_pattern = re.compile(
-                r'const\s+char\s*\*\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\[\s*\d+\s*\]\s*=\s*\{([^}]*)\}\s*;',
-                re.DOTALL | re.MULTILINE
-            )
-
-            for match in alt_pattern.finditer(content):
-                key = match.group(1).strip()
-                values_block = match.group(2).strip()
-
-                # 检查是否有多个值
-                if ',' in values_block:
-                    values = re.findall(r'"((?:[^"\\]|\\.)*)"', values_block)
-                    if len(values) > 1:
-                        if len(values) < len(headers) - 1:
-                            values.extend([''] * (len(headers) - 1 - len(values)))
-                        elif len(values) > len(headers) - 1:
-                            values = values[:len(headers) - 1]
-
-                        row = [key] + values
-                        ws.append(row)
-                        converted_count += 1
-                        logger.info(f"备选模式转换: {key} -> {len(values)} 个语言值")
+        # 创建Excel工作簿
+        sheet = StreamingSheet(
+            "Translations",
+            headers,
+            widths=[30] + [20] * value_count,
+            styles=CONVERT_STYLES,
+            header_style='convert_header'
+        )
+        for row in rows:
+            sheet.append(row)
+        metrics.lap('write')
 
         # 保存到文件
         output_filename = f"converted_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-        wb.save(output_path)
-
-        # 清理临时文件
-        try:
-            os.remove(temp_path)
-        except:
-            pass
+        sheet.save(output_path)
+        metrics.lap('save')
+        metrics.count('output_rows', converted_count)
+        metrics_registry.record_task('convert', {'status': 'completed', 'metrics': metrics.to_dict()})
+        logger.info(f"代码转换完成: {converted_count} 个多语言条目")
 
-        # 清理旧文件
-        cleanup_old_files()
+        # 登记生成的文件，超出配额时清理最旧的文件
+        storage.add(output_path)
 
         return jsonify({
             'success': True,
             'message': f'转换成功！共处理 {converted_count} 个多语言条目',
             'filename': output_filename,
-            'download_url': f'/download/{output_filename}'
+            'download_url': f'/download/{output_filename}',
+            'metrics': metrics.to_dict()
         })
 
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except UnicodeDecodeError:
         return jsonify({'error': '文件编码错误，请确保文件是UTF-8编码'}), 400
     except Exception as e:
         logger.error(f"转换失败: {str(e)}")
+        metrics_registry.record_task('convert', {'status': 'error'})
         return jsonify({'error': f'转换失败: {str(e)}'}), 500
+    finally:
+        if upload_id:
+            uploads.discard(upload_id)
 
 
 @app.route('/api/compare-excel', methods=['POST'])
 def compare_excel():
     """功能二：Excel对比 - 启动异步任务"""
     try:
-        if 'source_file' not in request.files or 'trans_file' not in request.files:
-            return jsonify({'error': '请上传两个Excel文件'}), 400
-
-        source_file = request.files['source_file']
-        trans_file = request.files['trans_file']
-
-        if source_file.filename == '' or trans_file.filename == '':
-            return jsonify({'error': '请选择有效的文件'}), 400
-
         # 获取选中的语言
         selected_languages = request.form.getlist('languages[]')
         if not selected_languages:
             selected_languages = LANGUAGE_ORDER  # 默认全选
 
-        # 保存上传的文件
-        source_filename = secure_filename(source_file.filename)
-        trans_filename = secure_filename(trans_file.filename)
+        # 可选的 CSV / Parquet 附属文件
+        sidecar_format = request.form.get('sidecar', '').strip().lower() or None
+        if sidecar_format and sidecar_format not in available_sidecar_formats():
+            return jsonify({'error': f'不支持的附属文件格式: {sidecar_format}'}), 400
+
+        # 可选的增量对比谱系：与同一谱系上次的对比结果比较，只重新对比变化的键
+        lineage = request.form.get('lineage', '').strip() or None
+        if lineage and len(lineage) > app.config['LINEAGE_MAX_LENGTH']:
+            return jsonify({'error': f"谱系名称过长（上限 {app.config['LINEAGE_MAX_LENGTH']} 个字符）"}), 400
+
+        # 保存上传的文件（普通表单文件或已完成的分块上传）
+        request_metrics = TaskMetrics()
+        with request_metrics.stage('upload'):
+            source_path, trans_path, digests = save_upload_pair()
+        if not source_path:
+            return jsonify({'error': '请上传两个Excel文件'}), 400
 
-        source_path = os.path.join(app.config['UPLOAD_FOLDER'], f"source_{uuid.uuid4().hex}_{source_filename}")
-        trans_path = os.path.join(app.config['UPLOAD_FOLDER'], f"trans_{uuid.uuid4().hex}_{trans_filename}")
+        output_dir = app.config['UPLOAD_FOLDER']
+        if lineage:
+            # 增量对比的变更报告取决于谱系的上次快照，不使用结果缓存
+            def on_done(result):
+                storage.add(*compare_output_paths(output_dir, result))
+        else:
+            # 相同文件和参数已有结果时直接返回
+            with request_metrics.stage('hash'):
+                cache_key = make_cache_key('compare', source_path, trans_path, selected_languages,
+                                           {'sidecar': sidecar_format} if sidecar_format else None, digests)
+            cached = lookup_result_cache('compare', cache_key)
+            if cached:
+                remove_files(source_path, trans_path)
+                return jsonify({
+                    'success': True,
+                    'task_id': create_cached_task(cached, request_metrics.to_dict())
+                })
 
-        source_file.save(source_path)
-        trans_file.save(trans_path)
+            def on_done(result):
+                store_compare_result(cache_key, output_dir, result)
 
-        # 创建任务
+        # 提交到后台任务调度器
         task_id = uuid.uuid4().hex
-        tasks[task_id] = {
-            'progress': 0,
-            'status': 'processing',
-            'message': '任务已创建'
-        }
-
-        # 启动后台线程处理
-        def process_task():
-            try:
-                tasks[task_id]['progress'] = 10
-                tasks[task_id]['message'] = '正在加载Excel文件...'
-
-                result = compare_excel_files(
-                    source_path,
-                    trans_path,
-                    selected_languages,
-                    task_id
-                )
-
-                if result['success']:
-                    tasks[task_id].update({
-                        'progress': 100,
-                        'status': 'completed',
-                        'message': '对比完成',
-                        'filename': result['filename'],
-                        'download_url': f'/download/{result["filename"]}'
-                    })
-                else:
-                    tasks[task_id].update({
-                        'progress': 0,
-                        'status': 'error',
-                        'message': result['error']
-                    })
-
-            except Exception as e:
-                logger.error(f"处理任务失败: {e}")
-                tasks[task_id].update({
-                    'progress': 0,
-                    'status': 'error',
-                    'message': str(e)
-                })
-            finally:
-                # 清理临时文件，添加重试机制
-                import time
-                time.sleep(1)  # 等待文件释放
-
-                for retry in range(3):  # 最多重试3次
-                    try:
-                        if os.path.exists(source_path):
-                            os.remove(source_path)
-                            logger.info(f"已删除临时文件: {source_path}")
-                        if os.path.exists(trans_path):
-                            os.remove(trans_path)
-                            logger.info(f"已删除临时文件: {trans_path}")
-                        break
-                    except Exception as e:
-                        if retry < 2:  # 最后一次不等待
-                            logger.warning(f"删除临时文件失败，{retry + 1}/3 次重试: {e}")
-                            time.sleep(2)  # 等待2秒后重试
-                        else:
-                            logger.error(f"最终无法删除临时文件: {e}")
 
-        thread = threading.Thread(target=process_task)
-        thread.daemon = True
-        thread.start()
+        try:
+            scheduler.submit(task_id, run_compare_job, source_path, trans_path, selected_languages,
+                             task_id, output_dir, sidecar_format, None, None, True, lineage,
+                             snapshots if lineage else None, on_done=on_done, metrics=request_metrics.to_dict())
+        except QueueFullError as e:
+            remove_files(source_path, trans_path)
+            return jsonify({'error': f'服务器繁忙，请稍后再试: {e}'}), 503
 
         return jsonify({
             'success': True,
             'task_id': task_id
         })
 
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         logger.error(f"启动任务失败: {e}")
         return jsonify({'error': f'启动任务失败: {str(e)}'}), 500
 
 
-def compare_excel_files(source_path, trans_path, selected_languages, task_id):
-    """执行Excel对比的核心逻辑"""
-    source_wb = None
-    trans_wb = None
-    output_wb = None
+def compare_output_paths(output_dir, result):
+    """对比任务生成的文件：结果文件在前，其后为附属文件、变更报告"""
+    return [os.path.join(output_dir, result[field])
+            for field in ('filename', 'sidecar_filename', 'changes_filename') if result.get(field)]
 
-    try:
-        tasks[task_id]['progress'] = 20
-        tasks[task_id]['message'] = '正在加载Excel文件...'
 
-        # 加载工作簿
-        source_wb = openpyxl.load_workbook(source_path, data_only=True)
-        trans_wb = openpyxl.load_workbook(trans_path, data_only=True)
-        output_wb = openpyxl.Workbook()
+def store_compare_result(cache_key, output_dir, result):
+    """对比完成后登记结果文件：写入结果缓存并纳入存储配额"""
+    result_path, *companions = compare_output_paths(output_dir, result)
+    meta = {'message': result['message']}
+    if 'result' in result:
+        meta['result'] = result['result']
+    result_cache.put(cache_key, result_path, meta, companions)
+    storage.add(result_path, *companions)
 
-        source_ws = source_wb.active
-        trans_ws = trans_wb.active
-        output_ws = output_wb.active
-        output_ws.title = "对比结果"
 
-        tasks[task_id]['progress'] = 30
-        tasks[task_id]['message'] = '正在分析文件结构...'
+def save_batch_upload(work_dir):
+    """保存批量对比的上传文件并配对，返回 BatchPair 列表
 
-        # 定义颜色样式
-        GREEN_FILL = PatternFill(start_color='8FBC8F', end_color='8FBC8F', fill_type='solid')
-        RED_FILL = PatternFill(start_color='CD0000', end_color='CD0000', fill_type='solid')
-        YELLOW_FILL = PatternFill(start_color='FFF68F', end_color='FFF68F', fill_type='solid')
-        HEADER_FONT = Font(bold=True, size=12)
-        HEADER_FILL = PatternFill(start_color='FFD3D3D3', end_color='FFD3D3D3', fill_type='solid')
-        BOLD_FONT = Font(bold=True)
+    支持 zip 压缩包（表单字段 archive，可为分块上传），或多文件表单（source_files / trans_files）。
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    archive_path, _ = save_upload('archive', 'batch')
+    if archive_path:
+        try:
+            sources, translations = extract_archive(archive_path, work_dir, app.config['BATCH_MAX_BYTES'])
+        finally:
+            remove_files(archive_path)
+        return pair_files(sources, translations)
+
+    saved = {}
+    for field, role in (('source_files', 'source'), ('trans_files', 'trans')):
+        role_dir = os.path.join(work_dir, role)
+        os.makedirs(role_dir, exist_ok=True)
+        saved[role] = []
+        for i, file in enumerate(f for f in request.files.getlist(field) if f.filename):
+            # 保存路径由序号生成，配对使用原始文件名（secure_filename 会去掉中文）
+            name = os.path.basename(file.filename.replace('\\', '/'))
+            path = os.path.join(role_dir, f"{i}{os.path.splitext(name)[1].lower()}")
+            file.save(path)
+            saved[role].append((name, path))
+    return pair_files(saved['source'], saved['trans'])
+
+
+def remove_temp_files(*paths):
+    """清理临时文件，添加重试机制（Windows 下文件可能尚未释放）"""
+    for retry in range(3):  # 最多重试3次
+        try:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+                    logger.info(f"已删除临时文件: {path}")
+            break
+        except Exception as e:
+            if retry < 2:  # 最后一次不等待
+                logger.warning(f"删除临时文件失败，{retry + 1}/3 次重试: {e}")
+                time.sleep(2)  # 等待2秒后重试
+            else:
+                logger.error(f"最终无法删除临时文件: {e}")
 
-        # 设置列宽
-        output_ws.column_dimensions['A'].width = 30  # 源文件键名
-        output_ws.column_dimensions['B'].width = 30  # 翻译文件键名
-        output_ws.column_dimensions['C'].width = 20  # 语言
-        output_ws.column_dimensions['D'].width = 40  # 源文件内容
-        output_ws.column_dimensions['E'].width = 40  # 翻译文件内容
-        output_ws.column_dimensions['F'].width = 15  # 对比结果
-
-        # 添加表头
-        headers = ["源文件键名", "翻译文件键名", "语言", "源文件内容", "翻译文件内容", "对比结果"]
-        output_ws.append(headers)
 
-        # 设置表头样式
-        for col in range(1, 7):
-            cell = output_ws.cell(row=1, column=col)
-            cell.font = HEADER_FONT
-            cell.fill = HEADER_FILL
-            cell.alignment = Alignment(horizontal='center')
+def run_compare_job(source_path, trans_path, selected_languages, task_id, output_dir, sidecar_format=None,
+                    source_digest=None, output_name=None, remove_inputs=True, lineage=None, snapshot_store=None):
+    """Excel对比后台任务（在工作进程中执行），返回最终的任务状态
+
+    批量对比时多个任务共用同一源文件：传入 source_digest 复用本进程已解析的源文件，
+    remove_inputs 为 False 时由批量任务统一清理上传文件；给出 lineage 时为增量对比，
+    快照保存在 snapshot_store（由服务进程传入的 SnapshotStore）中。
+    """
+    try:
+        report_progress(task_id, 10, '正在加载Excel文件...')
+
+        result = compare_excel_files(
+            source_path,
+            trans_path,
+            selected_languages,
+            task_id,
+            output_dir,
+            sidecar_format,
+            source_digest,
+            output_name,
+            lineage,
+            snapshot_store
+        )
+
+        if result['success']:
+            incremental = result['statistics'].get('incremental')
+            fields = {
+                'progress': 100,
+                'status': 'completed',
+                'message': f"对比完成（增量：{incremental['summary']}）" if incremental else '对比完成',
+                'filename': result['filename'],
+                'download_url': f'/download/{result["filename"]}',
+                'result': {'statistics': result['statistics']}
+            }
+            if result.get('sidecar_filename'):
+                fields['sidecar_filename'] = result['sidecar_filename']
+                fields['sidecar_url'] = f'/download/{result["sidecar_filename"]}'
+            if result.get('changes_filename'):
+                fields['changes_filename'] = result['changes_filename']
+                fields['changes_url'] = f'/download/{result["changes_filename"]}'
+            return fields
+        return {
+            'progress': 0,
+            'status': 'error',
+            'message': result['error']
+        }
+
+    except JobCancelled:
+        logger.info(f"任务已取消: {task_id}")
+        return {'progress': 0, 'status': 'cancelled', 'message': '任务已取消'}
+    except Exception as e:
+        logger.error(f"处理任务失败: {e}")
+        return {'progress': 0, 'status': 'error', 'message': str(e)}
+    finally:
+        if remove_inputs:
+            remove_temp_files(source_path, trans_path)
+
 
-        # 打印文件信息以便调试
-        logger.info("=" * 50)
-        logger.info("源文件信息:")
-        logger.info(f"最大行: {source_ws.max_row}, 最大列: {source_ws.max_column}")
-
-        # 打印源文件表头
-        source_headers = []
-        for col in range(1, source_ws.max_column + 1):
-            header = source_ws.cell(row=1, column=col).value
-            source_headers.append(f"列{col}: {header}")
-        logger.info(f"源文件表头: {', '.join(source_headers)}")
-
-        logger.info("\n翻译文件信息:")
-        logger.info(f"最大行: {trans_ws.max_row}, 最大列: {trans_ws.max_column}")
-
-        # 打印翻译文件表头
-        trans_headers = []
-        for col in range(1, trans_ws.max_column + 1):
-            header = trans_ws.cell(row=1, column=col).value
-            trans_headers.append(f"列{col}: {header}")
-        logger.info(f"翻译文件表头: {', '.join(trans_headers)}")
-        logger.info("=" * 50)
-
-        # 构建键映射 - 使用第一列作为键名
-        def build_key_map(ws, file_name):
-            key_map = {}
-            key_to_row = {}
-            logger.info(f"\n开始构建 {file_name} 键映射:")
-
-            # 明确使用第一列作为键名
-            key_column = 1
-            logger.info(f"使用第1列作为键名列")
-
-            # 收集所有键名
-            keys_found = []
-            for row in range(2, ws.max_row + 1):
-                key_cell = ws.cell(row=row, column=key_column)
-                if key_cell.value:
-                    key_str = str(key_cell.value).strip()
-                    if key_str:
-                        key_map[key_str] = row
-                        key_to_row[key_str] = row
-                        keys_found.append(key_str)
-
-            # 打印前10个键名用于调试
-            logger.info(f"{file_name} 前10个键名: {keys_found[:10]}")
-            logger.info(f"{file_name} 共找到 {len(key_map)} 个键")
-            return key_map, key_column, key_to_row
-
-        source_key_map, source_key_col, source_key_to_row = build_key_map(source_ws, "源文件")
-        trans_key_map, trans_key_col, trans_key_to_row = build_key_map(trans_ws, "翻译文件")
-
-        tasks[task_id]['progress'] = 40
-        tasks[task_id]['message'] = f'源文件发现 {len(source_key_map)} 个键，翻译文件发现 {len(trans_key_map)} 个键'
-
-        # 构建语言列映射 - 严格区分中文和繁体中文
-        def build_lang_col_map(ws, file_name):
-            lang_map = {}
-            logger.info(f"\n开始构建 {file_name} 语言列映射:")
-
-            # 首先处理特殊情况：中文和繁体中文必须严格区分
-            for col in range(1, ws.max_column + 1):
-                header = ws.cell(row=1, column=col).value
-                if header and isinstance(header, str):
-                    header_str = header.strip()
-
-                    # 1. 先检查是否是繁体中文（优先级最高）
-                    if header_str == "繁体中文" or "繁体" in header_str:
-                        lang_map["繁体中文"] = col
-                        logger.info(f"✓ 繁体中文匹配: '{header_str}' -> 繁体中文 (第{col}列)")
-                        continue
-
-                    # 2. 检查是否是中文（CN）- 必须包含"CN"或明确的中文标识
-                    if (header_str == "中文（CN）" or
-                            header_str == "中文(CN)" or
-                            (("中文" in header_str or "Chinese" in header_str) and "CN" in header_str) or
-                            (header_str == "中文" and ws.max_column > 2)):  # 如果只有"中文"且有多列，假设第一列是中文
-                        lang_map["中文（CN）"] = col
-                        logger.info(f"✓ 中文(CN)匹配: '{header_str}' -> 中文（CN） (第{col}列)")
-                        continue
-
-                    # 3. 检查其他语言
-                    header_lower = header_str.lower()
-
-                    # 英文
-                    if "英文" in header_str or "english" in header_lower or "en" == header_lower:
-                        lang_map["英文（EN）English"] = col
-                        logger.info(f"✓ 英文匹配: '{header_str}' -> 英文（EN）English (第{col}列)")
-
-                    # 德语
-                    elif "德语" in header_str or "german" in header_lower or "de" == header_lower:
-                        lang_map["德语(DE)Deutsch"] = col
-                        logger.info(f"✓ 德语匹配: '{header_str}' -> 德语(DE)Deutsch (第{col}列)")
-
-                    # 西语
-                    elif "西语" in header_str or "spanish" in header_lower or "es" == header_lower:
-                        lang_map["西语（ES）Español"] = col
-                        logger.info(f"✓ 西语匹配: '{header_str}' -> 西语（ES）Español (第{col}列)")
-
-                    # 法语
-                    elif "法语" in header_str or "french" in header_lower or "fr" == header_lower:
-                        lang_map["法语(FR)Français"] = col
-                        logger.info(f"✓ 法语匹配: '{header_str}' -> 法语(FR)Français (第{col}列)")
-
-                    # 意大利语
-                    elif "意大利语" in header_str or "italian" in header_lower or "it" == header_lower:
-                        lang_map["意大利语(IT)Italiano"] = col
-                        logger.info(f"✓ 意大利语匹配: '{header_str}' -> 意大利语(IT)Italiano (第{col}列)")
-
-                    # 巴西葡语
-                    elif "巴西葡语" in header_str or "portuguese" in header_lower or "br" in header_lower:
-                        lang_map["巴西葡语(BR)Português"] = col
-                        logger.info(f"✓ 巴西葡语匹配: '{header_str}' -> 巴西葡语(BR)Português (第{col}列)")
-
-                    # 俄语
-                    elif "俄语" in header_str or "russian" in header_lower or "ru" in header_lower:
-                        lang_map["俄语（Pyc）Русский"] = col
-                        logger.info(f"✓ 俄语匹配: '{header_str}' -> 俄语（Pyc）Русский (第{col}列)")
-
-                    # 土耳其语
-                    elif "土耳其语" in header_str or "turkish" in header_lower or "tr" in header_lower:
-                        lang_map["土耳其语(TR)Turkish"] = col
-                        logger.info(f"✓ 土耳其语匹配: '{header_str}' -> 土耳其语(TR)Turkish (第{col}列)")
-
-                    # 日语
-                    elif "日语" in header_str or "japanese" in header_lower or "jp" in header_lower:
-                        lang_map["日语(JP)日本語"] = col
-                        logger.info(f"✓ 日语匹配: '{header_str}' -> 日语(JP)日本語 (第{col}列)")
-
-                    # 韩语
-                    elif "韩语" in header_str or "korean" in header_lower or "kr" in header_lower:
-                        lang_map["韩语(KR)한국어"] = col
-                        logger.info(f"✓ 韩语匹配: '{header_str}' -> 韩语(KR)한국어 (第{col}列)")
-
-                    # 阿拉伯语
-                    elif "阿拉伯语" in header_str or "arabic" in header_lower or "ar" in header_lower:
-                        lang_map["阿拉伯语عربية"] = col
-                        logger.info(f"✓ 阿拉伯语匹配: '{header_str}' -> 阿拉伯语عربية (第{col}列)")
-
-                    # 波兰语（新增）
-                    elif "波兰语" in header_str or "polish" in header_lower or "pl" == header_lower:
-                        lang_map["波兰语（PL）Polski"] = col
-                        logger.info(f"✓ 波兰语匹配: '{header_str}' -> 波兰语（PL）Polski (第{col}列)")
-
-                    # 越南语（新增）
-                    elif "越南语" in header_str or "vietnamese" in header_lower or "vi" == header_lower:
-                        lang_map["越南语（VI）Tiếng Việt"] = col
-                        logger.info(f"✓ 越南语匹配: '{header_str}' -> 越南语（VI）Tiếng Việt (第{col}列)")
-
-                    # 印尼语（新增）
-                    elif "印尼语" in header_str or "indonesian" in header_lower or "id" == header_lower:
-                        lang_map["印尼语（ID）Bahasa Indonesia"] = col
-                        logger.info(f"✓ 印尼语匹配: '{header_str}' -> 印尼语（ID）Bahasa Indonesia (第{col}列)")
-
-                    # 泰语（新增）
-                    elif "泰语" in header_str or "thai" in header_lower or "th" == header_lower:
-                        lang_map["泰语（TH）ไทย"] = col
-                        logger.info(f"✓ 泰语匹配: '{header_str}' -> 泰语（TH）ไทย (第{col}列)")
-
-                    # 马来语（新增）
-                    elif "马来语" in header_str or "malay" in header_lower or "ms" == header_lower:
-                        lang_map["马来语（MS）Bahasa Melayu"] = col
-                        logger.info(f"✓ 马来语匹配: '{header_str}' -> 马来语（MS）Bahasa Melayu (第{col}列)")
-
-                    # 希伯来语（新增）
-                    elif "希伯来语" in header_str or "hebrew" in header_lower or "he" == header_lower:
-                        lang_map["希伯来语（HE）עברית"] = col
-                        logger.info(f"✓ 希伯来语匹配: '{header_str}' -> 希伯来语（HE）עברית (第{col}列)")
-
-                    # 南非语（新增）
-                    elif "南非语" in header_str or "afrikaans" in header_lower or "af" == header_lower:
-                        lang_map["南非语（AF）Afrikaans"] = col
-                        logger.info(f"✓ 南非语匹配: '{header_str}' -> 南非语（AF）Afrikaans (第{col}列)")
-
-                    # 印地语（新增）
-                    elif "印地语" in header_str or "hindi" in header_lower or "hi" == header_lower:
-                        lang_map["印地语 （HI）Hindi"] = col
-                        logger.info(f"✓ 印地语匹配: '{header_str}' -> 印地语 （HI）Hindi (第{col}列)")
-
-            logger.info(f"{file_name} 最终语言映射: {lang_map}")
-            return lang_map
-
-        source_lang_map = build_lang_col_map(source_ws, "源文件")
-        trans_lang_map = build_lang_col_map(trans_ws, "翻译文件")
+def compare_excel_files(source_path, trans_path, selected_languages, task_id, output_dir=None, sidecar_format=None,
+                        source_digest=None, output_name=None, lineage=None, snapshot_store=None):
+    """执行Excel对比的核心逻辑，sidecar_format 为 csv/parquet 时同时输出不带样式的附属文件
+
+    给出 source_digest 时源文件按内容哈希复用本进程已加载的表；output_name 为结果文件名（不含扩展名）。
+    给出 lineage 时与该谱系在 snapshot_store 中的上次快照比较，只重新对比变化的键，另外输出一份变更报告。
+    """
+    sidecar = None
+    metrics = task_metrics(task_id)
+
+    try:
+        report_progress(task_id, 20, '正在加载Excel文件...')
+        metrics.lap()
+
+        # 流式加载为列式翻译表（只读模式，一次遍历）
+        if source_digest:
+            if TranslationTable.is_cached(source_digest):
+                metrics.count('source_table_cache_hits')
+            source_table = TranslationTable.from_excel_cached(source_path, source_digest)
+        else:
+            source_table = TranslationTable.from_excel(source_path)
+        trans_table = TranslationTable.from_excel(trans_path)
+        metrics.lap('load')
+        metrics.count('rows', len(source_table) + len(trans_table))
+
+        report_progress(task_id, 30, '正在分析文件结构...')
+
+        # 文件结构的详细信息只在 DEBUG 级别输出（参数延迟格式化）
+        logger.info("源文件 %d 行、%d 列，翻译文件 %d 行、%d 列",
+                    len(source_table), source_table.max_column, len(trans_table), trans_table.max_column)
+        if logger.isEnabledFor(logging.DEBUG):
+            for file_name, table in (("源文件", source_table), ("翻译文件", trans_table)):
+                logger.debug("%s表头: %s", file_name,
+                             ', '.join(f"列{col}: {header}" for col, header in enumerate(table.header, 1)))
+                logger.debug("%s 前10个键名: %s", file_name,
+                             list(itertools.islice((key for key in table.keys if key), 10)))
+
+        # 构建键映射 - 使用第一列作为键名，值为翻译表中的下标
+        source_key_map = source_table.key_index
+        trans_key_map = trans_table.key_index
+
+        report_progress(task_id, 40, f'源文件发现 {len(source_key_map)} 个键，翻译文件发现 {len(trans_key_map)} 个键')
+
+        # 构建语言列映射（识别结果按表头行缓存，相同模板不再重复识别）
+        source_lang_map = header_recognizer.resolve(source_table.header, source_table.max_column)
+        trans_lang_map = header_recognizer.resolve(trans_table.header, trans_table.max_column)
+        logger.debug("源文件语言映射: %s", source_lang_map)
+        logger.debug("翻译文件语言映射: %s", trans_lang_map)
+
+        # 逐语言的映射情况按类别计数，结束时输出一行汇总
+        mapping_log = LoopLog(logger, "语言列映射", app.config['HOT_LOG_VERBOSITY'])
 
         # 筛选可对比的语言
         comparison_langs = []
         for lang in selected_languages:
             if lang in source_lang_map:
                 comparison_langs.append(lang)
-                logger.info(f"将对比语言: {lang} (源文件第{source_lang_map[lang]}列)")
                 if lang in trans_lang_map:
-                    logger.info(f"  - 翻译文件对应列: 第{trans_lang_map[lang]}列")
+                    mapping_log.event("两边都有", "将对比语言: %s (源文件第%s列, 翻译文件第%s列)",
+                                      lang, source_lang_map[lang], trans_lang_map[lang])
                 else:
-                    logger.warning(f"  - 警告: 翻译文件中未找到此语言列")
+                    mapping_log.event("翻译文件缺少", "翻译文件中未找到语言列: %s", lang)
             else:
-                logger.warning(f"源文件中未找到语言列: {lang}")
+                mapping_log.event("源文件缺少", "源文件中未找到语言列: %s", lang)
 
         # 如果某些选中的语言在源文件中没有找到，尝试使用列顺序映射
         missing_langs = [lang for lang in selected_languages if lang not in comparison_langs]
         if missing_langs:
-            logger.warning(f"以下语言未找到匹配列: {missing_langs}，尝试使用列顺序映射")
-
-            # 列顺序映射表
-            col_order = [
-                "中文（CN）",
-                "英文（EN）English",
-                "德语(DE)Deutsch",
-                "西语（ES）Español",
-                "法语(FR)Français",
-                "意大利语(IT)Italiano",
-                "巴西葡语(BR)Português",
-                "俄语（Pyc）Русский",
-                "土耳其语(TR)Turkish",
-                "日语(JP)日本語",
-                "韩语(KR)한국어",
-                "阿拉伯语عربية",
-                "繁体中文",
-                "波兰语（PL）Polski",
-                "越南语（VI）Tiếng Việt",
-                "印尼语（ID）Bahasa Indonesia",
-                "泰语（TH）ไทย",
-                "马来语（MS）Bahasa Melayu",
-                "希伯来语（HE）עברית",
-                "南非语（AF）Afrikaans",
-                "印地语 （HI）Hindi"
-            ]
+            logger.warning("以下语言未找到匹配列: %s，尝试使用列顺序映射", missing_langs)
 
-            # 根据列顺序为缺失的语言分配列号
-            next_col = 2  # 从第2列开始（第1列是键名）
-            for lang in col_order:
-                if lang in missing_langs and next_col <= source_ws.max_column:
-                    source_lang_map[lang] = next_col
-                    comparison_langs.append(lang)
-                    logger.info(f"默认将第{next_col}列映射为 {lang}")
-                next_col += 1
-
-        # 特别检查：确保繁体中文没有被错误映射到中文
-        if "繁体中文" in selected_languages and "繁体中文" in source_lang_map:
-            # 确认繁体中文的列不是中文的列
-            if "中文（CN）" in source_lang_map and source_lang_map["中文（CN）"] == source_lang_map["繁体中文"]:
-                logger.warning("繁体中文和中文映射到了同一列，尝试重新映射")
-                # 尝试找到真正的繁体中文列
-                for col in range(source_ws.max_column, 1, -1):  # 从最后一列往前找
-                    header = source_ws.cell(row=1, column=col).value
-                    if header and isinstance(header, str):
-                        if "繁体" in header or "traditional" in header.lower():
-                            source_lang_map["繁体中文"] = col
-                            logger.info(f"重新映射繁体中文到第{col}列")
-                            break
-
-        tasks[task_id]['progress'] = 50
-        tasks[task_id]['message'] = f'开始对比 {len(source_key_map)} 个键，{len(comparison_langs)} 种语言...'
-
-        # 打印最终的语言映射，用于调试
-        logger.info("=" * 50)
-        logger.info("最终语言映射:")
-        for lang in comparison_langs:
-            source_col = source_lang_map.get(lang, "None")
-            trans_col = trans_lang_map.get(lang, "None")
-            logger.info(f"{lang}: 源文件第{source_col}列, 翻译文件第{trans_col}列")
-        logger.info("=" * 50)
+            # 根据标准列顺序为缺失的语言分配列号（从第2列开始，第1列是键名）
+            filled = header_recognizer.fill_by_position(
+                source_lang_map, missing_langs, source_table.header, source_table.max_column)
+            for lang in filled:
+                comparison_langs.append(lang)
+                mapping_log.event("按列顺序补齐", "默认将第%s列映射为 %s", source_lang_map[lang], lang)
+        mapping_log.summary()
+
+        report_progress(task_id, 50, f'开始对比 {len(source_key_map)} 个键，{len(comparison_langs)} 种语言...')
+        metrics.lap('language_mapping')
 
         # 执行对比
-        output_row = 2
-        matched_count = 0
         total_keys = len(source_key_map)
-        total_comparisons = 0
-        key_match_count = 0
-
-        # 首先找出所有匹配的键名（忽略大小写和空格）
-        source_keys_normalized = {k.strip().lower(): k for k in source_key_map.keys()}
-        trans_keys_normalized = {k.strip().lower(): k for k in trans_key_map.keys()}
-
-        # 创建翻译键名的反向映射（原始键名 -> 行号）
-        trans_key_row_map = {k: v for k, v in trans_key_map.items()}
-
-        # 找出匹配的键名
-        matching_keys = set(source_keys_normalized.keys()) & set(trans_keys_normalized.keys())
-        key_match_count = len(matching_keys)
-
-        # 创建源键名到翻译键名的映射
-        source_to_trans_key = {}
-        for norm_key in matching_keys:
-            source_original = source_keys_normalized[norm_key]
-            trans_original = trans_keys_normalized[norm_key]
-            source_to_trans_key[source_original] = trans_original
-
-        logger.info(f"键名匹配数量: {key_match_count}/{total_keys}")
-        logger.info(f"匹配的键名示例: {list(source_to_trans_key.items())[:5]}")
-
-        # 存储每个键的起始行和结束行，用于后续合并
-        key_ranges = []
-
-        # 第一次遍历：收集每个键的数据行范围
-        current_key = None
-        key_start_row = output_row
-        key_lang_count = 0
-        current_trans_key = None
-
-        # 按源文件键名顺序处理
-        source_keys_list = list(source_key_map.keys())
-
-        for i, source_key in enumerate(source_keys_list):
-            source_row = source_key_map[source_key]
-
-            # 更新进度
-            progress = 50 + (i / total_keys) * 40
-            if i % 5 == 0:
-                tasks[task_id]['progress'] = int(progress)
-                tasks[task_id]['message'] = f'正在对比 {i + 1}/{total_keys}...'
-
-            # 查找匹配的翻译键
-            trans_key = source_to_trans_key.get(source_key)
-            trans_row = trans_key_row_map.get(trans_key) if trans_key else None
-
-            # 记录这个键的起始行
-            if current_key != source_key:
-                if current_key is not None and key_lang_count > 0:
-                    # 保存上一个键的范围
-                    key_ranges.append({
-                        'source_key': current_key,
-                        'trans_key': current_trans_key,
-                        'start_row': key_start_row,
-                        'end_row': output_row - 1,
-                        'lang_count': key_lang_count
-                    })
-                # 开始新键
-                current_key = source_key
-                current_trans_key = trans_key if trans_key else "未匹配"
-                key_start_row = output_row
-                key_lang_count = 0
-
-            # 对每个选中的语言进行对比
-            for lang in comparison_langs:
-                source_col = source_lang_map.get(lang)
-
-                if not source_col:
-                    continue
 
-                # 获取源文件内容
-                source_content = ""
-                try:
-                    source_cell = source_ws.cell(row=source_row, column=source_col)
-                    source_content = str(source_cell.value) if source_cell.value is not None else ""
-                except Exception as e:
-                    source_content = f"【读取错误】"
-                    logger.warning(f"读取源文件内容错误: {e}")
-
-                # 获取翻译文件内容
-                trans_content = ""
-                trans_col = trans_lang_map.get(lang) if lang in trans_lang_map else None
-
-                if trans_row and trans_col:
-                    try:
-                        trans_cell = trans_ws.cell(row=trans_row, column=trans_col)
-                        trans_content = str(trans_cell.value) if trans_cell.value is not None else ""
-                    except Exception as e:
-                        trans_content = f"【读取错误】"
-                        logger.warning(f"读取翻译文件内容错误: {e}")
-                elif not trans_row:
-                    trans_content = "【键名未匹配】"
-                elif not trans_col:
-                    trans_content = f"【翻译文件缺少{lang}列】"
-
-                # 先不写入源文件键名和翻译文件键名，留空
-                output_ws.cell(row=output_row, column=1).value = ""  # 源文件键名留空，后续合并
-                output_ws.cell(row=output_row, column=2).value = ""  # 翻译文件键名留空，后续合并
-                output_ws.cell(row=output_row, column=3).value = lang
-                output_ws.cell(row=output_row, column=4).value = source_content
-                output_ws.cell(row=output_row, column=5).value = trans_content
-
-                # 判断对比结果并设置样式
-                if not trans_row:
-                    result = "键名缺失"
-                    output_ws.cell(row=output_row, column=6).fill = YELLOW_FILL
-                elif trans_content.startswith("【翻译文件缺少"):
-                    result = "语言列缺失"
-                    output_ws.cell(row=output_row, column=6).fill = YELLOW_FILL
-                elif source_content and trans_content and source_content == trans_content:
-                    result = "一致"
-                    output_ws.cell(row=output_row, column=4).fill = GREEN_FILL
-                    output_ws.cell(row=output_row, column=5).fill = GREEN_FILL
-                    matched_count += 1
-                elif not source_content and not trans_content:
-                    result = "均为空"
-                    output_ws.cell(row=output_row, column=6).fill = GREEN_FILL
-                else:
-                    result = "不一致"
-                    output_ws.cell(row=output_row, column=4).fill = RED_FILL
-                    output_ws.cell(row=output_row, column=5).fill = RED_FILL
-
-                output_ws.cell(row=output_row, column=6).value = result
-                output_row += 1
-                key_lang_count += 1
-                total_comparisons += 1
-
-        # 保存最后一个键的范围
-        if current_key is not None and key_lang_count > 0:
-            key_ranges.append({
-                'source_key': current_key,
-                'trans_key': current_trans_key,
-                'start_row': key_start_row,
-                'end_row': output_row - 1,
-                'lang_count': key_lang_count
-            })
+        # 每个键输出的语言行数相同，合并区域在写入前即可确定
+        row_langs = [lang for lang in comparison_langs if source_lang_map.get(lang)]
+        rows_per_key = len(row_langs)
 
-        logger.info(f"收集到 {len(key_ranges)} 个键的数据范围")
+        output_dir = output_dir or app.config['UPLOAD_FOLDER']
+        output_filename = f"{output_name or 'comparison_' + datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        output_path = os.path.join(output_dir, output_filename)
 
-        # 第二次遍历：合并单元格并写入键名
-        for key_info in key_ranges:
-            start_row = key_info['start_row']
-            end_row = key_info['end_row']
-
-            if start_row <= end_row:
-                try:
-                    # 合并源文件键名单元格
-                    if end_row > start_row:
-                        output_ws.merge_cells(start_row=start_row, start_column=1,
-                                              end_row=end_row, end_column=1)
+        # 确保目录存在
+        os.makedirs(output_dir, exist_ok=True)
 
-                    # 写入源文件键名
-                    source_cell = output_ws.cell(row=start_row, column=1)
-                    source_cell.value = key_info['source_key']
-                    source_cell.font = BOLD_FONT
-                    source_cell.alignment = Alignment(vertical='center')
+        # 只写模式流式输出，样式预先注册为命名样式
+        headers = ["源文件键名", "翻译文件键名", "语言", "源文件内容", "翻译文件内容", "对比结果"]
+        output_sheet = StreamingSheet(
+            "对比结果",
+            headers,
+            # 源文件键名、翻译文件键名、语言、源文件内容、翻译文件内容、对比结果
+            widths=[30, 30, 20, 40, 40, 15],
+            styles=COMPARE_STYLES,
+            header_style='compare_header'
+        )
 
-                    # 合并翻译文件键名单元格
-                    if end_row > start_row:
-                        output_ws.merge_cells(start_row=start_row, start_column=2,
-                                              end_row=end_row, end_column=2)
+        sidecar_filename = None
+        if sidecar_format:
+            sidecar_filename = f"{os.path.splitext(output_filename)[0]}.{sidecar_format}"
+            sidecar = SidecarWriter(os.path.join(output_dir, sidecar_filename), sidecar_format, headers)
+
+        # 每种语言整列转换为字符串数组，按规范化键名一次对齐后逐语言整列对比
+        # （源文件表可能被多次对比共用，按列号取列，不修改表本身）
+        source_texts = {lang: source_table.column_texts(source_lang_map[lang]) for lang in row_langs}
+        trans_texts = {lang: trans_table.column_texts(trans_lang_map[lang]) for lang in row_langs
+                       if lang in trans_lang_map}
+        snapshot = changes = previous = None
+        if lineage:
+            comparison, snapshot, changes, previous = compare_incremental(
+                snapshot_store, lineage, source_key_map, trans_key_map, row_langs, source_texts, trans_texts)
+        else:
+            comparison = BulkComparison(source_key_map, trans_key_map, row_langs, source_texts, trans_texts)
+        key_match_count = comparison.key_match_count
+        matched_count = comparison.count(EQUAL)
+        total_comparisons = total_keys * rows_per_key
+        logger.info("键名匹配数量: %d/%d", key_match_count, total_keys)
+        metrics.lap('compare')
+        metrics.count('cells', comparison.recompared * rows_per_key)
+
+        # 各对比结果代码对应的样式（列下标从0开始）
+        result_styles = [
+            {5: 'compare_missing'},  # 键名缺失
+            {5: 'compare_missing'},  # 语言列缺失
+            {3: 'compare_match', 4: 'compare_match'},  # 一致
+            {5: 'compare_match'},  # 均为空
+            {3: 'compare_diff', 4: 'compare_diff'},  # 不一致
+        ]
+        first_row_styles = [{**styles, 0: 'compare_key', 1: 'compare_key'} for styles in result_styles]
 
-                    # 写入翻译文件键名
-                    trans_cell = output_ws.cell(row=start_row, column=2)
-                    trans_cell.value = key_info['trans_key']
-                    trans_cell.font = BOLD_FONT
-                    trans_cell.alignment = Alignment(vertical='center')
+        output_row = 2
+        last_progress = None
+        for i, (source_key, trans_key_name, cells) in enumerate(comparison.iter_keys()):
+            # 更新进度（百分比变化时才上报，避免无效的进度事件）
+            progress = int(50 + (i / total_keys) * 40)
+            if progress != last_progress:
+                last_progress = progress
+                report_progress(task_id, progress, f'正在写出 {i + 1}/{total_keys}...')
+
+            if rows_per_key > 1:
+                # 合并源文件键名和翻译文件键名单元格
+                output_sheet.merge(output_row, 1, output_row + rows_per_key - 1, 1)
+                output_sheet.merge(output_row, 2, output_row + rows_per_key - 1, 2)
+
+            # 键名只写在每个键的第一行（合并单元格的左上角）
+            for lang_index, (lang, source_content, trans_content, code) in enumerate(cells):
+                result = RESULT_LABELS[code]
+                if lang_index == 0:
+                    output_sheet.append([source_key, trans_key_name, lang, source_content, trans_content, result],
+                                        first_row_styles[code])
+                else:
+                    output_sheet.append([None, None, lang, source_content, trans_content, result],
+                                        result_styles[code])
 
-                    logger.info(
-                        f"写入键名: 源='{key_info['source_key']}', 翻译='{key_info['trans_key']}', 行范围 {start_row}-{end_row}")
+                if sidecar:
+                    sidecar.write([source_key, trans_key_name, lang, source_content, trans_content, result])
 
-                except Exception as e:
-                    logger.warning(f"合并单元格失败: {e}")
+            output_row += rows_per_key
 
-        tasks[task_id]['progress'] = 90
-        tasks[task_id]['message'] = '正在生成总结报告...'
+        report_progress(task_id, 90, '正在生成总结报告...')
 
-        # 添加总结
-        summary_row = output_row + 2
-        output_ws.cell(row=summary_row, column=1).value = "对比总结"
-        output_ws.cell(row=summary_row, column=1).font = HEADER_FONT
+        # 添加总结（与数据之间空两行）
+        output_sheet.append([])
+        output_sheet.append([])
+        output_sheet.append(["对比总结"], {0: 'compare_title'})
 
         # 统计各语言的数据量
         lang_stats = {}
@@ -875,50 +801,64 @@ def compare_excel_files(source_path, trans_path, selected_languages, task_id):
             f"总对比次数: {total_comparisons}",
             f"语言列情况: {lang_stats}"
         ]
+        incremental = None
+        if lineage:
+            incremental = incremental_statistics(comparison, changes)
+            summary_data.append(f"增量对比（{lineage}）: {incremental['summary']}")
 
-        for i, text in enumerate(summary_data):
-            output_ws.cell(row=summary_row + 1 + i, column=1).value = text
-
-        # 先关闭所有工作簿
-        if source_wb:
-            source_wb.close()
-        if trans_wb:
-            trans_wb.close()
+        for text in summary_data:
+            output_sheet.append([text])
 
-        tasks[task_id]['progress'] = 95
-        tasks[task_id]['message'] = '正在保存结果文件...'
+        report_progress(task_id, 95, '正在保存结果文件...')
+        metrics.lap('write')
+        metrics.count('output_rows', total_comparisons)
 
         # 保存结果
-        output_filename = f"comparison_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-
-        # 确保目录存在
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-        # 保存并关闭输出文件
-        output_wb.save(output_path)
-        output_wb.close()
+        output_sheet.save(output_path)
+        if sidecar:
+            sidecar.close()
+        changes_filename = None
+        if changes:
+            changes_filename = f"{os.path.splitext(output_filename)[0]}_changes.xlsx"
+            write_changes_report(os.path.join(output_dir, changes_filename), comparison, changes, previous)
+        if snapshot is not None:
+            # 结果文件保存成功后才更新快照，失败的任务不影响下次的变更判断
+            snapshot_store.save(lineage, snapshot)
+        metrics.lap('save')
 
         # 验证文件是否成功保存
         if not os.path.exists(output_path):
             raise Exception("文件保存失败")
 
-        tasks[task_id]['progress'] = 100
-        tasks[task_id]['message'] = '对比完成'
-
-        # 清理旧文件
-        cleanup_old_files()
-
-        logger.info("=" * 50)
-        logger.info(f"对比完成，结果保存到: {output_path}")
-        logger.info(f"统计: 总键数={total_keys}, 键名匹配={key_match_count}, 内容一致={matched_count}")
-        logger.info("=" * 50)
-
+        report_progress(task_id, 100, '对比完成')
+
+        logger.info("对比完成，结果保存到: %s（总键数=%d, 键名匹配=%d, 内容一致=%d）",
+                    output_path, total_keys, key_match_count, matched_count)
+
+        statistics = {
+            'total_keys': total_keys,
+            'trans_keys': len(trans_key_map),
+            'matched_keys': key_match_count,
+            'languages': len(comparison_langs),
+            'total_comparisons': total_comparisons,
+            'equal': matched_count,
+            'different': comparison.count(DIFFERENT),
+            'both_empty': comparison.count(BOTH_EMPTY),
+            'missing_key': comparison.count(MISSING_KEY),
+            'missing_column': comparison.count(MISSING_COLUMN),
+        }
+        if incremental:
+            statistics['incremental'] = incremental
         return {
             'success': True,
-            'filename': output_filename
+            'filename': output_filename,
+            'sidecar_filename': sidecar_filename,
+            'changes_filename': changes_filename,
+            'statistics': statistics
         }
 
+    except JobCancelled:
+        raise
     except Exception as e:
         logger.error(f"对比过程出错: {e}")
         import traceback
@@ -928,26 +868,378 @@ def compare_excel_files(source_path, trans_path, selected_languages, task_id):
             'error': str(e)
         }
     finally:
-        # 确保所有工作簿都被关闭
-        try:
-            if source_wb:
-                source_wb.close()
-            if trans_wb:
-                trans_wb.close()
-            if output_wb:
-                output_wb.close()
-        except:
-            pass
+        # 确保附属文件被关闭
+        if sidecar:
+            sidecar.close()
+
+
+def compare_incremental(snapshot_store, lineage, source_key_map, trans_key_map, langs, source_texts, trans_texts):
+    """增量对比：与谱系上次的快照比较，只重新对比新增和内容变化的键
+
+    返回 (BulkComparison, 本次快照, 变更列表, 上次快照)；没有可用的上次快照时完整对比，变更列表为 None。
+    """
+    alignment = align_keys(source_key_map, trans_key_map)
+    signatures = key_signatures(alignment, langs, source_texts, trans_texts)
+    previous = snapshot_store.load(lineage)
+    changes = reuse = None
+    if previous is not None and previous.applies_to(langs, [lang for lang in langs if lang in trans_texts]):
+        positions, changes = previous.plan(alignment.source_keys, signatures)
+        reuse = (positions, previous.codes)
+    elif previous is not None:
+        logger.info("增量对比 %s: 对比语言或翻译文件的语言列与上次不同，完整重新对比", lineage)
+        previous = None
+
+    comparison = BulkComparison(source_key_map, trans_key_map, langs, source_texts, trans_texts,
+                                alignment=alignment, reuse=reuse)
+    logger.info("增量对比 %s: 重新对比 %d/%d 个键", lineage, comparison.recompared, len(alignment.source_keys))
+    return comparison, CompareSnapshot.from_comparison(comparison, signatures), changes, previous
+
+
+def incremental_statistics(comparison, changes):
+    """增量对比的变更计数"""
+    total = len(comparison.alignment.source_keys)
+    if changes is None:
+        return {'baseline': False, 'added': 0, 'removed': 0, 'changed': 0, 'unchanged': 0,
+                'recompared': total, 'summary': '首次对比，已建立快照'}
+    added = sum(1 for _, change, _ in changes if change == CHANGE_ADDED)
+    removed = sum(1 for _, change, _ in changes if change == CHANGE_REMOVED)
+    changed = len(changes) - added - removed
+    return {
+        'baseline': True,
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'unchanged': total - added - changed,
+        'recompared': comparison.recompared,
+        'summary': f'新增 {added} 个键，删除 {removed} 个键，内容变化 {changed} 个键，'
+                   f'沿用上次结果 {total - added - changed} 个键',
+    }
+
+
+def write_changes_report(path, comparison, changes, previous):
+    """变更报告：只列出新增、删除和内容变化的键，附上次和本次的对比结果"""
+    headers = ["源文件键名", "变更类型", "翻译文件键名", "语言", "源文件内容", "翻译文件内容", "上次结果", "本次结果"]
+    sheet = StreamingSheet("变更", headers, widths=[30, 16, 30, 20, 40, 40, 15, 15],
+                           styles=COMPARE_STYLES, header_style='compare_header')
+    result_styles = [
+        {7: 'compare_missing'},  # 键名缺失
+        {7: 'compare_missing'},  # 语言列缺失
+        {7: 'compare_match'},  # 一致
+        {7: 'compare_match'},  # 均为空
+        {7: 'compare_diff'},  # 不一致
+    ]
+
+    positions = {key: i for i, key in enumerate(comparison.alignment.source_keys)}
+    current = [(change, previous_position) for key, change, previous_position in changes if change != CHANGE_REMOVED]
+    rows = comparison.iter_keys([positions[key] for key, change, _ in changes if change != CHANGE_REMOVED])
+    for (change, previous_position), (source_key, trans_key_name, cells) in zip(current, rows):
+        for lang, source_content, trans_content, code in cells:
+            previous_result = RESULT_LABELS[previous.codes[lang][previous_position]] if previous_position >= 0 else ''
+            sheet.append([source_key, change, trans_key_name, lang, source_content, trans_content,
+                          previous_result, RESULT_LABELS[code]], result_styles[code])
+
+    for key, change, previous_position in changes:
+        if change == CHANGE_REMOVED:
+            for lang in previous.langs:
+                sheet.append([key, change, None, lang, None, None,
+                              RESULT_LABELS[previous.codes[lang][previous_position]], None])
+    sheet.save(path)
+
+
+@app.route('/api/compare-batch', methods=['POST'])
+def compare_batch():
+    """批量Excel对比：多对文件共用语言选择，逐对并行对比，全部结束后生成汇总报告"""
+    batch_id = uuid.uuid4().hex
+    work_dir = os.path.join(app.config['BATCH_FOLDER'], batch_id)
+    try:
+        selected_languages = request.form.getlist('languages[]') or LANGUAGE_ORDER
+
+        sidecar_format = request.form.get('sidecar', '').strip().lower() or None
+        if sidecar_format and sidecar_format not in available_sidecar_formats():
+            return jsonify({'error': f'不支持的附属文件格式: {sidecar_format}'}), 400
+
+        pairs = save_batch_upload(work_dir)
+        if len(pairs) > app.config['BATCH_MAX_PAIRS']:
+            raise BatchError(f"文件对过多（上限 {app.config['BATCH_MAX_PAIRS']} 对）")
+        if scheduler.active_count() >= scheduler.max_queue:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return jsonify({'error': '服务器繁忙，请稍后再试'}), 503
+
+        # 每个文件只计算一次哈希：共用的源文件既用于结果缓存键，也用于工作进程复用已解析的表
+        digests = {}
+        for pair in pairs:
+            for path in (pair.source_path, pair.trans_path):
+                if path not in digests:
+                    digests[path] = file_sha256(path)
+                pair.digests[path] = digests[path]
+
+        output_dir = app.config['UPLOAD_FOLDER']
+        options = {'sidecar': sidecar_format} if sidecar_format else None
+
+        def submit(pair):
+            cache_key = make_cache_key('compare', pair.source_path, pair.trans_path, selected_languages,
+                                       options, pair.digests)
+            cached = lookup_result_cache('compare', cache_key)
+            if cached:
+                pair.task_id = create_cached_task(cached)
+                return dict(tasks[pair.task_id])
+
+            def on_finish(fields):
+                batch.pair_finished(pair, fields)
+                scheduler.update(batch_id, batch.progress_fields())
+
+            pair.task_id = uuid.uuid4().hex
+            scheduler.submit(pair.task_id, run_compare_job, pair.source_path, pair.trans_path,
+                             selected_languages, pair.task_id, output_dir, sidecar_format,
+                             pair.source_digest, f"comparison_{batch_id[:8]}_{pair.index + 1:03d}", False,
+                             message=f'批量对比任务已创建: {pair.name}',
+                             on_done=lambda result: store_compare_result(cache_key, output_dir, result),
+                             on_finish=on_finish)
+
+        batch = CompareBatch(batch_id, pairs, work_dir, submit, finish_compare_batch,
+                             max_parallel=app.config['BATCH_PARALLEL'] or scheduler.max_workers)
+        batches[batch_id] = batch
+        scheduler.register(batch_id, f'批量对比任务已创建，共 {len(pairs)} 对文件')
+        batch.start()
+        scheduler.update(batch_id, batch.progress_fields())
+        logger.info(f"批量对比任务已启动: {batch_id}，共 {len(pairs)} 对文件")
+
+        return jsonify({
+            'success': True,
+            'task_id': batch_id,
+            'pairs': [{'name': pair.name, 'source': pair.source_name, 'task_id': pair.task_id}
+                      for pair in pairs]
+        })
+
+    except (BatchError, UploadError) as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logger.error(f"启动批量对比任务失败: {e}")
+        return jsonify({'error': f'启动任务失败: {str(e)}'}), 500
+
+
+def finish_compare_batch(batch):
+    """批量对比全部结束：写出汇总报告，删除上传文件，结束批量任务"""
+    batch.cleanup()
+    statistics = batch.statistics()
+    fields = {
+        'progress': 100,
+        'reports': batch.reports(),
+        'result': {'statistics': statistics}
+    }
+    if batch.cancelled:
+        fields['status'] = 'cancelled'
+        fields['message'] = f"批量对比已取消（已完成 {statistics['completed']}/{statistics['pairs']} 对）"
+    else:
+        fields['status'] = 'completed'
+        fields['message'] = f"批量对比完成：成功 {statistics['completed']} 对，失败 {statistics['failed']} 对"
+
+    try:
+        output_filename = f"batch_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{batch.batch_id[:8]}.xlsx"
+        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
+        write_batch_summary(batch, statistics, output_path)
+        storage.add(output_path)
+        fields['filename'] = output_filename
+        fields['download_url'] = f'/download/{output_filename}'
+    except Exception as e:
+        logger.error(f"生成批量对比汇总报告失败: {e}")
+
+    scheduler.finish(batch.batch_id, fields)
+    metrics_registry.record_task('batch', fields)
+    batches.pop(batch.batch_id, None)
+    logger.info(f"批量对比任务结束: {batch.batch_id}，{fields['message']}")
+
+
+def write_batch_summary(batch, statistics, output_path):
+    """写出批量对比的汇总报告：每对文件一行，末尾为合计"""
+    headers = ["翻译文件", "源文件", "状态", "源文件键数", "翻译文件键数", "键名匹配数",
+               "一致", "不一致", "均为空", "键名缺失", "语言列缺失", "结果文件", "说明"]
+    sheet = StreamingSheet("批量对比汇总", headers,
+                           widths=[40, 40, 10, 12, 12, 12, 10, 10, 10, 10, 12, 45, 40],
+                           styles=COMPARE_STYLES, header_style='compare_header')
+    status_labels = {'completed': '完成', 'error': '失败', 'cancelled': '已取消'}
+    counted = ('total_keys', 'trans_keys', 'matched_keys', 'equal', 'different',
+               'both_empty', 'missing_key', 'missing_column')
+
+    for report in batch.reports():
+        stats = report.get('statistics', {})
+        completed = report['status'] == 'completed'
+        sheet.append([report['name'], report['source'], status_labels.get(report['status'], report['status'])]
+                     + [stats.get(field, '') for field in counted]
+                     + [report.get('filename', ''), '' if completed else report['message']],
+                     None if completed else {2: 'compare_diff'})
+
+    sheet.append([])
+    sheet.append(["合计", f"{statistics['pairs']} 对", f"成功 {statistics['completed']}"]
+                 + [statistics[field] for field in counted], {0: 'compare_title'})
+    sheet.save(output_path)
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """创建分块上传会话：{"filename": ..., "size": 字节数, "sha256": 可选的整个文件校验和}"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename', '')))
+    if not filename:
+        return jsonify({'error': '缺少文件名'}), 400
+    try:
+        session = uploads.create(filename, data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    result = session.to_dict()
+    result['chunk_size'] = app.config['UPLOAD_CHUNK_SIZE']
+    return jsonify(result), 201
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """查询上传进度，客户端从返回的 offset 续传"""
+    try:
+        return jsonify(uploads.get(upload_id).to_dict())
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """上传一个分块：请求体为原始字节，Upload-Offset 头给出起始偏移量，
+    可选的 Upload-Checksum 头给出本块的 SHA-256"""
+    try:
+        session = uploads.get(upload_id)
+        offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+        if offset is None or not str(offset).isdigit():
+            return jsonify({'error': '缺少有效的 Upload-Offset', 'offset': session.offset}), 400
+        if request.content_length is None:
+            return jsonify({'error': '缺少 Content-Length', 'offset': session.offset}), 411
+        session.write_chunk(int(offset), request.stream, request.content_length,
+                            request.headers.get('Upload-Checksum'))
+        return jsonify(session.to_dict())
+    except UploadError as e:
+        result = {'error': str(e)}
+        if upload_id in uploads:
+            result['offset'] = uploads.get(upload_id).offset
+        return jsonify(result), e.status_code
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    """取消上传并删除已接收的数据"""
+    if not uploads.discard(upload_id):
+        return jsonify({'error': '上传会话不存在或已过期'}), 404
+    return jsonify({'success': True})
 
 
 @app.route('/api/task-status/<task_id>')
 def task_status(task_id):
     """获取任务状态"""
+    scheduler.expire()
     if task_id in tasks:
         return jsonify(tasks[task_id])
     return jsonify({'status': 'not_found', 'message': '任务不存在'})
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 文本格式的性能指标"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/task-events/<task_id>')
+def task_events(task_id):
+    """以 Server-Sent Events 推送任务进度，支持心跳和 Last-Event-ID 断点续传"""
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_seq = 0
+    heartbeat = app.config['SSE_HEARTBEAT']
+
+    def generate():
+        seq = last_seq
+        yield 'retry: 2000\n\n'
+        while True:
+            new_seq, task = scheduler.wait_for_event(task_id, seq, heartbeat)
+            if new_seq is None:
+                yield f"event: end\ndata: {json.dumps({'status': 'not_found', 'message': '任务不存在'}, ensure_ascii=False)}\n\n"
+                return
+            if task is None:
+                yield ': heartbeat\n\n'
+                continue
+            seq = new_seq
+            finished = task.get('status') != 'processing'
+            event = 'end' if finished else 'progress'
+            yield f"id: {seq}\nevent: {event}\ndata: {json.dumps(task, ensure_ascii=False)}\n\n"
+            if finished:
+                return
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/task-cancel/<task_id>', methods=['POST'])
+def task_cancel(task_id):
+    """取消排队中或运行中的任务"""
+    if task_id not in tasks:
+        return jsonify({'status': 'not_found', 'message': '任务不存在'}), 404
+    batch = batches.get(task_id)
+    if batch is not None:
+        # 批量任务：不再提交剩余的文件对，并取消运行中的对比
+        for pair_task_id in batch.cancel():
+            scheduler.cancel(pair_task_id)
+        return jsonify({'success': True, 'message': '已发出取消请求'})
+    if not scheduler.cancel(task_id):
+        return jsonify({'success': False, 'message': '任务已结束，无法取消'}), 409
+    return jsonify({'success': True, 'message': '已发出取消请求'})
+
+
+def send_artifact(file_path, download_name):
+    """发送生成的文件：内容 ETag、条件请求、断点续传（Range），客户端接受 gzip 时发送预压缩版本
+
+    文件以真实文件对象交给 WSGI 服务器，支持 wsgi.file_wrapper 的服务器会用 sendfile 零拷贝发送；
+    配置 USE_X_SENDFILE 时交给前端 Web 服务器发送。发送完毕前持有存储引用。
+    """
+    stored = storage.describe(file_path)
+    encoding = None
+    send_path = file_path
+    etag = stored.etag
+    # Range 请求作用于实际发送的字节，压缩版本的 ETag 与原文件不同，续传时不会混用
+    if 'gzip' in stored.variants and request.accept_encodings['gzip'] and os.path.exists(stored.variants['gzip']):
+        encoding = 'gzip'
+        send_path = stored.variants['gzip']
+        etag = f"{stored.etag}-gzip"
+    mimetype = DOWNLOAD_MIMETYPES.get(os.path.splitext(download_name)[1].lower(), 'application/octet-stream')
+
+    if app.config.get('USE_X_SENDFILE'):
+        response = send_file(send_path, as_attachment=True, download_name=download_name,
+                             mimetype=mimetype, etag=etag, last_modified=stored.mtime)
+    else:
+        response = send_file(storage.open(file_path, send_path), as_attachment=True, download_name=download_name,
+                             mimetype=mimetype, conditional=False, etag=etag, last_modified=stored.mtime)
+        response.content_length = os.path.getsize(send_path)
+        try:
+            response = response.make_conditional(request, accept_ranges=True,
+                                                  complete_length=response.content_length)
+            response.accept_ranges = 'bytes'  # 非 Range 请求也声明支持续传
+        except RequestedRangeNotSatisfiable:
+            response.close()
+            error = jsonify({'error': '请求的范围无效'})
+            error.status_code = 416
+            error.headers['Content-Range'] = f"bytes */{os.path.getsize(send_path)}"
+            return error
+        except Exception:
+            response.close()
+            raise
+
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if stored.variants:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """下载文件"""
@@ -958,15 +1250,14 @@ def download_file(filename):
 
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
 
+        # 上传目录中已清理的结果，可能仍保存在结果缓存中
         if not os.path.exists(file_path):
+            file_path = result_cache.path_for(filename)
+
+        if not file_path:
             return jsonify({'error': '文件不存在或已过期'}), 404
 
-        return send_file(
-            file_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return send_artifact(file_path, filename)
 
     except Exception as e:
         logger.error(f"下载文件失败: {e}")
@@ -974,14 +1265,55 @@ def download_file(filename):
 
 
 # 添加错误码校对辅助类
+# 错误码特征提取使用的正则（预编译）
+NON_WORD_RE = re.compile(r'[^\w\s]')
+DIGITS_RE = re.compile(r'\d+')
+LETTER_PREFIX_RE = re.compile(r'[A-Za-z]+')
+
+
+class CodeFeatures:
+    """一个错误码的匹配特征，每个错误码只计算一次
+
+    text 原文、lower 小写、normalized 标准化文本、digits 数字串、numbers 数字（整数元组）、
+    prefix 字母前缀、stripped 去掉数字后的文本
+    """
+
+    __slots__ = ('text', 'lower', 'normalized', 'digits', 'numbers', 'prefix', 'stripped')
+
+    def __init__(self, matcher, text):
+        self.text = text
+        self.lower = text.lower()
+        self.normalized = matcher.normalize_error_code(text)
+        self.digits = tuple(DIGITS_RE.findall(text))
+        self.numbers = tuple(map(int, self.digits))
+        self.prefix = matcher.extract_prefix(text)
+        self.stripped = DIGITS_RE.sub('', text).strip() if self.digits else text.strip()
+
+
 class ErrorCodeMatcher:
-    """错误码匹配器 - 优化版"""
+    """错误码匹配器 - 优化版
 
-    def __init__(self, threshold=90, ignore_case=True, ignore_special_chars=True, extract_numbers=True):
+    每个错误码的数字、前缀、标准化文本等特征只提取一次（CodeFeatures），
+    按文本缓存在匹配器中，匹配器的生命周期为一次校对任务。
+    """
+
+    def __init__(self, threshold=90, ignore_case=True, ignore_special_chars=True, extract_numbers=True,
+                 engine=None):
         self.threshold = threshold / 100.0  # 转换为0-1之间的小数
         self.ignore_case = ignore_case
         self.ignore_special_chars = ignore_special_chars
         self.extract_numbers = extract_numbers
+        # 相似度引擎：可传入名称或引擎对象，默认按 SIMILARITY_ENGINE 环境变量选择（未设置时为 difflib）
+        self.engine = engine if hasattr(engine, 'ratio') else get_engine(engine)
+        self._features = {}  # 错误码文本 -> CodeFeatures
+
+    def features(self, code):
+        """返回错误码的特征记录（按文本缓存）"""
+        text = str(code)
+        features = self._features.get(text)
+        if features is None:
+            features = self._features[text] = CodeFeatures(self, text)
+        return features
 
     def normalize_error_code(self, code):
         """标准化错误码"""
@@ -995,7 +1327,7 @@ class ErrorCodeMatcher:
 
         if self.ignore_special_chars:
             # 移除非字母数字字符，但保留空格
-            code_str = re.sub(r'[^\w\s]', '', code_str)
+            code_str = NON_WORD_RE.sub('', code_str)
 
         return code_str.strip()
 
@@ -1003,46 +1335,36 @@ class ErrorCodeMatcher:
         """只提取数字部分"""
         if not code:
             return []
-
-        code_str = str(code)
-        # 提取所有连续的数字
-        numbers = re.findall(r'\d+', code_str)
-        # 转换为整数列表
-        return [int(num) for num in numbers]
+        return list(self.features(code).numbers)
 
     def extract_prefix(self, code):
         """提取错误码的前缀（字母部分）"""
         if not code:
             return ""
 
-        code_str = str(code)
         # 提取开头的字母部分（直到遇到第一个数字）
-        match = re.match(r'^([A-Za-z]+)', code_str)
+        match = LETTER_PREFIX_RE.match(str(code))
         if match:
-            return match.group(1).lower() if self.ignore_case else match.group(1)
+            return match.group().lower() if self.ignore_case else match.group()
         return ""
 
     def calculate_similarity(self, code1, code2):
         """计算两个错误码的相似度 - 优化版"""
         if not code1 or not code2:
             return 0
+        return self.feature_similarity(self.features(code1), self.features(code2))
 
-        str1 = str(code1)
-        str2 = str(code2)
-
+    def feature_similarity(self, features1, features2):
+        """calculate_similarity 的计算部分，只使用两个（非空）错误码的特征记录"""
         # 1. 首先检查是否完全相等
-        if str1 == str2:
+        if features1.text == features2.text:
             return 100
-        if self.ignore_case and str1.lower() == str2.lower():
+        if self.ignore_case and features1.lower == features2.lower:
             return 100
 
-        # 2. 提取数字部分
-        nums1 = self.extract_numbers_only(str1)
-        nums2 = self.extract_numbers_only(str2)
-
-        # 3. 提取前缀（字母部分）
-        prefix1 = self.extract_prefix(str1)
-        prefix2 = self.extract_prefix(str2)
+        # 2. 数字部分和 3. 前缀（字母部分）
+        nums1 = features1.numbers
+        nums2 = features2.numbers
 
         # 4. 数字必须存在且匹配的检查
         if nums1 and nums2:
@@ -1054,6 +1376,8 @@ class ErrorCodeMatcher:
                     num2_str = str(nums2[0])
                     # 如果一个数字是另一个数字的开头部分
                     if num2_str.startswith(num1_str) or num1_str.startswith(num2_str):
+                        prefix1 = features1.prefix
+                        prefix2 = features2.prefix
                         # 检查前缀是否匹配
                         if prefix1 and prefix2 and prefix1 == prefix2:
                             # 相同前缀，数字包含关系，给70%基础分
@@ -1066,85 +1390,62 @@ class ErrorCodeMatcher:
                             base_score = 50
 
                         # 比较剩余部分
-                        text1 = re.sub(r'\d+', '', str1).strip()
-                        text2 = re.sub(r'\d+', '', str2).strip()
+                        text1 = features1.stripped
+                        text2 = features2.stripped
                         if text1 and text2:
-                            text_similarity = SequenceMatcher(None, text1, text2).ratio() * 100
+                            text_similarity = self.engine.ratio(text1, text2) * 100
                             return min(100, base_score + text_similarity * 0.3)
                         return base_score
                 # 数字不匹配，直接返回0
                 return 0
 
         # 5. 如果只有一边有数字
-        elif nums1 and not nums2:
+        elif nums1 or nums2:
             # 有数字的一边和无数字的一边，返回0
             return 0
-        elif not nums1 and nums2:
-            return 0
 
         # 6. 都没有数字，使用文本相似度
-        norm1 = self.normalize_error_code(str1)
-        norm2 = self.normalize_error_code(str2)
+        norm1 = features1.normalized
+        norm2 = features2.normalized
 
         if not norm1 or not norm2:
             return 0
 
-        similarity = SequenceMatcher(None, norm1, norm2).ratio() * 100
+        similarity = self.engine.ratio(norm1, norm2) * 100
         return round(similarity, 2)
 
+    def build_index(self, trans_codes_dict):
+        """为翻译错误码预先建立候选索引，供多次 find_best_match 复用"""
+        return ErrorCodeIndex(self, trans_codes_dict)
+
     def find_best_match(self, source_code, trans_codes_dict):
-        """在翻译错误码中寻找最佳匹配 - 优化版"""
+        """在翻译错误码中寻找最佳匹配 - 索引版
+
+        trans_codes_dict 可以是 {键名: 错误码} 字典，也可以是 build_index 生成的索引。
+        只有真正的候选（数字完全相同、数字前缀包含、或双方都没有数字）才会计算相似度，
+        候选按原字典顺序评估，结果与逐项扫描一致。
+        """
+        if isinstance(trans_codes_dict, ErrorCodeIndex):
+            index = trans_codes_dict
+        else:
+            index = self.build_index(trans_codes_dict)
+
         best_match = None
         best_similarity = 0
         best_trans_key = None
 
-        str_source = str(source_code)
-        nums_source = self.extract_numbers_only(str_source)
-        prefix_source = self.extract_prefix(str_source)
-
-        # 如果有数字，先过滤出数字匹配的候选
-        candidates = []
-        if nums_source:
-            for trans_key, trans_code in trans_codes_dict.items():
-                str_trans = str(trans_code)
-                nums_trans = self.extract_numbers_only(str_trans)
-
-                if nums_trans:
-                    # 数字必须完全相等
-                    if nums_source == nums_trans:
-                        candidates.append((trans_key, trans_code, 100))
-                    else:
-                        # 检查数字包含关系
-                        if len(nums_source) == 1 and len(nums_trans) == 1:
-                            num1_str = str(nums_source[0])
-                            num2_str = str(nums_trans[0])
-                            if num2_str.startswith(num1_str) or num1_str.startswith(num2_str):
-                                # 检查前缀
-                                prefix_trans = self.extract_prefix(str_trans)
-                                if prefix_source and prefix_trans and prefix_source == prefix_trans:
-                                    candidates.append((trans_key, trans_code, 70))
-                                else:
-                                    candidates.append((trans_key, trans_code, 40))
-        else:
-            # 没有数字，所有都是候选
-            candidates = [(key, code, 0) for key, code in trans_codes_dict.items()]
-
-        # 如果没有候选，返回空
-        if not candidates:
+        if not index.entries:
             return None, None, 0
 
         # 在候选中计算相似度
-        for trans_key, trans_code, base_score in candidates:
-            similarity = self.calculate_similarity(source_code, trans_code)
-
+        for order, similarity, base_score in index.similarities(source_code):
             # 如果候选有基础分，确保相似度不低于基础分
             if base_score > 0:
                 similarity = max(similarity, base_score)
 
             if similarity > best_similarity:
                 best_similarity = similarity
-                best_match = trans_code
-                best_trans_key = trans_key
+                best_trans_key, best_match = index.entries[order]
 
         # 如果最佳匹配超过阈值，返回匹配结果
         if best_similarity >= (self.threshold * 100):
@@ -1153,67 +1454,568 @@ class ErrorCodeMatcher:
             return None, None, best_similarity
 
 
+class ErrorCodeIndex:
+    """翻译错误码的候选索引
+
+    - numbers: 数字元组 -> 条目序号列表（数字完全相等）
+    - single_numbers: 单个数字的字符串 -> 条目序号列表（用于"2000 与 2000A"前缀包含规则）
+    - sorted_digits: 排序后的单数字字符串，按前缀二分查找更长的数字
+    - 每个条目的特征记录（CodeFeatures）只计算一次，匹配时不再执行正则
+    """
+
+    def __init__(self, matcher, trans_codes_dict):
+        self.matcher = matcher
+        self.entries = list(trans_codes_dict.items())
+        self.features = [matcher.features(trans_code) for _, trans_code in self.entries]
+        self.numbers = {}
+        self.single_numbers = {}
+        self.text_entries = []
+
+        for order, ((trans_key, trans_code), features) in enumerate(zip(self.entries, self.features)):
+            nums = features.numbers
+            if nums:
+                self.numbers.setdefault(nums, []).append(order)
+                if len(nums) == 1:
+                    self.single_numbers.setdefault(str(nums[0]), []).append(order)
+            elif trans_code:
+                # 无数字且非空的条目才可能得到大于0的相似度
+                self.text_entries.append(order)
+
+        self.sorted_digits = sorted(self.single_numbers)
+
+    def number_candidates(self, nums_source, prefix_source):
+        """返回 {条目序号: 基础分}：数字完全相等100分，前缀包含时同前缀70分、否则40分"""
+        candidates = {order: 100 for order in self.numbers.get(tuple(nums_source), ())}
+
+        if len(nums_source) == 1:
+            num_str = str(nums_source[0])
+            related = set()
+            # 翻译数字是源数字的前缀（如 200 与 2000）
+            for end in range(1, len(num_str) + 1):
+                related.update(self.single_numbers.get(num_str[:end], ()))
+            # 源数字是翻译数字的前缀（如 2000 与 20001）
+            # 从二分查找的位置按下标向后遍历，每次查找只访问以 num_str 开头的数字
+            sorted_digits = self.sorted_digits
+            for i in range(bisect.bisect_left(sorted_digits, num_str), len(sorted_digits)):
+                if not sorted_digits[i].startswith(num_str):
+                    break
+                related.update(self.single_numbers[sorted_digits[i]])
+
+            for order in related:
+                if order in candidates:
+                    continue
+                prefix_trans = self.features[order].prefix
+                if prefix_source and prefix_trans and prefix_source == prefix_trans:
+                    candidates[order] = 70
+                else:
+                    candidates[order] = 40
+
+        return candidates
+
+    def similarities(self, source_code):
+        """返回 [(条目序号, calculate_similarity 分数, 基础分)]，按原字典顺序排列
+
+        相似度必为0的条目（数字不相关、一边有数字一边没有）直接跳过。
+        """
+        source = self.matcher.features(source_code)
+        if source.numbers:
+            base_scores = self.number_candidates(source.numbers, source.prefix)
+            similarity = self.matcher.feature_similarity
+            return [(order, similarity(source, self.features[order]), base_scores[order])
+                    for order in sorted(base_scores)]
+        return [(order, similarity, 0)
+                for order, similarity in zip(self.text_entries, self.text_similarities(source_code))]
+
+    def text_similarities(self, source_code):
+        """与 calculate_similarity 的无数字分支一致，使用特征记录中的标准化文本并批量计算"""
+        if not source_code:
+            return [0] * len(self.text_entries)
+        source = self.matcher.features(source_code)
+        str_source, lower_source, norm_source = source.text, source.lower, source.normalized
+
+        results = []
+        pending = []
+        for order in self.text_entries:
+            trans = self.features[order]
+            str_trans, lower_trans, norm_trans = trans.text, trans.lower, trans.normalized
+            if str_source == str_trans:
+                results.append(100)
+            elif self.matcher.ignore_case and lower_source == lower_trans:
+                results.append(100)
+            elif not norm_source or not norm_trans:
+                results.append(0)
+            else:
+                pending.append(len(results))
+                results.append(None)
+
+        ratios = self.matcher.engine.ratios(norm_source, [self.features[self.text_entries[i]].normalized
+                                                          for i in pending])
+        for i, ratio in zip(pending, ratios):
+            results[i] = round(ratio * 100, 2)
+        return results
+
+
+def build_selected_lang_map(table, selected_languages):
+    """按表头包含语言名的方式构建语言列映射
+
+    错误码校对沿用按完整语言名匹配的规则，不使用 Excel对比的表头识别器（后者还识别英文名、语言代码等别名）。
+    """
+    lang_map = {}
+    for col, header in enumerate(table.header, 1):
+        if header and isinstance(header, str):
+            header_str = header.strip()
+            for lang in selected_languages:
+                if lang in header_str:
+                    lang_map[lang] = col
+                    break
+    return lang_map
+
+
 def extract_error_codes_from_excel(file_path, selected_languages):
     """从Excel文件中提取错误码和对应的翻译"""
-    wb = None
+    table = TranslationTable.from_excel(file_path)
+
+    # 构建语言列映射
+    lang_col_map = build_selected_lang_map(table, selected_languages)
+    table.lang_columns = lang_col_map
+
+    # 提取数据
+    lang_texts = {lang: table.lang_texts(lang, empty_if_falsy=True) for lang in lang_col_map}
+    error_codes = []
+    for i, key in enumerate(table.keys):
+        if not key:
+            continue
+        error_codes.append({
+            'key': key,
+            'translations': {lang: texts[i] for lang, texts in lang_texts.items()}
+        })
+
+    return error_codes, lang_col_map
+
+
+# 键名匹配每处理多少个源键上报一次进度（同时检查任务是否已取消）
+KEY_MATCH_PROGRESS_INTERVAL = 200
+
+
+def run_error_code_job(source_path, trans_path, selected_languages, options, task_id, output_dir, timestamp):
+    """错误码校对后台任务（在工作进程中执行），返回最终的任务状态"""
+    threshold = options['threshold']
+    ignore_case = options['ignore_case']
+    ignore_special_chars = options['ignore_special_chars']
+    extract_numbers = options['extract_numbers']
+    metrics = task_metrics(task_id)
+
     try:
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        ws = wb.active
+        report_progress(task_id, 10, '正在加载源文件...')
+        metrics.lap()
+
+        # 加载源文件
+        source_table = TranslationTable.from_excel(source_path)
+
+        # 加载翻译文件
+        trans_table = TranslationTable.from_excel(trans_path)
+        metrics.lap('load')
+        metrics.count('rows', len(source_table) + len(trans_table))
+
+        report_progress(task_id, 20, '正在识别语言列...')
 
         # 构建语言列映射
-        lang_col_map = {}
-        for col in range(1, ws.max_column + 1):
-            header = ws.cell(row=1, column=col).value
-            if header and isinstance(header, str):
-                header_str = header.strip()
-                for lang in selected_languages:
-                    if lang in header_str:
-                        lang_col_map[lang] = col
-                        break
-
-        # 提取数据
-        error_codes = []
-        for row in range(2, ws.max_row + 1):
-            # 获取键名（第一列）
-            key_cell = ws.cell(row=row, column=1)
-            if not key_cell.value:
-                continue
+        source_lang_map = build_selected_lang_map(source_table, selected_languages)
+        trans_lang_map = build_selected_lang_map(trans_table, selected_languages)
+        source_table.lang_columns = source_lang_map
+        trans_table.lang_columns = trans_lang_map
 
-            key = str(key_cell.value).strip()
-            if not key:
-                continue
+        # 找到中文列（用于键名匹配）
+        source_chinese_col = None
+        trans_chinese_col = None
 
-            # 获取各语言的错误码
-            translations = {}
-            for lang, col in lang_col_map.items():
-                cell = ws.cell(row=row, column=col)
-                translations[lang] = str(cell.value) if cell.value else ""
+        for lang in selected_languages:
+            if '中文' in lang:
+                source_chinese_col = source_lang_map.get(lang)
+                trans_chinese_col = trans_lang_map.get(lang)
+                break
+
+        if not source_chinese_col or not trans_chinese_col:
+            raise Exception("无法找到中文列")
+
+        report_progress(task_id, 30, '正在构建源文件数据...')
+        metrics.lap('language_mapping')
+
+        # 各语言整列的字符串数组，按下标查询
+        source_texts = {lang: source_table.lang_texts(lang, empty_if_falsy=True)
+                        for lang in source_lang_map}
+        trans_texts = {lang: trans_table.lang_texts(lang, empty_if_falsy=True)
+                       for lang in trans_lang_map}
+
+        # 创建匹配器（同一文本的数字、前缀、标准化结果在本任务中只提取一次）
+        matcher = ErrorCodeMatcher(
+            threshold=threshold,
+            ignore_case=ignore_case,
+            ignore_special_chars=ignore_special_chars,
+            extract_numbers=extract_numbers
+        )
 
-            error_codes.append({
-                'key': key,
-                'translations': translations
+        # 读取源文件数据
+        source_data = []
+        source_chinese_texts = source_table.column_texts(source_chinese_col, empty_if_falsy=True)
+        for index, source_key in enumerate(source_table.keys):
+            chinese_value = source_chinese_texts[index]
+            source_data.append({
+                'key': source_key,
+                'chinese': chinese_value,
+                'numbers': matcher.features(chinese_value).digits,  # 提取数字用于匹配
+                'index': index
             })
 
-        return error_codes, lang_col_map
+        report_progress(task_id, 40, '正在构建翻译文件数据...')
+
+        # 读取翻译文件数据
+        trans_data = []
+        trans_by_key = {}
+        trans_by_number = {}
+        trans_chinese_texts = trans_table.column_texts(trans_chinese_col, empty_if_falsy=True)
+        for index, trans_key in enumerate(trans_table.keys):
+            chinese_value = trans_chinese_texts[index]
+            item = {
+                'key': trans_key,
+                'chinese': chinese_value,
+                'numbers': matcher.features(chinese_value).digits,
+                'index': index
+            }
+            trans_data.append(item)
+            trans_by_key[trans_key] = item
+
+            # 按数字建立候选索引，数字匹配时只比较包含该数字的条目
+            for num in set(item['numbers']):
+                trans_by_number.setdefault(num, []).append(item)
+
+        report_progress(task_id, 50, '正在建立匹配索引...')
+
+        chinese_index = matcher.build_index({i: item['chinese'] for i, item in enumerate(trans_data)})
 
+        report_progress(task_id, 60, '正在进行键名+中文匹配...')
+        metrics.lap('index')
+
+        # 第一步：按键名+中文进行匹配
+        matches = []
+        key_matches = {}  # 记录每个源键名匹配到的翻译键名
+        current_row = 2
+        candidates = 0  # 计算过相似度的候选数
+        match_log = LoopLog(logger, "键名匹配", app.config['HOT_LOG_VERBOSITY'])
+
+        for i, source_item in enumerate(source_data):
+            # 模糊匹配每个键都可能较慢，定期上报进度，取消的任务不必等到匹配结束
+            if i and i % KEY_MATCH_PROGRESS_INTERVAL == 0:
+                report_progress(task_id, 60 + i * 10 // len(source_data),
+                                f'正在进行键名+中文匹配 {i}/{len(source_data)}...')
+
+            source_key = source_item['key']
+            source_chinese = source_item['chinese']
+
+            # 记录起始行
+            if source_key not in key_matches:
+                key_matches[source_key] = {
+                    'matched_key': '未匹配',
+                    'match_type': '无匹配',
+                    'similarity': 0,
+                    'start_row': current_row,
+                    'end_row': current_row + len(selected_languages) - 1
+                }
+
+            # 尝试匹配
+            best_match = None
+            best_similarity = 0
+
+            # 1. 先尝试精确匹配键名
+            if source_key in trans_by_key:
+                trans_item = trans_by_key[source_key]
+                trans_chinese = trans_item['chinese']
+
+                if source_chinese and trans_chinese:
+                    candidates += 1
+                    similarity = matcher.calculate_similarity(source_chinese, trans_chinese)
+                    if similarity >= threshold:
+                        best_match = trans_item
+                        best_similarity = similarity
+                        match_type = '键名+中文精确匹配'
+
+            # 2. 如果键名不匹配，尝试通过中文内容匹配
+            if not best_match and source_chinese:
+                # 先找相同数字的
+                if source_item['numbers']:
+                    for num in source_item['numbers']:
+                        for trans_item in trans_by_number.get(num, ()):
+                            candidates += 1
+                            similarity = matcher.calculate_similarity(source_chinese, trans_item['chinese'])
+                            if similarity > best_similarity and similarity >= threshold:
+                                best_similarity = similarity
+                                best_match = trans_item
+                                match_type = '数字匹配'
+
+                # 如果没找到，找相似内容的（索引跳过相似度必为0的条目，文本批量计算）
+                if not best_match:
+                    scored = chinese_index.similarities(source_chinese)
+                    candidates += len(scored)
+                    for order, similarity, _ in scored:
+                        if similarity > best_similarity and similarity >= threshold:
+                            best_similarity = similarity
+                            best_match = trans_data[order]
+                            match_type = '内容模糊匹配'
+
+            # 更新匹配结果
+            if best_match:
+                key_matches[source_key]['matched_key'] = best_match['key']
+                key_matches[source_key]['match_type'] = match_type
+                key_matches[source_key]['similarity'] = best_similarity
+                key_matches[source_key]['trans_item'] = best_match
+                match_log.event(match_type, "源键 %s -> %s（%s，相似度 %.2f）",
+                                source_key, best_match['key'], match_type, best_similarity)
+            else:
+                match_log.event('无匹配', "源键 %s 未找到匹配", source_key)
+
+        report_progress(task_id, 70, '正在对比各语言内容...')
+        metrics.lap('key_matching')
+        metrics.count('candidates', candidates)
+        match_log.summary()
+
+        # 第二步：根据匹配到的键名，对比所有语言
+        exact_matches = 0
+        content_matches = 0
+        unmatched = 0
+
+        for source_item in source_data:
+            source_key = source_item['key']
+            match_info = key_matches[source_key]
+            matched_key = match_info['matched_key']
+            trans_item = match_info.get('trans_item')
+
+            for lang in selected_languages:
+                source_value = ''
+                if lang in source_texts:
+                    source_value = source_texts[lang][source_item['index']]
+                trans_value = ''
+
+                if trans_item and lang in trans_texts:
+                    trans_value = trans_texts[lang][trans_item['index']]
+
+                # 判断匹配类型
+                if matched_key != '未匹配' and trans_item:
+                    if source_value and trans_value and source_value == trans_value:
+                        match_type = f'内容一致'
+                        exact_matches += 1
+                    elif source_value and trans_value:
+                        match_type = f'内容不一致'
+                        content_matches += 1
+                    elif source_value and not trans_value:
+                        match_type = f'翻译缺失'
+                        unmatched += 1
+                    elif not source_value and trans_value:
+                        match_type = f'源文件缺失'
+                        unmatched += 1
+                    else:
+                        match_type = f'均为空'
+                        unmatched += 1
+                else:
+                    match_type = f'键名未匹配'
+                    unmatched += 1
+
+                matches.append({
+                    'source_key': source_key,
+                    'matched_key': matched_key,
+                    'lang': lang,
+                    'source_value': source_value,
+                    'trans_value': trans_value,
+                    'match_type': match_type,
+                    'row': current_row
+                })
+                current_row += 1
+
+        report_progress(task_id, 85, '正在生成结果文件...')
+        metrics.lap('compare')
+        metrics.count('cells', len(matches))
+
+        # 创建结果Excel文件
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "错误码校对结果"
+
+        # 设置表头
+        headers = ["源文件键名", "匹配键名", "语言", "源文件错误码", "翻译错误码", "匹配类型"]
+        ws.append(headers)
+
+        # 设置表头样式
+        header_font = Font(bold=True, size=12)
+        header_fill = PatternFill(start_color='FFD3D3D3', end_color='FFD3D3D3', fill_type='solid')
+        for col in range(1, len(headers) + 1):
+            cell = ws.cell(row=1, column=col)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = Alignment(horizontal='center')
+
+        # 设置列宽
+        ws.column_dimensions['A'].width = 25
+        ws.column_dimensions['B'].width = 25
+        ws.column_dimensions['C'].width = 20
+        ws.column_dimensions['D'].width = 30
+        ws.column_dimensions['E'].width = 30
+        ws.column_dimensions['F'].width = 20
+
+        # 定义颜色样式
+        green_fill = PatternFill(start_color='8FBC8F', end_color='8FBC8F', fill_type='solid')
+        yellow_fill = PatternFill(start_color='FFF68F', end_color='FFF68F', fill_type='solid')
+        blue_fill = PatternFill(start_color='87CEFA', end_color='87CEFA', fill_type='solid')
+        red_fill = PatternFill(start_color='CD0000', end_color='CD0000', fill_type='solid')
+
+        # 写入数据
+        for match in matches:
+            row = [
+                match['source_key'],
+                match['matched_key'],
+                match['lang'],
+                match['source_value'],
+                match['trans_value'],
+                match['match_type']
+            ]
+            ws.append(row)
+
+            # 设置行样式
+            current_row = ws.max_row
+            match_type = match['match_type']
+
+            if '内容一致' in match_type:
+                for col in range(4, 6):
+                    ws.cell(row=current_row, column=col).fill = green_fill
+            elif '内容不一致' in match_type:
+                for col in range(4, 6):
+                    ws.cell(row=current_row, column=col).fill = yellow_fill
+            elif '缺失' in match_type:
+                for col in range(4, 6):
+                    ws.cell(row=current_row, column=col).fill = red_fill
+
+                # 合并源文件键名和匹配键名的单元格
+                current_source_key = None
+                start_row = 2
+                end_row = 2
+
+                # 先对matches按source_key排序，确保同一个键的行是连续的
+                for i, match in enumerate(matches):
+                    if current_source_key is None:
+                        current_source_key = match['source_key']
+                        start_row = match['row']
+
+                    # 如果是最后一个元素或者下一个键不同，执行合并
+                    if i == len(matches) - 1 or matches[i + 1]['source_key'] != current_source_key:
+                        end_row = match['row']
+
+                        if end_row > start_row:
+                            # 合并源文件键名列
+                            ws.merge_cells(start_row=start_row, start_column=1, end_row=end_row, end_column=1)
+                            cell = ws.cell(row=start_row, column=1)
+                            cell.font = Font(bold=True)
+                            cell.alignment = Alignment(vertical='center', horizontal='left')
+
+                            # 合并匹配键名列
+                            ws.merge_cells(start_row=start_row, start_column=2, end_row=end_row, end_column=2)
+                            cell = ws.cell(row=start_row, column=2)
+                            cell.font = Font(bold=True)
+
+                            # 在匹配键名后添加匹配信息
+                            match_info = key_matches.get(current_source_key, {})
+                            if match_info.get('matched_key') != '未匹配':
+                                cell.font = Font(bold=True, color='006400')
+                                # 在H列添加详细匹配信息
+                                info_cell = ws.cell(row=start_row, column=8)
+                                info_cell.value = f"匹配方式: {match_info.get('match_type', '未知')}, 相似度: {match_info.get('similarity', 0)}%"
+                                info_cell.font = Font(italic=True, size=9)
+                            else:
+                                cell.font = Font(bold=True, color='FF0000')
+
+                        # 重置，准备处理下一个键
+                        if i < len(matches) - 1:
+                            current_source_key = matches[i + 1]['source_key']
+                            start_row = matches[i + 1]['row']
+
+
+                # 根据匹配类型设置颜色
+                if match_info['matched_key'] != '未匹配':
+                    cell.font = Font(bold=True, color='006400')
+                    # 在合并单元格的旁边添加匹配信息
+                    info_cell = ws.cell(row=start_row, column=7)
+                    info_cell.value = f"匹配方式: {match_info['match_type']}, 相似度: {match_info['similarity']}%"
+                    info_cell.font = Font(italic=True, size=10)
+
+        # 添加统计信息
+        summary_row = ws.max_row + 3
+        ws.cell(row=summary_row, column=1).value = "统计信息"
+        ws.cell(row=summary_row, column=1).font = Font(bold=True, size=14)
+
+        total_items = len(source_data) * len(selected_languages)
+        matched_keys = sum(1 for info in key_matches.values() if info['matched_key'] != '未匹配')
+
+        stats = [
+            f"总键数: {len(source_data)}",
+            f"匹配到的键数: {matched_keys}",
+            f"键匹配率: {(matched_keys / len(source_data) * 100):.1f}%",
+            f"总语言项数: {total_items}",
+            f"内容一致项: {exact_matches}",
+            f"内容不一致项: {content_matches}",
+            f"未匹配项: {unmatched}",
+            f"内容匹配率: {((exact_matches + content_matches) / total_items * 100):.1f}%",
+            f"匹配阈值: {threshold}%"
+        ]
+
+        for i, stat in enumerate(stats):
+            ws.cell(row=summary_row + 1 + i, column=1).value = stat
+
+        # 保存文件
+        output_filename = f"error_check_{timestamp}.xlsx"
+        output_path = os.path.join(output_dir, output_filename)
+        metrics.lap('write')
+        metrics.count('output_rows', len(matches))
+        wb.save(output_path)
+        metrics.lap('save')
+
+        return {
+            'progress': 100,
+            'status': 'completed',
+            'message': f'校对完成！总键数: {len(source_data)}, 匹配键数: {matched_keys}, 内容一致: {exact_matches}',
+            'filename': output_filename,
+            'download_url': f'/download/{output_filename}',
+            'result': {
+                'statistics': {
+                    'total_keys': len(source_data),
+                    'matched_keys': matched_keys,
+                    'key_match_rate': round(matched_keys / len(source_data) * 100, 1),
+                    'total_items': total_items,
+                    'exact_matches': exact_matches,
+                    'content_matches': content_matches,
+                    'unmatched': unmatched,
+                    'item_match_rate': round((exact_matches + content_matches) / total_items * 100, 1)
+                }
+            }
+        }
+
+    except JobCancelled:
+        logger.info(f"错误码校对任务已取消: {task_id}")
+        return {'progress': 0, 'status': 'cancelled', 'message': '任务已取消'}
+    except Exception as e:
+        logger.error(f"错误码校对失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            'progress': 0,
+            'status': 'error',
+            'message': str(e)
+        }
     finally:
-        if wb:
-            wb.close()
+        # 清理临时文件
+        remove_files(source_path, trans_path)
 
 
 @app.route('/api/error-code-check', methods=['POST'])
 def error_code_check():
     """功能三：错误码校对 - 完整实现"""
     try:
-        if 'source_file' not in request.files or 'trans_file' not in request.files:
-            return jsonify({'error': '请上传两个Excel文件'}), 400
-
-        source_file = request.files['source_file']
-        trans_file = request.files['trans_file']
-
-        if source_file.filename == '' or trans_file.filename == '':
-            return jsonify({'error': '请选择有效的文件'}), 400
-
         # 获取参数
         selected_languages = request.form.getlist('languages[]')
         if not selected_languages:
@@ -1224,461 +2026,52 @@ def error_code_check():
         ignore_special_chars = request.form.get('ignore_special_chars', 'true').lower() == 'true'
         extract_numbers = request.form.get('extract_numbers', 'true').lower() == 'true'
 
-        # 保存上传的文件
-        source_filename = secure_filename(source_file.filename)
-        trans_filename = secure_filename(trans_file.filename)
-
+        # 保存上传的文件（普通表单文件或已完成的分块上传）
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        source_path = os.path.join(app.config['UPLOAD_FOLDER'], f"error_source_{uuid.uuid4().hex}_{source_filename}")
-        trans_path = os.path.join(app.config['UPLOAD_FOLDER'], f"error_trans_{uuid.uuid4().hex}_{trans_filename}")
+        request_metrics = TaskMetrics()
+        with request_metrics.stage('upload'):
+            source_path, trans_path, digests = save_upload_pair('error_')
+        if not source_path:
+            return jsonify({'error': '请上传两个Excel文件'}), 400
 
-        source_file.save(source_path)
-        trans_file.save(trans_path)
+        # 相同文件和参数已有结果时直接返回
+        options = {
+            'threshold': threshold,
+            'ignore_case': ignore_case,
+            'ignore_special_chars': ignore_special_chars,
+            'extract_numbers': extract_numbers
+        }
+        with request_metrics.stage('hash'):
+            cache_key = make_cache_key('error_code', source_path, trans_path, selected_languages, options, digests)
+        cached = lookup_result_cache('error_code', cache_key)
+        if cached:
+            remove_files(source_path, trans_path)
+            return jsonify({
+                'success': True,
+                'task_id': create_cached_task(cached, request_metrics.to_dict()),
+                'message': '错误码校对结果已缓存'
+            })
 
-        # 创建任务
+        # 提交到后台任务调度器
         task_id = uuid.uuid4().hex
-        tasks[task_id] = {
-            'progress': 0,
-            'status': 'processing',
-            'message': '错误码校对任务已创建'
-        }
+        output_dir = app.config['UPLOAD_FOLDER']
 
-        # 启动后台线程处理
-        def process_error_task():
-            try:
-                tasks[task_id]['progress'] = 10
-                tasks[task_id]['message'] = '正在加载源文件...'
-
-                # 加载源文件
-                wb_source = openpyxl.load_workbook(source_path, data_only=True)
-                ws_source = wb_source.active
-
-                # 加载翻译文件
-                wb_trans = openpyxl.load_workbook(trans_path, data_only=True)
-                ws_trans = wb_trans.active
-
-                tasks[task_id]['progress'] = 20
-                tasks[task_id]['message'] = '正在识别语言列...'
-
-                # 构建语言列映射
-                def build_lang_column_map(ws):
-                    lang_map = {}
-                    for col in range(1, ws.max_column + 1):
-                        header = ws.cell(row=1, column=col).value
-                        if header and isinstance(header, str):
-                            header_str = header.strip()
-                            for lang in selected_languages:
-                                if lang in header_str:
-                                    lang_map[lang] = col
-                                    break
-                    return lang_map
-
-                source_lang_map = build_lang_column_map(ws_source)
-                trans_lang_map = build_lang_column_map(ws_trans)
-
-                # 找到中文列（用于键名匹配）
-                source_chinese_col = None
-                trans_chinese_col = None
-
-                for lang in selected_languages:
-                    if '中文' in lang:
-                        source_chinese_col = source_lang_map.get(lang)
-                        trans_chinese_col = trans_lang_map.get(lang)
-                        break
-
-                if not source_chinese_col or not trans_chinese_col:
-                    raise Exception("无法找到中文列")
-
-                tasks[task_id]['progress'] = 30
-                tasks[task_id]['message'] = '正在构建源文件数据...'
-
-                # 读取源文件数据
-                source_data = []
-                for row in range(2, ws_source.max_row + 1):
-                    key_cell = ws_source.cell(row=row, column=1)
-                    if not key_cell.value:
-                        continue
-
-                    source_key = str(key_cell.value).strip()
-                    chinese_cell = ws_source.cell(row=row, column=source_chinese_col)
-                    chinese_value = str(chinese_cell.value) if chinese_cell.value else ""
-
-                    # 提取数字用于匹配
-                    numbers = re.findall(r'\d+', chinese_value)
-
-                    source_data.append({
-                        'key': source_key,
-                        'chinese': chinese_value,
-                        'numbers': numbers,
-                        'row': row,
-                        'translations': {}
-                    })
-
-                    # 读取所有语言的内容
-                    for lang, col in source_lang_map.items():
-                        cell = ws_source.cell(row=row, column=col)
-                        source_data[-1]['translations'][lang] = str(cell.value) if cell.value else ""
-
-                tasks[task_id]['progress'] = 40
-                tasks[task_id]['message'] = '正在构建翻译文件数据...'
-
-                # 读取翻译文件数据
-                trans_data = []
-                trans_by_key = {}
-                trans_by_chinese = {}  # 按中文内容索引
-
-                for row in range(2, ws_trans.max_row + 1):
-                    key_cell = ws_trans.cell(row=row, column=1)
-                    if not key_cell.value:
-                        continue
-
-                    trans_key = str(key_cell.value).strip()
-                    chinese_cell = ws_trans.cell(row=row, column=trans_chinese_col)
-                    chinese_value = str(chinese_cell.value) if chinese_cell.value else ""
-
-                    # 提取数字
-                    numbers = re.findall(r'\d+', chinese_value)
-
-                    item = {
-                        'key': trans_key,
-                        'chinese': chinese_value,
-                        'numbers': numbers,
-                        'row': row,
-                        'translations': {}
-                    }
-
-                    # 读取所有语言的内容
-                    for lang, col in trans_lang_map.items():
-                        cell = ws_trans.cell(row=row, column=col)
-                        item['translations'][lang] = str(cell.value) if cell.value else ""
-
-                    trans_data.append(item)
-                    trans_by_key[trans_key] = item
-
-                    # 按中文内容建立索引
-                    if chinese_value:
-                        # 按完整内容索引
-                        if chinese_value not in trans_by_chinese:
-                            trans_by_chinese[chinese_value] = []
-                        trans_by_chinese[chinese_value].append(item)
-
-                tasks[task_id]['progress'] = 50
-                tasks[task_id]['message'] = '正在创建匹配器...'
-
-                # 创建匹配器
-                matcher = ErrorCodeMatcher(
-                    threshold=threshold,
-                    ignore_case=ignore_case,
-                    ignore_special_chars=ignore_special_chars,
-                    extract_numbers=extract_numbers
-                )
-
-                tasks[task_id]['progress'] = 60
-                tasks[task_id]['message'] = '正在进行键名+中文匹配...'
-
-                # 第一步：按键名+中文进行匹配
-                matches = []
-                key_matches = {}  # 记录每个源键名匹配到的翻译键名
-                current_row = 2
-
-                for source_item in source_data:
-                    source_key = source_item['key']
-                    source_chinese = source_item['chinese']
-
-                    # 记录起始行
-                    if source_key not in key_matches:
-                        key_matches[source_key] = {
-                            'matched_key': '未匹配',
-                            'match_type': '无匹配',
-                            'similarity': 0,
-                            'start_row': current_row,
-                            'end_row': current_row + len(selected_languages) - 1
-                        }
-
-                    # 尝试匹配
-                    best_match = None
-                    best_similarity = 0
-
-                    # 1. 先尝试精确匹配键名
-                    if source_key in trans_by_key:
-                        trans_item = trans_by_key[source_key]
-                        trans_chinese = trans_item['chinese']
-
-                        if source_chinese and trans_chinese:
-                            similarity = matcher.calculate_similarity(source_chinese, trans_chinese)
-                            if similarity >= threshold:
-                                best_match = trans_item
-                                best_similarity = similarity
-                                match_type = '键名+中文精确匹配'
-
-                    # 2. 如果键名不匹配，尝试通过中文内容匹配
-                    if not best_match and source_chinese:
-                        # 先找相同数字的
-                        if source_item['numbers']:
-                            for num in source_item['numbers']:
-                                for trans_item in trans_data:
-                                    if num in trans_item['numbers']:
-                                        similarity = matcher.calculate_similarity(source_chinese, trans_item['chinese'])
-                                        if similarity > best_similarity and similarity >= threshold:
-                                            best_similarity = similarity
-                                            best_match = trans_item
-                                            match_type = '数字匹配'
-
-                        # 如果没找到，找相似内容的
-                        if not best_match:
-                            for trans_item in trans_data:
-                                if trans_item['chinese']:
-                                    similarity = matcher.calculate_similarity(source_chinese, trans_item['chinese'])
-                                    if similarity > best_similarity and similarity >= threshold:
-                                        best_similarity = similarity
-                                        best_match = trans_item
-                                        match_type = '内容模糊匹配'
-
-                    # 更新匹配结果
-                    if best_match:
-                        key_matches[source_key]['matched_key'] = best_match['key']
-                        key_matches[source_key]['match_type'] = match_type
-                        key_matches[source_key]['similarity'] = best_similarity
-                        key_matches[source_key]['trans_item'] = best_match
-
-                tasks[task_id]['progress'] = 70
-                tasks[task_id]['message'] = '正在对比各语言内容...'
-
-                # 第二步：根据匹配到的键名，对比所有语言
-                exact_matches = 0
-                content_matches = 0
-                unmatched = 0
-
-                for source_item in source_data:
-                    source_key = source_item['key']
-                    match_info = key_matches[source_key]
-                    matched_key = match_info['matched_key']
-                    trans_item = match_info.get('trans_item')
-
-                    for lang in selected_languages:
-                        source_value = source_item['translations'].get(lang, '')
-                        trans_value = ''
-
-                        if trans_item and lang in trans_item['translations']:
-                            trans_value = trans_item['translations'][lang]
-
-                        # 判断匹配类型
-                        if matched_key != '未匹配' and trans_item:
-                            if source_value and trans_value and source_value == trans_value:
-                                match_type = f'内容一致'
-                                exact_matches += 1
-                            elif source_value and trans_value:
-                                match_type = f'内容不一致'
-                                content_matches += 1
-                            elif source_value and not trans_value:
-                                match_type = f'翻译缺失'
-                                unmatched += 1
-                            elif not source_value and trans_value:
-                                match_type = f'源文件缺失'
-                                unmatched += 1
-                            else:
-                                match_type = f'均为空'
-                                unmatched += 1
-                        else:
-                            match_type = f'键名未匹配'
-                            unmatched += 1
-
-                        matches.append({
-                            'source_key': source_key,
-                            'matched_key': matched_key,
-                            'lang': lang,
-                            'source_value': source_value,
-                            'trans_value': trans_value,
-                            'match_type': match_type,
-                            'row': current_row
-                        })
-                        current_row += 1
-
-                tasks[task_id]['progress'] = 85
-                tasks[task_id]['message'] = '正在生成结果文件...'
-
-                # 创建结果Excel文件
-                wb = openpyxl.Workbook()
-                ws = wb.active
-                ws.title = "错误码校对结果"
-
-                # 设置表头
-                headers = ["源文件键名", "匹配键名", "语言", "源文件错误码", "翻译错误码", "匹配类型"]
-                ws.append(headers)
-
-                # 设置表头样式
-                header_font = Font(bold=True, size=12)
-                header_fill = PatternFill(start_color='FFD3D3D3', end_color='FFD3D3D3', fill_type='solid')
-                for col in range(1, len(headers) + 1):
-                    cell = ws.cell(row=1, column=col)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = Alignment(horizontal='center')
-
-                # 设置列宽
-                ws.column_dimensions['A'].width = 25
-                ws.column_dimensions['B'].width = 25
-                ws.column_dimensions['C'].width = 20
-                ws.column_dimensions['D'].width = 30
-                ws.column_dimensions['E'].width = 30
-                ws.column_dimensions['F'].width = 20
-
-                # 定义颜色样式
-                green_fill = PatternFill(start_color='8FBC8F', end_color='8FBC8F', fill_type='solid')
-                yellow_fill = PatternFill(start_color='FFF68F', end_color='FFF68F', fill_type='solid')
-                blue_fill = PatternFill(start_color='87CEFA', end_color='87CEFA', fill_type='solid')
-                red_fill = PatternFill(start_color='CD0000', end_color='CD0000', fill_type='solid')
-
-                # 写入数据
-                for match in matches:
-                    row = [
-                        match['source_key'],
-                        match['matched_key'],
-                        match['lang'],
-                        match['source_value'],
-                        match['trans_value'],
-                        match['match_type']
-                    ]
-                    ws.append(row)
-
-                    # 设置行样式
-                    current_row = ws.max_row
-                    match_type = match['match_type']
-
-                    if '内容一致' in match_type:
-                        for col in range(4, 6):
-                            ws.cell(row=current_row, column=col).fill = green_fill
-                    elif '内容不一致' in match_type:
-                        for col in range(4, 6):
-                            ws.cell(row=current_row, column=col).fill = yellow_fill
-                    elif '缺失' in match_type:
-                        for col in range(4, 6):
-                            ws.cell(row=current_row, column=col).fill = red_fill
-
-                        # 合并源文件键名和匹配键名的单元格
-                        current_source_key = None
-                        start_row = 2
-                        end_row = 2
-
-                        # 先对matches按source_key排序，确保同一个键的行是连续的
-                        for i, match in enumerate(matches):
-                            if current_source_key is None:
-                                current_source_key = match['source_key']
-                                start_row = match['row']
-
-                            # 如果是最后一个元素或者下一个键不同，执行合并
-                            if i == len(matches) - 1 or matches[i + 1]['source_key'] != current_source_key:
-                                end_row = match['row']
-
-                                if end_row > start_row:
-                                    # 合并源文件键名列
-                                    ws.merge_cells(start_row=start_row, start_column=1, end_row=end_row, end_column=1)
-                                    cell = ws.cell(row=start_row, column=1)
-                                    cell.font = Font(bold=True)
-                                    cell.alignment = Alignment(vertical='center', horizontal='left')
-
-                                    # 合并匹配键名列
-                                    ws.merge_cells(start_row=start_row, start_column=2, end_row=end_row, end_column=2)
-                                    cell = ws.cell(row=start_row, column=2)
-                                    cell.font = Font(bold=True)
-
-                                    # 在匹配键名后添加匹配信息
-                                    match_info = key_matches.get(current_source_key, {})
-                                    if match_info.get('matched_key') != '未匹配':
-                                        cell.font = Font(bold=True, color='006400')
-                                        # 在H列添加详细匹配信息
-                                        info_cell = ws.cell(row=start_row, column=8)
-                                        info_cell.value = f"匹配方式: {match_info.get('match_type', '未知')}, 相似度: {match_info.get('similarity', 0)}%"
-                                        info_cell.font = Font(italic=True, size=9)
-                                    else:
-                                        cell.font = Font(bold=True, color='FF0000')
-
-                                # 重置，准备处理下一个键
-                                if i < len(matches) - 1:
-                                    current_source_key = matches[i + 1]['source_key']
-                                    start_row = matches[i + 1]['row']
-
-
-                        # 根据匹配类型设置颜色
-                        if match_info['matched_key'] != '未匹配':
-                            cell.font = Font(bold=True, color='006400')
-                            # 在合并单元格的旁边添加匹配信息
-                            info_cell = ws.cell(row=start_row, column=7)
-                            info_cell.value = f"匹配方式: {match_info['match_type']}, 相似度: {match_info['similarity']}%"
-                            info_cell.font = Font(italic=True, size=10)
-
-                # 添加统计信息
-                summary_row = ws.max_row + 3
-                ws.cell(row=summary_row, column=1).value = "统计信息"
-                ws.cell(row=summary_row, column=1).font = Font(bold=True, size=14)
-
-                total_items = len(source_data) * len(selected_languages)
-                matched_keys = sum(1 for info in key_matches.values() if info['matched_key'] != '未匹配')
-
-                stats = [
-                    f"总键数: {len(source_data)}",
-                    f"匹配到的键数: {matched_keys}",
-                    f"键匹配率: {(matched_keys / len(source_data) * 100):.1f}%",
-                    f"总语言项数: {total_items}",
-                    f"内容一致项: {exact_matches}",
-                    f"内容不一致项: {content_matches}",
-                    f"未匹配项: {unmatched}",
-                    f"内容匹配率: {((exact_matches + content_matches) / total_items * 100):.1f}%",
-                    f"匹配阈值: {threshold}%"
-                ]
-
-                for i, stat in enumerate(stats):
-                    ws.cell(row=summary_row + 1 + i, column=1).value = stat
-
-                # 保存文件
-                output_filename = f"error_check_{timestamp}.xlsx"
-                output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-                wb.save(output_path)
-
-                tasks[task_id].update({
-                    'progress': 100,
-                    'status': 'completed',
-                    'message': f'校对完成！总键数: {len(source_data)}, 匹配键数: {matched_keys}, 内容一致: {exact_matches}',
-                    'filename': output_filename,
-                    'download_url': f'/download/{output_filename}',
-                    'result': {
-                        'statistics': {
-                            'total_keys': len(source_data),
-                            'matched_keys': matched_keys,
-                            'key_match_rate': round(matched_keys / len(source_data) * 100, 1),
-                            'total_items': total_items,
-                            'exact_matches': exact_matches,
-                            'content_matches': content_matches,
-                            'unmatched': unmatched,
-                            'item_match_rate': round((exact_matches + content_matches) / total_items * 100, 1)
-                        }
-                    }
-                })
+        def on_done(result):
+            result_path = os.path.join(output_dir, result['filename'])
+            result_cache.put(cache_key, result_path, {
+                'message': result['message'],
+                'result': result['result']
+            })
+            storage.add(result_path)
 
-            except Exception as e:
-                logger.error(f"错误码校对失败: {e}")
-                import traceback
-                traceback.print_exc()
-                tasks[task_id].update({
-                    'progress': 0,
-                    'status': 'error',
-                    'message': str(e)
-                })
-            finally:
-                # 清理临时文件
-                try:
-                    wb_source.close()
-                    wb_trans.close()
-                    if os.path.exists(source_path):
-                        os.remove(source_path)
-                    if os.path.exists(trans_path):
-                        os.remove(trans_path)
-                except:
-                    pass
-
-        thread = threading.Thread(target=process_error_task)
-        thread.daemon = True
-        thread.start()
+        try:
+            scheduler.submit(task_id, run_error_code_job, source_path, trans_path, selected_languages,
+                             options, task_id, output_dir, timestamp,
+                             message='错误码校对任务已创建', on_done=on_done,
+                             metrics=request_metrics.to_dict())
+        except QueueFullError as e:
+            remove_files(source_path, trans_path)
+            return jsonify({'error': f'服务器繁忙，请稍后再试: {e}'}), 503
 
         return jsonify({
             'success': True,
@@ -1686,6 +2079,8 @@ def error_code_check():
             'message': '错误码校对任务已启动'
         })
 
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         logger.error(f"启动错误码校对任务失败: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1697,4 +2092,8 @@ if __name__ == '__main__':
     print(f"局域网访问: http://{local_ip}:5000")
     print(f"临时文件目录: {app.config['UPLOAD_FOLDER']}")
     print(f"支持语言: {', '.join(LANGUAGE_ORDER[:5])}...")
-    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
+    use_reloader = True  # 调试模式下修改代码后自动重启
+    # 启用自动重载时，监视进程只负责重启，服务对象只在处理请求的子进程（WERKZEUG_RUN_MAIN）中创建
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_server()
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True, use_reloader=use_reloader)
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""
+Muti_Web 的 ASGI 入口
+
+与 app.py 使用同一组 Flask 路由，由 ASGI 服务器（如 uvicorn）在事件循环中接收连接：
+- 请求体在事件循环中异步接收，写入临时文件（小于 ASGI_SPOOL_SIZE 时在内存中），
+  上传慢的客户端只占用一个协程，不占用线程，不会挡住其他用户的请求
+- 请求体超过该接口的上传大小限制（ENDPOINT_MAX_CONTENT_LENGTH）时提前返回 413，不再继续接收
+- 请求体接收完整后，在线程池（ASGI_THREADS）中调用 Flask 处理（解析、写 Excel 等 CPU 工作），
+  Excel对比、错误码校对仍提交给任务调度器的工作进程
+- 响应体在另一个线程池（ASGI_STREAM_THREADS）中逐块读取后发送，
+  下载和进度事件流这类长时间的响应不会占满处理请求的线程池；客户端断开后停止读取
+
+运行方式：
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import logging
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.wsgi import FileWrapper
+
+import app as web_app
+
+logger = logging.getLogger(__name__)
+
+# 发送文件时每次读取的字节数（每块需要一次线程切换，比 WSGI 默认的 8KB 大）
+FILE_BLOCK_SIZE = 256 * 1024
+
+
+class _BlockFileWrapper(FileWrapper):
+    """wsgi.file_wrapper：按 FILE_BLOCK_SIZE 读取文件"""
+
+    def __init__(self, file, buffer_size=8192):
+        super().__init__(file, max(buffer_size, FILE_BLOCK_SIZE))
+
+
+async def wait_for_disconnect(receive):
+    """等待客户端断开；未接收的请求体消息（如超限时不再读取的上传）直接丢弃"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+class WsgiBridge:
+    """把 WSGI 应用挂到 ASGI 服务器上：异步接收请求体，在线程池中执行应用并读取响应"""
+
+    def __init__(self, wsgi_app, max_threads=32, stream_threads=64, spool_size=1024 * 1024):
+        self.app = wsgi_app
+        self.spool_size = spool_size
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi-handler')
+        self.stream_executor = ThreadPoolExecutor(max_workers=stream_threads, thread_name_prefix='asgi-stream')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.handle_lifespan(receive, send)
+
+    async def handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.stream_executor.shutdown(wait=False, cancel_futures=True)
+
+    def body_limit(self, scope):
+        """按请求的接口返回上传大小限制（与 ToolRequest.max_content_length 一致）"""
+        config = web_app.app.config
+        try:
+            endpoint, _ = web_app.app.url_map.bind('').match(scope['path'], method=scope['method'])
+        except HTTPException:
+            endpoint = None  # 404、405、重定向等交给 Flask 处理
+        return config['ENDPOINT_MAX_CONTENT_LENGTH'].get(endpoint, config['MAX_CONTENT_LENGTH'])
+
+    async def handle_http(self, scope, receive, send):
+        headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']]
+        declared = next((value for name, value in headers if name.lower() == 'content-length'), None)
+        limit = self.body_limit(scope)
+
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        try:
+            if declared is not None and limit is not None and declared.isdigit() and int(declared) > limit:
+                # 声明的长度已超限：不接收请求体，由 Flask 按原有方式返回 413
+                length = int(declared)
+            else:
+                length = await self.receive_body(receive, body, limit)
+                if length is None:
+                    await self.send_response(send, RequestEntityTooLarge(), {}, None)
+                    return
+                if length < 0:
+                    return  # 客户端在上传过程中断开
+            body.seek(0)
+            environ = self.build_environ(scope, headers, body, length)
+            await self.run_app(environ, receive, send)
+        finally:
+            body.close()
+
+    async def receive_body(self, receive, body, limit):
+        """接收请求体写入 body，返回总字节数；超过 limit 返回 None，客户端断开返回 -1"""
+        length = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return -1
+            chunk = message.get('body', b'')
+            if chunk:
+                length += len(chunk)
+                if limit is not None and length > limit:
+                    return None
+                body.write(chunk)
+            if not message.get('more_body', False):
+                return length
+
+    def build_environ(self, scope, headers, body, length):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(length),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': _BlockFileWrapper,
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_LENGTH':
+                continue
+            if key != 'CONTENT_TYPE':
+                key = 'HTTP_' + key
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    async def run_app(self, environ, receive, send):
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            if exc_info and started.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            started['status'] = status
+            started['headers'] = response_headers
+
+        try:
+            iterable = await loop.run_in_executor(self.executor, self.app, environ, start_response)
+        except Exception as e:
+            logger.error(f"请求处理出错: {e}")
+            await self.send_response(send, None, {}, None, status=500)
+            return
+        await self.send_response(send, iterable, started, receive)
+
+    async def send_response(self, send, iterable, started, receive, status=None):
+        """发送 WSGI 响应；iterable 为 werkzeug 异常时发送其默认响应"""
+        if isinstance(iterable, RequestEntityTooLarge):
+            response = iterable.get_response()
+            status = response.status_code
+            started = {'headers': list(response.headers.items())}
+            iterable = [response.get_data()]
+        elif iterable is None:
+            started = {'headers': [('Content-Type', 'text/plain; charset=utf-8')]}
+            iterable = ['服务器内部错误'.encode('utf-8')]
+        loop = asyncio.get_running_loop()
+        iterator = iter(iterable)
+        # 监听客户端断开；请求体未读取（声明的长度已超限）时 receive() 先返回剩余的请求体消息
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive)) if receive is not None else None
+        sentinel = object()
+        try:
+            # 先取第一块：Flask 可能在迭代开始时才调用 start_response
+            chunk = await loop.run_in_executor(self.stream_executor, next, iterator, sentinel)
+            if status is None:
+                status = int(started['status'].split(' ', 1)[0])
+            started['sent'] = True
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': [(name.lower().encode('latin-1'), str(value).encode('latin-1'))
+                            for name, value in started['headers']],
+            })
+            while chunk is not sentinel:
+                if disconnect is not None and disconnect.done():
+                    return
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': bytes(chunk), 'more_body': True})
+                chunk = await loop.run_in_executor(self.stream_executor, next, iterator, sentinel)
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if disconnect is not None and not disconnect.done():
+                disconnect.cancel()
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                # 释放下载持有的存储引用等；放到线程池中，避免阻塞事件循环
+                await loop.run_in_executor(self.stream_executor, close)
+
+
+web_app.init_server()
+application = WsgiBridge(
+    web_app.app,
+    max_threads=web_app.app.config['ASGI_THREADS'],
+    stream_threads=web_app.app.config['ASGI_STREAM_THREADS'],
+    spool_size=web_app.app.config['ASGI_SPOOL_SIZE'],
+)
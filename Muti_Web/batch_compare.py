@@ -0,0 +1,269 @@
+"""
+Excel对比的批量任务
+
+一次提交多对源文件/翻译文件（zip 压缩包或多文件表单），共用同一组语言选择：
+- 配对规则：只有一个源文件时所有翻译文件都与它对比；否则同名文件配对，名称对不上时按上传顺序配对
+- 压缩包中 source/（或 源文件/）目录下为源文件，trans/（或 翻译文件/）目录下为翻译文件
+- 每对文件作为一个普通对比任务提交给任务调度器，同时最多提交 max_parallel 个，
+  一个结束后再提交下一个，批量任务不会占满任务队列
+- 共用同一源文件的对比按内容哈希复用工作进程中已解析的源文件表
+- 全部结束后汇总各对文件的统计，生成一份汇总报告
+"""
+
+import logging
+import os
+import shutil
+import threading
+import zipfile
+from collections import deque
+
+from job_scheduler import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+EXCEL_SUFFIXES = ('.xlsx', '.xlsm')
+
+# 压缩包中的目录名 -> 文件角色
+ARCHIVE_DIRS = {
+    'source': 'source', '源文件': 'source',
+    'trans': 'trans', 'translation': 'trans', '翻译文件': 'trans',
+}
+
+# 汇总报告中逐项相加的统计字段
+STATISTIC_FIELDS = ('total_keys', 'trans_keys', 'matched_keys', 'total_comparisons',
+                    'equal', 'different', 'both_empty', 'missing_key', 'missing_column')
+
+
+class BatchError(Exception):
+    """批量对比请求无效"""
+
+    status_code = 400
+
+
+class BatchPair:
+    """批量任务中的一对文件及其对比任务的状态"""
+
+    __slots__ = ('index', 'name', 'source_name', 'source_path', 'trans_path',
+                 'digests', 'task_id', 'status', 'fields')
+
+    def __init__(self, index, name, source_name, source_path, trans_path):
+        self.index = index
+        self.name = name
+        self.source_name = source_name
+        self.source_path = source_path
+        self.trans_path = trans_path
+        self.digests = {}  # 路径 -> SHA-256
+        self.task_id = None
+        self.status = 'waiting'  # waiting / processing / completed / error / cancelled
+        self.fields = {}
+
+    @property
+    def source_digest(self):
+        return self.digests.get(self.source_path)
+
+    def to_dict(self):
+        report = {
+            'name': self.name,
+            'source': self.source_name,
+            'task_id': self.task_id,
+            'status': self.status,
+            'message': self.fields.get('message', ''),
+        }
+        for field in ('filename', 'download_url', 'sidecar_url'):
+            if self.fields.get(field):
+                report[field] = self.fields[field]
+        statistics = self.fields.get('result', {}).get('statistics')
+        if statistics:
+            report['statistics'] = statistics
+        return report
+
+
+def pair_files(sources, translations):
+    """把 [(文件名, 路径), ...] 形式的源文件和翻译文件配对，返回 BatchPair 列表"""
+    if not sources or not translations:
+        raise BatchError("请至少上传一个源文件和一个翻译文件")
+
+    if len(sources) == 1:
+        matched = [(sources[0], trans) for trans in translations]
+    else:
+        by_name = {name.lower(): (name, path) for name, path in sources}
+        if all(name.lower() in by_name for name, _ in translations):
+            matched = [(by_name[name.lower()], (name, path)) for name, path in translations]
+        elif len(sources) == len(translations):
+            matched = list(zip(sources, translations))
+        else:
+            raise BatchError(f"无法配对：{len(sources)} 个源文件、{len(translations)} 个翻译文件，"
+                             f"文件名也不一致")
+
+    return [BatchPair(index, trans_name, source_name, source_path, trans_path)
+            for index, ((source_name, source_path), (trans_name, trans_path)) in enumerate(matched)]
+
+
+def extract_archive(archive_path, dest_dir, max_bytes):
+    """解压批量对比的压缩包，返回 (源文件列表, 翻译文件列表)，元素为 (包内文件名, 解压路径)
+
+    只解压 source/ 与 trans/ 目录下的 Excel 文件，解压路径由序号生成，不使用包内路径；
+    解压后的总字节数超过 max_bytes 时中止。
+    """
+    try:
+        archive = zipfile.ZipFile(archive_path)
+    except zipfile.BadZipFile:
+        raise BatchError("压缩包无效，请上传 zip 文件")
+
+    found = {'source': [], 'trans': []}
+    remaining = max_bytes
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            parts = [part for part in info.filename.replace('\\', '/').split('/') if part]
+            if (not parts or parts[0] == '__MACOSX' or parts[-1].startswith('.')
+                    or not parts[-1].lower().endswith(EXCEL_SUFFIXES)):
+                continue
+            role_index = next((i for i, part in enumerate(parts[:-1]) if part.lower() in ARCHIVE_DIRS), None)
+            if role_index is None:
+                continue
+            role = ARCHIVE_DIRS[parts[role_index].lower()]
+            if info.file_size > remaining:
+                raise BatchError(f"压缩包解压后过大（上限 {max_bytes // 1024 // 1024}MB）")
+
+            role_dir = os.path.join(dest_dir, role)
+            os.makedirs(role_dir, exist_ok=True)
+            path = os.path.join(role_dir, f"{len(found[role])}{os.path.splitext(parts[-1])[1].lower()}")
+            with archive.open(info) as src, open(path, 'wb') as dst:
+                # 按实际解压的字节数计数，不只相信包内记录的大小
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    if remaining < 0:
+                        raise BatchError(f"压缩包解压后过大（上限 {max_bytes // 1024 // 1024}MB）")
+                    dst.write(chunk)
+            found[role].append(('/'.join(parts[role_index + 1:]), path))
+
+    for files in found.values():
+        files.sort(key=lambda item: item[0].lower())
+    return found['source'], found['trans']
+
+
+class CompareBatch:
+    """批量对比的调度状态
+
+    submit(pair) 提交一对文件的对比任务：已提交时返回 None，结果缓存命中时直接返回最终状态字典，
+    队列已满时抛出 QueueFullError。每对文件结束后调用 pair_finished；全部结束时调用一次 on_complete(batch)。
+    """
+
+    def __init__(self, batch_id, pairs, work_dir, submit, on_complete, max_parallel=1):
+        self.batch_id = batch_id
+        self.pairs = list(pairs)
+        self.work_dir = work_dir
+        self.max_parallel = max(1, max_parallel)
+        self.cancelled = False
+        self._submit = submit
+        self._on_complete = on_complete
+        self._waiting = deque(self.pairs)
+        self._running = 0
+        self._finished = 0
+        self._completed = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._fill()
+
+    def _fill(self):
+        """提交等待中的文件对，直到达到并行上限"""
+        while True:
+            with self._lock:
+                if self.cancelled or self._running >= self.max_parallel or not self._waiting:
+                    break
+                pair = self._waiting.popleft()
+                pair.status = 'processing'
+                self._running += 1
+            try:
+                fields = self._submit(pair)
+            except QueueFullError as e:
+                with self._lock:
+                    self._running -= 1
+                    pair.status = 'waiting'
+                    self._waiting.appendleft(pair)
+                    if self._running:
+                        break  # 等本批其他任务结束后再提交
+                    # 本批没有运行中的任务可以等待，剩余的文件对都记为失败
+                    failed = list(self._waiting)
+                    self._waiting.clear()
+                for pair in failed:
+                    self._record(pair, {'status': 'error', 'message': f'服务器繁忙: {e}'}, running=False)
+                break
+            except Exception as e:
+                logger.error(f"提交批量对比任务失败 {pair.name}: {e}")
+                fields = {'status': 'error', 'message': str(e)}
+            if fields is not None:
+                self._record(pair, fields)
+        self._check_complete()
+
+    def pair_finished(self, pair, fields):
+        """一对文件的对比任务已结束（由任务调度器在主进程中回调）"""
+        self._record(pair, fields)
+        self._fill()
+
+    def _record(self, pair, fields, running=True):
+        with self._lock:
+            pair.fields = dict(fields)
+            pair.status = fields.get('status', 'error')
+            self._finished += 1
+            if running:
+                self._running -= 1
+
+    def _check_complete(self):
+        with self._lock:
+            if self._completed or self._running or (self._waiting and not self.cancelled):
+                return
+            self._completed = True
+        self._on_complete(self)
+
+    def cancel(self):
+        """取消批量任务：等待中的文件对直接记为取消，返回需要取消的运行中任务 ID"""
+        with self._lock:
+            self.cancelled = True
+            waiting = list(self._waiting)
+            self._waiting.clear()
+            running = [pair.task_id for pair in self.pairs if pair.status == 'processing' and pair.task_id]
+        for pair in waiting:
+            self._record(pair, {'status': 'cancelled', 'message': '任务已取消'}, running=False)
+        self._check_complete()
+        return running
+
+    @property
+    def finished_count(self):
+        return self._finished
+
+    def progress_fields(self):
+        """批量任务的进度状态"""
+        total = len(self.pairs)
+        return {
+            'progress': int(self._finished / total * 100) if total else 100,
+            'message': f'已完成 {self._finished}/{total} 对文件',
+            'reports': self.reports(),
+        }
+
+    def reports(self):
+        return [pair.to_dict() for pair in self.pairs]
+
+    def statistics(self):
+        """全部文件对的合计统计"""
+        totals = {'pairs': len(self.pairs), 'completed': 0, 'failed': 0}
+        totals.update((field, 0) for field in STATISTIC_FIELDS)
+        for pair in self.pairs:
+            if pair.status == 'completed':
+                totals['completed'] += 1
+            else:
+                totals['failed'] += 1
+            statistics = pair.fields.get('result', {}).get('statistics', {})
+            for field in STATISTIC_FIELDS:
+                totals[field] += statistics.get(field, 0)
+        return totals
+
+    def cleanup(self):
+        """删除批量任务的上传文件"""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
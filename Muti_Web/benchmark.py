@@ -0,0 +1,734 @@
+"""
+Muti_Web 性能基准测试
+
+用法：
+    python benchmark.py similarity --size 10000
+    python benchmark.py match --size 10000
+    python benchmark.py features --size 5000
+    python benchmark.py output --rows 400000
+    python benchmark.py convert --megabytes 32
+    python benchmark.py compare --keys 50000 --langs 21
+    python benchmark.py logging --keys 20000 --langs 21
+    python benchmark.py server --uploaders 20 --clients 8 --seconds 20
+
+每个子命令生成可复现的随机数据，输出各实现的耗时和加速比。
+纯 Python 实现太慢时只跑 --sample 个源条目，再按比例推算全量耗时。
+"""
+
+import argparse
+import http.client
+import importlib.util
+import io
+import os
+import re
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from similarity import available_engines, get_engine
+
+WORDS = ['nozzle', 'clog', 'timeout', 'filament', 'runout', 'heater', 'error', 'motor',
+         'sensor', 'fan', '错误', '超时', '喷嘴', '堵塞', '温度', '电机']
+PREFIXES = ['E', 'W', 'ERR', 'Key', '']
+
+
+def make_codes(count, seed=0, numeric_ratio=0.7):
+    """生成 count 个错误码样式的字符串：带数字的错误码和纯文本描述混合"""
+    rng = random.Random(seed)
+    codes = []
+    for _ in range(count):
+        if rng.random() < numeric_ratio:
+            code = f"{rng.choice(PREFIXES)}{rng.randint(100, 9999)}"
+            if rng.random() < 0.3:
+                code += rng.choice(['A', 'B', ' ' + rng.choice(WORDS)])
+        else:
+            code = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        codes.append(code)
+    return codes
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def report(title, timings):
+    """打印耗时表，以第一项为基准计算加速比"""
+    print(f"\n{title}")
+    baseline = timings[0][1]
+    for name, seconds in timings:
+        print(f"  {name:<24} {seconds:10.3f} 秒   x{baseline / seconds if seconds else float('inf'):.1f}")
+
+
+def bench_similarity(args):
+    """size×size 的全量相似度矩阵"""
+    sources = make_codes(args.size, seed=1)
+    targets = make_codes(args.size, seed=2)
+    print(f"相似度矩阵: {args.size} x {args.size} = {args.size * args.size:,} 对")
+
+    timings = []
+    for name in available_engines():
+        engine = get_engine(name)
+        rows = sources if name != 'difflib' else sources[:args.sample]
+        seconds, _ = timed(lambda: [engine.ratios(query, targets) for query in rows])
+        timings.append((name, seconds * len(sources) / len(rows)))
+        if len(rows) < len(sources):
+            print(f"  {name}: 抽样 {len(rows)} 行，按比例推算全量耗时")
+    report("全量相似度矩阵耗时:", timings)
+
+
+def bench_match(args):
+    """ErrorCodeMatcher.find_best_match：建索引后逐个匹配，分别使用各相似度引擎"""
+    import app as web_app
+
+    sources = make_codes(args.size, seed=3)
+    trans_codes = {f"T{i}": code for i, code in enumerate(make_codes(args.size, seed=4))}
+    rows = sources[:args.sample]
+    print(f"错误码匹配: {args.size} 个源错误码 x {len(trans_codes)} 个翻译错误码（抽样 {len(rows)} 个源）")
+
+    timings = []
+    for name in available_engines():
+        matcher = web_app.ErrorCodeMatcher(threshold=80, engine=name)
+        index_seconds, index = timed(matcher.build_index, trans_codes)
+        match_seconds, _ = timed(lambda: [matcher.find_best_match(code, index) for code in rows])
+        timings.append((f"索引 + {name}", index_seconds + match_seconds * len(sources) / len(rows)))
+    report("全量匹配耗时（含建索引）:", timings)
+
+
+class CountingRe:
+    """统计调用次数的正则函数：包装 re 模块（原有写法）或预编译的正则（特征记录写法）"""
+
+    def __init__(self, target, counter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        function = getattr(self._target, name)
+
+        def counted(*args, **kwargs):
+            self._counter[0] += 1
+            return function(*args, **kwargs)
+        return counted
+
+
+def make_legacy_matcher(web_app, counter, **options):
+    """原有写法的错误码匹配器：每次计算相似度都对两个错误码重新执行正则"""
+    legacy_re = CountingRe(re, counter)
+
+    class LegacyErrorCodeMatcher(web_app.ErrorCodeMatcher):
+        def normalize_error_code(self, code):
+            if not code:
+                return ""
+            code_str = str(code)
+            if self.ignore_case:
+                code_str = code_str.lower()
+            if self.ignore_special_chars:
+                code_str = legacy_re.sub(r'[^\w\s]', '', code_str)
+            return code_str.strip()
+
+        def extract_numbers_only(self, code):
+            if not code:
+                return []
+            return [int(num) for num in legacy_re.findall(r'\d+', str(code))]
+
+        def extract_prefix(self, code):
+            if not code:
+                return ""
+            match = legacy_re.match(r'^([A-Za-z]+)', str(code))
+            if match:
+                return match.group(1).lower() if self.ignore_case else match.group(1)
+            return ""
+
+        def calculate_similarity(self, code1, code2):
+            if not code1 or not code2:
+                return 0
+            str1, str2 = str(code1), str(code2)
+            if str1 == str2 or (self.ignore_case and str1.lower() == str2.lower()):
+                return 100
+            nums1, nums2 = self.extract_numbers_only(str1), self.extract_numbers_only(str2)
+            prefix1, prefix2 = self.extract_prefix(str1), self.extract_prefix(str2)
+            if nums1 and nums2:
+                if nums1 != nums2:
+                    if len(nums1) == 1 and len(nums2) == 1:
+                        num1_str, num2_str = str(nums1[0]), str(nums2[0])
+                        if num2_str.startswith(num1_str) or num1_str.startswith(num2_str):
+                            if prefix1 and prefix2 and prefix1 == prefix2:
+                                base_score = 70
+                            elif prefix1 and prefix2:
+                                base_score = 40
+                            else:
+                                base_score = 50
+                            text1 = legacy_re.sub(r'\d+', '', str1).strip()
+                            text2 = legacy_re.sub(r'\d+', '', str2).strip()
+                            if text1 and text2:
+                                return min(100, base_score + self.engine.ratio(text1, text2) * 100 * 0.3)
+                            return base_score
+                    return 0
+            elif nums1 or nums2:
+                return 0
+            norm1, norm2 = self.normalize_error_code(str1), self.normalize_error_code(str2)
+            if not norm1 or not norm2:
+                return 0
+            return round(self.engine.ratio(norm1, norm2) * 100, 2)
+
+    return LegacyErrorCodeMatcher(**options)
+
+
+def bench_features(args):
+    """错误码特征记录：逐对计算相似度时的正则调用次数和耗时（原有写法 vs 每个错误码只提取一次特征）"""
+    import app as web_app
+
+    sources = make_codes(args.size, seed=3)[:args.sample]
+    targets = make_codes(args.size, seed=4)
+    # 与错误码校对的键名匹配相同：源错误码逐个与数字相关的候选计算相似度
+    by_number = {}
+    for code in targets:
+        for num in set(re.findall(r'\d+', code)):
+            by_number.setdefault(num, []).append(code)
+    pairs = [(source, target) for source in sources
+             for num in re.findall(r'\d+', source) for target in by_number.get(num, ())]
+    pairs += [(source, target) for source in sources[:20] for target in targets]  # 无数字的全量比较
+    print(f"错误码特征: {len(sources):,} 个源错误码，{len(targets):,} 个翻译错误码，{len(pairs):,} 对相似度计算")
+
+    options = dict(threshold=80, engine='difflib')
+    legacy_counter = [0]
+    legacy = make_legacy_matcher(web_app, legacy_counter, **options)
+    legacy_seconds, expected = timed(lambda: [legacy.calculate_similarity(a, b) for a, b in pairs])
+
+    counter = [0]
+    saved = {name: getattr(web_app, name) for name in ('NON_WORD_RE', 'DIGITS_RE', 'LETTER_PREFIX_RE')}
+    try:
+        for name, pattern in saved.items():
+            setattr(web_app, name, CountingRe(pattern, counter))
+        matcher = web_app.ErrorCodeMatcher(**options)
+        seconds, results = timed(lambda: [matcher.calculate_similarity(a, b) for a, b in pairs])
+    finally:
+        for name, pattern in saved.items():
+            setattr(web_app, name, pattern)
+    assert results == expected
+
+    print(f"\n  原有写法          {legacy_seconds:8.3f} 秒   正则调用 {legacy_counter[0]:>12,}")
+    print(f"  特征记录          {seconds:8.3f} 秒   正则调用 {counter[0]:>12,}"
+          f"   （{len(matcher._features):,} 个特征记录，正则调用减少 {legacy_counter[0] / max(1, counter[0]):.0f} 倍）")
+
+
+def make_result_rows(rows, langs_per_key, seed=5):
+    """生成对比结果行：(源键名, 翻译键名, 语言, 源内容, 翻译内容, 结果)"""
+    rng = random.Random(seed)
+    results = ["一致", "不一致", "键名缺失", "均为空"]
+    for i in range(rows):
+        key = f"KEY_{i // langs_per_key}"
+        text = ' '.join(rng.choice(WORDS) for _ in range(3))
+        yield key, key.lower(), f"lang{i % langs_per_key}", text, text, rng.choice(results)
+
+
+def write_cell_by_cell(path, rows, langs_per_key):
+    """原有写法：普通工作簿逐个单元格赋值和着色，最后逐个合并"""
+    import openpyxl
+    from openpyxl.styles import Alignment, Font, PatternFill
+
+    green = PatternFill(start_color='8FBC8F', end_color='8FBC8F', fill_type='solid')
+    red = PatternFill(start_color='CD0000', end_color='CD0000', fill_type='solid')
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["源文件键名", "翻译文件键名", "语言", "源文件内容", "翻译文件内容", "对比结果"])
+    row_num = 2
+    for _, _, lang, source, trans, result in make_result_rows(rows, langs_per_key):
+        ws.cell(row=row_num, column=1).value = ""
+        ws.cell(row=row_num, column=2).value = ""
+        ws.cell(row=row_num, column=3).value = lang
+        ws.cell(row=row_num, column=4).value = source
+        ws.cell(row=row_num, column=5).value = trans
+        fill = green if result == "一致" else red
+        ws.cell(row=row_num, column=4).fill = fill
+        ws.cell(row=row_num, column=5).fill = fill
+        ws.cell(row=row_num, column=6).value = result
+        row_num += 1
+    for start in range(2, row_num, langs_per_key):
+        end = min(start + langs_per_key, row_num) - 1
+        for col in (1, 2):
+            if end > start:
+                ws.merge_cells(start_row=start, start_column=col, end_row=end, end_column=col)
+            cell = ws.cell(row=start, column=col)
+            cell.value = f"KEY_{(start - 2) // langs_per_key}"
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(vertical='center')
+    wb.save(path)
+
+
+def write_streaming(path, rows, langs_per_key):
+    """只写模式流式写出，样式使用命名样式"""
+    import app as web_app
+    from report_writer import StreamingSheet
+
+    sheet = StreamingSheet("对比结果", ["源文件键名", "翻译文件键名", "语言", "源文件内容", "翻译文件内容", "对比结果"],
+                           widths=[30, 30, 20, 40, 40, 15], styles=web_app.COMPARE_STYLES,
+                           header_style='compare_header')
+    for i, (key, trans_key, lang, source, trans, result) in enumerate(make_result_rows(rows, langs_per_key)):
+        style = 'compare_match' if result == "一致" else 'compare_diff'
+        styles = {3: style, 4: style}
+        if i % langs_per_key == 0:
+            row_num = sheet.row_count + 1
+            sheet.merge(row_num, 1, row_num + langs_per_key - 1, 1)
+            sheet.merge(row_num, 2, row_num + langs_per_key - 1, 2)
+            styles.update({0: 'compare_key', 1: 'compare_key'})
+            sheet.append([key, trans_key, lang, source, trans, result], styles)
+        else:
+            sheet.append([None, None, lang, source, trans, result], styles)
+    sheet.save(path)
+
+
+def bench_output(args):
+    """结果工作簿写出：逐单元格着色 vs 只写模式流式写出"""
+    print(f"结果工作簿: {args.rows:,} 行，每个键 {args.langs} 种语言（原有写法抽样 {args.sample:,} 行）")
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        seconds, _ = timed(write_cell_by_cell, os.path.join(tmp_dir, 'old.xlsx'), args.sample, args.langs)
+        timings.append(("逐单元格 + merge_cells", seconds * args.rows / args.sample))
+        seconds, _ = timed(write_streaming, os.path.join(tmp_dir, 'new.xlsx'), args.rows, args.langs)
+        timings.append(("只写模式 + 命名样式", seconds))
+    print("  逐个 merge_cells 的耗时随合并区域数平方增长，按比例推算会低估原有写法")
+    report("写出耗时:", timings)
+
+
+def make_c_source(megabytes, languages=21, seed=6):
+    """生成语言头文件：多语言数组为主，夹杂注释、单字符串定义和转义字符"""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    i = 0
+    while size < megabytes * 1024 * 1024:
+        values = ', '.join(f'"{rng.choice(WORDS)} {i} \\"{rng.choice(WORDS)}\\""' for _ in range(languages))
+        part = f'/* 条目 {i} */\nconst char *str_key_{i}[MAX_LANGUAGE] = {{\n    {values}\n}};\n'
+        if i % 50 == 0:
+            part += f'const char *str_title_{i}[MAX_LANGUAGE] = "{rng.choice(WORDS)}";\n'
+        parts.append(part)
+        size += len(part.encode('utf-8'))
+        i += 1
+    return ''.join(parts)
+
+
+def regex_convert_rows(content, value_count):
+    """原有写法：多次整文件正则扫描"""
+    pattern = re.compile(
+        r'const\s+char\s*\*\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\[\s*MAX_LANGUAGE\s*\]\s*=\s*\{([^}]*)\}\s*;',
+        re.DOTALL | re.MULTILINE)
+    single_pattern = re.compile(
+        r'const\s+char\s*\*\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\[\s*MAX_LANGUAGE\s*\]\s*=\s*"([^"]*)"\s*;',
+        re.DOTALL | re.MULTILINE)
+    single_keys = {match.group(1).strip() for match in single_pattern.finditer(content)}
+    rows = []
+    for match in pattern.finditer(content):
+        key = match.group(1).strip()
+        if key in single_keys:
+            continue
+        values_block = match.group(2)
+        if ',' not in values_block and len(re.findall(r'"([^"\\]*(?:\\.[^"\\]*)*)"', values_block)) <= 1:
+            continue
+        values = re.findall(r'"((?:[^"\\]|\\.)*)"', values_block)
+        rows.append([key] + (values + [''] * value_count)[:value_count])
+    return rows
+
+
+def lexer_convert_rows(stream, value_count):
+    """单遍流式词法分析"""
+    from c_lexer import iter_definitions
+
+    single_keys = set()
+    rows = []
+    for definition in iter_definitions(stream):
+        if definition.size != 'MAX_LANGUAGE':
+            continue
+        if definition.kind == 'single':
+            single_keys.add(definition.name)
+        elif definition.commas or len(definition.values) > 1:
+            rows.append([definition.name] + (definition.values + [''] * value_count)[:value_count])
+    return [row for row in rows if row[0] not in single_keys]
+
+
+def bench_convert(args):
+    """代码转Excel的源码解析：多次正则扫描 vs 单遍流式词法分析（不含写出 Excel）"""
+    content = make_c_source(args.megabytes)
+    data = content.encode('utf-8')
+    print(f"语言头文件: {len(data) / 1024 / 1024:.1f} MB")
+
+    def regex_path():
+        return regex_convert_rows(io.BytesIO(data).read().decode('utf-8', errors='ignore'), 21)
+
+    def lexer_path():
+        return lexer_convert_rows(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='ignore'), 21)
+
+    regex_seconds, regex_rows = timed(regex_path)
+    lexer_seconds, lexer_rows = timed(lexer_path)
+    assert regex_rows == lexer_rows, "两种解析结果不一致"
+    print(f"  两种解析结果一致: {len(lexer_rows)} 个多语言条目")
+    report("解析耗时:", [("正则（整文件读入）", regex_seconds), ("流式词法分析", lexer_seconds)])
+
+    # 解析过程中除结果行以外的峰值内存（源文件字节本身不计入）
+    print("\n峰值内存:")
+    rows_bytes = peak_memory(lambda: [list(row) for row in lexer_rows])
+    for name, func in (("正则（整文件读入）", regex_path), ("流式词法分析", lexer_path)):
+        print(f"  {name:<24} {(peak_memory(func) - rows_bytes) / 1024 / 1024:10.1f} MB")
+
+
+def peak_memory(func):
+    """用 tracemalloc 测量函数执行期间的峰值内存（字节）"""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def make_compare_tables(keys, langs, seed=7):
+    """生成对齐前的源文件/翻译文件数据：键名大小写不同、部分键缺失、约 80% 内容一致"""
+    rng = random.Random(seed)
+    values = make_codes(2000, seed=seed)
+    lang_names = [f"lang{i}" for i in range(langs)]
+    source_keys = [f"KEY_{i}" for i in range(keys)]
+    trans_keys = [key.lower() if rng.random() < 0.5 else key for key in source_keys if rng.random() < 0.95]
+    rng.shuffle(trans_keys)
+    source_texts, trans_texts = {}, {}
+    for lang in lang_names:
+        column = [rng.choice(values) if rng.random() < 0.9 else '' for _ in source_keys]
+        source_texts[lang] = column
+        by_key = dict(zip((key.lower() for key in source_keys), column))
+        trans_texts[lang] = [by_key[key.lower()] if rng.random() < 0.8 else rng.choice(values)
+                             for key in trans_keys]
+    del trans_texts[lang_names[-1]]  # 翻译文件缺少一种语言
+    return ({key: i for i, key in enumerate(source_keys)}, {key: i for i, key in enumerate(trans_keys)},
+            lang_names, source_texts, trans_texts)
+
+
+def loop_compare_results(source_key_map, trans_key_map, langs, source_texts, trans_texts):
+    """原有的逐键 × 逐语言对比循环（不含写出），返回结果标签列表"""
+    source_normalized = {k.strip().lower(): k for k in source_key_map}
+    trans_normalized = {k.strip().lower(): k for k in trans_key_map}
+    matching = set(source_normalized) & set(trans_normalized)
+    source_to_trans = {source_normalized[k]: trans_normalized[k] for k in matching}
+    results = []
+    for source_key, source_index in source_key_map.items():
+        trans_key = source_to_trans.get(source_key)
+        trans_index = trans_key_map.get(trans_key) if trans_key else None
+        trans_row = trans_index is not None
+        for lang in langs:
+            source_content = source_texts[lang][source_index]
+            trans_content = ""
+            trans_col = lang in trans_texts
+            if trans_row and trans_col:
+                trans_content = trans_texts[lang][trans_index]
+            elif not trans_row:
+                trans_content = "【键名未匹配】"
+            elif not trans_col:
+                trans_content = f"【翻译文件缺少{lang}列】"
+            if not trans_row:
+                result = "键名缺失"
+            elif trans_content.startswith("【翻译文件缺少"):
+                result = "语言列缺失"
+            elif source_content and trans_content and source_content == trans_content:
+                result = "一致"
+            elif not source_content and not trans_content:
+                result = "均为空"
+            else:
+                result = "不一致"
+            results.append(result)
+    return results
+
+
+def cell_compare_results(source_key_map, trans_key_map, langs, source_texts, trans_texts):
+    """最初的实现：数据留在工作表中，逐单元格用 ws.cell() 读取后对比（不含写出）"""
+    import openpyxl
+
+    def to_sheet(key_map, texts):
+        ws = openpyxl.Workbook().active
+        columns = [texts[lang] for lang in langs if lang in texts]
+        for key, index in key_map.items():
+            ws.append([key] + [column[index] for column in columns])
+        return ws, {lang: col for col, lang in enumerate((name for name in langs if name in texts), 2)}
+
+    source_ws, source_cols = to_sheet(source_key_map, source_texts)
+    trans_ws, trans_cols = to_sheet(trans_key_map, trans_texts)
+    source_rows = {source_ws.cell(row=row, column=1).value: row for row in range(1, source_ws.max_row + 1)}
+    trans_rows = {trans_ws.cell(row=row, column=1).value: row for row in range(1, trans_ws.max_row + 1)}
+    trans_normalized = {k.strip().lower(): k for k in trans_rows}
+
+    start = time.perf_counter()
+    results = []
+    for source_key, source_row in source_rows.items():
+        trans_key = trans_normalized.get(source_key.strip().lower())
+        trans_row = trans_rows.get(trans_key) if trans_key else None
+        for lang in langs:
+            value = source_ws.cell(row=source_row, column=source_cols[lang]).value
+            source_content = str(value) if value is not None else ""
+            if trans_row is None:
+                results.append("键名缺失")
+            elif lang not in trans_cols:
+                results.append("语言列缺失")
+            else:
+                value = trans_ws.cell(row=trans_row, column=trans_cols[lang]).value
+                trans_content = str(value) if value is not None else ""
+                if source_content and trans_content and source_content == trans_content:
+                    results.append("一致")
+                elif not source_content and not trans_content:
+                    results.append("均为空")
+                else:
+                    results.append("不一致")
+    return time.perf_counter() - start  # 只计对比循环，不含构建工作表
+
+
+def bench_compare(args):
+    """Excel对比核心：逐单元格循环 vs 批量对比引擎（不含读写 Excel 文件）"""
+    from compare_engine import BulkComparison, RESULT_LABELS, _np
+
+    data = make_compare_tables(args.keys, args.langs)
+    print(f"Excel对比: {args.keys:,} 个键 x {args.langs} 种语言 = {args.keys * args.langs:,} 个单元格"
+          f"（ws.cell() 写法抽样 {args.sample:,} 个键）")
+
+    def engine_results(use_numpy):
+        comparison = BulkComparison(*data, use_numpy=use_numpy)
+        return [RESULT_LABELS[code] for lang in comparison.langs for code in comparison.codes[lang]]
+
+    sample = make_compare_tables(args.sample, args.langs)
+    timings = [("ws.cell() 逐单元格", cell_compare_results(*sample) * args.keys / args.sample)]
+    seconds, expected = timed(loop_compare_results, *data)
+    timings.append(("列式表 + 逐单元格循环", seconds))
+    variants = [("批量引擎（纯 Python）", False)] + ([("批量引擎（numpy）", True)] if _np is not None else [])
+    for name, use_numpy in variants:
+        seconds, _ = timed(BulkComparison, *data, use_numpy)
+        timings.append((name, seconds))
+        # 结果顺序不同（按语言整列），比较各标签的数量
+        results = engine_results(use_numpy)
+        assert sorted(results) == sorted(expected), name
+    report("对比耗时:", timings)
+
+
+def bench_logging(args):
+    """对比循环中的逐单元格日志：f-string logger.info vs LoopLog 计数/抽样，报告相对无日志循环的开销"""
+    import logging
+    from loop_log import LoopLog
+
+    source_key_map, trans_key_map, langs, source_texts, trans_texts = make_compare_tables(args.keys, args.langs)
+    print(f"逐单元格日志: {args.keys:,} 个键 x {args.langs} 种语言 = {args.keys * args.langs:,} 个单元格")
+
+    logger = logging.getLogger('benchmark.loop')
+    logger.propagate = False
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+    def run(mode):
+        loop_log = LoopLog(logger, "对比", mode) if mode in ('summary', 'sample') else None
+        start = time.perf_counter()
+        for source_key, source_index in source_key_map.items():
+            trans_index = trans_key_map.get(source_key)
+            for lang in langs:
+                source_content = source_texts[lang][source_index]
+                trans_content = trans_texts[lang][trans_index] if trans_index is not None and lang in trans_texts else ''
+                result = "一致" if source_content == trans_content else "不一致"
+                if mode == 'f-string info':
+                    logger.info(f"语言处理: lang='{lang}', 键={source_key}, 源预览='{source_content[:30]}', "
+                                f"对比预览='{trans_content[:30]}', 结果={result}")
+                elif mode == 'f-string debug':
+                    logger.debug(f"语言处理: lang='{lang}', 键={source_key}, 源预览='{source_content[:30]}', "
+                                 f"对比预览='{trans_content[:30]}', 结果={result}")
+                elif loop_log is not None:
+                    loop_log.event(result, "语言处理: lang='%s', 键=%s, 源预览='%.30s', 对比预览='%.30s', 结果=%s",
+                                   lang, source_key, source_content, trans_content, result)
+        if loop_log is not None:
+            loop_log.summary()
+        return time.perf_counter() - start
+
+    modes = [('无日志', None, logging.INFO),
+             ('f-string info（写出）', 'f-string info', logging.INFO),
+             ('f-string debug（级别关闭）', 'f-string debug', logging.INFO),
+             ('LoopLog summary', 'summary', logging.INFO),
+             ('LoopLog sample（DEBUG）', 'sample', logging.DEBUG)]
+    print("\n循环耗时（相对无日志循环的开销）:")
+    baseline = None
+    for name, mode, level in modes:
+        logger.setLevel(level)
+        stream.seek(0)
+        stream.truncate()
+        seconds = run(mode)
+        baseline = baseline or seconds
+        lines = stream.getvalue().count('\n')
+        print(f"  {name:<26} {seconds:8.3f} 秒   开销 {(seconds / baseline - 1) * 100:+7.1f}%   日志 {lines:,} 行")
+    logger.removeHandler(handler)
+
+
+def multipart_body(field, filename, content):
+    boundary = 'benchmark-boundary'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8') + content
+    body += f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+def post_convert(port, content_type, body, chunk_size=None, chunk_delay=0.0):
+    """上传一个代码转换请求；给定 chunk_size 时按 chunk_delay 的间隔分块慢速发送，返回 (耗时, 状态码)"""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+    try:
+        conn.putrequest('POST', '/api/convert-code')
+        conn.putheader('Content-Type', content_type)
+        conn.putheader('Content-Length', str(len(body)))
+        conn.endheaders()
+        step = chunk_size or len(body)
+        for offset in range(0, len(body), step):
+            conn.send(body[offset:offset + step])
+            if chunk_delay:
+                time.sleep(chunk_delay)
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - start, response.status
+    finally:
+        conn.close()
+
+
+def start_server(kind, port):
+    """在子进程中启动服务器：wsgi 为 app.py 原有的 werkzeug 多线程服务器，asgi 为 uvicorn + asgi.py"""
+    if kind == 'wsgi':
+        command = [sys.executable, '-c', "import logging, app; from werkzeug.serving import run_simple; "
+                   "logging.disable(logging.INFO); "
+                   f"run_simple('127.0.0.1', {port}, app.app, threaded=True)"]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                   '--port', str(port), '--log-level', 'warning', '--no-access-log']
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} 服务器启动失败")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def bench_server(args):
+    """负载测试：慢速上传大文件的同时，其他用户的小请求延迟（WSGI 多线程 vs ASGI）"""
+    small_type, small_body = multipart_body('code_file', 'small.c', make_c_source(0.05, seed=8).encode('utf-8'))
+    large_type, large_body = multipart_body('code_file', 'large.c',
+                                            make_c_source(args.upload_megabytes).encode('utf-8'))
+    chunk_size = 64 * 1024
+    chunk_delay = args.upload_seconds / max(1, len(large_body) // chunk_size)
+    print(f"负载: {args.uploaders} 个慢速上传（每个 {len(large_body) / 1024 / 1024:.1f}MB，约 {args.upload_seconds} 秒传完）"
+          f" + {args.clients} 个客户端连续发送小转换请求，持续 {args.seconds} 秒")
+
+    kinds = ['wsgi'] + (['asgi'] if importlib.util.find_spec('uvicorn') else [])
+    if len(kinds) == 1:
+        print("未安装 uvicorn，只测试 WSGI 服务器（pip install uvicorn）")
+
+    for kind in kinds:
+        port = free_port()
+        process = start_server(kind, port)
+        try:
+            post_convert(port, small_type, small_body)  # 预热
+            latencies, errors, uploads = [], [], []
+            stop = time.perf_counter() + args.seconds
+            lock = threading.Lock()
+
+            def client():
+                while time.perf_counter() < stop:
+                    seconds, status = post_convert(port, small_type, small_body)
+                    with lock:
+                        (latencies if status == 200 else errors).append(seconds)
+
+            def uploader():
+                seconds, status = post_convert(port, large_type, large_body, chunk_size, chunk_delay)
+                with lock:
+                    uploads.append((seconds, status))
+
+            threads = ([threading.Thread(target=uploader) for _ in range(args.uploaders)]
+                       + [threading.Thread(target=client) for _ in range(args.clients)])
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+        latencies.sort()
+        if not latencies:
+            print(f"\n{kind}: 没有成功的小请求（失败 {len(errors)} 个）")
+            continue
+        pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+        upload_ok = [seconds for seconds, status in uploads if status == 200]
+        print(f"\n{kind}:")
+        print(f"  小请求  {len(latencies) / args.seconds:8.1f} 次/秒   p50 {pick(0.5):8.1f} ms   "
+              f"p95 {pick(0.95):8.1f} ms   最大 {latencies[-1] * 1000:8.1f} ms   失败 {len(errors)}")
+        if upload_ok:
+            print(f"  大上传  成功 {len(upload_ok)}/{len(uploads)}   平均 {sum(upload_ok) / len(upload_ok):.1f} 秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Muti_Web 性能基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_similarity = subparsers.add_parser('similarity', help='相似度引擎批量计算')
+    parser_similarity.add_argument('--size', type=int, default=10000)
+    parser_similarity.add_argument('--sample', type=int, default=20, help='difflib 抽样行数')
+    parser_similarity.set_defaults(func=bench_similarity)
+
+    parser_match = subparsers.add_parser('match', help='错误码最佳匹配')
+    parser_match.add_argument('--size', type=int, default=10000)
+    parser_match.add_argument('--sample', type=int, default=500, help='抽样的源错误码数')
+    parser_match.set_defaults(func=bench_match)
+
+    parser_features = subparsers.add_parser('features', help='错误码特征记录（正则调用次数）')
+    parser_features.add_argument('--size', type=int, default=5000)
+    parser_features.add_argument('--sample', type=int, default=1000, help='参与匹配的源错误码数')
+    parser_features.set_defaults(func=bench_features)
+
+    parser_output = subparsers.add_parser('output', help='结果工作簿写出')
+    parser_output.add_argument('--rows', type=int, default=400000)
+    parser_output.add_argument('--langs', type=int, default=5, help='每个键的语言行数')
+    parser_output.add_argument('--sample', type=int, default=50000, help='原有写法的抽样行数')
+    parser_output.set_defaults(func=bench_output)
+
+    parser_convert = subparsers.add_parser('convert', help='C 源码多语言数组解析')
+    parser_convert.add_argument('--megabytes', type=int, default=32)
+    parser_convert.set_defaults(func=bench_convert)
+
+    parser_compare = subparsers.add_parser('compare', help='Excel对比核心（键对齐 + 逐语言对比）')
+    parser_compare.add_argument('--keys', type=int, default=50000)
+    parser_compare.add_argument('--langs', type=int, default=21)
+    parser_compare.add_argument('--sample', type=int, default=5000, help='ws.cell() 写法抽样的键数')
+    parser_compare.set_defaults(func=bench_compare)
+
+    parser_logging = subparsers.add_parser('logging', help='热点循环日志开销')
+    parser_logging.add_argument('--keys', type=int, default=20000)
+    parser_logging.add_argument('--langs', type=int, default=21)
+    parser_logging.set_defaults(func=bench_logging)
+
+    parser_server = subparsers.add_parser('server', help='WSGI 与 ASGI 服务器的并发上传负载测试')
+    parser_server.add_argument('--uploaders', type=int, default=20, help='同时慢速上传的客户端数')
+    parser_server.add_argument('--upload-megabytes', type=int, default=8, help='每个慢速上传的大小')
+    parser_server.add_argument('--upload-seconds', type=float, default=10, help='每个慢速上传的发送时长')
+    parser_server.add_argument('--clients', type=int, default=8, help='连续发送小请求的客户端数')
+    parser_server.add_argument('--seconds', type=float, default=20, help='小请求的持续时间')
+    parser_server.set_defaults(func=bench_server)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
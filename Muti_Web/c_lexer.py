@@ -0,0 +1,115 @@
+"""
+C 源码多语言数组的单遍流式词法分析
+
+代码转Excel 需要从语言头文件中提取：
+    const char *key[MAX_LANGUAGE] = {"值1", "值2", ...};
+
+按块读取文件，用一个组合正则从左到右扫描一次，内存占用与文件大小无关：
+- 跳过 // 和 /* */ 注释（被注释掉的定义不会被提取）
+- 字符串按 C 规则处理转义（\\" 和字符串内的 } 不会提前结束），值保留源码中的转义写法
+- 相邻的字符串字面量拼接为一个值（"ab" "cd" -> "abcd"）
+- 识别到一个完整定义就立即产出，调用方可以边读边写
+"""
+
+import re
+from collections import namedtuple
+
+CHUNK_SIZE = 1024 * 1024
+MAX_DEFINITION = 256 * 1024  # 单个定义的最大长度
+
+# 一个定义：kind 为 array（花括号数组）或 single（单字符串）；
+# size 为方括号中的内容（MAX_LANGUAGE 或数字）；commas 为数组中值之间的逗号数
+Definition = namedtuple('Definition', 'kind name size values commas')
+
+# 字符串和字符字面量采用 普通字符* (转义 普通字符*)* 的展开写法，避免逐字符分支
+_STRING = r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"'
+_CHAR = r"'[^'\\\n]*(?:\\.[^'\\\n]*)*'"
+_COMMENT = r'//[^\n]*|/\*.*?\*/'
+
+# 顶层扫描：定义 | 注释 | 字符串 | 字符 | 标识符 | 其他字符。
+# 各分支由首字符区分，失败时不会指数回溯；未闭合的注释和字符串匹配到缓冲区末尾，留待下一块。
+_SCAN = re.compile(rf'''
+    (?P<definition>
+        const\s+char\s*\*\s*(?P<name>[A-Za-z_]\w*)\s*
+        \[\s*(?P<size>MAX_LANGUAGE|\d+)\s*\]\s*=\s*
+        (?:
+            \{{(?P<body>[^}}"'/]*(?:(?:{_STRING}|{_CHAR}|{_COMMENT}|/(?![/*]))[^}}"'/]*)*)\}}
+          | (?P<single>(?:{_STRING}\s*)+)
+        )
+        \s*;
+    )
+  | (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>"[^"\\\n]*(?:\\.[^"\\\n]*)*(?:"|\\?\Z))
+  | (?P<char>'[^'\\\n]*(?:\\.[^'\\\n]*)*(?:'|\\?\Z))
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<other>[^"'/A-Za-z_]+|.)
+''', re.VERBOSE | re.DOTALL)
+
+# 数组体内的记号：字符串 | 逗号 | 其他记号（注释和空白不产出分组）
+_BODY_ITEM = re.compile(rf'({_STRING})|(,)|{_COMMENT}|({_CHAR}|[^\s"\',/]+|/)', re.DOTALL)
+_STRING_ITEM = re.compile(_STRING, re.DOTALL)
+_STRING_SPLIT = re.compile(r'"([^"\\\n]*(?:\\.[^"\\\n]*)*)"', re.DOTALL)
+_PLAIN_GAPS = re.compile(r'[\s,\0]*')
+_ADJACENT = re.compile(r'\0\s*\0')
+
+
+def parse_array_body(body):
+    """拆分花括号中的值，返回 (值列表, 逗号数)；相邻字符串拼接，非字符串记号不计为值"""
+    # 常见情况：字符串之间只有空白和逗号，且每两个字符串之间都有逗号
+    parts = _STRING_SPLIT.split(body)
+    gaps = '\0'.join(parts[0::2])  # 以 \0 标记字符串所在位置
+    if _PLAIN_GAPS.fullmatch(gaps) and not _ADJACENT.search(gaps):
+        return parts[1::2], gaps.count(',')
+
+    values = []
+    pieces = None
+    commas = 0
+    for string, comma, other in _BODY_ITEM.findall(body):
+        if string:
+            if pieces is None:
+                pieces = []
+            pieces.append(string[1:-1])
+            continue
+        if not (comma or other):
+            continue  # 注释
+        if pieces is not None:
+            values.append(''.join(pieces))
+            pieces = None
+        if comma:
+            commas += 1
+    if pieces is not None:
+        values.append(''.join(pieces))
+    return values, commas
+
+
+def iter_definitions(stream, chunk_size=CHUNK_SIZE, max_definition=MAX_DEFINITION):
+    """从 C 源码文本流中依次产出多语言字符串定义（Definition）
+
+    触及缓冲区末尾的记号、以及距末尾 max_definition 之内未能识别的 const，可能被块边界截断，
+    留到读入下一块后重新识别（因此单个定义的长度不能超过 max_definition）。
+    """
+    buffer = ''
+    eof = False
+    while not eof:
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+        end = len(buffer)
+        pos = 0
+        for match in _SCAN.finditer(buffer):
+            if not eof and (match.end() == end or
+                            (match.group('word') == 'const' and end - match.start() < max_definition)):
+                break
+            pos = match.end()
+            if match.lastgroup != 'definition':
+                continue
+
+            name, size = match.group('name'), match.group('size')
+            body = match.group('body')
+            if body is not None:
+                values, commas = parse_array_body(body)
+                yield Definition('array', name, size, values, commas)
+            else:
+                value = ''.join(item[1:-1] for item in _STRING_ITEM.findall(match.group('single')))
+                yield Definition('single', name, size, [value], 0)
+        buffer = buffer[pos:]
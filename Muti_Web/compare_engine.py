@@ -0,0 +1,193 @@
+"""
+Excel对比的批量对比引擎
+
+按规范化键名（去空格、小写）一次连接源文件和翻译文件，再逐语言整列对比：
+- 每种语言一次计算出与源文件键对齐的结果代码数组（一致 / 不一致 / 均为空 / 键名缺失 / 语言列缺失）
+- 安装 numpy 时整列向量化计算，否则用列表推导逐列计算，结果相同
+- 对比阶段只产生结果代码，单元格内容在写出结果时才逐行取出
+- 增量对比时只重新计算内容有变化的键，其余键沿用上次的结果代码（见 snapshot_store）
+"""
+
+from collections import namedtuple
+from hashlib import blake2b
+
+try:
+    import numpy as _np
+except ImportError:  # 可选依赖
+    _np = None
+
+# 结果代码，与 RESULT_LABELS 的下标对应
+MISSING_KEY, MISSING_COLUMN, EQUAL, BOTH_EMPTY, DIFFERENT = range(5)
+RESULT_LABELS = ("键名缺失", "语言列缺失", "一致", "均为空", "不一致")
+
+UNMATCHED_KEY = "未匹配"
+UNMATCHED_CONTENT = "【键名未匹配】"
+
+# 源文件键的对齐结果：trans_keys 中未匹配的为 None，trans_indices 中为 -1
+KeyAlignment = namedtuple('KeyAlignment', 'source_keys source_indices trans_keys trans_indices match_count')
+
+
+def align_keys(source_key_map, trans_key_map):
+    """按规范化键名（去空格、小写）连接两个 {键名: 下标} 映射，按源文件键名顺序返回 KeyAlignment
+
+    规范化后重复的键名以最后一个为准，其余视为未匹配。
+    """
+    source_keys = list(source_key_map)
+    source_normalized = dict(zip([key.strip().lower() for key in source_keys], source_keys))
+    trans_normalized = {key.strip().lower(): key for key in trans_key_map}
+    source_to_trans = {source_key: trans_normalized[norm_key]
+                       for norm_key, source_key in source_normalized.items()
+                       if norm_key in trans_normalized}
+
+    trans_keys = list(map(source_to_trans.get, source_keys))
+    trans_index = dict(trans_key_map)
+    trans_index[None] = -1
+    return KeyAlignment(
+        source_keys,
+        list(source_key_map.values()),
+        trans_keys,
+        list(map(trans_index.__getitem__, trans_keys)),
+        len(source_to_trans),
+    )
+
+
+def row_digests(columns):
+    """每行在给定各列（与表格行对齐的字符串数组）中内容的摘要，用于判断行内容是否变化"""
+    if not columns:
+        return []
+    return [blake2b('\x1f'.join(values).encode('utf-8'), digest_size=8).hexdigest() for values in zip(*columns)]
+
+
+def _subset_alignment(alignment, positions):
+    """只包含 positions 处源文件键的对齐结果"""
+    return KeyAlignment(*([column[i] for i in positions] for column in alignment[:4]), alignment.match_count)
+
+
+def _compare_column_python(source_values, trans_values, alignment):
+    """逐列计算结果代码（纯 Python）"""
+    if trans_values is None:
+        return [MISSING_KEY if ti < 0 else MISSING_COLUMN for ti in alignment.trans_indices]
+    codes = []
+    append = codes.append
+    for si, ti in zip(alignment.source_indices, alignment.trans_indices):
+        if ti < 0:
+            append(MISSING_KEY)
+            continue
+        source, trans = source_values[si], trans_values[ti]
+        if source and source == trans:
+            append(EQUAL)
+        elif not source and not trans:
+            append(BOTH_EMPTY)
+        else:
+            append(DIFFERENT)
+    return codes
+
+
+def _compare_column_numpy(source_values, trans_values, alignment, arrays):
+    """整列向量化计算结果代码；arrays 缓存下标数组和未匹配掩码"""
+    if 'matched' not in arrays:
+        trans_indices = _np.asarray(alignment.trans_indices, dtype=_np.intp)
+        arrays['matched'] = trans_indices >= 0
+        source_indices = _np.asarray(alignment.source_indices, dtype=_np.intp)
+        # 源文件没有重复键名时下标就是行号，切片即可，无需重排
+        identity = _np.array_equal(source_indices, _np.arange(len(source_indices)))
+        arrays['source'] = slice(0, len(source_indices)) if identity else source_indices
+        arrays['trans'] = _np.where(arrays['matched'], trans_indices, 0)
+    matched = arrays['matched']
+
+    if trans_values is None:
+        return _np.where(matched, MISSING_COLUMN, MISSING_KEY).tolist()
+
+    source = _np.asarray(source_values, dtype=object)[arrays['source']]
+    if trans_values:
+        trans = _np.asarray(trans_values, dtype=object)[arrays['trans']]
+    else:  # 翻译文件没有数据行，所有键都未匹配
+        trans = _np.full(len(source), '', dtype=object)
+    source_empty = source == ''
+    trans_empty = trans == ''
+
+    codes = _np.full(len(source), DIFFERENT, dtype=_np.int8)
+    codes[(source == trans) & ~source_empty] = EQUAL
+    codes[source_empty & trans_empty] = BOTH_EMPTY
+    codes[~matched] = MISSING_KEY
+    return codes.tolist()
+
+
+class BulkComparison:
+    """源文件与翻译文件按键名对齐后的逐语言对比结果
+
+    source_texts / trans_texts 为 {语言: 与表格行对齐的字符串数组}；
+    翻译文件缺少的语言不出现在 trans_texts 中。
+
+    reuse 为 (previous_positions, previous_codes) 时只对比部分键：previous_positions 与源文件键顺序对齐，
+    为该键在上次结果中的位置（-1 表示需要重新对比），previous_codes 为上次的 {语言: 结果代码序列}。
+    """
+
+    def __init__(self, source_key_map, trans_key_map, langs, source_texts, trans_texts, use_numpy=None,
+                 alignment=None, reuse=None):
+        self.langs = list(langs)
+        self.source_texts = source_texts
+        self.trans_texts = trans_texts
+        self.alignment = alignment or align_keys(source_key_map, trans_key_map)
+        use_numpy = _np is not None if use_numpy is None else use_numpy
+
+        arrays = {}
+        self.codes = {}
+        self.recompared = len(self.alignment.source_keys)
+        if reuse is not None:
+            self._merge_previous(*reuse)
+            return
+        for lang in self.langs:
+            trans_values = trans_texts.get(lang)
+            if use_numpy:
+                self.codes[lang] = _compare_column_numpy(source_texts[lang], trans_values, self.alignment, arrays)
+            else:
+                self.codes[lang] = _compare_column_python(source_texts[lang], trans_values, self.alignment)
+
+    def _merge_previous(self, previous_positions, previous_codes):
+        """沿用上次的结果代码，只对位置为 -1 的键重新对比（变化的键通常很少，逐列纯 Python 计算）"""
+        changed = [i for i, position in enumerate(previous_positions) if position < 0]
+        subset = _subset_alignment(self.alignment, changed)
+        self.recompared = len(changed)
+        for lang in self.langs:
+            previous = previous_codes[lang]
+            codes = [previous[position] if position >= 0 else MISSING_KEY for position in previous_positions]
+            fresh = _compare_column_python(self.source_texts[lang], self.trans_texts.get(lang), subset)
+            for i, code in zip(changed, fresh):
+                codes[i] = code
+            self.codes[lang] = codes
+
+    @property
+    def key_match_count(self):
+        return self.alignment.match_count
+
+    def count(self, code):
+        """所有语言中结果为 code 的单元格数"""
+        return sum(codes.count(code) for codes in self.codes.values())
+
+    def iter_keys(self, positions=None):
+        """按源文件键名顺序产出 (源键名, 翻译键名, [(语言, 源内容, 翻译内容, 结果代码), ...])
+
+        positions 为源文件键的位置列表时只产出这些键。
+        """
+        alignment = self.alignment
+        columns = [(lang, self.source_texts[lang], self.trans_texts.get(lang), self.codes[lang],
+                    f"【翻译文件缺少{lang}列】") for lang in self.langs]
+        if positions is None:
+            rows = enumerate(zip(alignment.source_keys, alignment.source_indices,
+                                 alignment.trans_keys, alignment.trans_indices))
+        else:
+            rows = ((i, (alignment.source_keys[i], alignment.source_indices[i],
+                         alignment.trans_keys[i], alignment.trans_indices[i])) for i in positions)
+        for i, (source_key, si, trans_key, ti) in rows:
+            cells = []
+            for lang, source_values, trans_values, codes, missing_column in columns:
+                code = codes[i]
+                if code == MISSING_KEY:
+                    trans_content = UNMATCHED_CONTENT
+                elif code == MISSING_COLUMN:
+                    trans_content = missing_column
+                else:
+                    trans_content = trans_values[ti]
+                cells.append((lang, source_values[si], trans_content, code))
+            yield source_key, UNMATCHED_KEY if trans_key is None else trans_key, cells
@@ -0,0 +1,317 @@
+"""
+后台任务调度器
+
+用有界的进程池执行 CPU 密集的对比任务，避免与 Flask 请求线程争抢 GIL：
+- 排队和运行中的任务总数受 max_queue 限制，超过时拒绝新任务
+- 每个任务可单独取消（排队中直接取消，运行中在下一次上报进度时中止）
+- 工作进程通过共享队列上报进度，主进程的监听线程写回任务状态
+- 已结束的任务在 task_ttl 秒后过期删除
+- 每次状态变化递增任务的事件序号，供 SSE 事件流等待和断点续传
+- 记录每个任务的排队等待、运行时间和任务自身上报的阶段指标，写入任务状态的 metrics 字段
+- 任务结束后的收尾回调（写结果缓存、生成汇总报告等）在单独的小线程池中执行，不占用进程池的结果处理线程
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from metrics import begin_task, end_task
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+
+
+# 工作进程中的进度通道和取消标记，由进程池的 initializer 注入
+_progress_queue = None
+_cancelled = None
+
+# 主进程中的调度器，直接在本进程执行任务时用于更新状态
+_local_schedulers = weakref.WeakSet()
+
+
+def _init_worker(progress_queue, cancelled):
+    """进程池工作进程初始化"""
+    global _progress_queue, _cancelled
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+
+
+def report_progress(task_id, progress=None, message=None):
+    """上报任务进度；任务已被取消时抛出 JobCancelled"""
+    fields = {}
+    if progress is not None:
+        fields['progress'] = int(progress)
+    if message is not None:
+        fields['message'] = message
+
+    if _progress_queue is not None:
+        if task_id in _cancelled:
+            raise JobCancelled(task_id)
+        _progress_queue.put((task_id, fields))
+        return
+
+    for scheduler in list(_local_schedulers):
+        if task_id in scheduler.tasks:
+            if scheduler.is_cancel_requested(task_id):
+                raise JobCancelled(task_id)
+            scheduler.update(task_id, fields)
+
+
+def _run_job(fn, task_id, submitted_at, initial_metrics, args):
+    """在执行任务的进程中运行 fn，把排队等待、运行时间和任务上报的指标附加到结果的 metrics 字段"""
+    started = time.time()
+    metrics = begin_task(task_id, initial_metrics)
+    metrics.add_time('queue_wait', max(0.0, started - submitted_at))
+    try:
+        fields = fn(*args)
+    finally:
+        end_task(task_id)
+    metrics.add_time('run', time.time() - started)
+    if isinstance(fields, dict):
+        fields = dict(fields, metrics=metrics.to_dict())
+    return fields
+
+
+class JobScheduler:
+    """有界任务调度器，tasks 字典保存所有任务状态供状态接口查询"""
+
+    def __init__(self, max_workers=None, max_queue=20, task_ttl=3600, use_processes=True, metrics=None,
+                 callback_threads=2):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.callback_threads = callback_threads
+        self.max_queue = max_queue
+        self.task_ttl = task_ttl
+        self.use_processes = use_processes
+        self.metrics = metrics  # MetricsRegistry，汇总已结束任务的指标
+        self.tasks = {}
+        self._futures = {}
+        self._kinds = {}
+        self._finished_at = {}
+        self._cancel_requested = set()
+        self._seq = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._executor = None
+        self._callback_executor = None
+        self._manager = None
+        self._progress_queue = None
+        self._cancelled = None
+        _local_schedulers.add(self)
+
+    def _ensure_executor(self):
+        """首次提交任务时才创建进程池和共享通道"""
+        if self._executor is not None:
+            return
+        self._callback_executor = ThreadPoolExecutor(max_workers=self.callback_threads,
+                                                     thread_name_prefix='job-callback')
+        if self.use_processes:
+            self._manager = multiprocessing.Manager()
+            self._progress_queue = self._manager.Queue()
+            self._cancelled = self._manager.dict()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self._progress_queue, self._cancelled)
+            )
+            listener = threading.Thread(target=self._listen_progress, daemon=True)
+            listener.start()
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        logger.info(f"任务调度器已启动: {self.max_workers} 个工作{'进程' if self.use_processes else '线程'}, "
+                    f"队列上限 {self.max_queue}")
+
+    def _listen_progress(self):
+        """把工作进程上报的进度写回任务状态"""
+        while True:
+            try:
+                task_id, fields = self._progress_queue.get()
+            except (EOFError, OSError):
+                break
+            self.update(task_id, fields)
+
+    def _touch(self, task_id):
+        """任务状态已变化：递增事件序号并唤醒等待的事件流（调用方需持有锁）"""
+        self._seq[task_id] = self._seq.get(task_id, 0) + 1
+        self._changed.notify_all()
+
+    def update(self, task_id, fields):
+        """更新进行中任务的状态，已结束的任务忽略迟到的进度"""
+        with self._changed:
+            task = self.tasks.get(task_id)
+            if task is not None and task.get('status') == 'processing':
+                task.update(fields)
+                self._touch(task_id)
+
+    def wait_for_event(self, task_id, last_seq, timeout):
+        """等待任务状态在 last_seq 之后发生变化
+
+        返回 (序号, 状态快照)：任务不存在时序号为 None，超时无变化时快照为 None。
+        已结束的任务总是立即返回最终状态，便于续传的连接直接收尾。
+        """
+        def ready():
+            task = self.tasks.get(task_id)
+            return (task is None or task.get('status') != 'processing'
+                    or self._seq.get(task_id, 0) > last_seq)
+
+        with self._changed:
+            self._changed.wait_for(ready, timeout)
+            task = self.tasks.get(task_id)
+            if task is None:
+                return None, None
+            seq = self._seq.get(task_id, 0)
+            if seq <= last_seq and task.get('status') == 'processing':
+                return seq, None
+            return seq, dict(task)
+
+    def active_count(self):
+        """排队中和运行中的任务数"""
+        return sum(1 for future in self._futures.values() if not future.done())
+
+    def submit(self, task_id, fn, *args, message='任务已创建', on_done=None, on_finish=None,
+               kind=None, metrics=None):
+        """提交任务，fn 返回的字典会写入任务状态；队列已满时抛出 QueueFullError
+
+        on_done 在主进程中以任务结果字典调用，用于缓存、清理等收尾工作。
+        on_finish 在任务结束（完成、出错或取消）并写入最终状态后调用，参数为最终状态字典。
+        两者都在收尾线程池中执行；排队中被取消的任务在调用 cancel 的线程中直接收尾。
+        kind 为指标中的任务类型（默认由函数名得出，如 run_compare_job -> compare）；
+        metrics 为提交前已记录的指标（如上传耗时），与任务执行时记录的指标合并。
+        """
+        self.expire()
+        with self._lock:
+            self._ensure_executor()
+            if self.active_count() >= self.max_queue:
+                raise QueueFullError(f"任务队列已满（{self.max_queue}）")
+            self.tasks[task_id] = {
+                'progress': 0,
+                'status': 'processing',
+                'message': message
+            }
+            self._touch(task_id)
+            future = self._executor.submit(_run_job, fn, task_id, time.time(), metrics, args)
+            self._futures[task_id] = future
+            self._kinds[task_id] = kind or fn.__name__.removeprefix('run_').removesuffix('_job')
+        future.add_done_callback(lambda f: self._dispatch_done(task_id, f, on_done, on_finish))
+        return task_id
+
+    def _dispatch_done(self, task_id, future, on_done, on_finish):
+        """进程池的结果处理线程只转交任务，收尾回调在收尾线程池中执行
+
+        排队中被取消的任务没有结果需要处理，直接收尾，cancel 返回时状态已是 cancelled。
+        """
+        if future.cancelled():
+            self._on_done(task_id, future, on_done, on_finish)
+            return
+        try:
+            self._callback_executor.submit(self._on_done, task_id, future, on_done, on_finish)
+        except RuntimeError:  # 解释器退出时收尾线程池已关闭
+            self._on_done(task_id, future, on_done, on_finish)
+
+    def register(self, task_id, message='任务已创建'):
+        """登记一个不占用工作进程的组合任务（如批量对比），由 update 更新进度、finish 结束"""
+        with self._lock:
+            self.tasks[task_id] = {
+                'progress': 0,
+                'status': 'processing',
+                'message': message
+            }
+            self._touch(task_id)
+        return task_id
+
+    def _on_done(self, task_id, future, on_done, on_finish=None):
+        if future.cancelled() or isinstance(future.exception(), JobCancelled):
+            fields = {'progress': 0, 'status': 'cancelled', 'message': '任务已取消'}
+        elif future.exception() is not None:
+            logger.error(f"任务 {task_id} 执行失败: {future.exception()}")
+            fields = {'progress': 0, 'status': 'error', 'message': str(future.exception())}
+        else:
+            fields = future.result()
+            if on_done and fields.get('status') == 'completed':
+                try:
+                    on_done(fields)
+                except Exception as e:
+                    logger.warning(f"任务 {task_id} 收尾失败: {e}")
+        self.finish(task_id, fields)
+        self._record_metrics(task_id, fields)
+        if on_finish:
+            try:
+                on_finish(fields)
+            except Exception as e:
+                logger.warning(f"任务 {task_id} 结束回调失败: {e}")
+
+    def _record_metrics(self, task_id, fields):
+        kind = self._kinds.pop(task_id, 'unknown')
+        if self.metrics is None:
+            return
+        self.metrics.record_task(kind, fields)
+        run_seconds = (fields.get('metrics') or {}).get('stages', {}).get('run')
+        if run_seconds:
+            self.metrics.inc('worker_busy_seconds_total', run_seconds,
+                             help_text='工作进程执行任务的累计时间（秒），按时间求增长率即为平均忙碌的工作进程数')
+
+    def stats(self):
+        """任务队列的即时状态：工作进程数、运行中、排队中的任务数"""
+        with self._lock:
+            futures = list(self._futures.values())
+        running = sum(1 for future in futures if future.running())
+        active = sum(1 for future in futures if not future.done())
+        return {
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'running': running,
+            'queued': active - running,
+        }
+
+    def finish(self, task_id, fields):
+        """把任务标记为结束，开始计算过期时间"""
+        with self._lock:
+            self.tasks.setdefault(task_id, {}).update(fields)
+            self._touch(task_id)
+            self._finished_at[task_id] = time.time()
+            self._futures.pop(task_id, None)
+            self._cancel_requested.discard(task_id)
+            if self._cancelled is not None:
+                self._cancelled.pop(task_id, None)
+
+    def cancel(self, task_id):
+        """取消任务，返回是否成功发出取消"""
+        future = self._futures.get(task_id)
+        if future is None or future.done():
+            return False
+        if future.cancel():
+            return True
+        # 已在运行，设置取消标记，由任务在上报进度时中止
+        with self._lock:
+            self._cancel_requested.add(task_id)
+            if self._cancelled is not None:
+                self._cancelled[task_id] = True
+        self.update(task_id, {'message': '正在取消...'})
+        return True
+
+    def is_cancel_requested(self, task_id):
+        return task_id in self._cancel_requested
+
+    def expire(self):
+        """删除结束时间超过 task_ttl 的任务"""
+        deadline = time.time() - self.task_ttl
+        with self._lock:
+            expired = [task_id for task_id, finished in self._finished_at.items() if finished < deadline]
+            for task_id in expired:
+                self.tasks.pop(task_id, None)
+                self._seq.pop(task_id, None)
+                del self._finished_at[task_id]
+            if expired:
+                self._changed.notify_all()
+        if expired:
+            logger.info(f"已清理 {len(expired)} 个过期任务")
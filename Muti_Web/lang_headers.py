@@ -0,0 +1,150 @@
+"""
+表头语言识别
+
+由语言列表（LANGUAGE_ORDER）编译出一个识别器，一次正则匹配判断一个表头属于哪种语言：
+- 每种语言一个分支，按优先级排列：繁体中文 > 中文（CN）> 其他语言（按列表顺序）
+- 分支内的条件：中文名称、英文名称（不区分大小写）、语言代码
+- 一张表的全部表头一次识别完成，结果按表头行缓存，重复上传相同模板时不再识别
+
+识别不到的语言可以按标准列顺序补齐（第2列为第一种语言，依次类推）。
+"""
+
+import functools
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+TRADITIONAL_CHINESE = "繁体中文"
+SIMPLIFIED_CHINESE = "中文（CN）"
+
+# 标准名称之外的别名：(英文名称, 语言代码, 代码是否只需出现在表头中)。
+# 代码默认要求整个表头等于代码；标记为 True 的沿用原有的包含匹配（如表头中出现 "br" 即为巴西葡语）
+LANGUAGE_ALIASES = {
+    "英文（EN）English": ("english", "en", False),
+    "德语(DE)Deutsch": ("german", "de", False),
+    "西语（ES）Español": ("spanish", "es", False),
+    "法语(FR)Français": ("french", "fr", False),
+    "意大利语(IT)Italiano": ("italian", "it", False),
+    "巴西葡语(BR)Português": ("portuguese", "br", True),
+    "俄语（Pyc）Русский": ("russian", "ru", True),
+    "土耳其语(TR)Turkish": ("turkish", "tr", True),
+    "日语(JP)日本語": ("japanese", "jp", True),
+    "韩语(KR)한국어": ("korean", "kr", True),
+    "阿拉伯语عربية": ("arabic", "ar", True),
+    "波兰语（PL）Polski": ("polish", "pl", False),
+    "越南语（VI）Tiếng Việt": ("vietnamese", "vi", False),
+    "印尼语（ID）Bahasa Indonesia": ("indonesian", "id", False),
+    "泰语（TH）ไทย": ("thai", "th", False),
+    "马来语（MS）Bahasa Melayu": ("malay", "ms", False),
+    "希伯来语（HE）עברית": ("hebrew", "he", False),
+    "南非语（AF）Afrikaans": ("afrikaans", "af", False),
+    "印地语 （HI）Hindi": ("hindi", "hi", False),
+}
+
+_CHINESE_NAME = re.compile(r'[\u4e00-\u9fff]+')
+
+
+def _contains(text):
+    return rf'(?=.*?{text})'
+
+
+def _language_branch(lang, aliases):
+    """单个语言的识别条件（零宽断言，多个条件之间为"或"）"""
+    if lang == TRADITIONAL_CHINESE:
+        return _contains('繁体')
+    if lang == SIMPLIFIED_CHINESE:
+        # 同时出现中文标识和 CN；单独的"中文"由 resolve 按列数决定是否采用
+        return rf'{_contains("(?:中文|Chinese)")}{_contains("CN")}|(?P<bare_chinese>中文\Z)'
+
+    conditions = []
+    chinese_name = _CHINESE_NAME.match(lang)
+    if chinese_name:
+        conditions.append(_contains(re.escape(chinese_name.group())))
+    english_name, code, code_anywhere = aliases.get(lang, (None, None, False))
+    if english_name:
+        conditions.append(_contains(f'(?i:{re.escape(english_name)})'))
+    if code:
+        code = f'(?i:{re.escape(code)})'
+        conditions.append(_contains(code) if code_anywhere else rf'{code}\Z')
+    if not conditions:
+        conditions.append(_contains(re.escape(lang)))
+    return '|'.join(conditions)
+
+
+class LanguageHeaderRecognizer:
+    """由语言列表编译的表头识别器"""
+
+    def __init__(self, languages, aliases=None, cache_size=256):
+        self.languages = list(languages)
+        aliases = LANGUAGE_ALIASES if aliases is None else aliases
+
+        # 繁体中文和中文（CN）优先，其余按语言列表顺序；分支按顺序尝试，第一个成立的分支即为结果
+        ordered = [lang for lang in (TRADITIONAL_CHINESE, SIMPLIFIED_CHINESE) if lang in self.languages]
+        ordered += [lang for lang in self.languages if lang not in ordered]
+        self._branch_langs = {f'lang{i}': lang for i, lang in enumerate(ordered)}
+        self._pattern = re.compile(
+            '|'.join(f'(?P<{name}>{_language_branch(lang, aliases)})'
+                     for name, lang in self._branch_langs.items()),
+            re.DOTALL)
+
+        self._resolve_cached = functools.lru_cache(maxsize=cache_size)(self._resolve)
+
+    def recognize(self, header, max_column=None):
+        """返回表头对应的语言，无法识别时返回 None
+
+        单独的"中文"只在表格多于两列时视为中文（CN），max_column 为 None 时不限制。
+        """
+        if not header or not isinstance(header, str):
+            return None
+        match = self._pattern.match(header.strip())
+        if match is None:
+            return None
+        if (max_column is not None and max_column <= 2
+                and match.groupdict().get('bare_chinese') is not None):
+            return None
+        return self._branch_langs[match.lastgroup]
+
+    def resolve(self, headers, max_column=None):
+        """识别一行表头，返回 {语言: 列号(从1开始)}；同一语言出现多次时取最后一列
+
+        结果按 (表头行, 列数) 缓存，返回的是副本，调用方可以修改。
+        """
+        if max_column is None:
+            max_column = len(headers)
+        return dict(self._resolve_cached(tuple(headers), max_column))
+
+    def _resolve(self, headers, max_column):
+        lang_map = {}
+        for col, header in enumerate(headers, 1):
+            lang = self.recognize(header, max_column)
+            if lang:
+                lang_map[lang] = col
+        return lang_map
+
+    def cache_info(self):
+        return self._resolve_cached.cache_info()
+
+    def fill_by_position(self, lang_map, languages, headers, max_column):
+        """按标准列顺序为未识别的语言补齐列号（第2列起依次对应语言列表），返回补齐的语言
+
+        补齐后若繁体中文与中文（CN）落在同一列，改用表头中带"繁体"或"traditional"的最后一列。
+        """
+        filled = []
+        for col, lang in enumerate(self.languages, 2):
+            if col > max_column:
+                break
+            if lang in languages and lang not in lang_map:
+                lang_map[lang] = col
+                filled.append(lang)
+
+        if (lang_map.get(TRADITIONAL_CHINESE) is not None
+                and lang_map.get(TRADITIONAL_CHINESE) == lang_map.get(SIMPLIFIED_CHINESE)):
+            logger.warning("繁体中文和中文映射到了同一列，尝试重新映射")
+            for col in range(min(max_column, len(headers)), 1, -1):
+                header = headers[col - 1]
+                if isinstance(header, str) and ('繁体' in header or 'traditional' in header.lower()):
+                    lang_map[TRADITIONAL_CHINESE] = col
+                    logger.info(f"重新映射繁体中文到第{col}列")
+                    break
+        return filled
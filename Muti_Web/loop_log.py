@@ -0,0 +1,50 @@
+"""
+热点循环的日志
+
+逐键、逐语言、逐候选的循环中不直接调用 logger.info(f"...")：
+- 每类事件只计数，任务结束时输出一行汇总（各类事件的次数），代替每个单元格一行日志
+- 详细日志由 verbosity 控制：
+  off     不输出任何内容
+  summary 只输出汇总（默认）
+  sample  另外输出每类事件的前 first 条，之后每 every 条输出一条
+  all     输出每一条
+- 详细日志使用 logging 的 %s 参数延迟格式化，日志级别未开启时不会格式化
+"""
+
+import logging
+
+VERBOSITY_LEVELS = ('off', 'summary', 'sample', 'all')
+
+
+class LoopLog:
+    """按类别计数、抽样输出的循环日志"""
+
+    __slots__ = ('logger', 'name', 'verbosity', 'level', 'first', 'every', 'counts', 'detail', '_all')
+
+    def __init__(self, logger, name, verbosity='summary', level=logging.DEBUG, first=5, every=1000):
+        if verbosity not in VERBOSITY_LEVELS:
+            raise ValueError(f"无效的日志详细程度: {verbosity}（可选 {', '.join(VERBOSITY_LEVELS)}）")
+        self.logger = logger
+        self.name = name
+        self.verbosity = verbosity
+        self.level = level
+        self.first = first
+        self.every = max(1, every)
+        self.counts = {}
+        # 级别只在创建时检查一次，循环中不再查询 logger
+        self.detail = verbosity in ('sample', 'all') and logger.isEnabledFor(level)
+        self._all = verbosity == 'all'
+
+    def event(self, category, msg=None, *args):
+        """记录一次事件；msg 和 args 按 logging 的 % 格式，只在需要输出时才格式化"""
+        count = self.counts.get(category, 0) + 1
+        self.counts[category] = count
+        if self.detail and msg is not None and (self._all or count <= self.first or count % self.every == 0):
+            self.logger.log(self.level, msg, *args)
+
+    def summary(self, level=logging.INFO):
+        """输出各类事件的次数（一行）"""
+        if self.verbosity == 'off' or not self.counts or not self.logger.isEnabledFor(level):
+            return
+        self.logger.log(level, "%s: %s", self.name,
+                        '，'.join(f"{category} {count}" for category, count in self.counts.items()))
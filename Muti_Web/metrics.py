@@ -0,0 +1,181 @@
+"""
+任务性能指标
+
+- TaskMetrics：单个任务的各阶段耗时（上传、加载、语言映射、对比、写出、保存……）和计数
+  （行数、单元格数、评估的候选数、缓存命中），在执行任务的进程中记录，
+  任务结束时随任务状态返回，保存在任务记录的 metrics 字段中
+- MetricsRegistry：主进程中汇总所有任务的指标，加上抓取时采集的队列深度、工作进程利用率等即时值，
+  由 /metrics 接口以 Prometheus 文本格式输出
+
+不依赖 prometheus_client，指标种类只有 counter / gauge / histogram 三种。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# 本进程中正在执行的任务：任务 ID -> TaskMetrics
+_active = {}
+
+# 阶段耗时直方图的桶（秒）
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class TaskMetrics:
+    """一个任务的阶段耗时（秒）和计数"""
+
+    __slots__ = ('stages', 'counters', '_last')
+
+    def __init__(self, initial=None):
+        initial = initial or {}
+        self.stages = dict(initial.get('stages', {}))
+        self.counters = dict(initial.get('counters', {}))
+        self._last = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """计时一个阶段，同名阶段的耗时累加"""
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def lap(self, name=None):
+        """把上一次 lap 以来的耗时记为阶段 name，用于依次执行的阶段；name 为 None 时只重新开始计时"""
+        now = time.perf_counter()
+        if name is not None:
+            self.add_time(name, now - self._last)
+        self._last = now
+
+    def add_time(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        return {
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+
+def begin_task(task_id, initial=None):
+    """开始记录任务的指标（由调度器在执行任务的进程中调用）"""
+    metrics = _active[task_id] = TaskMetrics(initial)
+    return metrics
+
+
+def end_task(task_id):
+    return _active.pop(task_id, None)
+
+
+def task_metrics(task_id):
+    """返回本进程中任务的指标记录；任务不是由调度器执行时（如直接调用）返回一个临时记录"""
+    metrics = _active.get(task_id)
+    return metrics if metrics is not None else TaskMetrics()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """进程内指标汇总，render() 输出 Prometheus 文本格式"""
+
+    def __init__(self, prefix='muti_web', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._meta = {}  # 指标名 -> (类型, 说明)
+        self._counters = {}  # (指标名, 标签) -> 值
+        self._histograms = {}  # (指标名, 标签) -> [各桶计数..., 总和, 次数]
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _name(self, name, kind, help_text):
+        full_name = f'{self.prefix}_{name}'
+        self._meta.setdefault(full_name, (kind, help_text))
+        return full_name
+
+    def inc(self, name, value=1, help_text='', **labels):
+        """累加计数器"""
+        with self._lock:
+            key = (self._name(name, 'counter', help_text), tuple(sorted(labels.items())))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, help_text='', **labels):
+        """记录一次直方图观测值"""
+        with self._lock:
+            key = (self._name(name, 'histogram', help_text), tuple(sorted(labels.items())))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def add_collector(self, collector):
+        """登记抓取时调用的采集函数，返回 [(指标名, 类型, 说明, {标签}, 值), ...]"""
+        self._collectors.append(collector)
+
+    def record_task(self, kind, fields):
+        """汇总一个已结束任务的状态和 metrics 字段"""
+        self.inc('tasks_total', help_text='已结束的任务数', kind=kind, status=fields.get('status', 'unknown'))
+        metrics = fields.get('metrics') or {}
+        for stage, seconds in metrics.get('stages', {}).items():
+            self.observe('task_stage_seconds', seconds, help_text='任务各阶段耗时（秒）', kind=kind, stage=stage)
+        for item, value in metrics.get('counters', {}).items():
+            self.inc('task_items_total', value, help_text='任务处理的行、单元格、候选等计数',
+                     kind=kind, item=item)
+
+    def value(self, name, **labels):
+        """读取计数器的当前值（不存在时为0）"""
+        return self._counters.get((f'{self.prefix}_{name}', tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        """输出 Prometheus 文本格式（text/plain; version=0.0.4）"""
+        samples = {}
+        meta = {}
+        with self._lock:
+            meta.update(self._meta)
+            for (name, labels), value in self._counters.items():
+                samples.setdefault(name, []).append((name, labels, value))
+            for (name, labels), histogram in self._histograms.items():
+                lines = samples.setdefault(name, [])
+                for bound, count in zip(self.buckets + (float('inf'),), histogram[:-2] + [histogram[-1]]):
+                    lines.append((f'{name}_bucket', labels + (('le', _format_value(float(bound))),), count))
+                lines.append((f'{name}_sum', labels, round(histogram[-2], 6)))
+                lines.append((f'{name}_count', labels, histogram[-1]))
+
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                full_name = f'{self.prefix}_{name}'
+                meta.setdefault(full_name, (kind, help_text))
+                samples.setdefault(full_name, []).append((full_name, tuple(sorted(labels.items())), value))
+
+        output = []
+        for name in sorted(samples):
+            kind, help_text = meta[name]
+            if help_text:
+                output.append(f'# HELP {name} {help_text}')
+            output.append(f'# TYPE {name} {kind}')
+            for sample_name, labels, value in samples[name]:
+                output.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(output) + '\n'
@@ -0,0 +1,131 @@
+"""
+流式输出结果工作簿
+
+使用 openpyxl 的只写模式逐行写出结果，内存占用与行数无关：
+- 样式预先注册为命名样式，单元格只引用样式名，不再为每个单元格创建填充和字体对象
+- 合并区域在写入时登记，保存时一次性写入（逐个 merge_cells 会与已有区域逐一做重叠检查）
+- 可选输出 CSV / Parquet 附属文件，供不需要颜色的下游工具使用
+
+安装 lxml 后 openpyxl 的写入速度会明显提升。
+"""
+
+import csv
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:  # 可选依赖，仅 Parquet 附属文件需要
+    pyarrow = None
+    pyarrow_parquet = None
+
+
+def available_sidecar_formats():
+    """返回当前环境支持的附属文件格式"""
+    formats = ['csv']
+    if pyarrow is not None:
+        formats.append('parquet')
+    return formats
+
+
+class StreamingSheet:
+    """只写模式的单工作表结果文件
+
+    styles 为 {样式名: {'font': ..., 'fill': ..., 'alignment': ...}}，在写入任何行之前注册。
+    """
+
+    def __init__(self, title, headers, widths=None, styles=None, header_style=None):
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title)
+        self.row_count = 0
+        self._merged = []
+
+        for name, attrs in (styles or {}).items():
+            # 未指定字体的样式沿用工作簿默认字体，与普通单元格保持一致
+            attrs = dict({'font': DEFAULT_FONT}, **attrs)
+            self.workbook.add_named_style(NamedStyle(name=name, **attrs))
+
+        # 列宽必须在写入第一行之前设置
+        for col, width in enumerate(widths or [], 1):
+            self.sheet.column_dimensions[get_column_letter(col)].width = width
+
+        self.append(headers, {col: header_style for col in range(len(headers))} if header_style else None)
+
+    def append(self, values, styles=None):
+        """追加一行，styles 为 {列下标(从0开始): 样式名}，返回该行行号"""
+        if styles:
+            values = list(values)
+            for col, style in styles.items():
+                cell = WriteOnlyCell(self.sheet, value=values[col])
+                cell.style = style
+                values[col] = cell
+        self.sheet.append(values)
+        self.row_count += 1
+        return self.row_count
+
+    def merge(self, start_row, start_column, end_row, end_column):
+        """登记合并区域，保存时统一写入"""
+        self._merged.append(CellRange(min_col=start_column, min_row=start_row,
+                                      max_col=end_column, max_row=end_row))
+
+    def save(self, path):
+        self.sheet.merged_cells = MultiCellRange(self._merged)
+        self.workbook.save(path)
+
+
+class SidecarWriter:
+    """逐行写出不带样式的 CSV / Parquet 附属文件"""
+
+    def __init__(self, path, file_format, headers, batch_size=10000):
+        if file_format not in available_sidecar_formats():
+            raise ValueError(f"不支持的附属文件格式: {file_format}")
+        self.path = path
+        self.file_format = file_format
+        self.headers = list(headers)
+        self.batch_size = batch_size
+        self._batch = []
+        self._file = None
+        self._writer = None
+
+        if file_format == 'csv':
+            # utf-8-sig 便于 Excel 直接打开中文内容
+            self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.headers)
+        else:
+            self._schema = pyarrow.schema([(name, pyarrow.string()) for name in self.headers])
+            self._writer = pyarrow_parquet.ParquetWriter(path, self._schema)
+
+    def write(self, values):
+        if self.file_format == 'csv':
+            self._writer.writerow(values)
+            return
+        self._batch.append(values)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """把缓存的行按列写成一个 Parquet 行组"""
+        if not self._batch:
+            return
+        columns = [pyarrow.array([None if row[i] is None else str(row[i]) for row in self._batch],
+                                 type=pyarrow.string())
+                   for i in range(len(self.headers))]
+        self._writer.write_table(pyarrow.Table.from_arrays(columns, schema=self._schema))
+        self._batch = []
+
+    def close(self):
+        if self._writer is None:
+            return
+        if self.file_format == 'csv':
+            self._file.close()
+        else:
+            self._flush()
+            self._writer.close()
+        self._writer = None
@@ -0,0 +1,158 @@
+"""
+基于内容哈希的对比结果缓存
+
+同一对源文件/翻译文件在相同语言和匹配参数下的结果总是相同的，
+因此以 两个文件的 SHA-256 + 语言选择 + 匹配参数 作为缓存键，
+把生成的结果文件保存在磁盘缓存目录中，命中时直接返回已有文件。
+
+缓存按最近使用时间（LRU）淘汰，同时限制条目数和总字节数。
+一个条目可以附带若干伴随文件（如 CSV 附属文件），与主结果文件一起命中和淘汰。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = 'index.json'
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """分块计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(kind, source_path, trans_path, languages, options=None, digests=None):
+    """由任务类型、两个文件内容、语言列表和匹配参数生成缓存键
+
+    digests 为 {路径: SHA-256}，已知哈希的文件（如分块上传时已算好）不再重新读取。
+    """
+    digests = digests or {}
+    payload = {
+        'kind': kind,
+        'source': digests.get(source_path) or file_sha256(source_path),
+        'trans': digests.get(trans_path) or file_sha256(trans_path),
+        'languages': list(languages),  # 语言顺序决定输出行顺序，不排序
+        'options': options or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """磁盘结果缓存，索引保存在缓存目录的 index.json 中"""
+
+    def __init__(self, cache_dir, max_entries=200, max_bytes=500 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._entries = self._load_index()
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILENAME)
+
+    def _load_index(self):
+        """读取索引，丢弃文件已不存在的条目"""
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {key: entry for key, entry in entries.items() if self._files_exist(entry)}
+
+    def _files_exist(self, entry):
+        return all(os.path.isfile(os.path.join(self.cache_dir, filename))
+                   for filename in [entry['filename']] + entry.get('companions', []))
+
+    def _save_index(self):
+        tmp_path = self._index_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path())
+
+    def path_for(self, filename):
+        """返回缓存目录中结果文件的路径（不存在时返回None）"""
+        path = os.path.join(self.cache_dir, filename)
+        return path if os.path.isfile(path) else None
+
+    def get(self, key):
+        """查询缓存，命中时返回条目（含 filename、meta），否则返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not self._files_exist(entry):
+                del self._entries[key]
+                self._save_index()
+                return None
+            entry['last_access'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._save_index()
+            return dict(entry)
+
+    def _store(self, key, source_path):
+        """把文件链接或复制到缓存目录，返回缓存文件名"""
+        # 以缓存键前缀区分同名（同一秒生成）的结果文件
+        filename = f"{key[:12]}_{os.path.basename(source_path)}"
+        cached_path = os.path.join(self.cache_dir, filename)
+        if not os.path.exists(cached_path):
+            try:
+                os.link(source_path, cached_path)
+            except OSError:
+                shutil.copy2(source_path, cached_path)
+        return filename
+
+    def put(self, key, result_path, meta=None, companion_paths=()):
+        """把结果文件及其伴随文件加入缓存（优先硬链接，失败时复制）"""
+        with self._lock:
+            try:
+                filename = self._store(key, result_path)
+                companions = [self._store(key, path) for path in companion_paths]
+            except OSError as e:
+                logger.warning(f"写入结果缓存失败: {e}")
+                return
+
+            self._entries[key] = {
+                'filename': filename,
+                'companions': companions,
+                'size': sum(os.path.getsize(os.path.join(self.cache_dir, name))
+                            for name in [filename] + companions),
+                'created': time.time(),
+                'last_access': time.time(),
+                'hits': 0,
+                'meta': meta or {},
+            }
+            self._evict()
+            self._save_index()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(entry['size'] for entry in self._entries.values()),
+            }
+
+    def _evict(self):
+        """按最近使用时间淘汰，直到满足条目数和字节数限制"""
+        total_bytes = sum(entry['size'] for entry in self._entries.values())
+        by_age = sorted(self._entries.items(), key=lambda item: item[1]['last_access'])
+        while by_age and (len(self._entries) > self.max_entries or total_bytes > self.max_bytes):
+            key, entry = by_age.pop(0)
+            del self._entries[key]
+            total_bytes -= entry['size']
+            for filename in [entry['filename']] + entry.get('companions', []):
+                try:
+                    os.remove(os.path.join(self.cache_dir, filename))
+                except OSError:
+                    pass
+            logger.info(f"淘汰缓存结果: {entry['filename']}")
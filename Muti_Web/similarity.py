@@ -0,0 +1,85 @@
+"""
+可插拔的字符串相似度引擎
+
+- DifflibEngine: 标准库 difflib.SequenceMatcher，始终可用，与原有结果完全一致
+- RapidFuzzEngine: 安装了 rapidfuzz 时使用编译实现（Indel 距离的 ratio），
+  批量计算时一次调用完成，速度快一到两个数量级
+
+两种引擎的 ratio 都返回 0~1 之间的小数。rapidfuzz 按最长公共子序列计算，
+个别字符串上会比 SequenceMatcher 略高（差异范围由 test_app.py 中的一致性测试约束），
+阈值附近的条目可能因此改变匹配结果，所以需要显式启用。
+
+通过环境变量 SIMILARITY_ENGINE 选择引擎：difflib（默认）/ rapidfuzz / auto（已安装 rapidfuzz 时使用）。
+"""
+
+import os
+from difflib import SequenceMatcher
+
+try:
+    from rapidfuzz import fuzz as _rapid_fuzz
+    from rapidfuzz import process as _rapid_process
+except ImportError:  # 可选依赖
+    _rapid_fuzz = None
+    _rapid_process = None
+
+try:
+    import numpy as _np  # rapidfuzz 的 cdist 批量计算需要 numpy
+except ImportError:
+    _np = None
+
+
+class DifflibEngine:
+    """基于 difflib.SequenceMatcher 的相似度引擎"""
+
+    name = 'difflib'
+
+    def ratio(self, a, b):
+        return SequenceMatcher(None, a, b).ratio()
+
+    def ratios(self, query, choices):
+        """逐个计算 query 与每个候选的相似度（与逐对调用 ratio 相同，没有批量加速）
+
+        SequenceMatcher 只为 seq2 建查找表，但 ratio 对两个参数不对称（交换后个别字符串的分数不同），
+        query 仍作为 seq1，每个候选都要重新建表。
+        """
+        return [SequenceMatcher(None, query, choice).ratio() for choice in choices]
+
+
+class RapidFuzzEngine:
+    """基于 rapidfuzz 编译实现的相似度引擎"""
+
+    name = 'rapidfuzz'
+
+    def ratio(self, a, b):
+        return _rapid_fuzz.ratio(a, b) / 100.0
+
+    def ratios(self, query, choices):
+        """一次调用批量计算 query 与所有候选的相似度"""
+        if not choices:
+            return []
+        if _np is not None:
+            scores = _rapid_process.cdist([query], choices, scorer=_rapid_fuzz.ratio, dtype=_np.float64)
+            return (scores[0] / 100.0).tolist()
+        return [_rapid_fuzz.ratio(query, choice) / 100.0 for choice in choices]
+
+
+def available_engines():
+    """返回当前环境可用的引擎名称列表"""
+    names = [DifflibEngine.name]
+    if _rapid_fuzz is not None:
+        names.append(RapidFuzzEngine.name)
+    return names
+
+
+def get_engine(name=None):
+    """按名称获取相似度引擎，默认 difflib；auto 时已安装 rapidfuzz 则使用 rapidfuzz"""
+    name = (name or os.environ.get('SIMILARITY_ENGINE') or DifflibEngine.name).lower()
+    if name == RapidFuzzEngine.name:
+        if _rapid_fuzz is None:
+            raise ValueError("未安装 rapidfuzz，无法使用 rapidfuzz 相似度引擎")
+        return RapidFuzzEngine()
+    if name == DifflibEngine.name:
+        return DifflibEngine()
+    if name != 'auto':
+        raise ValueError(f"未知的相似度引擎: {name}")
+    return RapidFuzzEngine() if _rapid_fuzz is not None else DifflibEngine()
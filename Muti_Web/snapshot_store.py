@@ -0,0 +1,169 @@
+"""
+增量对比的快照
+
+同一谱系（lineage，如"项目A 多语言表"）的源文件/翻译文件在版本之间通常只改动少数键。
+每次增量对比结束后保存一份快照：每个源文件键的内容签名（源文件行摘要、匹配到的翻译文件键名、
+翻译文件行摘要）和各语言的结果代码。下次对比同一谱系时：
+- 按签名找出新增、删除、内容变化的键，只对这些键重新对比，并单独输出变更报告
+- 未变化的键沿用快照中的结果代码，与重新对比的键合并为完整结果
+- 对比的语言或翻译文件的语言列发生变化时快照不再适用，整体重新对比
+
+每个谱系一个 JSON 文件，写入临时文件后原子替换；同一谱系的并发任务以后完成的为准。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from compare_engine import row_digests
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# 变更类型
+CHANGE_ADDED = '新增'
+CHANGE_REMOVED = '删除'
+CHANGE_SOURCE = '源文件内容变化'
+CHANGE_MATCH = '匹配键变化'
+CHANGE_TRANS = '翻译内容变化'
+
+# 结果代码（0~4）与快照中保存的数字字符互转
+_TO_DIGITS = bytes.maketrans(bytes(range(5)), b'01234')
+_FROM_DIGITS = bytes.maketrans(b'01234', bytes(range(5)))
+
+
+def key_signatures(alignment, langs, source_texts, trans_texts):
+    """每个源文件键的内容签名 (源文件行摘要, 翻译文件键名, 翻译文件行摘要)，与 alignment 的键顺序对齐"""
+    source_digests = row_digests([source_texts[lang] for lang in langs])
+    trans_digests = row_digests([trans_texts[lang] for lang in langs if lang in trans_texts])
+    return [
+        (source_digests[si] if source_digests else '',
+         trans_key or '',
+         trans_digests[ti] if ti >= 0 and trans_digests else '')
+        for si, trans_key, ti in zip(alignment.source_indices, alignment.trans_keys, alignment.trans_indices)
+    ]
+
+
+class CompareSnapshot:
+    """一次对比的键签名和结果代码"""
+
+    __slots__ = ('langs', 'trans_langs', 'keys', 'signatures', 'codes', '_index')
+
+    def __init__(self, langs, trans_langs, keys, signatures, codes):
+        self.langs = list(langs)
+        self.trans_langs = list(trans_langs)
+        self.keys = keys
+        self.signatures = signatures
+        self.codes = codes  # {语言: bytes，每个字节为一个结果代码}
+        self._index = None
+
+    @classmethod
+    def from_comparison(cls, comparison, signatures):
+        return cls(comparison.langs, [lang for lang in comparison.langs if lang in comparison.trans_texts],
+                   comparison.alignment.source_keys, signatures,
+                   {lang: bytes(codes) for lang, codes in comparison.codes.items()})
+
+    def applies_to(self, langs, trans_langs):
+        """语言和翻译文件的语言列与本快照相同时才能沿用结果代码"""
+        return self.langs == list(langs) and self.trans_langs == list(trans_langs)
+
+    def plan(self, source_keys, signatures):
+        """与本快照比较，返回 (previous_positions, changes)
+
+        previous_positions 与 source_keys 对齐，未变化的键为其在快照中的位置，需要重新对比的为 -1；
+        changes 为 [(源文件键名, 变更类型, 快照中的位置), ...]，删除的键排在最后。
+        """
+        if self._index is None:
+            self._index = {key: position for position, key in enumerate(self.keys)}
+        positions = []
+        changes = []
+        for key, signature in zip(source_keys, signatures):
+            position = self._index.get(key, -1)
+            if position < 0:
+                positions.append(-1)
+                changes.append((key, CHANGE_ADDED, -1))
+                continue
+            previous = self.signatures[position]
+            if previous == signature:
+                positions.append(position)
+                continue
+            positions.append(-1)
+            if previous[0] != signature[0]:
+                change = CHANGE_SOURCE
+            elif previous[1] != signature[1]:
+                change = CHANGE_MATCH
+            else:
+                change = CHANGE_TRANS
+            changes.append((key, change, position))
+        current = set(source_keys)
+        changes.extend((key, CHANGE_REMOVED, position) for position, key in enumerate(self.keys)
+                       if key not in current)
+        return positions, changes
+
+    def to_json(self):
+        return {
+            'version': SNAPSHOT_VERSION,
+            'created': time.time(),
+            'langs': self.langs,
+            'trans_langs': self.trans_langs,
+            'keys': self.keys,
+            'signatures': self.signatures,
+            'codes': {lang: codes.translate(_TO_DIGITS).decode('ascii') for lang, codes in self.codes.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"快照版本不符: {data.get('version')}")
+        return cls(data['langs'], data['trans_langs'], data['keys'],
+                   [tuple(signature) for signature in data['signatures']],
+                   {lang: codes.encode('ascii').translate(_FROM_DIGITS) for lang, codes in data['codes'].items()})
+
+
+class SnapshotStore:
+    """按谱系保存最近一次对比的快照，超过 max_lineages 个谱系时删除最久未更新的"""
+
+    def __init__(self, root, max_lineages=50):
+        self.root = root
+        self.max_lineages = max_lineages
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, lineage):
+        return os.path.join(self.root, hashlib.sha256(lineage.encode('utf-8')).hexdigest()[:32] + '.json')
+
+    def load(self, lineage):
+        """读取谱系的快照，不存在或已损坏时返回 None"""
+        path = self._path(lineage)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return CompareSnapshot.from_json(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"增量对比快照无效，将重新建立: {lineage}: {e}")
+            return None
+
+    def save(self, lineage, snapshot):
+        path = self._path(lineage)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(snapshot.to_json(), lineage=lineage), f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self._evict()
+
+    def _evict(self):
+        try:
+            with os.scandir(self.root) as entries:
+                files = [(entry.stat().st_mtime, entry.path) for entry in entries
+                         if entry.is_file() and entry.name.endswith('.json')]
+        except OSError:
+            return
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_lineages)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
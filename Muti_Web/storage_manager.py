@@ -0,0 +1,262 @@
+"""
+生成文件的存储配额管理
+
+转换、对比、错误码校对生成的结果文件都保存在 UPLOAD_FOLDER 中。
+StorageManager 在内存中按生成顺序索引这些文件，不再每次请求都扫描、排序整个目录：
+- 同时限制文件数、总字节数和保存时长，超出时从最旧的文件开始删除
+- 后台清理线程定期删除过期文件
+- 下载期间持有引用，被持有的文件到期后延迟到最后一个引用释放时再删除
+  （Windows 下正在发送的文件无法删除）
+- 登记时计算内容哈希作为下载的 ETag，可压缩的文件（如 CSV）同时生成一次 gzip 预压缩版本，
+  与原文件一起计入配额、一起删除
+
+启动时扫描一次目录，把上次运行留下的文件纳入索引；子目录（结果缓存、分块上传）不在管理范围内。
+"""
+
+import gzip
+import hashlib
+import io
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+GZIP_SUFFIX = '.gz'
+
+
+def file_etag(path, chunk_size=1024 * 1024):
+    """由文件内容计算强 ETag（SHA-256 前 32 位）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+class StoredFile:
+    """一个生成文件：大小、修改时间、ETag 和预压缩版本 {编码: 路径}"""
+
+    __slots__ = ('path', 'size', 'mtime', 'created', 'etag', 'variants', 'total_size')
+
+    def __init__(self, path, size, mtime, created, etag=None, variants=None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.created = created
+        self.etag = etag
+        self.variants = variants or {}
+        # 原文件与预压缩版本的总字节数
+        self.total_size = size + sum(os.path.getsize(variant) for variant in self.variants.values())
+
+
+class _HeldFile(io.FileIO):
+    """关闭时释放存储引用的只读文件；保留真实的文件描述符，WSGI 服务器可以用 sendfile 零拷贝发送"""
+
+    def __init__(self, path, release):
+        super().__init__(path, 'rb')
+        self._release = release
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._release()
+
+
+class StorageManager:
+    """UPLOAD_FOLDER 中生成文件的索引与配额"""
+
+    def __init__(self, root, max_files=100, max_bytes=2 * 1024 * 1024 * 1024, max_age=24 * 3600,
+                 reap_interval=60, precompress=('.csv',)):
+        self.root = root
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.reap_interval = reap_interval
+        self.precompress = tuple(precompress or ())
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # 路径 -> StoredFile，最旧的在前
+        self._foreign = OrderedDict()  # 索引之外的文件（如结果缓存）：(路径, 大小, 修改时间) -> ETag
+        self._holds = {}  # 路径 -> 引用数
+        self._pending = set()  # 已到期但仍被持有、等待释放后删除的文件
+        self._pending_variants = {}  # 等待删除的文件的预压缩版本
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """把目录中已有的文件按修改时间加入索引，预压缩版本归入原文件（ETag 在首次下载时计算）"""
+        found = {}
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    found[entry.path] = entry.stat()
+        for path, stat in sorted(found.items(), key=lambda item: item[1].st_mtime):
+            if path.endswith(GZIP_SUFFIX) and path[:-len(GZIP_SUFFIX)] in found:
+                continue
+            variants = {'gzip': path + GZIP_SUFFIX} if path + GZIP_SUFFIX in found else None
+            stored = StoredFile(path, stat.st_size, stat.st_mtime, stat.st_mtime, variants=variants)
+            self._entries[path] = stored
+            self.total_bytes += stored.total_size
+        if found:
+            logger.info(f"存储目录已有 {len(found)} 个文件，共 {self.total_bytes // 1024} KB")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def add(self, *paths):
+        """登记新生成的文件：计算 ETag、按需生成预压缩版本，超出配额时删除最旧的文件"""
+        stored_files = [self._describe_new(path) for path in paths if path and os.path.isfile(path)]
+        with self._lock:
+            for stored in stored_files:
+                self._pending.discard(stored.path)
+                old = self._entries.pop(stored.path, None)
+                if old:
+                    self.total_bytes -= old.total_size
+                self._entries[stored.path] = stored
+                self.total_bytes += stored.total_size
+            self._enforce(time.time())
+
+    def _describe_new(self, path):
+        """在锁外完成哈希和压缩，生成文件只处理这一次"""
+        stat = os.stat(path)
+        variants = {}
+        if path.lower().endswith(self.precompress):
+            gzip_path = path + GZIP_SUFFIX
+            with open(path, 'rb') as src, open(gzip_path, 'wb') as raw:
+                # mtime=0 使相同内容的压缩结果完全一致
+                with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            if os.path.getsize(gzip_path) < stat.st_size:
+                variants['gzip'] = gzip_path
+            else:
+                os.remove(gzip_path)  # 压缩后不变小的文件不保留压缩版本
+        return StoredFile(path, stat.st_size, stat.st_mtime, time.time(), file_etag(path), variants)
+
+    def describe(self, path):
+        """返回文件的 StoredFile；不在索引中的文件（如结果缓存）按内容计算 ETag 并缓存"""
+        with self._lock:
+            stored = self._entries.get(path)
+        if stored is not None:
+            if stored.etag is None:
+                stored.etag = file_etag(path)
+            return stored
+
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime)
+        etag = self._foreign.get(key)
+        if etag is None:
+            etag = file_etag(path)
+            with self._lock:
+                self._foreign[key] = etag
+                while len(self._foreign) > 256:
+                    self._foreign.popitem(last=False)
+        return StoredFile(path, stat.st_size, stat.st_mtime, stat.st_mtime, etag)
+
+    def open(self, path, send_path=None):
+        """打开文件用于发送（send_path 可为预压缩版本），关闭前持有 path 的引用"""
+        release = self.hold(path)
+        try:
+            return _HeldFile(send_path or path, release)
+        except OSError:
+            release()
+            raise
+
+    def hold(self, path):
+        """持有文件引用，返回释放函数（可重复调用）；持有期间文件不会被删除"""
+        with self._lock:
+            self._holds[path] = self._holds.get(path, 0) + 1
+        released = []
+
+        def release():
+            if released:
+                return
+            released.append(True)
+            with self._lock:
+                count = self._holds.pop(path) - 1
+                if count:
+                    self._holds[path] = count
+                elif path in self._pending:
+                    self._pending.discard(path)
+                    self._remove(path)
+        return release
+
+    def reap(self):
+        """删除过期文件并执行配额，返回删除的文件数"""
+        with self._lock:
+            return self._enforce(time.time())
+
+    def _enforce(self, now):
+        """从最旧的文件开始删除，直到满足时长、文件数和字节数限制"""
+        removed = 0
+        deadline = now - self.max_age if self.max_age else None
+        while self._entries:
+            path, stored = next(iter(self._entries.items()))
+            expired = deadline is not None and stored.created < deadline
+            over_quota = len(self._entries) > self.max_files or self.total_bytes > self.max_bytes
+            if not (expired or over_quota):
+                break
+            if path in self._holds:
+                # 正在下载：移出索引，等引用释放后再删除
+                self._pending.add(path)
+                self._entries.pop(path)
+                self.total_bytes -= stored.total_size
+                self._pending_variants[path] = stored.variants
+                continue
+            self._remove(path)
+            removed += 1
+        return removed
+
+    def _remove(self, path):
+        stored = self._entries.pop(path, None)
+        variants = self._pending_variants.pop(path, {})
+        if stored:
+            self.total_bytes -= stored.total_size
+            variants = stored.variants
+        for file_path in [path] + list(variants.values()):
+            try:
+                os.remove(file_path)
+                logger.info(f"已清理旧文件: {os.path.basename(file_path)}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"清理文件失败: {e}")
+
+    def start_reaper(self):
+        """启动后台清理线程（守护线程，重复调用无效果）"""
+        if self._reaper is not None or not self.reap_interval:
+            return
+        self._stop.clear()
+        self._reaper = threading.Thread(target=self._reap_loop, name='storage-reaper', daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self):
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join(timeout=5)
+            self._reaper = None
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"清理文件过程出错: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'bytes': self.total_bytes,
+                'held': len(self._holds),
+                'pending': len(self._pending),
+            }
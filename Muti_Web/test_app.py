@@ -0,0 +1,1198 @@
+"""
+Muti_Web 测试套件
+
+覆盖多语言工具 Web 服务的核心处理逻辑：
+- 列式翻译表加载
+- 代码转 Excel 与 C 源码词法分析
+- ASGI 入口（异步接收请求体）
+- Excel 对比结果、增量对比与批量对比
+- 流式结果工作簿和附属文件
+- 结果缓存
+- 后台任务调度与性能指标
+- 热点循环日志的计数与抽样
+- 进度事件流
+- 错误码匹配索引
+- 相似度引擎一致性
+
+运行方式：
+    python -m pytest test_app.py -v
+"""
+
+import io
+import json
+import os
+import sys
+import time
+
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+pytest.importorskip('flask')
+
+# 添加 Muti_Web 目录到路径，以便直接导入 app 模块
+sys.path.insert(0, os.path.dirname(__file__))
+
+import app as web_app  # noqa: E402
+import similarity  # noqa: E402
+
+web_app.init_server()
+
+
+def write_workbook(path, rows):
+    """把二维列表写入一个新的 Excel 文件"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    wb.close()
+    return str(path)
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """把上传目录指向临时目录"""
+    monkeypatch.setitem(web_app.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(web_app, 'result_cache', web_app.ResultCache(str(tmp_path / 'result_cache')))
+    monkeypatch.setattr(web_app, 'storage', web_app.StorageManager(str(tmp_path), reap_interval=None))
+    return tmp_path
+
+
+@pytest.fixture
+def excel_pair(upload_dir):
+    """生成一对源文件/翻译文件"""
+    header = ["Key", "中文（CN）", "英文（EN）English", "德语(DE)Deutsch"]
+    source = write_workbook(upload_dir / 'source.xlsx', [
+        header,
+        ["KEY_OK", "确定", "OK", "OK"],
+        ["KEY_CANCEL", "取消", "Cancel", "Abbrechen"],
+        ["KEY_ONLY_SOURCE", "仅源", "Only", None],
+    ])
+    trans = write_workbook(upload_dir / 'trans.xlsx', [
+        header,
+        ["key_ok", "确定", "OK", "OK"],
+        ["KEY_CANCEL", "取消", "Cancel!", "Abbrechen"],
+    ])
+    return source, trans
+
+
+def test_translation_table_from_excel(excel_pair):
+    """测试列式翻译表的流式加载和查询"""
+    source, _ = excel_pair
+    table = web_app.TranslationTable.from_excel(source)
+    table.lang_columns = {"英文（EN）English": 3}
+
+    assert table.header[0] == "Key"
+    assert table.max_column == 4
+    assert table.keys == ["KEY_OK", "KEY_CANCEL", "KEY_ONLY_SOURCE"]
+    assert table.key_index["KEY_CANCEL"] == 1
+    assert table.lang_texts("英文（EN）English") == ["OK", "Cancel", "Only"]
+    assert table.column_texts(4) == ["OK", "Abbrechen", ""]
+    assert table.lang_texts("缺失语言") == ["", "", ""]
+
+
+def test_convert_code(upload_dir):
+    """测试 C 源码多语言数组转换为 Excel"""
+    code = (
+        'const char *str_ok[MAX_LANGUAGE] = {"确定", "OK", "OK"};\n'
+        'const char *str_single[MAX_LANGUAGE] = "single";\n'
+        'const char *str_cancel[MAX_LANGUAGE] = {\n    "取消",\n    "Cancel \\"x\\"",\n};\n'
+    )
+    client = web_app.app.test_client()
+    response = client.post('/api/convert-code', data={
+        'code_file': (io.BytesIO(code.encode('utf-8')), 'lang.c')
+    }, content_type='multipart/form-data')
+
+    data = response.get_json()
+    assert data['success'], data
+    wb = openpyxl.load_workbook(upload_dir / data['filename'])
+    rows = list(wb.active.iter_rows(values_only=True))
+    wb.close()
+
+    assert rows[0][:3] == ("Key", "中文（CN）", "英文（EN）English")
+    assert rows[1][:4] == ("str_ok", "确定", "OK", "OK")
+    assert rows[2][:3] == ("str_cancel", "取消", 'Cancel \\"x\\"')
+    assert len(rows) == 3
+
+
+def call_asgi(application, method, path, body=b'', headers=(), chunk_size=None):
+    """在事件循环中调用 ASGI 应用，请求体按 chunk_size 分块送入，返回 (状态码, 响应头, 响应体)
+
+    检查响应以 more_body 为 False 的消息结束（否则服务器不会结束这个响应）。
+    """
+    import asyncio
+
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] if chunk_size else [body]
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)  # 请求体已送完，模拟客户端保持连接
+
+    async def send(message):
+        sent.append(message)
+
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '', 'scheme': 'http',
+        'query_string': query.encode(), 'http_version': '1.1',
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        'server': ('127.0.0.1', 5000), 'client': ('127.0.0.1', 50000),
+    }
+    asyncio.run(application(scope, receive, send))
+    start = sent[0]
+    assert sent[-1]['type'] == 'http.response.body' and not sent[-1].get('more_body', False), sent[-1]
+    return (start['status'], {name.decode(): value.decode() for name, value in start['headers']},
+            b''.join(message.get('body', b'') for message in sent[1:]))
+
+
+def test_asgi_entry_point(upload_dir, monkeypatch):
+    """ASGI 入口：分块接收上传后交给同一组 Flask 路由，大文件下载分块发送，超限请求提前返回 413"""
+    from werkzeug.datastructures import FileStorage
+    from werkzeug.test import encode_multipart
+    import asgi
+
+    application = asgi.WsgiBridge(web_app.app, max_threads=2, stream_threads=2, spool_size=64)
+    try:
+        status, _, page = call_asgi(application, 'GET', '/')
+        assert status == 200 and '<html' in page.decode('utf-8').lower()
+
+        code = 'const char *str_ok[MAX_LANGUAGE] = {"确定", "OK", "OK"};\n' * 50
+        boundary, body = encode_multipart(
+            {'code_file': FileStorage(io.BytesIO(code.encode('utf-8')), 'lang.c')})
+        content_type = f'multipart/form-data; boundary={boundary}'
+        status, _, data = call_asgi(application, 'POST', '/api/convert-code', body,
+                                    [('Content-Type', content_type), ('Content-Length', str(len(body)))],
+                                    chunk_size=100)
+        data = json.loads(data)
+        assert status == 200 and data['success'], data
+
+        status, headers, content = call_asgi(application, 'GET', data['download_url'])
+        assert status == 200
+        assert content == (upload_dir / data['filename']).read_bytes()
+        assert int(headers['content-length']) == len(content)
+
+        # 没有 Content-Length 的上传：接收过程中超过该接口的限制即返回 413
+        monkeypatch.setitem(web_app.app.config, 'ENDPOINT_MAX_CONTENT_LENGTH', {'convert_code': 1000})
+        status, _, content = call_asgi(application, 'POST', '/api/convert-code', body,
+                                       [('Content-Type', content_type)], chunk_size=100)
+        assert status == 413 and b'Request Entity Too Large' in content
+        # 声明的长度已超限：不接收请求体，直接由 Flask 返回 413（未读取的请求体消息不算客户端断开）
+        status, _, content = call_asgi(application, 'POST', '/api/convert-code', body,
+                                       [('Content-Type', content_type), ('Content-Length', str(len(body)))],
+                                       chunk_size=100)
+        assert status == 413 and b'Request Entity Too Large' in content
+    finally:
+        application.close()
+
+
+def test_c_lexer_definitions():
+    """测试词法分析处理注释、转义、字符串拼接和任意块边界"""
+    import c_lexer
+    code = (
+        '/* const char *commented[MAX_LANGUAGE] = {"x", "y"}; */\n'
+        '// const char *line_commented[MAX_LANGUAGE] = {"x", "y"};\n'
+        'const int size = 3;\n'
+        'static const char *str_ok[MAX_LANGUAGE] = {"确定", /* 英文, "x" */ "O" "K"};\n'
+        'const char *str_single[MAX_LANGUAGE] = "single";\n'
+        'const char* str_esc[ MAX_LANGUAGE ]={ "a\\"}b", "c\\\\",\n "d" };\n'
+        'const char *str_num[3] = {"1", "2"};\n'
+        'const char *unclosed[MAX_LANGUAGE] = {"a", "b"\n'
+    )
+    expected = [
+        c_lexer.Definition('array', 'str_ok', 'MAX_LANGUAGE', ['确定', 'OK'], 1),
+        c_lexer.Definition('single', 'str_single', 'MAX_LANGUAGE', ['single'], 0),
+        c_lexer.Definition('array', 'str_esc', 'MAX_LANGUAGE', ['a\\"}b', 'c\\\\', 'd'], 2),
+        c_lexer.Definition('array', 'str_num', '3', ['1', '2'], 1),
+    ]
+    for chunk_size in (1, 5, 64, c_lexer.CHUNK_SIZE):
+        assert list(c_lexer.iter_definitions(io.StringIO(code), chunk_size)) == expected, chunk_size
+
+
+def test_upload_limit_per_endpoint(upload_dir, monkeypatch):
+    """测试代码转换接口不受全局上传大小限制"""
+    monkeypatch.setitem(web_app.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    code = 'const char *str_ok[MAX_LANGUAGE] = {"确定", "OK"};\n' + '// padding\n' * 200
+    client = web_app.app.test_client()
+
+    response = client.post('/api/convert-code', data={
+        'code_file': (io.BytesIO(code.encode('utf-8')), 'lang.c')
+    }, content_type='multipart/form-data')
+    assert response.get_json()['success']
+
+    response = client.post('/api/compare-excel', data={
+        'source_file': (io.BytesIO(code.encode('utf-8')), 'source.xlsx'),
+        'trans_file': (io.BytesIO(b''), 'trans.xlsx')
+    }, content_type='multipart/form-data')
+    assert response.status_code >= 400  # 超过全局限制（接口把 413 包装为错误响应）
+
+
+def upload_in_chunks(client, data, chunk_size, filename='file.bin'):
+    """通过分块上传接口上传 data，返回 upload_id"""
+    import hashlib
+    response = client.post('/api/uploads', json={
+        'filename': filename, 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()})
+    assert response.status_code == 201
+    upload_id = response.get_json()['upload_id']
+    for offset in range(0, len(data), chunk_size):
+        response = client.put(f'/api/uploads/{upload_id}', data=data[offset:offset + chunk_size],
+                              headers={'Upload-Offset': str(offset)})
+        assert response.status_code == 200, response.get_json()
+    return upload_id
+
+
+@pytest.fixture
+def chunked_uploads(upload_dir, monkeypatch):
+    """使用临时目录中的上传会话表"""
+    manager = web_app.UploadManager(str(upload_dir / 'uploads'))
+    monkeypatch.setattr(web_app, 'uploads', manager)
+    return manager
+
+
+def test_chunked_upload_resume_and_checksum(chunked_uploads):
+    """测试分块上传的偏移量续传、分块校验和整个文件校验"""
+    import hashlib
+    client = web_app.app.test_client()
+    data = os.urandom(1000)
+    upload_id = client.post('/api/uploads', json={
+        'filename': 'a.bin', 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}).get_json()['upload_id']
+
+    def put(offset, body, checksum=None):
+        headers = {'Upload-Offset': str(offset)}
+        if checksum:
+            headers['Upload-Checksum'] = checksum
+        return client.put(f'/api/uploads/{upload_id}', data=body, headers=headers)
+
+    assert put(0, data[:400]).get_json()['offset'] == 400
+    # 重复发送同一块（如客户端未收到响应）时返回当前偏移量，客户端据此续传
+    response = put(0, data[:400])
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 400
+    # 分块校验失败时丢弃该块
+    response = put(400, data[400:800], checksum=hashlib.sha256(b'other').hexdigest())
+    assert response.status_code == 422
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['offset'] == 400
+
+    assert put(400, data[400:800], checksum=hashlib.sha256(data[400:800]).hexdigest()).status_code == 200
+    status = put(800, data[800:]).get_json()
+    assert status['status'] == 'complete'
+    done_path = os.path.join(chunked_uploads.upload_dir, 'done.bin')
+    assert chunked_uploads.take(upload_id, done_path) == hashlib.sha256(data).hexdigest()
+
+    # 整个文件校验和不一致时上传被标记为损坏
+    upload_id = client.post('/api/uploads', json={'filename': 'b.bin', 'size': 3, 'sha256': '0' * 64}).get_json()['upload_id']
+    assert put(0, b'abc').get_json()['status'] == 'corrupt'
+    assert client.post('/api/compare-excel', data={'source_file_upload_id': upload_id}).status_code == 422
+    assert client.delete(f'/api/uploads/{upload_id}').status_code == 200
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+
+
+def test_chunked_upload_compare_and_convert(excel_pair, upload_dir, chunked_uploads):
+    """测试分块上传的文件用于对比（缓存键与普通上传一致），以及边上传边解析代码文件"""
+    import threading
+    source, trans = excel_pair
+    client = web_app.app.test_client()
+    source_bytes, trans_bytes = open(source, 'rb').read(), open(trans, 'rb').read()
+
+    response = client.post('/api/compare-excel', data={
+        'source_file_upload_id': upload_in_chunks(client, source_bytes, 1000, 'source.xlsx'),
+        'trans_file_upload_id': upload_in_chunks(client, trans_bytes, 1000, 'trans.xlsx'),
+        'languages[]': ["中文（CN）"]
+    })
+    first = response.get_json()['task_id']
+    deadline = time.time() + 10
+    while web_app.tasks[first]['status'] == 'processing' and time.time() < deadline:
+        time.sleep(0.05)
+    assert web_app.tasks[first]['status'] == 'completed'
+
+    response = client.post('/api/compare-excel', data={
+        'source_file': (io.BytesIO(source_bytes), 'source.xlsx'),
+        'trans_file': (io.BytesIO(trans_bytes), 'trans.xlsx'),
+        'languages[]': ["中文（CN）"]
+    }, content_type='multipart/form-data')
+    assert web_app.tasks[response.get_json()['task_id']].get('cached') is True
+
+    # 转换请求先于最后一块到达，解析与上传重叠进行
+    code = ''.join(f'const char *str_{i}[MAX_LANGUAGE] = {{"值{i}", "Value {i}"}};\n' for i in range(500))
+    data = code.encode('utf-8')
+    upload_id = client.post('/api/uploads', json={'filename': 'lang.c', 'size': len(data)}).get_json()['upload_id']
+    session = chunked_uploads.get(upload_id)
+    session.write_chunk(0, io.BytesIO(data), len(data) // 2)
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(
+        response=web_app.app.test_client().post('/api/convert-code', data={'upload_id': upload_id})))
+    worker.start()
+    time.sleep(0.2)
+    assert worker.is_alive()  # 等待剩余数据
+    session.write_chunk(len(data) // 2, io.BytesIO(data[len(data) // 2:]), len(data) - len(data) // 2)
+    worker.join(10)
+    assert result['response'].get_json()['success']
+    wb = openpyxl.load_workbook(upload_dir / result['response'].get_json()['filename'])
+    assert wb.active.max_row == 501
+    wb.close()
+    assert upload_id not in chunked_uploads
+
+
+def test_language_header_recognizer():
+    """测试表头语言识别的优先级、别名、按列顺序补齐和缓存"""
+    recognizer = web_app.LanguageHeaderRecognizer(web_app.LANGUAGE_ORDER)
+    expected = {
+        "繁体中文(TW)": "繁体中文",
+        "中文(CN)": "中文（CN）",
+        "Chinese CN": "中文（CN）",
+        " English ": "英文（EN）English",
+        "EN": "英文（EN）English",
+        "en-US": None,  # 语言代码要求整个表头一致
+        "葡萄牙 br": "巴西葡语(BR)Português",  # br/ru/tr/jp/kr/ar 沿用包含匹配
+        "Traditional": "土耳其语(TR)Turkish",
+        "Hindi": "印地语 （HI）Hindi",
+        "Key": None,
+    }
+    for header, lang in expected.items():
+        assert recognizer.recognize(header) == lang, header
+    for lang in web_app.LANGUAGE_ORDER:
+        assert recognizer.recognize(lang) == lang
+    # 单独的"中文"只在多于两列的表格中视为中文（CN）
+    assert recognizer.resolve(["Key", "中文"]) == {}
+    assert recognizer.resolve(["Key", "中文", "EN"]) == {"中文（CN）": 2, "英文（EN）English": 3}
+
+    # 相同表头行命中缓存，返回的映射可以修改
+    headers = ["Key", "中文（CN）", "备注", "Traditional"]
+    lang_map = recognizer.resolve(headers)
+    lang_map["额外"] = 9
+    assert recognizer.resolve(headers) == {"中文（CN）": 2, "土耳其语(TR)Turkish": 4}
+    assert recognizer.cache_info().hits == 1
+
+    # 未识别的语言按标准列顺序补齐；繁体中文与中文落在同一列时改用 traditional 列
+    headers = ["Key", "备注", "说明", "列3", "列4", "列5", "列6", "列7", "列8", "列9", "列10",
+               "列11", "列12", "中文（CN）", "Traditional"]
+    lang_map = recognizer.resolve(headers)
+    filled = recognizer.fill_by_position(lang_map, ["繁体中文", "英文（EN）English"], headers, len(headers))
+    assert filled == ["英文（EN）English", "繁体中文"]
+    assert lang_map["英文（EN）English"] == 3
+    assert lang_map["繁体中文"] == 15
+
+
+def test_error_code_lang_map_matches_full_names():
+    """错误码校对的语言列只按表头包含完整语言名匹配，不识别英文名、语言代码等别名"""
+    from types import SimpleNamespace
+
+    langs = ["中文（CN）", "英文（EN）English", "德语(DE)Deutsch", "繁体中文"]
+    table = SimpleNamespace(header=["Key", "中文（CN）", "English", " 英文（EN）English 译文", "DE", "繁体中文", None],
+                            max_column=7)
+    assert web_app.build_selected_lang_map(table, langs) == {
+        "中文（CN）": 2, "英文（EN）English": 4, "繁体中文": 6}
+    # Excel对比的识别器会把 English、DE 也识别为语言列
+    assert web_app.header_recognizer.resolve(table.header, table.max_column)["德语(DE)Deutsch"] == 5
+
+
+def test_compare_excel_files(excel_pair, upload_dir):
+    """测试 Excel 对比生成的结果文件内容"""
+    source, trans = excel_pair
+    task_id = 'test-compare'
+    web_app.tasks[task_id] = {'progress': 0, 'status': 'processing', 'message': ''}
+
+    result = web_app.compare_excel_files(
+        source, trans, ["中文（CN）", "英文（EN）English"], task_id)
+
+    assert result['success'], result.get('error')
+    wb = openpyxl.load_workbook(upload_dir / result['filename'])
+    ws = wb.active
+    rows = list(ws.iter_rows(min_row=2, max_row=7, values_only=True))
+    wb.close()
+
+    assert rows[0] == ("KEY_OK", "key_ok", "中文（CN）", "确定", "确定", "一致")
+    assert rows[3][2:] == ("英文（EN）English", "Cancel", "Cancel!", "不一致")
+    assert rows[4][1] == "未匹配"
+    assert rows[4][4:] == ("【键名未匹配】", "键名缺失")
+
+
+def test_compare_excel_incremental(excel_pair, upload_dir, monkeypatch):
+    """增量对比：首次建立快照；再次对比只重新对比变化的键，合并后的完整报告与完整对比一致"""
+    from snapshot_store import SnapshotStore
+
+    snapshot_store = SnapshotStore(str(upload_dir / 'snapshots'))
+    source, trans = excel_pair
+    langs = ["中文（CN）", "英文（EN）English", "德语(DE)Deutsch"]
+    task_id = 'test-incremental'
+    web_app.tasks[task_id] = {'progress': 0, 'status': 'processing', 'message': ''}
+
+    first = web_app.compare_excel_files(source, trans, langs, task_id, lineage='项目A', snapshot_store=snapshot_store)
+    assert first['success'], first.get('error')
+    assert first['statistics']['incremental']['baseline'] is False
+    assert first['changes_filename'] is None
+
+    # 新版本：删除一个键、新增一个键，翻译文件修改一个键
+    header = ["Key", "中文（CN）", "英文（EN）English", "德语(DE)Deutsch"]
+    source_v2 = write_workbook(upload_dir / 'source_v2.xlsx', [
+        header,
+        ["KEY_OK", "确定", "OK", "OK"],
+        ["KEY_CANCEL", "取消", "Cancel", "Abbrechen"],
+        ["KEY_NEW", "新建", "New", "Neu"],
+    ])
+    trans_v2 = write_workbook(upload_dir / 'trans_v2.xlsx', [
+        header,
+        ["key_ok", "确定", "OK", "OK"],
+        ["KEY_CANCEL", "取消", "Cancel", "Abbrechen"],
+        ["KEY_NEW", "新建", "New", "Neu"],
+    ])
+    second = web_app.compare_excel_files(source_v2, trans_v2, langs, task_id, output_name='incremental',
+                                         lineage='项目A', snapshot_store=snapshot_store)
+    assert second['success'], second.get('error')
+    incremental = second['statistics']['incremental']
+    assert incremental == dict(incremental, baseline=True, added=1, removed=1, changed=1, unchanged=1,
+                               recompared=2)
+
+    full = web_app.compare_excel_files(source_v2, trans_v2, langs, task_id, output_name='full')
+    for field in ('equal', 'different', 'both_empty', 'missing_key', 'missing_column'):
+        assert second['statistics'][field] == full['statistics'][field]
+
+    def read_rows(filename):
+        wb = openpyxl.load_workbook(upload_dir / filename)
+        rows = list(wb.active.iter_rows(min_row=2, values_only=True))
+        wb.close()
+        return rows
+
+    merged_rows = read_rows(second['filename'])
+    full_rows = read_rows(full['filename'])
+    assert merged_rows[:9] == full_rows[:9]
+
+    changes = read_rows(second['changes_filename'])
+    assert [(row[0], row[1]) for row in changes[::3]] == [
+        ("KEY_CANCEL", "翻译内容变化"), ("KEY_NEW", "新增"), ("KEY_ONLY_SOURCE", "删除")]
+    assert changes[1][3:] == ("英文（EN）English", "Cancel", "Cancel", "不一致", "一致")
+    assert changes[3][6:] == (None, "一致")
+    assert changes[6][6:] == ("键名缺失", None)
+
+
+@pytest.mark.parametrize('sidecar_format', ['csv', 'parquet'])
+def test_compare_excel_files_sidecar(excel_pair, upload_dir, sidecar_format):
+    """测试只写模式输出的合并区域、样式和附属文件内容"""
+    import report_writer
+    if sidecar_format not in report_writer.available_sidecar_formats():
+        pytest.skip(f'当前环境不支持 {sidecar_format}')
+    source, trans = excel_pair
+    task_id = 'test-sidecar'
+    web_app.tasks[task_id] = {'progress': 0, 'status': 'processing', 'message': ''}
+
+    result = web_app.compare_excel_files(
+        source, trans, ["中文（CN）", "英文（EN）English"], task_id, sidecar_format=sidecar_format)
+
+    assert result['success'], result.get('error')
+    wb = openpyxl.load_workbook(upload_dir / result['filename'])
+    ws = wb.active
+    assert {str(r) for r in ws.merged_cells.ranges} >= {'A2:A3', 'B2:B3'}
+    assert ws['A2'].font.b and ws['D2'].fill.fgColor.rgb.endswith('8FBC8F')
+    assert ws['D5'].fill.fgColor.rgb.endswith('CD0000')
+    wb.close()
+
+    sidecar_path = upload_dir / result['sidecar_filename']
+    if sidecar_format == 'csv':
+        import csv
+        with open(sidecar_path, encoding='utf-8-sig', newline='') as f:
+            rows = [tuple(row) for row in csv.reader(f)]
+    else:
+        import pyarrow.parquet as pq
+        table = pq.read_table(sidecar_path)
+        rows = [tuple(table.column_names)] + [tuple(row.values()) for row in table.to_pylist()]
+    assert rows[1] == ("KEY_OK", "key_ok", "中文（CN）", "确定", "确定", "一致")
+    # 附属文件每行都带键名，不依赖合并单元格
+    assert rows[2][:2] == ("KEY_OK", "key_ok")
+
+
+def loop_compare(source_key_map, trans_key_map, langs, source_texts, trans_texts):
+    """逐单元格对比的参考实现（批量引擎之前的 compare_excel_files 主循环）"""
+    source_normalized = {k.strip().lower(): k for k in source_key_map}
+    trans_normalized = {k.strip().lower(): k for k in trans_key_map}
+    source_to_trans = {source_normalized[k]: trans_normalized[k]
+                       for k in set(source_normalized) & set(trans_normalized)}
+    rows = []
+    for source_key, source_index in source_key_map.items():
+        trans_key = source_to_trans.get(source_key)
+        trans_index = trans_key_map.get(trans_key) if trans_key else None
+        for lang in langs:
+            source_content = source_texts[lang][source_index]
+            if trans_index is None:
+                trans_content, result = "【键名未匹配】", "键名缺失"
+            elif lang not in trans_texts:
+                trans_content, result = f"【翻译文件缺少{lang}列】", "语言列缺失"
+            else:
+                trans_content = trans_texts[lang][trans_index]
+                if source_content and trans_content and source_content == trans_content:
+                    result = "一致"
+                elif not source_content and not trans_content:
+                    result = "均为空"
+                else:
+                    result = "不一致"
+            rows.append((source_key, trans_key or "未匹配", lang, source_content, trans_content, result))
+    return rows
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_bulk_comparison_matches_loop(use_numpy):
+    """测试批量对比引擎与逐单元格对比结果完全一致"""
+    import random
+    import compare_engine
+    if use_numpy and compare_engine._np is None:
+        pytest.skip('未安装 numpy')
+    rng = random.Random(42)
+    langs = ["中文（CN）", "英文（EN）English", "德语(DE)Deutsch"]
+    values = ['', 'a', 'b', 'OK', '确定']
+    source_keys = [rng.choice(['K', 'k', 'Key ', 'X']) + str(rng.randint(0, 60)) for _ in range(300)]
+    trans_keys = [rng.choice(['K', 'k', 'KEY', 'Y']) + str(rng.randint(0, 60)) for _ in range(200)]
+    source_key_map = {key: i for i, key in enumerate(source_keys)}
+    trans_key_map = {key: i for i, key in enumerate(trans_keys)}
+    source_texts = {lang: [rng.choice(values) for _ in source_keys] for lang in langs}
+    trans_texts = {lang: [rng.choice(values) for _ in trans_keys] for lang in langs[:2]}
+
+    comparison = compare_engine.BulkComparison(
+        source_key_map, trans_key_map, langs, source_texts, trans_texts, use_numpy=use_numpy)
+    rows = [(source_key, trans_key, lang, source, trans, compare_engine.RESULT_LABELS[code])
+            for source_key, trans_key, cells in comparison.iter_keys()
+            for lang, source, trans, code in cells]
+    expected = loop_compare(source_key_map, trans_key_map, langs, source_texts, trans_texts)
+    assert rows == expected
+    assert comparison.count(compare_engine.EQUAL) == sum(row[5] == "一致" for row in expected)
+
+    # 翻译文件没有数据行
+    comparison = compare_engine.BulkComparison(
+        source_key_map, {}, langs, source_texts, {lang: [] for lang in langs}, use_numpy=use_numpy)
+    assert comparison.key_match_count == 0
+    assert set(comparison.codes[langs[0]]) == {compare_engine.MISSING_KEY}
+
+
+def test_result_cache_key_and_lru(excel_pair, tmp_path):
+    """测试缓存键只取决于内容和参数，且按 LRU 淘汰"""
+    source, trans = excel_pair
+    copy_path = tmp_path / 'source_copy.xlsx'
+    copy_path.write_bytes(open(source, 'rb').read())
+
+    key = web_app.make_cache_key('compare', source, trans, ["中文（CN）"])
+    assert key == web_app.make_cache_key('compare', str(copy_path), trans, ["中文（CN）"])
+    assert key != web_app.make_cache_key('compare', source, trans, ["英文（EN）English"])
+    assert key != web_app.make_cache_key('error_code', source, trans, ["中文（CN）"], {'threshold': 80})
+
+    cache = web_app.ResultCache(str(tmp_path / 'cache'), max_entries=2)
+    cache.put('a', source, {'message': 'A'})
+    cache.put('b', trans, {'message': 'B'})
+    assert cache.get('a')['meta'] == {'message': 'A'}  # a 变为最近使用
+    cache.put('c', source)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    # 重新加载索引后条目仍然存在
+    assert web_app.ResultCache(str(tmp_path / 'cache')).get('a') is not None
+
+    # 伴随文件与主结果一起缓存和淘汰
+    cache.put('d', source, companion_paths=[trans])
+    companion = cache.get('d')['companions'][0]
+    assert cache.path_for(companion) is not None
+    cache.put('e', trans)
+    cache.put('f', source)
+    assert cache.get('d') is None
+    assert cache.path_for(companion) is None
+
+
+def test_compare_excel_cache_hit(excel_pair, upload_dir):
+    """测试重复上传相同文件时直接返回缓存结果"""
+    source, trans = excel_pair
+    client = web_app.app.test_client()
+
+    def upload(sidecar=''):
+        response = client.post('/api/compare-excel', data={
+            'source_file': (open(source, 'rb'), 'source.xlsx'),
+            'trans_file': (open(trans, 'rb'), 'trans.xlsx'),
+            'languages[]': ["中文（CN）"],
+            'sidecar': sidecar
+        }, content_type='multipart/form-data')
+        return response.get_json().get('task_id')
+
+    first = upload()
+    deadline = time.time() + 10
+    while web_app.tasks[first]['status'] == 'processing' and time.time() < deadline:
+        time.sleep(0.05)
+    assert web_app.tasks[first]['status'] == 'completed'
+
+    second = upload()
+    status = client.get(f'/api/task-status/{second}').get_json()
+    assert status['status'] == 'completed'
+    assert status['cached'] is True
+    assert client.get(status['download_url']).status_code == 200
+
+    # 附属文件格式参与缓存键，命中时一并返回
+    assert upload('xml') is None
+    third = upload('csv')
+    deadline = time.time() + 10
+    while web_app.tasks[third]['status'] == 'processing' and time.time() < deadline:
+        time.sleep(0.05)
+    status = client.get(f'/api/task-status/{upload("csv")}').get_json()
+    assert status['cached'] is True
+    response = client.get(status['sidecar_url'])
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+
+
+def wait_for_task(task_id, timeout=20):
+    deadline = time.time() + timeout
+    while web_app.tasks[task_id]['status'] == 'processing' and time.time() < deadline:
+        time.sleep(0.05)
+    return web_app.tasks[task_id]
+
+
+def test_compare_batch(excel_pair, upload_dir, monkeypatch):
+    """测试批量对比：共用源文件的多文件表单、按目录配对的压缩包、汇总统计和报告"""
+    import shutil
+    import zipfile
+    from translation_table import TranslationTable
+    monkeypatch.setitem(web_app.app.config, 'BATCH_FOLDER', str(upload_dir / 'batches'))
+    source, trans = excel_pair
+    client = web_app.app.test_client()
+    languages = ["中文（CN）", "英文（EN）English"]
+
+    # 一个源文件、两个翻译文件：两对共用源文件
+    response = client.post('/api/compare-batch', data={
+        'source_files': [(open(source, 'rb'), '源文件.xlsx')],
+        'trans_files': [(open(trans, 'rb'), 'v1.xlsx'), (open(trans, 'rb'), 'v2.xlsx')],
+        'languages[]': languages,
+    }, content_type='multipart/form-data')
+    data = response.get_json()
+    assert [pair['name'] for pair in data['pairs']] == ['v1.xlsx', 'v2.xlsx']
+    assert {pair['source'] for pair in data['pairs']} == {'源文件.xlsx'}
+
+    batch = wait_for_task(data['task_id'])
+    assert batch['status'] == 'completed', batch['message']
+    totals = batch['result']['statistics']
+    assert totals['pairs'] == 2 and totals['completed'] == 2 and totals['failed'] == 0
+    assert totals['total_keys'] == 6 and totals['matched_keys'] == 4
+    assert (totals['equal'], totals['different'], totals['missing_key']) == (6, 2, 4)
+    assert all(report['statistics']['equal'] == 3 for report in batch['reports'])
+    assert not os.path.exists(upload_dir / 'batches' / data['task_id'])  # 上传文件已清理
+
+    wb = openpyxl.load_workbook(io.BytesIO(client.get(batch['download_url']).get_data()))
+    rows = list(wb.active.iter_rows(values_only=True))
+    wb.close()
+    assert rows[1][:3] == ('v1.xlsx', '源文件.xlsx', '完成')
+    assert rows[-1][0] == '合计' and rows[-1][6] == 6
+    for report in batch['reports']:
+        assert client.get(report['download_url']).status_code == 200
+
+    # 压缩包：source/ 与 trans/ 目录下同名文件配对
+    other = upload_dir / 'other.xlsx'
+    shutil.copy(source, other)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.write(source, 'batch/source/a.xlsx')
+        zf.write(other, 'batch/source/b.xlsx')
+        zf.write(source, 'batch/trans/b.xlsx')
+        zf.write(trans, 'batch/trans/a.xlsx')
+        zf.writestr('batch/readme.txt', 'ignored')
+    archive.seek(0)
+    response = client.post('/api/compare-batch', data={
+        'archive': (archive, 'batch.zip'),
+        'languages[]': languages,
+    }, content_type='multipart/form-data')
+    data = response.get_json()
+    assert [pair['name'] for pair in data['pairs']] == ['a.xlsx', 'b.xlsx']
+    batch = wait_for_task(data['task_id'])
+    assert [report['statistics']['equal'] for report in batch['reports']] == [3, 6]
+
+    # 无法配对、压缩包无效
+    response = client.post('/api/compare-batch', data={
+        'source_files': [(open(source, 'rb'), 'a.xlsx'), (open(source, 'rb'), 'b.xlsx')],
+        'trans_files': [(open(trans, 'rb'), 'c.xlsx')],
+    }, content_type='multipart/form-data')
+    assert response.status_code == 400
+    response = client.post('/api/compare-batch', data={
+        'archive': (io.BytesIO(b'not a zip'), 'batch.zip'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 400
+
+    # 同一内容哈希的源文件在本进程中只解析一次
+    first = TranslationTable.from_excel_cached(source, 'digest-a')
+    assert TranslationTable.from_excel_cached(str(other), 'digest-a') is first
+    assert TranslationTable.from_excel_cached(source, 'digest-b') is not first
+
+
+def test_storage_manager_quotas_and_holds(tmp_path, monkeypatch):
+    """测试生成文件的数量/字节/时长配额，以及下载期间延迟删除"""
+    def make(name, size):
+        path = tmp_path / name
+        path.write_bytes(b'x' * size)
+        return str(path)
+
+    old = make('old.xlsx', 10)
+    os.utime(old, (time.time() - 100, time.time() - 100))
+    storage = web_app.StorageManager(str(tmp_path), max_files=3, max_bytes=100, max_age=50, reap_interval=None)
+    assert old in storage and storage.total_bytes == 10  # 启动时扫描已有文件
+
+    # 时长：上次运行留下的文件已过期
+    assert storage.reap() == 1
+    assert not os.path.exists(old)
+
+    # 文件数：超过 3 个时删除最旧的
+    paths = [make(f'r{i}.xlsx', 10) for i in range(4)]
+    storage.add(*paths)
+    assert not os.path.exists(paths[0]) and len(storage) == 3
+
+    # 字节数：被持有的文件移出索引，释放后才删除
+    release = storage.hold(paths[1])
+    storage.add(make('big.xlsx', 90))
+    assert os.path.exists(paths[1]) and paths[1] not in storage
+    assert not os.path.exists(paths[2])
+    assert storage.total_bytes <= 100
+    release()
+    release()  # 重复释放无效果
+    assert not os.path.exists(paths[1])
+    assert os.path.exists(paths[3])
+    assert storage.stats() == {'files': 2, 'bytes': 100, 'held': 0, 'pending': 0}
+
+    # 下载接口在响应关闭时释放引用
+    monkeypatch.setitem(web_app.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(web_app, 'storage', storage)
+    response = web_app.app.test_client().get('/download/big.xlsx')
+    assert storage.stats()['held'] == 1
+    assert len(response.get_data()) == 90
+    response.close()
+    assert storage.stats()['held'] == 0
+
+    storage.reap_interval = 0.01
+    storage.max_age = 0
+    storage.max_files = 0
+    storage.start_reaper()
+    deadline = time.time() + 5
+    while len(storage) and time.time() < deadline:
+        time.sleep(0.01)
+    storage.stop_reaper()
+    assert len(storage) == 0
+
+
+def test_download_etag_range_and_gzip(upload_dir):
+    """测试下载的内容 ETag、条件请求、Range 续传和 gzip 预压缩版本"""
+    import gzip
+    data = ''.join(f'KEY_{i},确定,OK\n' for i in range(2000)).encode('utf-8')
+    csv_path = upload_dir / 'report.csv'
+    csv_path.write_bytes(data)
+    web_app.storage.add(str(csv_path))
+    assert os.path.exists(f'{csv_path}.gz')
+    client = web_app.app.test_client()
+
+    response = client.get('/download/report.csv')
+    etag = response.headers['ETag'].strip('"')
+    assert response.get_data() == data
+    assert etag == web_app.storage.describe(str(csv_path)).etag
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    response = client.get('/download/report.csv', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    response.close()
+
+    response = client.get('/download/report.csv', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(data)}'
+    assert response.get_data() == data[100:200]
+    response.close()
+
+    response = client.get('/download/report.csv', headers={'Range': f'bytes={len(data) + 10}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(data)}'
+
+    response = client.get('/download/report.csv', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].strip('"') == f'{etag}-gzip'
+    assert gzip.decompress(response.get_data()) == data
+    response.close()
+    assert web_app.storage.stats()['held'] == 0
+
+    # 删除时连同预压缩版本一起删除
+    web_app.storage.max_files = 0
+    web_app.storage.reap()
+    assert not os.path.exists(csv_path) and not os.path.exists(f'{csv_path}.gz')
+
+
+def test_task_metrics_and_endpoint(excel_pair, upload_dir):
+    """测试任务记录中的阶段耗时和计数，以及 /metrics 的 Prometheus 文本输出"""
+    source, trans = excel_pair
+    client = web_app.app.test_client()
+
+    def upload():
+        response = client.post('/api/compare-excel', data={
+            'source_file': (open(source, 'rb'), 'source.xlsx'),
+            'trans_file': (open(trans, 'rb'), 'trans.xlsx'),
+            'languages[]': ["中文（CN）", "英文（EN）English"],
+        }, content_type='multipart/form-data')
+        return response.get_json()['task_id']
+
+    task = wait_for_task(upload())
+    assert task['status'] == 'completed'
+    stages = task['metrics']['stages']
+    for stage in ('upload', 'queue_wait', 'load', 'language_mapping', 'compare', 'write', 'save', 'run'):
+        assert stages[stage] >= 0
+    assert task['metrics']['counters'] == {'rows': 5, 'cells': 6, 'output_rows': 6}
+    assert task['result']['statistics']['equal'] == 3
+
+    cached = wait_for_task(upload())
+    assert cached['metrics']['counters'] == {'cache_hits': 1}
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    lines = text.splitlines()
+    assert '# TYPE muti_web_task_stage_seconds histogram' in lines
+    assert any(line.startswith('muti_web_task_stage_seconds_bucket{kind="compare",stage="load",le="+Inf"} ')
+               for line in lines)
+    assert 'muti_web_task_items_total{item="cells",kind="compare"}' in text
+    assert 'muti_web_result_cache_requests_total{kind="compare",result="hit"}' in text
+    assert 'muti_web_queue_depth 0' in lines
+    assert any(line.startswith('muti_web_worker_utilization ') for line in lines)
+
+    # 独立的注册表：计数器累加、直方图按桶累计、标签转义
+    registry = web_app.MetricsRegistry(prefix='t', buckets=(1, 5))
+    registry.record_task('x', {'status': 'completed', 'metrics': {'stages': {'s': 2}, 'counters': {'rows': 3}}})
+    registry.record_task('x', {'status': 'completed', 'metrics': {'stages': {'s': 0.5}, 'counters': {'rows': 4}}})
+    registry.inc('odd_total', label='a"b')
+    lines = registry.render().splitlines()
+    assert 't_tasks_total{kind="x",status="completed"} 2' in lines
+    assert 't_task_items_total{item="rows",kind="x"} 7' in lines
+    assert 't_task_stage_seconds_bucket{kind="x",stage="s",le="1"} 1' in lines
+    assert 't_task_stage_seconds_bucket{kind="x",stage="s",le="+Inf"} 2' in lines
+    assert 't_task_stage_seconds_sum{kind="x",stage="s"} 2.5' in lines
+    assert 't_odd_total{label="a\\"b"} 1' in lines
+
+
+def test_loop_log_counts_and_sampling(caplog):
+    """LoopLog：按类别计数，sample 只输出前 first 条和每 every 条，关闭时不格式化参数"""
+    import logging
+    from loop_log import LoopLog
+
+    class Unformattable:
+        def __str__(self):
+            raise AssertionError("未输出的日志不应格式化参数")
+
+    logger = logging.getLogger('test.loop_log')
+    caplog.set_level(logging.DEBUG, logger='test.loop_log')
+
+    sampled = LoopLog(logger, "抽样", 'sample', first=2, every=5)
+    for i in range(1, 11):
+        sampled.event('一致', "第 %d 条", i)
+    sampled.event('不一致')
+    assert sampled.counts == {'一致': 10, '不一致': 1}
+    assert [r.getMessage() for r in caplog.records] == ["第 1 条", "第 2 条", "第 5 条", "第 10 条"]
+
+    caplog.clear()
+    summary = LoopLog(logger, "汇总", 'summary')
+    for _ in range(3):
+        summary.event('一致', "%s", Unformattable())
+    summary.summary()
+    assert [r.getMessage() for r in caplog.records] == ["汇总: 一致 3"]
+
+    caplog.clear()
+    caplog.set_level(logging.INFO, logger='test.loop_log')
+    # sample 模式下 DEBUG 未开启时同样不输出明细
+    quiet = LoopLog(logger, "静默", 'sample')
+    quiet.event('一致', "%s", Unformattable())
+    off = LoopLog(logger, "关闭", 'off')
+    off.event('一致', "%s", Unformattable())
+    off.summary()
+    assert quiet.counts == {'一致': 1}
+    assert not caplog.records
+
+    with pytest.raises(ValueError):
+        LoopLog(logger, "无效", 'verbose')
+
+
+def test_job_scheduler_queue_limit_and_cancel():
+    """测试任务调度器的队列上限、取消和过期清理"""
+    import threading
+    from job_scheduler import JobScheduler
+
+    release = threading.Event()
+
+    def blocking_job(task_id):
+        web_app.report_progress(task_id, 50, '运行中')
+        release.wait(5)
+        web_app.report_progress(task_id, 90, '即将完成')
+        return {'progress': 100, 'status': 'completed', 'message': 'done'}
+
+    scheduler = JobScheduler(max_workers=1, max_queue=2, task_ttl=0, use_processes=False)
+    scheduler.submit('running', blocking_job, 'running')
+    scheduler.submit('pending', blocking_job, 'pending')
+    with pytest.raises(web_app.QueueFullError):
+        scheduler.submit('overflow', blocking_job, 'overflow')
+
+    assert scheduler.cancel('pending')
+    assert scheduler.tasks['pending']['status'] == 'cancelled'
+    assert scheduler.cancel('running')
+    release.set()
+
+    deadline = time.time() + 5
+    while scheduler.tasks['running']['status'] == 'processing' and time.time() < deadline:
+        time.sleep(0.01)
+    assert scheduler.tasks['running']['status'] == 'cancelled'
+    assert not scheduler.cancel('running')
+
+    scheduler.expire()
+    assert scheduler.tasks == {}
+
+
+def test_job_scheduler_callbacks_run_off_result_thread():
+    """收尾回调在收尾线程池中执行，不占用执行器的结果处理线程"""
+    import threading
+    from job_scheduler import JobScheduler
+
+    threads = {}
+    finished = threading.Event()
+
+    def job(task_id):
+        return {'progress': 100, 'status': 'completed', 'message': 'done'}
+
+    def on_finish(fields):
+        threads['on_finish'] = threading.current_thread().name
+        finished.set()
+
+    scheduler = JobScheduler(max_workers=1, use_processes=False)
+    scheduler.submit('job', job, 'job', on_done=lambda fields: threads.setdefault(
+        'on_done', threading.current_thread().name), on_finish=on_finish)
+    assert finished.wait(5)
+    assert threads['on_done'].startswith('job-callback') and threads['on_finish'].startswith('job-callback')
+    assert scheduler.tasks['job']['status'] == 'completed'
+
+
+def test_import_creates_no_server_state():
+    """工作进程导入 app 模块（反序列化任务函数）时不创建存储索引，也不启动清理线程"""
+    import subprocess
+
+    code = ("import threading, app; "
+            "assert app.scheduler is None and app.storage is None and app.result_cache is None; "
+            "assert not any(t.name == 'storage-reaper' for t in threading.enumerate())")
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(__file__), check=True)
+
+
+def test_error_code_job_cancels_during_key_matching(upload_dir, monkeypatch):
+    """错误码校对在键名匹配循环中定期上报进度，取消的任务在匹配结束前中止"""
+    header = ["Key", "中文（CN）", "英文（EN）English"]
+    rows = [[f"ERR_{i}", f"错误{i}：打印头温度异常", f"Error {i}"] for i in range(10)]
+    source = write_workbook(upload_dir / 'source.xlsx', [header] + rows)
+    trans = write_workbook(upload_dir / 'trans.xlsx', [header] + rows)
+    reported = []
+
+    def cancel_during_matching(task_id, progress=None, message=None):
+        reported.append(progress)
+        if message.startswith('正在进行键名+中文匹配 '):
+            raise web_app.JobCancelled(task_id)
+
+    monkeypatch.setattr(web_app, 'report_progress', cancel_during_matching)
+    monkeypatch.setattr(web_app, 'KEY_MATCH_PROGRESS_INTERVAL', 4)
+    options = {'threshold': 80, 'ignore_case': True, 'ignore_special_chars': True, 'extract_numbers': True}
+    fields = web_app.run_error_code_job(source, trans, ["中文（CN）", "英文（EN）English"], options,
+                                        'test-error-cancel', str(upload_dir), 'test')
+    assert fields['status'] == 'cancelled'
+    assert reported[-1] == 64  # 第4个键：60 + 4 * 10 // 10
+    assert not os.path.exists(upload_dir / 'error_check_test.xlsx')
+
+
+def parse_sse(body):
+    """把 SSE 响应拆分为 (事件名, 事件ID, 数据) 列表，忽略注释行"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], fields.get('id'), json.loads(fields['data'])))
+    return events
+
+
+def test_task_events_stream(excel_pair, upload_dir):
+    """测试进度事件流推送到任务结束，并支持 Last-Event-ID 续传"""
+    source, trans = excel_pair
+    client = web_app.app.test_client()
+    response = client.post('/api/compare-excel', data={
+        'source_file': (open(source, 'rb'), 'source.xlsx'),
+        'trans_file': (open(trans, 'rb'), 'trans.xlsx'),
+    }, content_type='multipart/form-data')
+    task_id = response.get_json()['task_id']
+
+    response = client.get(f'/api/task-events/{task_id}')
+    assert response.mimetype == 'text/event-stream'
+    events = parse_sse(response.get_data(as_text=True))
+    assert events[-1][0] == 'end'
+    assert events[-1][2]['status'] == 'completed'
+    assert all(name == 'progress' for name, _, _ in events[:-1])
+    ids = [int(event_id) for _, event_id, _ in events]
+    assert ids == sorted(ids)
+
+    # 从最后一个事件续传：已结束的任务直接返回最终状态
+    response = client.get(f'/api/task-events/{task_id}', headers={'Last-Event-ID': str(ids[-1])})
+    assert parse_sse(response.get_data(as_text=True))[-1][2]['status'] == 'completed'
+
+    response = client.get('/api/task-events/unknown')
+    assert parse_sse(response.get_data(as_text=True)) == [
+        ('end', None, {'status': 'not_found', 'message': '任务不存在'})]
+
+
+def scan_best_match(matcher, source_code, trans_codes_dict):
+    """逐项扫描的参考实现（索引化之前的 find_best_match）"""
+    best = (None, None, 0)
+    str_source = str(source_code)
+    nums_source = matcher.extract_numbers_only(str_source)
+    prefix_source = matcher.extract_prefix(str_source)
+    candidates = []
+    for trans_key, trans_code in trans_codes_dict.items():
+        if not nums_source:
+            candidates.append((trans_key, trans_code, 0))
+            continue
+        nums_trans = matcher.extract_numbers_only(str(trans_code))
+        if not nums_trans:
+            continue
+        if nums_source == nums_trans:
+            candidates.append((trans_key, trans_code, 100))
+        elif len(nums_source) == 1 and len(nums_trans) == 1:
+            num1_str, num2_str = str(nums_source[0]), str(nums_trans[0])
+            if num2_str.startswith(num1_str) or num1_str.startswith(num2_str):
+                prefix_trans = matcher.extract_prefix(str(trans_code))
+                same_prefix = prefix_source and prefix_trans and prefix_source == prefix_trans
+                candidates.append((trans_key, trans_code, 70 if same_prefix else 40))
+    if not candidates:
+        return None, None, 0
+    for trans_key, trans_code, base_score in candidates:
+        similarity = matcher.calculate_similarity(source_code, trans_code)
+        if base_score > 0:
+            similarity = max(similarity, base_score)
+        if similarity > best[2]:
+            best = (trans_key, trans_code, similarity)
+    if best[2] >= matcher.threshold * 100:
+        return best
+    return None, None, best[2]
+
+
+@pytest.mark.parametrize('engine', similarity.available_engines())
+def test_find_best_match_index_matches_scan(engine):
+    """测试索引化的候选查找与逐项扫描结果完全一致"""
+    import random
+    rng = random.Random(20240601)
+    prefixes = ['E', 'e', 'ERR', 'W', '', 'Err-']
+    words = ['timeout', 'Time out', 'nozzle', 'Nozzle clog', 'jam', '']
+
+    def random_code():
+        kind = rng.random()
+        if kind < 0.6:
+            code = f"{rng.choice(prefixes)}{rng.choice(['2', '20', '200', '2000', '20001', '31', '3100', '007'])}"
+            if rng.random() < 0.3:
+                code += rng.choice(['A', '-1', ' ' + rng.choice(words)])
+            return code
+        if kind < 0.95:
+            return rng.choice(words) + rng.choice(['', '!', ' x'])
+        return rng.choice([None, 0, ''])
+
+    trans_codes = {f"T{i}": random_code() for i in range(200)}
+    for options in ({}, {'ignore_case': False, 'threshold': 50}, {'ignore_special_chars': False, 'threshold': 0}):
+        matcher = web_app.ErrorCodeMatcher(engine=engine, **options)
+        index = matcher.build_index(trans_codes)
+        for _ in range(200):
+            source = random_code()
+            expected = scan_best_match(matcher, source, trans_codes)
+            assert matcher.find_best_match(source, index) == expected, source
+            assert matcher.find_best_match(source, trans_codes) == expected, source
+
+
+def mutated_code_pairs(count, seed):
+    """生成 (原错误码, 轻微改动后的错误码) 对，模拟源文件与翻译文件中的近似条目"""
+    import random
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzE0123456789 -_错误超时喷嘴'
+    pairs = []
+    for _ in range(count):
+        code = ''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 24)))
+        mutated = list(code)
+        for _ in range(rng.randint(0, 3)):
+            pos = rng.randrange(len(mutated) + 1)
+            op = rng.choice(['insert', 'delete', 'replace'])
+            if op == 'insert':
+                mutated.insert(pos, rng.choice(alphabet))
+            elif mutated and pos < len(mutated):
+                if op == 'delete':
+                    del mutated[pos]
+                else:
+                    mutated[pos] = rng.choice(alphabet)
+        pairs.append((code, ''.join(mutated)))
+    return pairs
+
+
+def test_error_code_features_memoized():
+    """每个错误码的特征只提取一次，相似度计算只使用特征记录"""
+    matcher = web_app.ErrorCodeMatcher(threshold=80, engine='difflib')
+    features = matcher.features('ERR-2000 喷嘴堵塞!')
+    assert matcher.features('ERR-2000 喷嘴堵塞!') is features
+    assert features.numbers == (2000,) and features.digits == ('2000',)
+    assert features.prefix == 'err'
+    assert features.stripped == 'ERR- 喷嘴堵塞!'
+    assert features.normalized == 'err2000 喷嘴堵塞'
+
+    codes = ['E2000 堵塞', 'E20001 堵塞', 'W2000', 'timeout', 'Timeout!', '']
+    scores = [matcher.calculate_similarity(a, b) for a in codes for b in codes]
+    assert len(matcher._features) == 6  # 含第一个错误码，空错误码不提取特征
+    assert matcher.calculate_similarity('E2000 堵塞', 'E20001 堵塞') == scores[1]
+    assert matcher.calculate_similarity('timeout', 'Timeout!') == 100
+    assert matcher.calculate_similarity('E2000', '') == 0
+
+
+def test_difflib_engine_matches_sequence_matcher():
+    """测试 difflib 引擎的单个和批量计算与原有 SequenceMatcher 结果完全一致"""
+    from difflib import SequenceMatcher
+    engine = similarity.get_engine('difflib')
+    pairs = mutated_code_pairs(300, seed=7)
+    choices = [b for _, b in pairs]
+    for a, b in pairs[:50]:
+        assert engine.ratio(a, b) == SequenceMatcher(None, a, b).ratio()
+        assert engine.ratios(a, choices) == [SequenceMatcher(None, a, c).ratio() for c in choices]
+    assert engine.ratios('E001', []) == []
+    # ratio 不对称：query 必须作为 seq1
+    assert SequenceMatcher(None, '超noqdhed', '超喷oqhd').ratio() != SequenceMatcher(None, '超喷oqhd', '超noqdhed').ratio()
+    assert engine.ratios('超noqdhed', ['超喷oqhd']) == [SequenceMatcher(None, '超noqdhed', '超喷oqhd').ratio()]
+
+
+def test_rapidfuzz_engine_within_tolerance():
+    """测试 rapidfuzz 引擎与 difflib 的分数差异在容差范围内
+
+    rapidfuzz 按最长公共子序列计算，不会低于 SequenceMatcher；
+    在匹配阈值附近（difflib ≥ 0.8）的近似条目上两者几乎一致。
+    """
+    if 'rapidfuzz' not in similarity.available_engines():
+        pytest.skip('未安装 rapidfuzz')
+    difflib_engine = similarity.get_engine('difflib')
+    rapid_engine = similarity.get_engine('rapidfuzz')
+    pairs = mutated_code_pairs(5000, seed=11)
+
+    diffs = []
+    for a, b in pairs:
+        expected = difflib_engine.ratio(a, b)
+        actual = rapid_engine.ratio(a, b)
+        assert actual >= expected - 1e-9, (a, b)
+        if expected >= 0.8:
+            assert actual - expected <= 0.12, (a, b)
+        if expected == 1.0:
+            assert actual == 1.0
+        diffs.append(actual - expected)
+    assert sum(diffs) / len(diffs) < 0.01
+
+    # 批量接口与逐个计算一致
+    choices = [b for _, b in pairs[:200]]
+    assert rapid_engine.ratios(pairs[0][0], choices) == pytest.approx(
+        [rapid_engine.ratio(pairs[0][0], c) for c in choices])
+
+
+def test_get_engine_selection(monkeypatch):
+    """测试按名称和环境变量选择相似度引擎：未设置时总是 difflib，rapidfuzz 需显式启用"""
+    monkeypatch.delenv('SIMILARITY_ENGINE', raising=False)
+    assert similarity.get_engine().name == 'difflib'
+    assert web_app.ErrorCodeMatcher().engine.name == 'difflib'
+    assert similarity.get_engine('difflib').name == 'difflib'
+    assert similarity.get_engine('auto').name == similarity.available_engines()[-1]
+    monkeypatch.setenv('SIMILARITY_ENGINE', 'difflib')
+    assert similarity.get_engine().name == 'difflib'
+    assert web_app.ErrorCodeMatcher().engine.name == 'difflib'
+    with pytest.raises(ValueError):
+        similarity.get_engine('levenshtein')
@@ -0,0 +1,145 @@
+"""
+多语言翻译表的列式内存结构
+
+所有接口（代码转Excel、Excel对比、错误码校对）统一把数据加载到
+TranslationTable 中再查询：
+- keys: 键名数组（第一列，已去除首尾空格）
+- columns: 列号（从1开始）-> 与 keys 对齐的值数组
+- lang_columns: 语言 -> 列号 的索引
+"""
+
+import threading
+from collections import OrderedDict
+
+import openpyxl
+
+# 按文件内容哈希缓存的已加载表（每个进程各自一份），批量对比中共用同一源文件时只解析一次
+_TABLE_CACHE_SIZE = 4
+_table_cache = OrderedDict()
+_table_cache_lock = threading.Lock()
+
+
+class TranslationTable:
+    """列式翻译表：键名数组 + 语言列索引 + 每列的值数组"""
+
+    __slots__ = ('header', 'keys', 'columns', 'lang_columns', 'max_column', '_key_index')
+
+    def __init__(self, header=None):
+        self.header = list(header or [])
+        self.keys = []
+        self.columns = {}
+        self.lang_columns = {}
+        self.max_column = len(self.header)
+        self._key_index = None
+
+    @classmethod
+    def from_rows(cls, header, rows, key_column=1):
+        """从表头和数据行构建列式表，跳过键名为空的行"""
+        table = cls(header)
+        key_pos = key_column - 1
+        data_rows = []
+        for row in rows:
+            if len(row) > key_pos and row[key_pos]:
+                table.keys.append(str(row[key_pos]).strip())
+                data_rows.append(row)
+            if len(row) > table.max_column:
+                table.max_column = len(row)
+
+        # 按列转置，一次性生成每列的值数组
+        for col in range(1, table.max_column + 1):
+            pos = col - 1
+            table.columns[col] = [row[pos] if pos < len(row) else None for row in data_rows]
+        return table
+
+    @classmethod
+    def from_excel(cls, file_path, key_column=1):
+        """以只读模式流式读取活动工作表，一次 iter_rows 遍历完成加载"""
+        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            rows_iter = ws.iter_rows(values_only=True)
+            header = next(rows_iter, ())
+            return cls.from_rows(header, rows_iter, key_column)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def is_cached(digest, key_column=1):
+        """本进程是否已缓存该内容哈希的表"""
+        return (digest, key_column) in _table_cache
+
+    @classmethod
+    def from_excel_cached(cls, file_path, digest, key_column=1):
+        """按文件内容哈希复用本进程中已加载的表；返回的表由多次调用共用，调用方不应修改"""
+        cache_key = (digest, key_column)
+        with _table_cache_lock:
+            table = _table_cache.get(cache_key)
+            if table is not None:
+                _table_cache.move_to_end(cache_key)
+                return table
+        table = cls.from_excel(file_path, key_column)
+        table.key_index  # 在共用之前建好键名索引
+        with _table_cache_lock:
+            _table_cache[cache_key] = table
+            while len(_table_cache) > _TABLE_CACHE_SIZE:
+                _table_cache.popitem(last=False)
+        return table
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def key_index(self):
+        """键名 -> 下标，重复键名以最后一次出现为准"""
+        if self._key_index is None:
+            self._key_index = {key: i for i, key in enumerate(self.keys) if key}
+        return self._key_index
+
+    def append(self, key, values, start_column=2):
+        """追加一行：键名写入第一列，values 依次写入 start_column 开始的列"""
+        width = max(self.max_column, start_column + len(values) - 1)
+        for col in range(1, width + 1):
+            if col not in self.columns:
+                self.columns[col] = [None] * len(self.keys)
+        self.max_column = width
+        self.columns[1].append(key)
+        for col in range(2, width + 1):
+            pos = col - start_column
+            self.columns[col].append(values[pos] if 0 <= pos < len(values) else None)
+        self.keys.append(key)
+        self._key_index = None
+
+    def header_text(self, col):
+        """返回指定列的表头，越界返回None"""
+        if 1 <= col <= len(self.header):
+            return self.header[col - 1]
+        return None
+
+    def value(self, index, col):
+        """读取第 index 行、第 col 列的原始值"""
+        column = self.columns.get(col) if col else None
+        if column is None:
+            return None
+        return column[index]
+
+    def column_texts(self, col, empty_if_falsy=False):
+        """返回整列的字符串数组，None 转为空字符串
+
+        empty_if_falsy 为 True 时所有假值（0、空串等）都转为空字符串。
+        """
+        column = self.columns.get(col) if col else None
+        if column is None:
+            return [''] * len(self.keys)
+        if empty_if_falsy:
+            return [str(v) if v else '' for v in column]
+        return ['' if v is None else str(v) for v in column]
+
+    def lang_texts(self, lang, empty_if_falsy=False):
+        """返回某语言整列的字符串数组"""
+        return self.column_texts(self.lang_columns.get(lang), empty_if_falsy)
+
+    def rows(self):
+        """按行生成 [键名, 第2列值, ...]，用于写出 Excel"""
+        columns = [self.columns[col] for col in range(2, self.max_column + 1)]
+        for i, key in enumerate(self.keys):
+            yield [key] + [column[i] for column in columns]
@@ -0,0 +1,253 @@
+"""
+分块、可续传的大文件上传
+
+客户端先创建上传会话，再按偏移量逐块上传：
+- 每块必须从服务端记录的当前偏移量开始写入，偏移量不一致时返回当前偏移量，客户端据此续传
+- 每块可附带 SHA-256 校验，校验失败时该块被丢弃，偏移量不变
+- 服务端边接收边计算整个文件的 SHA-256，完成时与创建会话时给出的值核对，
+  结果缓存直接使用该值，不再重新读取文件
+- 解析方可以在上传过程中通过 reader() 读取已到达的数据，读到尚未到达的位置时等待，
+  使解析时间与上传时间重叠
+
+会话保存在内存中，空闲超过 ttl 秒的会话连同临时文件一起删除。
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """上传请求无效"""
+
+    status_code = 400
+
+
+class UploadNotFound(UploadError):
+    """上传会话不存在或已过期"""
+
+    status_code = 404
+
+
+class OffsetMismatch(UploadError):
+    """分块的起始偏移量与已接收的字节数不一致"""
+
+    status_code = 409
+
+
+class ChecksumMismatch(UploadError):
+    """分块或整个文件的校验和不一致"""
+
+    status_code = 422
+
+
+class UploadSession:
+    """一个上传中的文件"""
+
+    def __init__(self, upload_id, filename, size, path, sha256=None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.path = path
+        self.expected_sha256 = sha256.lower() if sha256 else None
+        self.offset = 0
+        self.status = 'uploading'  # uploading / complete / corrupt / aborted
+        self.sha256 = None
+        self.updated = time.time()
+        self._hash = hashlib.sha256()
+        self._write_lock = threading.Lock()
+        self._changed = threading.Condition()
+        open(path, 'wb').close()
+
+    def to_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': self.offset,
+            'status': self.status,
+        }
+
+    def write_chunk(self, offset, stream, length, chunk_sha256=None):
+        """从 stream 读取 length 字节写到 offset 处，返回新的偏移量"""
+        with self._write_lock:
+            if self.status != 'uploading':
+                raise UploadError(f"上传已结束（{self.status}）")
+            if offset != self.offset:
+                raise OffsetMismatch(f"偏移量不一致：期望 {self.offset}，收到 {offset}")
+            if length <= 0 or offset + length > self.size:
+                raise UploadError(f"分块长度无效: {length}")
+
+            chunk_hash = hashlib.sha256()
+            file_hash = self._hash.copy()
+            received = 0
+            with open(self.path, 'r+b') as f:
+                f.seek(offset)
+                while received < length:
+                    data = stream.read(min(READ_SIZE, length - received))
+                    if not data:
+                        break
+                    f.write(data)
+                    chunk_hash.update(data)
+                    file_hash.update(data)
+                    received += len(data)
+
+                # 数据不完整或校验失败时丢弃本块，偏移量不变，客户端可重传
+                if received != length:
+                    f.truncate(offset)
+                    raise UploadError(f"分块数据不完整：期望 {length} 字节，收到 {received} 字节")
+                if chunk_sha256 and chunk_hash.hexdigest() != chunk_sha256.lower():
+                    f.truncate(offset)
+                    raise ChecksumMismatch("分块校验失败")
+
+            with self._changed:
+                self._hash = file_hash
+                self.offset += length
+                self.updated = time.time()
+                if self.offset == self.size:
+                    self._complete()
+                self._changed.notify_all()
+            return self.offset
+
+    def _complete(self):
+        """全部字节已到达：核对整个文件的校验和"""
+        self.sha256 = self._hash.hexdigest()
+        if self.expected_sha256 and self.sha256 != self.expected_sha256:
+            self.status = 'corrupt'
+            logger.warning(f"上传文件校验失败: {self.filename}")
+        else:
+            self.status = 'complete'
+            logger.info(f"上传完成: {self.filename} ({self.size} 字节)")
+
+    def abort(self):
+        with self._changed:
+            if self.status == 'uploading':
+                self.status = 'aborted'
+            self._changed.notify_all()
+
+    def wait_for(self, position, timeout):
+        """等待 position 之后有数据可读，返回可读到的偏移量；上传结束且已读完时返回 position"""
+        with self._changed:
+            ready = self._changed.wait_for(
+                lambda: self.offset > position or self.status != 'uploading', timeout)
+            if not ready:
+                raise UploadError("等待上传数据超时")
+            if self.status == 'aborted':
+                raise UploadError("上传已取消")
+            if self.status == 'corrupt' and position >= self.offset:
+                raise ChecksumMismatch("上传文件校验失败")
+            return self.offset
+
+    def reader(self, timeout=120):
+        """返回一个二进制读取对象，读到尚未上传的位置时等待（最多 timeout 秒无新数据）"""
+        return io.BufferedReader(_SessionReader(self, timeout), buffer_size=READ_SIZE)
+
+
+class _SessionReader(io.RawIOBase):
+    """按已接收的偏移量读取上传中的文件"""
+
+    def __init__(self, session, timeout):
+        self._session = session
+        self._timeout = timeout
+        self._file = open(session.path, 'rb')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        available = self._session.wait_for(self._position, self._timeout)
+        count = min(len(buffer), available - self._position)
+        if count <= 0:
+            return 0
+        self._file.seek(self._position)
+        data = self._file.read(count)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class UploadManager:
+    """上传会话表"""
+
+    def __init__(self, upload_dir, ttl=3600, max_bytes=1024 * 1024 * 1024):
+        self.upload_dir = upload_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    def create(self, filename, size, sha256=None):
+        """创建上传会话"""
+        self.expire()
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("文件大小无效")
+        if size > self.max_bytes:
+            raise UploadError(f"文件过大（上限 {self.max_bytes // 1024 // 1024}MB）")
+        upload_id = uuid.uuid4().hex
+        session = UploadSession(upload_id, filename, size,
+                                os.path.join(self.upload_dir, f"{upload_id}.part"), sha256)
+        with self._lock:
+            self._sessions[upload_id] = session
+        logger.info(f"创建上传会话: {filename} ({size} 字节)")
+        return session
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, upload_id):
+        return upload_id in self._sessions
+
+    def get(self, upload_id):
+        session = self._sessions.get(upload_id)
+        if session is None:
+            raise UploadNotFound("上传会话不存在或已过期")
+        return session
+
+    def take(self, upload_id, dest_path):
+        """取走已完成的上传文件，移动到 dest_path，返回文件的 SHA-256"""
+        session = self.get(upload_id)
+        if session.status == 'corrupt':
+            raise ChecksumMismatch("上传文件校验失败")
+        if session.status != 'complete':
+            raise OffsetMismatch(f"上传尚未完成：{session.offset}/{session.size}")
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        os.replace(session.path, dest_path)
+        return session.sha256
+
+    def discard(self, upload_id):
+        """取消并删除上传会话及其临时文件"""
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is None:
+            return False
+        session.abort()
+        try:
+            os.remove(session.path)
+        except OSError:
+            pass
+        return True
+
+    def expire(self):
+        """删除空闲超过 ttl 秒的会话"""
+        deadline = time.time() - self.ttl
+        expired = [upload_id for upload_id, session in list(self._sessions.items())
+                   if session.updated < deadline]
+        for upload_id in expired:
+            self.discard(upload_id)
+        if expired:
+            logger.info(f"已清理 {len(expired)} 个过期上传")
@@ -0,0 +1,251 @@
+"""
+3D打印日志分析（logKeyword_crawling.py）性能基准测试
+
+用法：
+    python logKeyword_benchmark.py timestamps --lines 10000000
+    python logKeyword_benchmark.py keywords --lines 2000000
+    python logKeyword_benchmark.py parallel --lines 5000000 --workers 1 2 4 8
+
+每个子命令生成可复现的随机日志（写入临时目录，结束后删除），输出各实现的耗时和加速比。
+原有实现太慢时只跑 --sample 行，再按比例推算全量耗时。
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from logKeyword_crawling import (PRINT_KEYWORDS, KeywordMatcher, PrintProcessAnalyzer, TimestampDecoder,
+                                 find_timestamp)
+
+# 日志格式（strftime）；%f 为6位小数秒，写入时按 fraction 截短
+LOG_FORMATS = {
+    'datetime_ms': ('%Y-%m-%d %H:%M:%S.%f', 3),
+    'datetime': ('%Y-%m-%d %H:%M:%S', 0),
+    'time_ms': ('%H:%M:%S.%f', 3),
+    'time': ('%H:%M:%S', 0),
+}
+
+KEYWORD_LINES = ['Starting SD card print', 'Finished SD card print', 'cmd_CR_BOX_CUT return None',
+                 'slow_kiss_to_pipe', 'sh: restore speed factor: 1.0']
+
+
+def make_log(path, lines, log_format='datetime_ms', seed=0, keyword_ratio=0.002):
+    """生成 lines 行的打印日志：按时间顺序的打印会话、换色流程，其余为温度/状态行"""
+    rng = random.Random(seed)
+    fmt, fraction = LOG_FORMATS[log_format]
+    moment = datetime(2024, 3, 1, 8, 0, 0)
+    step = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(lines):
+            moment += timedelta(milliseconds=rng.randint(1, 900))
+            stamp = moment.strftime(fmt)
+            if fraction:
+                stamp = stamp[:len(stamp) - 6 + fraction]
+            if rng.random() < keyword_ratio:
+                # 按 开始打印 → (切料 → 冲刷开始 → 冲刷结束)* → 结束打印 的顺序循环
+                message = KEYWORD_LINES[step]
+                step = (step + 1) % len(KEYWORD_LINES)
+            else:
+                message = (f"Stats {i}: heater_bed: target=60 temp={rng.uniform(55, 65):.1f} "
+                           f"extruder: target=220 temp={rng.uniform(215, 225):.1f} bytes_write={rng.randint(0, 99999)}")
+            f.write(f"[{stamp}] {message}\n")
+
+
+def legacy_parse_timestamp(line):
+    """原有写法：逐个 re.search 六个格式，strptime 解析，只有时间时每次取当天日期"""
+    timestamp_patterns = [
+        r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+)',
+        r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})',
+        r'(\d{2}:\d{2}:\d{2}\.\d+)',
+        r'(\d{2}:\d{2}:\d{2})',
+        r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})',
+        r'(\d{2}-\d{2}-\d{4} \d{2}:\d{2}:\d{2})',
+    ]
+
+    for pattern in timestamp_patterns:
+        match = re.search(pattern, line)
+        if match:
+            timestamp_str = match.group(1)
+            try:
+                if len(timestamp_str) > 8 and ('-' in timestamp_str or '/' in timestamp_str):
+                    if '-' in timestamp_str and timestamp_str.count('-') == 2:
+                        if '.' in timestamp_str:
+                            return datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S.%f')
+                        else:
+                            return datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+                    elif '-' in timestamp_str and timestamp_str.count('-') == 1:
+                        return datetime.strptime(timestamp_str, '%m-%d-%Y %H:%M:%S')
+                    elif '/' in timestamp_str:
+                        return datetime.strptime(timestamp_str, '%m/%d/%Y %H:%M:%S')
+                else:
+                    today = datetime.now().strftime('%Y-%m-%d')
+                    full_timestamp = f"{today} {timestamp_str}"
+                    if '.' in timestamp_str:
+                        return datetime.strptime(full_timestamp, '%Y-%m-%d %H:%M:%S.%f')
+                    else:
+                        return datetime.strptime(full_timestamp, '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                continue
+    return None
+
+
+def make_extra_keywords(count, seed=0):
+    """生成 count 个额外关键字（断料、堵头之类的提示），不会出现在 make_log 生成的日志中"""
+    rng = random.Random(seed)
+    subjects = ['Filament runout', 'Nozzle clog', 'Heater fault', 'MCU shutdown', 'Probe failed', 'Belt skip']
+    return {f'extra_{i}': f"{rng.choice(subjects)} code {1000 + i}" for i in range(count)}
+
+
+def legacy_match_line(line, keywords):
+    """原有写法：调试统计逐个 in 查找第一个关键字，状态机再逐个 in 判断各阶段"""
+    first = None
+    for key, keyword in keywords.items():
+        if keyword in line:
+            first = key
+            break
+    stages = [key for key in PRINT_KEYWORDS if keywords[key] in line]
+    return first, stages
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def report(title, timings):
+    """打印耗时表，以第一项为基准计算加速比"""
+    print(f"\n{title}")
+    baseline = timings[0][1]
+    for name, seconds in timings:
+        print(f"  {name:<24} {seconds:10.3f} 秒   x{baseline / seconds if seconds else float('inf'):.1f}")
+
+
+def decode_lines(path, decode, limit=None):
+    """逐行解析时间戳，返回 (行数, 解析出的时间戳的校验和)"""
+    count = 0
+    checksum = 0
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            if count == limit:
+                break
+            count += 1
+            timestamp = decode(line.strip())
+            if timestamp is not None:
+                checksum = (checksum + hash(timestamp)) & 0xFFFFFFFFFFFF
+    return count, checksum
+
+
+def bench_timestamps(args):
+    """逐行解析时间戳（每一行都当作关键字行，即最坏情况）"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'printer.log')
+        seconds, _ = timed(make_log, path, args.lines, args.format)
+        print(f"时间戳解析: {args.lines:,} 行（{args.format}，{os.path.getsize(path) / 1024 / 1024:.0f}MB，"
+              f"生成耗时 {seconds:.1f} 秒）")
+
+        sample = min(args.sample, args.lines)
+        scale = args.lines / sample
+        read_seconds, _ = timed(decode_lines, path, lambda line: None)
+
+        legacy_seconds, (_, legacy_checksum) = timed(decode_lines, path, legacy_parse_timestamp, sample)
+        find_seconds, (_, find_checksum) = timed(decode_lines, path, lambda line: find_timestamp(line)[0], sample)
+        decoder = TimestampDecoder()
+        decoder_seconds, _ = timed(decode_lines, path, decoder.decode)
+        _, (_, sample_checksum) = timed(decode_lines, path, TimestampDecoder().decode, sample)
+        assert legacy_checksum == find_checksum == sample_checksum, "解析结果与原有写法不一致"
+
+        print(f"  只读取文件                {read_seconds:10.3f} 秒（以下耗时均已扣除）")
+        report(f"每行解析时间戳（原有写法和逐个查找只跑 {sample:,} 行，按比例推算）", [
+            ('原有写法（推算）', legacy_seconds * scale - read_seconds),
+            ('预编译正则 + strptime（推算）', find_seconds * scale - read_seconds),
+            ('格式检测 + 固定偏移', decoder_seconds - read_seconds),
+        ])
+        print(f"\n  回退到逐个查找的行: {decoder.fallbacks:,}")
+
+
+def match_lines(path, match):
+    """逐行匹配关键字，返回含关键字的行数"""
+    hits = 0
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            if match(line.strip()):
+                hits += 1
+    return hits
+
+
+def bench_keywords(args):
+    """逐行匹配关键字：关键字数增加时每行的耗时"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'printer.log')
+        make_log(path, args.lines)
+        read_seconds, _ = timed(match_lines, path, lambda line: False)
+        print(f"关键字匹配: {args.lines:,} 行，只读取文件 {read_seconds:.3f} 秒（以下耗时均已扣除）")
+
+        for extra in args.extra:
+            keywords = dict(PRINT_KEYWORDS, **make_extra_keywords(extra))
+            matcher = KeywordMatcher(keywords)
+            legacy_seconds, legacy_hits = timed(
+                match_lines, path, lambda line: legacy_match_line(line, keywords)[0] is not None)
+            seconds, hits = timed(match_lines, path, matcher.match)
+            assert hits == legacy_hits
+            strategy = '合并正则' if matcher.pattern is not None else '逐个 in'
+            report(f"{len(keywords)} 个关键字（KeywordMatcher 使用{strategy}，含关键字的行 {hits:,}）", [
+                ('逐个 in（原有写法）', legacy_seconds - read_seconds),
+                ('KeywordMatcher', seconds - read_seconds),
+            ])
+
+
+def bench_parallel(args):
+    """整个日志的分析（analyze_print_process）：逐行扫描 vs 按块并行扫描"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'printer.log')
+        make_log(path, args.lines)
+        print(f"并行分析: {args.lines:,} 行（{os.path.getsize(path) / 1024 / 1024:.0f}MB），CPU 核数 {os.cpu_count()}")
+
+        analyzer = PrintProcessAnalyzer()
+        timings = []
+        expected = None
+        for workers in args.workers:
+            with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+                seconds, sessions = timed(analyzer.analyze_print_process, path, workers)
+            if expected is None:
+                expected = sessions
+            assert sessions == expected, f"{workers} 个进程的结果与逐行扫描不一致"
+            timings.append(('逐行扫描' if workers == 1 else f'{workers} 个进程', seconds))
+        report(f"分析耗时（{len(expected)} 个会话，{sum(len(s['color_changes']) for s in expected)} 次换色）", timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='3D打印日志分析性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_timestamps = subparsers.add_parser('timestamps', help='时间戳解析（格式检测 + 固定偏移 vs 逐个格式 strptime）')
+    parser_timestamps.add_argument('--lines', type=int, default=10_000_000)
+    parser_timestamps.add_argument('--format', choices=sorted(LOG_FORMATS), default='datetime_ms')
+    parser_timestamps.add_argument('--sample', type=int, default=1_000_000, help='原有写法实际解析的行数')
+    parser_timestamps.set_defaults(func=bench_timestamps)
+
+    parser_keywords = subparsers.add_parser('keywords', help='多关键字匹配（KeywordMatcher vs 逐个 in）')
+    parser_keywords.add_argument('--lines', type=int, default=2_000_000)
+    parser_keywords.add_argument('--extra', type=int, nargs='+', default=[0, 5, 15, 45, 95],
+                                 help='额外关键字数（打印流程的5个关键字之外）')
+    parser_keywords.set_defaults(func=bench_keywords)
+
+    parser_parallel = subparsers.add_parser('parallel', help='按块并行分析整个日志')
+    parser_parallel.add_argument('--lines', type=int, default=5_000_000)
+    parser_parallel.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                                 help='进程数，第一个为基准（1 为逐行扫描）')
+    parser_parallel.set_defaults(func=bench_parallel)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
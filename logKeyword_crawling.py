@@ -1,26 +1,493 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import re
-from datetime import datetime
+from datetime import date, datetime
 import pandas as pd
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import glob
+import hashlib
+import io
+import itertools
+import json
 import os
 
 
+# 时间戳格式，按顺序查找，使用第一个能解析的
+TIMESTAMP_PATTERNS = [
+    re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+)'),
+    re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})'),
+    re.compile(r'(\d{2}:\d{2}:\d{2}\.\d+)'),
+    re.compile(r'(\d{2}:\d{2}:\d{2})'),
+    re.compile(r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})'),
+    re.compile(r'(\d{2}-\d{2}-\d{4} \d{2}:\d{2}:\d{2})'),
+]
+
+# TimestampDecoder 可以锁定的格式：TIMESTAMP_PATTERNS 序号 -> (是否带日期, 需要先排除的更靠前的格式序号)
+# 不带小数秒的格式能匹配的行，带小数秒的格式也可能匹配，按查找顺序应由后者解析；
+# 只有时间的格式：行中有 '-' 时可能有更靠前的带日期格式，都回退到逐个查找
+FAST_TIMESTAMP_FORMATS = {0: (True, None), 1: (True, 0), 2: (False, None), 3: (False, 2)}
+
+# 小数秒位数 -> 换算成微秒的倍数
+_FRACTION_SCALE = [0] + [10 ** (6 - digits) for digits in range(1, 7)]
+
+
+def find_timestamp(line, today=None):
+    """逐个尝试 TIMESTAMP_PATTERNS 解析时间戳，返回 (时间戳, 格式序号, 在行中的位置)，找不到时返回 (None, -1, -1)
+
+    只有时间的格式使用 today（默认当天）的日期。
+    """
+    for index, pattern in enumerate(TIMESTAMP_PATTERNS):
+        match = pattern.search(line)
+        if match:
+            timestamp_str = match.group(1)
+            try:
+                if len(timestamp_str) > 8 and ('-' in timestamp_str or '/' in timestamp_str):
+                    if '-' in timestamp_str and timestamp_str.count('-') == 2:
+                        if '.' in timestamp_str:
+                            timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S.%f')
+                        else:
+                            timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+                    elif '-' in timestamp_str and timestamp_str.count('-') == 1:
+                        timestamp = datetime.strptime(timestamp_str, '%m-%d-%Y %H:%M:%S')
+                    elif '/' in timestamp_str:
+                        timestamp = datetime.strptime(timestamp_str, '%m/%d/%Y %H:%M:%S')
+                    else:
+                        continue
+                else:
+                    if today is None:
+                        today = date.today()
+                    full_timestamp = f"{today:%Y-%m-%d} {timestamp_str}"
+                    if '.' in timestamp_str:
+                        timestamp = datetime.strptime(full_timestamp, '%Y-%m-%d %H:%M:%S.%f')
+                    else:
+                        timestamp = datetime.strptime(full_timestamp, '%Y-%m-%d %H:%M:%S')
+                return timestamp, index, match.start()
+            except ValueError:
+                continue
+    return None, -1, -1
+
+
+class TimestampDecoder:
+    """一个日志文件的时间戳解码器
+
+    同一个日志的时间戳格式通常固定：第一次解析成功时记下格式，之后每行只用该格式的一个正则查找，
+    按固定偏移切出年月日时分秒直接构造 datetime，不再调用 strptime；
+    行中没有该格式、可能有更靠前的格式或数值无效时回退到 find_timestamp，结果与逐个尝试所有格式相同。
+    只有时间的格式使用创建解码器时的日期。
+    """
+
+    def __init__(self, today=None):
+        self.today = today or date.today()
+        self.pattern = None
+        self.has_date = False
+        self.exclude = None
+        self.fallbacks = 0
+        # 日志按时间顺序，相邻行的年月日时分通常相同：缓存上一行的"年-月-日 时:分"及其数值
+        self._head = None
+        self._head_fields = None
+
+    def decode(self, line):
+        """返回行中的时间戳，没有时返回 None"""
+        if self.pattern is not None:
+            timestamp = self._decode_fast(line)
+            if timestamp is not None:
+                return timestamp
+            self.fallbacks += 1
+
+        timestamp, index, _ = find_timestamp(line, self.today)
+        if self.pattern is None and index in FAST_TIMESTAMP_FORMATS:
+            # 第一次解析成功：锁定格式
+            self.pattern = TIMESTAMP_PATTERNS[index]
+            self.has_date, exclude = FAST_TIMESTAMP_FORMATS[index]
+            self.exclude = TIMESTAMP_PATTERNS[exclude] if exclude is not None else None
+        return timestamp
+
+    def _decode_fast(self, line):
+        if not self.has_date and '-' in line:
+            return None
+        match = self.pattern.search(line)
+        if match is None or (self.exclude is not None and self.exclude.search(line)):
+            return None
+        start, end = match.span()
+        # \d 也匹配非 ASCII 数字，而 strptime 只接受 ASCII 数字（不成功时逐个查找会换用下一个格式），交给回退处理
+        if not line[start:end].isascii():
+            return None
+        # 秒所在的位置：带日期时为 'YYYY-MM-DD HH:MM:' 之后，否则为 'HH:MM:' 之后
+        seconds_at = start + 17 if self.has_date else start + 6
+        head = line[start:seconds_at - 1]
+        if head != self._head:
+            if self.has_date:
+                fields = (int(head[0:4]), int(head[5:7]), int(head[8:10]), int(head[11:13]), int(head[14:16]))
+            else:
+                fields = (self.today.year, self.today.month, self.today.day, int(head[0:2]), int(head[3:5]))
+            self._head, self._head_fields = head, fields
+        microsecond = 0
+        digits = end - seconds_at - 3
+        if digits > 0:
+            # strptime 的 %f 只接受1~6位数字
+            if digits > 6:
+                return None
+            microsecond = int(line[seconds_at + 3:end]) * _FRACTION_SCALE[digits]
+        try:
+            return datetime(*self._head_fields, int(line[seconds_at:seconds_at + 2]), microsecond)
+        except ValueError:
+            return None
+
+
+# 打印流程的关键字：关键字名 -> 日志中的文字，状态机按关键字名识别各阶段
+PRINT_KEYWORDS = {
+    'start_print': 'Starting SD card print',
+    'end_print': 'Finished SD card print',
+    'cut_start': 'cmd_CR_BOX_CUT return None',
+    'flush_start': 'slow_kiss_to_pipe',
+    'flush_end': 'sh: restore speed factor:'
+}
+
+# 关键字不超过这个数时逐个用 in 查找比合并的正则快（实测约12~15个时两者相当）
+INLINE_KEYWORD_LIMIT = 12
+
+
+class KeywordMatcher:
+    """多关键字匹配：match(line) 返回行中包含的关键字名
+
+    关键字多时编译成一个正则（各关键字按长度从长到短组成多选），每行扫描一次就能判断是否包含任一关键字，
+    每行的耗时基本不随关键字数增长；关键字少时逐个 in 查找更快。
+    只有含关键字的行（通常很少）才进一步找出包含的全部关键字。
+    """
+
+    def __init__(self, keywords):
+        self.keywords = dict(keywords)
+        if not all(self.keywords.values()):
+            raise ValueError("关键字不能为空")
+        self.texts = sorted(set(self.keywords.values()), key=len, reverse=True)
+        alternation = '|'.join(re.escape(text) for text in self.texts)
+        self.pattern = re.compile(alternation) if len(self.texts) > INLINE_KEYWORD_LIMIT else None
+        # 每个位置上最长的关键字（允许与其他关键字重叠）
+        self.overlapping = re.compile(f'(?=({alternation}))')
+        # 关键字 -> 它包含的关键字（含自身）：较短的关键字与较长的从同一位置开始时由后者带出
+        self.contained = {text: {other for other in self.texts if other in text} for text in self.texts}
+
+    def match(self, line):
+        """返回行中包含的关键字名（按 keywords 的顺序），都不包含时返回空元组"""
+        if self.pattern is None:
+            for text in self.texts:
+                if text in line:
+                    return tuple(name for name, text in self.keywords.items() if text in line)
+            return ()
+
+        found = self.pattern.search(line)
+        if found is None:
+            return ()
+        present = set()
+        for found in self.overlapping.finditer(line, found.start()):
+            present |= self.contained[found.group(1)]
+        return tuple(name for name, text in self.keywords.items() if text in present)
+
+
+class KeywordStats:
+    """关键字调试统计：各关键字的匹配次数，只保留每个关键字前 sample_limit 次匹配的行"""
+
+    def __init__(self, keywords, sample_limit=10):
+        self.counts = {key: 0 for key in keywords}
+        self.sample_limit = sample_limit
+        self.samples = []  # [(行号, 关键字名, 时间戳, 内容), ...]
+
+    def record(self, line_num, key, line, timestamp):
+        self.counts[key] += 1
+        if self.counts[key] <= self.sample_limit:
+            self.samples.append((line_num, key, timestamp, line))
+
+    def merge(self, other, line_offset=0):
+        """合并紧接在后面的一块日志的统计，other 的行号加上 line_offset"""
+        added = dict.fromkeys(self.counts, 0)
+        for line_num, key, timestamp, line in other.samples:
+            if self.counts[key] + added[key] < self.sample_limit:
+                self.samples.append((line_num + line_offset, key, timestamp, line))
+            added[key] += 1
+        for key, count in other.counts.items():
+            self.counts[key] += count
+
+    def report(self, file_name):
+        """按原调试输出的格式打印匹配的行和统计"""
+        print(f"\n=== 文件 {file_name} 的精确调试 ===")
+        for line_num, key, timestamp, line in self.samples:
+            timestamp_info = f"时间戳: {timestamp}" if timestamp else "无时间戳"
+            print(f"行{line_num} - {key}: {timestamp_info}")
+            print(f"    内容: {line}")
+            print()
+
+        print(f"关键字匹配统计:")
+        for key, count in self.counts.items():
+            print(f"  {key}: {count} 次")
+        print(f"=== 文件 {file_name} 调试结束 ===\n")
+
+
+class PrintProcessState:
+    """打印会话和换色流程的状态机：逐行输入，只保存已识别出的会话和换色流程"""
+
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        self.print_sessions = []
+        self.all_color_changes = []
+        self.current_session = None
+        self.current_color_change = None
+        self.session_count = 0
+
+    def _print(self, message):
+        if self.verbose:
+            print(message)
+
+    def feed(self, names, timestamp):
+        """输入一行日志包含的关键字名（KeywordMatcher.match 的结果）及其时间戳（没有时间戳的行不改变状态）"""
+        if not timestamp:
+            return
+
+        # 检查开始打印 - 如果有开始打印，创建新会话
+        if 'start_print' in names:
+            # 保存当前会话（如果有）
+            if self.current_session:
+                self.print_sessions.append(self.current_session)
+
+            self.session_count += 1
+            self.current_session = {
+                'session_id': self.session_count,
+                'start_time': timestamp,
+                'end_time': None,
+                'color_changes': [],
+                'incomplete': True,
+                'has_start': True,
+                'has_end': False
+            }
+            self.current_color_change = None
+            self._print(f"✅ 创建会话 {self.current_session['session_id']}，开始时间: {timestamp}")
+
+        # 检查打印结束
+        elif self.current_session and 'end_print' in names:
+            self.current_session['end_time'] = timestamp
+            self.current_session['incomplete'] = False
+            self.current_session['has_end'] = True
+            self._print(f"✅ 会话 {self.current_session['session_id']} 完成，结束时间: {timestamp}")
+
+        # 检查切料开始 - 无论是否有会话都记录
+        if 'cut_start' in names:
+            # 如果没有当前会话，创建一个默认会话
+            if not self.current_session:
+                self.session_count += 1
+                self.current_session = {
+                    'session_id': self.session_count,
+                    'start_time': None,  # 没有开始时间
+                    'end_time': None,
+                    'color_changes': [],
+                    'incomplete': True,
+                    'has_start': False,
+                    'has_end': False
+                }
+                self._print(f"📝 创建默认会话 {self.current_session['session_id']} 用于存放换色数据")
+
+            # 如果已经有未完成的换色流程，先完成它
+            if self.current_color_change:
+                self._print(f"找到新的切料开始，保存当前换色流程 {self.current_color_change['change_id']}")
+                self.current_session['color_changes'].append(self.current_color_change)
+                self.all_color_changes.append(self.current_color_change)
+
+            self.current_color_change = {
+                'change_id': len(self.current_session['color_changes']) + 1,
+                'cut_start_time': timestamp,
+                'flush_start_time': None,
+                'flush_end_time': None,
+                'complete': False,
+                'session_id': self.current_session['session_id']
+            }
+            self._print(f"✅ 记录换色流程 {self.current_color_change['change_id']}，切料开始: {timestamp}")
+
+        # 检查冲刷开始
+        elif self.current_color_change and 'flush_start' in names:
+            self.current_color_change['flush_start_time'] = timestamp
+            self._print(f"✅ 换色 {self.current_color_change['change_id']} 冲刷开始: {timestamp}")
+
+        # 检查冲刷结束
+        elif self.current_color_change and 'flush_end' in names:
+            color_change = self.current_color_change
+            color_change['flush_end_time'] = timestamp
+            color_change['complete'] = True
+            # 完成当前换色流程
+            self.current_session['color_changes'].append(color_change)
+            self.all_color_changes.append(color_change)
+
+            if color_change['cut_start_time']:
+                total_duration = (timestamp - color_change['cut_start_time']).total_seconds()
+                self._print(f"✅ 换色 {color_change['change_id']} 完成，总耗时: {total_duration:.2f}秒")
+            else:
+                self._print(f"✅ 换色 {color_change['change_id']} 完成，冲刷结束: {timestamp}")
+            self.current_color_change = None
+
+    def finish(self):
+        """文件处理完毕，保存当前会话和最后一个换色流程，返回全部会话"""
+        if self.current_color_change:
+            if self.current_session:
+                self.current_session['color_changes'].append(self.current_color_change)
+            self.all_color_changes.append(self.current_color_change)
+            self.current_color_change = None
+
+        if self.current_session:
+            self.print_sessions.append(self.current_session)
+            self.current_session = None
+
+        # 如果没有找到任何会话但找到了换色数据，创建一个汇总会话
+        if not self.print_sessions and self.all_color_changes:
+            self.session_count += 1
+            summary_session = {
+                'session_id': self.session_count,
+                'start_time': None,
+                'end_time': None,
+                'color_changes': self.all_color_changes,
+                'incomplete': True,
+                'has_start': False,
+                'has_end': False,
+                'is_summary': True
+            }
+            self.print_sessions.append(summary_session)
+            self._print(f"📊 创建汇总会话 {self.session_count} 包含所有换色数据")
+
+        return self.print_sessions
+
+
+# 并行分析时每块的大小（字节），块数不少于进程数
+PARALLEL_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def scan_lines(lines, keywords, state=None, stats=None, today=None):
+    """把 (行号, 行) 中含关键字的行同时交给状态机 state 和调试统计 stats（都可以为 None），返回最后一行的行号"""
+    matcher = KeywordMatcher(keywords)
+    decoder = TimestampDecoder(today)
+    line_num = 0
+    for line_num, line in lines:
+        names = matcher.match(line)
+        if not names:
+            continue  # 不含任何关键字的行既不计入统计，也不会改变状态，不解析时间戳
+        timestamp = decoder.decode(line)
+        if stats is not None:
+            # 一行包含多个关键字时只计入排在前面的一个
+            stats.record(line_num, names[0], line, timestamp)
+        if state is not None:
+            state.feed(names, timestamp)
+    return line_num
+
+
+def split_log(file_path, chunk_count):
+    """把日志按字节分成约 chunk_count 块，返回 [(起始字节, 结束字节), ...]；每块都从一行的行首开始"""
+    size = os.path.getsize(file_path)
+    bounds = [0]
+    with open(file_path, 'rb') as file:
+        for i in range(1, chunk_count):
+            file.seek(max(size * i // chunk_count, bounds[-1]))
+            file.readline()  # 跳到下一个换行符之后
+            position = file.tell()
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_chunk_lines(file_path, start, end, block_size=4 * 1024 * 1024):
+    """逐行读取日志的一块 [start, end)，产出 (块内行号, 去掉首尾空白的行)
+
+    块从行首开始、在换行符之后结束；按 block_size 读取由整行组成的字节块后解码、分行，
+    结果与 iter_log_lines 以文本模式读取整个文件相同。
+    """
+    line_num = 0
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = file.read(min(block_size, remaining))
+            if not block:
+                break
+            if len(block) < remaining and not block.endswith(b'\n'):
+                block += file.readline()  # 补全最后一行，不会超过 end
+            remaining -= len(block)
+            text = block.decode('utf-8', 'ignore')
+            if '\r' in text:
+                lines = io.StringIO(text, newline=None)  # 与文本模式相同，\r 和 \r\n 也是换行
+            else:
+                lines = text.split('\n')
+                if not lines[-1]:
+                    lines.pop()
+            for line_num, line in enumerate(lines, line_num + 1):
+                yield line_num, line.strip()
+
+
+class ChunkEvents(list):
+    """并行分析时代替状态机收集一块日志中的事件 [(关键字名, 时间戳), ...]，由主进程按顺序输入状态机"""
+
+    def feed(self, names, timestamp):
+        if timestamp:
+            self.append((names, timestamp))
+
+
+def scan_log_chunk(file_path, start, end, keywords, today):
+    """并行分析的工作进程：扫描日志的一块，返回 (行数, 关键字统计, 事件列表)
+
+    关键字统计的行号为块内行号，只保留本块每个关键字的前10次匹配。
+    """
+    stats = KeywordStats(keywords)
+    events = ChunkEvents()
+    line_count = scan_lines(iter_chunk_lines(file_path, start, end), keywords, events, stats, today)
+    return line_count, stats, list(events)
+
+
+def add_average_durations(statistics):
+    """按各项耗时列表计算平均值（没有数据的项不设置）"""
+    if statistics['session_durations']:
+        statistics['avg_session_duration'] = sum(statistics['session_durations']) / len(
+            statistics['session_durations'])
+
+    if statistics['flush_durations']:
+        statistics['avg_flush_duration'] = sum(statistics['flush_durations']) / len(statistics['flush_durations'])
+
+    if statistics['color_change_durations']:
+        statistics['avg_color_change_duration'] = sum(statistics['color_change_durations']) / len(
+            statistics['color_change_durations'])
+
+
+def summary_items(statistics):
+    """统计汇总表的各项 [(统计项目, 数值), ...]"""
+    return [
+        ('总会话数', statistics['total_sessions']),
+        ('有开始时间的会话', statistics['sessions_with_start']),
+        ('有结束时间的会话', statistics['sessions_with_end']),
+        ('总换色次数', statistics['total_color_changes']),
+        ('完成换色次数', statistics['completed_color_changes']),
+        ('总打印耗时(秒)', round(statistics['total_print_duration'], 2)),
+        ('平均每次打印耗时(秒)', round(statistics.get('avg_session_duration', 0), 2)),
+        ('平均每次换色耗时(秒)', round(statistics.get('avg_color_change_duration', 0), 2)),
+        ('平均冲刷耗时(秒)', round(statistics.get('avg_flush_duration', 0), 2))
+    ]
+
+
 class PrintProcessAnalyzer:
-    def __init__(self):
-        self.root = tk.Tk()
-        self.root.withdraw()
-        self.keywords = {
-            'start_print': 'Starting SD card print',
-            'end_print': 'Finished SD card print',
-            'cut_start': 'cmd_CR_BOX_CUT return None',
-            'flush_start': 'slow_kiss_to_pipe',
-            'flush_end': 'sh: restore speed factor:'
-        }
+    def __init__(self, extra_keywords=None):
+        """extra_keywords: 额外统计的关键字 {关键字名: 日志中的文字}，如断料、堵头的提示，
+        与打印流程的关键字在同一次扫描中匹配，出现次数和前10次匹配的行显示在关键字匹配统计中"""
+        self.root = None  # 用到对话框时才创建 Tk 根窗口，只分析日志时不需要图形界面
+        self.keywords = dict(PRINT_KEYWORDS)
+        if extra_keywords:
+            self.keywords.update(extra_keywords)
+
+    def ensure_root(self):
+        """创建隐藏的 Tk 根窗口（对话框和消息框使用）"""
+        if self.root is None:
+            self.root = tk.Tk()
+            self.root.withdraw()
+        return self.root
 
     def select_file(self):
         """弹出文件选择对话框"""
+        self.ensure_root()
         file_path = filedialog.askopenfilename(
             title="选择3D打印日志文件",
             filetypes=[("文本文件", "*.txt"), ("日志文件", "*.log"), ("所有文件", "*.*")]
@@ -29,6 +496,7 @@ class PrintProcessAnalyzer:
 
     def select_output_path(self):
         """选择输出Excel文件路径"""
+        self.ensure_root()
         output_path = filedialog.asksaveasfilename(
             title="保存分析结果",
             defaultextension=".xlsx",
@@ -37,205 +505,71 @@ class PrintProcessAnalyzer:
         return output_path
 
     def parse_timestamp(self, line):
-        """从日志行中解析时间戳"""
-        timestamp_patterns = [
-            r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+)',
-            r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})',
-            r'(\d{2}:\d{2}:\d{2}\.\d+)',
-            r'(\d{2}:\d{2}:\d{2})',
-            r'(\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})',
-            r'(\d{2}-\d{2}-\d{4} \d{2}:\d{2}:\d{2})',
-        ]
-
-        for pattern in timestamp_patterns:
-            match = re.search(pattern, line)
-            if match:
-                timestamp_str = match.group(1)
-                try:
-                    if len(timestamp_str) > 8 and ('-' in timestamp_str or '/' in timestamp_str):
-                        if '-' in timestamp_str and timestamp_str.count('-') == 2:
-                            if '.' in timestamp_str:
-                                return datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S.%f')
-                            else:
-                                return datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                        elif '-' in timestamp_str and timestamp_str.count('-') == 1:
-                            return datetime.strptime(timestamp_str, '%m-%d-%Y %H:%M:%S')
-                        elif '/' in timestamp_str:
-                            return datetime.strptime(timestamp_str, '%m/%d/%Y %H:%M:%S')
-                    else:
-                        today = datetime.now().strftime('%Y-%m-%d')
-                        full_timestamp = f"{today} {timestamp_str}"
-                        if '.' in timestamp_str:
-                            return datetime.strptime(full_timestamp, '%Y-%m-%d %H:%M:%S.%f')
-                        else:
-                            return datetime.strptime(full_timestamp, '%Y-%m-%d %H:%M:%S')
-                except ValueError as e:
-                    continue
-        return None
+        """从日志行中解析时间戳（逐个尝试所有格式；分析整个文件时使用 TimestampDecoder）"""
+        return find_timestamp(line)[0]
+
+    def iter_log_lines(self, file_path):
+        """逐行读取日志（生成器），产出 (行号, 去掉首尾空白的行)，不把整个文件读入内存"""
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+            for line_num, line in enumerate(file, 1):
+                yield line_num, line.strip()
+
+    def scan_log(self, file_path, state=None, stats=None, workers=1):
+        """读一遍日志，把含关键字的行同时交给状态机 state 和调试统计 stats（都可以为 None）
+
+        workers 大于1时并行扫描（见 scan_log_parallel），结果与逐行扫描相同。
+        """
+        if workers > 1:
+            chunks = split_log(file_path, max(workers, -(-os.path.getsize(file_path) // PARALLEL_CHUNK_SIZE)))
+            if len(chunks) > 1:
+                self.scan_log_parallel(file_path, chunks, state, stats, workers)
+                return
+        scan_lines(self.iter_log_lines(file_path), self.keywords, state, stats)
+
+    def scan_log_parallel(self, file_path, chunks, state, stats, workers):
+        """并行扫描：各块日志在进程池中读取、匹配关键字、解析时间戳，得到关键字统计和事件；
+        主进程按块的顺序合并统计（行号加上前面各块的行数），并把事件依次输入状态机，
+        跨块的会话和换色流程与逐行扫描的结果完全相同"""
+        today = date.today()  # 只有时间的时间戳各块使用同一个日期
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            futures = [executor.submit(scan_log_chunk, file_path, start, end, self.keywords, today)
+                       for start, end in chunks]
+            line_offset = 0
+            for future in futures:
+                line_count, chunk_stats, events = future.result()
+                if stats is not None:
+                    stats.merge(chunk_stats, line_offset)
+                if state is not None:
+                    for names, timestamp in events:
+                        state.feed(names, timestamp)
+                line_offset += line_count
 
     def debug_exact_matches(self, file_path):
         """精确调试：显示包含关键字的实际行内容"""
-        print(f"\n=== 文件 {os.path.basename(file_path)} 的精确调试 ===")
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                lines = file.readlines()
-
-            keyword_counts = {key: 0 for key in self.keywords}
-
-            for i, line in enumerate(lines):
-                line = line.strip()
-                for key, keyword in self.keywords.items():
-                    if keyword in line:
-                        keyword_counts[key] += 1
-                        timestamp = self.parse_timestamp(line)
-                        timestamp_info = f"时间戳: {timestamp}" if timestamp else "无时间戳"
-                        if keyword_counts[key] <= 10:  # 只显示前10次匹配
-                            print(f"行{i + 1} - {key}: {timestamp_info}")
-                            print(f"    内容: {line}")
-                            print()
-                        break
-
-            print(f"关键字匹配统计:")
-            for key, count in keyword_counts.items():
-                print(f"  {key}: {count} 次")
-            print(f"=== 文件 {os.path.basename(file_path)} 调试结束 ===\n")
-
+            stats = KeywordStats(self.keywords)
+            self.scan_log(file_path, stats=stats)
+            stats.report(os.path.basename(file_path))
         except Exception as e:
             print(f"调试时出错: {e}")
 
-    def analyze_print_process(self, file_path):
-        """分析3D打印换色流程 - 无论是否找到开始结束都统计所有数据"""
-        print("开始分析3D打印日志...")
-
-        # 先进行精确调试
-        self.debug_exact_matches(file_path)
+    def analyze_print_process(self, file_path, workers=1):
+        """分析3D打印换色流程 - 无论是否找到开始结束都统计所有数据
 
-        # 创建一个默认的会话用于存放所有数据
-        all_color_changes = []
-        print_sessions = []
-        current_session = None
-        current_color_change = None
-        session_count = 0
+        只读一遍日志：状态机和精确调试的关键字统计在同一遍中完成，内存占用与日志大小无关
+        （只保存识别出的会话、换色流程和每个关键字的前10次匹配）。
+        workers 大于1时按块并行扫描，结果与逐行扫描相同。
+        """
+        print("开始分析3D打印日志...")
 
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                lines = file.readlines()
-
-            for line_num, line in enumerate(lines, 1):
-                line = line.strip()
-
-                # 检查开始打印 - 如果有开始打印，创建新会话
-                if self.keywords['start_print'] in line:
-                    timestamp = self.parse_timestamp(line)
-                    if timestamp:
-                        # 保存当前会话（如果有）
-                        if current_session:
-                            print_sessions.append(current_session)
-
-                        session_count += 1
-                        current_session = {
-                            'session_id': session_count,
-                            'start_time': timestamp,
-                            'end_time': None,
-                            'color_changes': [],
-                            'incomplete': True,
-                            'has_start': True,
-                            'has_end': False
-                        }
-                        current_color_change = None
-                        print(f"✅ 创建会话 {current_session['session_id']}，开始时间: {timestamp}")
-
-                # 检查打印结束
-                elif current_session and self.keywords['end_print'] in line:
-                    timestamp = self.parse_timestamp(line)
-                    if timestamp:
-                        current_session['end_time'] = timestamp
-                        current_session['incomplete'] = False
-                        current_session['has_end'] = True
-                        print(f"✅ 会话 {current_session['session_id']} 完成，结束时间: {timestamp}")
-
-                # 检查切料开始 - 无论是否有会话都记录
-                if self.keywords['cut_start'] in line:
-                    timestamp = self.parse_timestamp(line)
-                    if timestamp:
-                        # 如果没有当前会话，创建一个默认会话
-                        if not current_session:
-                            session_count += 1
-                            current_session = {
-                                'session_id': session_count,
-                                'start_time': None,  # 没有开始时间
-                                'end_time': None,
-                                'color_changes': [],
-                                'incomplete': True,
-                                'has_start': False,
-                                'has_end': False
-                            }
-                            print(f"📝 创建默认会话 {current_session['session_id']} 用于存放换色数据")
-
-                        # 如果已经有未完成的换色流程，先完成它
-                        if current_color_change:
-                            print(f"找到新的切料开始，保存当前换色流程 {current_color_change['change_id']}")
-                            current_session['color_changes'].append(current_color_change)
-                            all_color_changes.append(current_color_change)
-
-                        current_color_change = {
-                            'change_id': len(current_session['color_changes']) + 1,
-                            'cut_start_time': timestamp,
-                            'flush_start_time': None,
-                            'flush_end_time': None,
-                            'complete': False,
-                            'session_id': current_session['session_id']
-                        }
-                        print(f"✅ 记录换色流程 {current_color_change['change_id']}，切料开始: {timestamp}")
-
-                # 检查冲刷开始
-                elif current_color_change and self.keywords['flush_start'] in line:
-                    timestamp = self.parse_timestamp(line)
-                    if timestamp:
-                        current_color_change['flush_start_time'] = timestamp
-                        print(f"✅ 换色 {current_color_change['change_id']} 冲刷开始: {timestamp}")
-
-                # 检查冲刷结束
-                elif current_color_change and self.keywords['flush_end'] in line:
-                    timestamp = self.parse_timestamp(line)
-                    if timestamp:
-                        current_color_change['flush_end_time'] = timestamp
-                        current_color_change['complete'] = True
-                        # 完成当前换色流程
-                        current_session['color_changes'].append(current_color_change)
-                        all_color_changes.append(current_color_change)
-
-                        if current_color_change['cut_start_time']:
-                            total_duration = (timestamp - current_color_change['cut_start_time']).total_seconds()
-                            print(f"✅ 换色 {current_color_change['change_id']} 完成，总耗时: {total_duration:.2f}秒")
-                        else:
-                            print(f"✅ 换色 {current_color_change['change_id']} 完成，冲刷结束: {timestamp}")
-                        current_color_change = None
-
-            # 文件处理完毕，保存当前会话和最后一个换色流程
-            if current_color_change:
-                if current_session:
-                    current_session['color_changes'].append(current_color_change)
-                all_color_changes.append(current_color_change)
-
-            if current_session:
-                print_sessions.append(current_session)
-
-            # 如果没有找到任何会话但找到了换色数据，创建一个汇总会话
-            if not print_sessions and all_color_changes:
-                session_count += 1
-                summary_session = {
-                    'session_id': session_count,
-                    'start_time': None,
-                    'end_time': None,
-                    'color_changes': all_color_changes,
-                    'incomplete': True,
-                    'has_start': False,
-                    'has_end': False,
-                    'is_summary': True
-                }
-                print_sessions.append(summary_session)
-                print(f"📊 创建汇总会话 {session_count} 包含所有换色数据")
+            state = PrintProcessState()
+            stats = KeywordStats(self.keywords)
+            self.scan_log(file_path, state=state, stats=stats, workers=workers)
+            stats.report(os.path.basename(file_path))
+
+            print_sessions = state.finish()
+            all_color_changes = state.all_color_changes
 
             print(f"\n📊 分析完成，统计结果:")
             print(f"• 找到会话数: {len(print_sessions)}")
@@ -314,17 +648,7 @@ class PrintProcessAnalyzer:
                 statistics['color_change_durations'].append(color_change_duration)
 
         # 计算平均值
-        if statistics['session_durations']:
-            statistics['avg_session_duration'] = sum(statistics['session_durations']) / len(
-                statistics['session_durations'])
-
-        if statistics['flush_durations']:
-            statistics['avg_flush_duration'] = sum(statistics['flush_durations']) / len(statistics['flush_durations'])
-
-        if statistics['color_change_durations']:
-            statistics['avg_color_change_duration'] = sum(statistics['color_change_durations']) / len(
-                statistics['color_change_durations'])
-
+        add_average_durations(statistics)
         return statistics
 
     def generate_excel_report(self, print_sessions, statistics, output_path):
@@ -393,18 +717,7 @@ class PrintProcessAnalyzer:
                 # 2. 统计汇总表
                 summary_data = []
                 if statistics:
-                    summary_data = [
-                        ['统计项目', '数值'],
-                        ['总会话数', statistics['total_sessions']],
-                        ['有开始时间的会话', statistics['sessions_with_start']],
-                        ['有结束时间的会话', statistics['sessions_with_end']],
-                        ['总换色次数', statistics['total_color_changes']],
-                        ['完成换色次数', statistics['completed_color_changes']],
-                        ['总打印耗时(秒)', round(statistics['total_print_duration'], 2)],
-                        ['平均每次打印耗时(秒)', round(statistics.get('avg_session_duration', 0), 2)],
-                        ['平均每次换色耗时(秒)', round(statistics.get('avg_color_change_duration', 0), 2)],
-                        ['平均冲刷耗时(秒)', round(statistics.get('avg_flush_duration', 0), 2)]
-                    ]
+                    summary_data = [['统计项目', '数值']] + [list(item) for item in summary_items(statistics)]
 
                 df_summary = pd.DataFrame(summary_data)
                 df_summary.to_excel(writer, sheet_name='统计汇总', index=False, header=False)
@@ -420,6 +733,7 @@ class PrintProcessAnalyzer:
 
     def run(self):
         """运行分析程序"""
+        self.ensure_root()
         try:
             # 选择日志文件
             file_path = self.select_file()
@@ -473,6 +787,289 @@ class PrintProcessAnalyzer:
             traceback.print_exc()
 
 
-if __name__ == "__main__":
+# ---------------- 批量分析（命令行） ----------------
+
+# 批量分析时在目录中查找的日志文件后缀
+LOG_SUFFIXES = ('.log', '.txt')
+
+# 按文件合并的统计项（相加）和耗时列表（拼接）
+STATISTIC_COUNT_FIELDS = ('total_sessions', 'sessions_with_start', 'sessions_with_end',
+                          'total_color_changes', 'completed_color_changes', 'total_print_duration')
+STATISTIC_DURATION_FIELDS = ('session_durations', 'flush_durations', 'color_change_durations')
+
+INDEX_VERSION = 1
+
+
+def merge_statistics(statistics_list):
+    """合并多个 calculate_statistics 的结果：计数和总耗时相加，耗时列表拼接后重新计算平均值"""
+    merged = {field: 0 for field in STATISTIC_COUNT_FIELDS}
+    merged.update((field, []) for field in STATISTIC_DURATION_FIELDS)
+    for statistics in statistics_list:
+        if not statistics:
+            continue
+        for field in STATISTIC_COUNT_FIELDS:
+            merged[field] += statistics[field]
+        for field in STATISTIC_DURATION_FIELDS:
+            merged[field].extend(statistics[field])
+    add_average_durations(merged)
+    return merged
+
+
+def find_log_files(paths, suffixes=LOG_SUFFIXES):
+    """展开命令行中的文件、目录（递归查找 suffixes 后缀的文件）和通配符，返回 [(日志路径, 根目录), ...]
+
+    根目录用于确定打印机名：目录参数为该目录，通配符为其中不含通配符的部分，文件为其所在目录。
+    同一个文件只出现一次。
+    """
+    found = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(suffixes):
+                        found.setdefault(os.path.abspath(os.path.join(directory, name)), path)
+        elif os.path.isfile(path):
+            found.setdefault(os.path.abspath(path), os.path.dirname(path))
+        else:
+            parts = path.replace('\\', '/').split('/')
+            root = '/'.join(itertools.takewhile(lambda part: not glob.has_magic(part), parts[:-1])) or '.'
+            for match in sorted(glob.glob(path, recursive=True)):
+                if os.path.isfile(match):
+                    found.setdefault(os.path.abspath(match), root)
+    return sorted(found.items())
+
+
+def printer_name(file_path, root, pattern=None):
+    """日志所属的打印机：pattern（正则，取 printer 命名组或第一组）匹配相对路径的结果；
+    未指定 pattern 时为根目录下的第一级目录名，日志直接在根目录下时为文件名（不含后缀）"""
+    relative = os.path.relpath(file_path, os.path.abspath(root)).replace(os.sep, '/')
+    if pattern is not None:
+        match = pattern.search(relative)
+        if match:
+            if 'printer' in match.re.groupindex:
+                return match.group('printer')
+            return match.group(1) if match.re.groups else match.group(0)
+    parts = relative.split('/')
+    return parts[0] if len(parts) > 1 else os.path.splitext(parts[0])[0]
+
+
+def file_digest(file_path):
+    """日志内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def analyze_log_file(file_path, keywords, today):
+    """批量分析的工作进程：不输出过程，返回 (calculate_statistics 的结果, 关键字匹配次数)"""
     analyzer = PrintProcessAnalyzer()
-    analyzer.run()
\ No newline at end of file
+    analyzer.keywords = keywords
+    state = PrintProcessState(verbose=False)
+    stats = KeywordStats(keywords)
+    scan_lines(analyzer.iter_log_lines(file_path), keywords, state, stats, today)
+    return analyzer.calculate_statistics(state.finish()), stats.counts
+
+
+class LogIndex:
+    """已分析日志的索引：内容哈希 -> 分析结果，保存为 JSON 文件（写入临时文件后原子替换）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self.entries = data['entries']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            print(f"已分析日志的索引无效，将重新建立: {path}: {e}")
+
+    def get(self, digest, keywords):
+        """关键字相同时才沿用之前的结果"""
+        entry = self.entries.get(digest)
+        return entry if entry is not None and entry.get('keywords') == keywords else None
+
+    def put(self, digest, keywords, file_path, statistics, keyword_counts):
+        self.entries[digest] = {
+            'file': file_path,
+            'keywords': keywords,
+            'statistics': statistics,
+            'keyword_counts': keyword_counts,
+            'analyzed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'entries': self.entries}, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+class LogBatch:
+    """多个打印机日志的批量分析
+
+    先在进程池中计算各日志的内容哈希：索引中已有（且关键字相同）的日志沿用之前的结果，
+    本次重复的内容只统计一次；其余日志在进程池中并发分析。读取或分析失败的日志记入报告但不参与汇总。
+    结果按打印机和全部打印机合并 calculate_statistics 的统计，写入一份汇总报告。
+    force 为 True 时不沿用索引中的结果，全部重新分析（索引中其他日志的结果仍然保留）。
+    """
+
+    def __init__(self, keywords, index, workers=None, printer_pattern=None, force=False):
+        self.keywords = dict(keywords)
+        self.index = index
+        self.force = force
+        self.workers = workers or os.cpu_count() or 1
+        self.printer_pattern = printer_pattern
+        self.files = []  # [{'file', 'printer', 'digest', 'status', 'statistics', 'keyword_counts'}, ...]
+
+    def run(self, log_files):
+        """log_files 为 find_log_files 的结果"""
+        today = date.today()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            digests = [executor.submit(file_digest, file_path) for file_path, _ in log_files]
+
+            seen = set()
+            pending = {}
+            for (file_path, root), digest_future in zip(log_files, digests):
+                record = {'file': file_path, 'printer': printer_name(file_path, root, self.printer_pattern),
+                          'digest': None, 'statistics': None, 'keyword_counts': {}}
+                self.files.append(record)
+                # 单个日志读取失败（没有权限、拉取过程中被轮转删除等）只记录该日志，其他日志照常分析
+                try:
+                    digest = record['digest'] = digest_future.result()
+                except Exception as e:
+                    record['status'] = f'读取失败: {e}'
+                    print(f"{file_path} 读取失败: {e}")
+                    continue
+                entry = None if self.force else self.index.get(digest, self.keywords)
+                if digest in seen:
+                    record['status'] = '内容重复'
+                elif entry is not None:
+                    record.update(status='已分析过', statistics=entry['statistics'],
+                                  keyword_counts=entry['keyword_counts'])
+                else:
+                    record['status'] = '新分析'
+                    pending[executor.submit(analyze_log_file, file_path, self.keywords, today)] = record
+                seen.add(digest)
+
+            print(f"共 {len(self.files)} 个日志，需要分析 {len(pending)} 个，使用 {self.workers} 个进程")
+            for done, future in enumerate(as_completed(pending), 1):
+                record = pending[future]
+                try:
+                    record['statistics'], record['keyword_counts'] = future.result()
+                except Exception as e:
+                    record['status'] = f'分析失败: {e}'
+                    print(f"[{done}/{len(pending)}] {record['file']} 分析失败: {e}")
+                    continue
+                self.index.put(record['digest'], self.keywords, record['file'],
+                               record['statistics'], record['keyword_counts'])
+                sessions = record['statistics']['total_sessions'] if record['statistics'] else 0
+                print(f"[{done}/{len(pending)}] {record['printer']}: {os.path.basename(record['file'])}，"
+                      f"{sessions} 个会话")
+        self.index.save()
+        return self
+
+    def counted_files(self):
+        """参与汇总的日志（重复内容、读取失败和分析失败的不计入）"""
+        return [record for record in self.files if record['status'] in ('新分析', '已分析过')]
+
+    def printer_statistics(self):
+        """{打印机: (合并的统计, 日志数, 关键字匹配次数)}，按打印机名排序"""
+        grouped = defaultdict(list)
+        for record in self.counted_files():
+            grouped[record['printer']].append(record)
+        return {printer: (merge_statistics([record['statistics'] for record in records]), len(records),
+                          self.sum_keyword_counts(records))
+                for printer, records in sorted(grouped.items())}
+
+    def fleet_statistics(self):
+        return merge_statistics([record['statistics'] for record in self.counted_files()])
+
+    def sum_keyword_counts(self, records):
+        counts = dict.fromkeys(self.keywords, 0)
+        for record in records:
+            for key, count in record['keyword_counts'].items():
+                if key in counts:
+                    counts[key] += count
+        return counts
+
+    def write_report(self, output_path):
+        """写出汇总报告：全部打印机、各打印机、各日志文件三个表"""
+        printers = self.printer_statistics()
+        fleet = self.fleet_statistics()
+        counted = self.counted_files()
+
+        fleet_rows = [['统计项目', '数值'], ['打印机数', len(printers)], ['日志文件数', len(counted)]]
+        fleet_rows += [list(item) for item in summary_items(fleet)]
+        fleet_rows += [[f'关键字 {key}', count] for key, count in self.sum_keyword_counts(counted).items()]
+
+        printer_rows = []
+        for printer, (statistics, file_count, keyword_counts) in printers.items():
+            row = {'打印机': printer, '日志文件数': file_count}
+            row.update(summary_items(statistics))
+            row.update((f'关键字 {key}', count) for key, count in keyword_counts.items())
+            printer_rows.append(row)
+
+        file_rows = []
+        for record in self.files:
+            row = {'打印机': record['printer'], '日志文件': record['file'], '状态': record['status'],
+                   'SHA-256': record['digest']}
+            if record['statistics']:
+                row.update(summary_items(record['statistics']))
+            file_rows.append(row)
+
+        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+            pd.DataFrame(fleet_rows).to_excel(writer, sheet_name='全部打印机', index=False, header=False)
+            pd.DataFrame(printer_rows).to_excel(writer, sheet_name='各打印机', index=False)
+            pd.DataFrame(file_rows).to_excel(writer, sheet_name='日志文件', index=False)
+        print(f"汇总报告已生成: {output_path}")
+
+
+def parse_keyword_option(value):
+    """--keyword 名称=文字"""
+    name, sep, text = value.partition('=')
+    if not sep or not name or not text:
+        raise argparse.ArgumentTypeError(f"关键字格式应为 名称=文字: {value}")
+    return name, text
+
+
+def main(argv=None):
+    """命令行入口：不指定日志时打开图形界面，否则批量分析并写出汇总报告"""
+    parser = argparse.ArgumentParser(description='3D打印日志换色流程分析')
+    parser.add_argument('paths', nargs='*',
+                        help='日志文件、目录（递归查找 .log/.txt）或通配符（如 "logs/*/*.log"）；不指定时打开图形界面')
+    parser.add_argument('-o', '--output', default='print_log_report.xlsx', help='汇总报告路径')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='并发分析的进程数')
+    parser.add_argument('--index', help='已分析日志的索引文件（默认为报告所在目录的 analyzed_logs.json）')
+    parser.add_argument('--force', action='store_true', help='不沿用索引中的结果，重新分析全部日志')
+    parser.add_argument('--printer-pattern', type=re.compile,
+                        help='从日志的相对路径中取打印机名的正则（printer 命名组或第一组），默认为第一级目录名')
+    parser.add_argument('--keyword', type=parse_keyword_option, action='append', default=[], metavar='名称=文字',
+                        help='额外统计的关键字，可重复指定')
+    args = parser.parse_args(argv)
+
+    if not args.paths:
+        PrintProcessAnalyzer().run()
+        return None
+
+    log_files = find_log_files(args.paths)
+    if not log_files:
+        print("没有找到日志文件")
+        return None
+
+    keywords = dict(PRINT_KEYWORDS, **dict(args.keyword))
+    index_path = args.index or os.path.join(os.path.dirname(os.path.abspath(args.output)), 'analyzed_logs.json')
+    batch = LogBatch(keywords, LogIndex(index_path), workers=args.jobs, printer_pattern=args.printer_pattern,
+                     force=args.force).run(log_files)
+    batch.write_report(args.output)
+    return batch
+
+
+if __name__ == "__main__":
+    main()
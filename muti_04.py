@@ -9,6 +9,64 @@ import os
 import logging
 from difflib import SequenceMatcher
 
+try:
+    from rapidfuzz import fuzz as rapid_fuzz  # 可选依赖，启用后键名相似度改用编译实现
+except ImportError:
+    rapid_fuzz = None
+
+# 键名相似度引擎（环境变量 SIMILARITY_ENGINE，与 Muti_Web 相同）：
+# difflib（默认）/ rapidfuzz / auto（已安装 rapidfuzz 时使用）。rapidfuzz 的分数个别情况下略高，需显式启用
+SIMILARITY_ENGINE = os.environ.get('SIMILARITY_ENGINE', 'difflib').lower()
+if SIMILARITY_ENGINE not in ('difflib', 'rapidfuzz', 'auto'):
+    raise ValueError(f"未知的相似度引擎: {SIMILARITY_ENGINE}")
+if SIMILARITY_ENGINE == 'rapidfuzz' and rapid_fuzz is None:
+    raise ValueError("未安装 rapidfuzz，无法使用 rapidfuzz 相似度引擎")
+use_rapid_fuzz = SIMILARITY_ENGINE != 'difflib' and rapid_fuzz is not None
+
+
+# 逐行循环中的日志详细程度（环境变量 LANGUAGE_TOOL_LOG_VERBOSITY）：
+# off 不输出；summary 只在结束时输出各类事件的次数（默认）；sample 另外抽样输出明细；all 输出全部明细
+LOG_VERBOSITY = os.environ.get('LANGUAGE_TOOL_LOG_VERBOSITY', 'summary')
+
+
+class SampledLog:
+    """逐行循环用的日志：按类别计数，明细只抽样输出（每类前 first 条，之后每 every 条一条）"""
+
+    __slots__ = ('logger', 'title', 'first', 'every', 'counts', 'verbose', 'show_all')
+
+    def __init__(self, logger, title, verbosity=None, first=3, every=500):
+        verbosity = verbosity or LOG_VERBOSITY
+        self.logger = logger
+        self.title = title if verbosity != 'off' else None
+        self.first = first
+        self.every = every
+        self.counts = {}
+        # 只在创建时判断一次是否需要明细，明细按 DEBUG 级别输出
+        self.verbose = verbosity in ('sample', 'all') and logger.isEnabledFor(logging.DEBUG)
+        self.show_all = verbosity == 'all'
+
+    def event(self, kind, msg=None, *args):
+        n = self.counts[kind] = self.counts.get(kind, 0) + 1
+        if self.verbose and msg and (self.show_all or n <= self.first or n % self.every == 0):
+            self.logger.debug(msg, *args)
+
+    def once(self, kind, level, msg, *args):
+        """同一类别只输出第一次（如逐键重复出现的"未找到语言列"警告），之后只计数"""
+        n = self.counts[kind] = self.counts.get(kind, 0) + 1
+        if n == 1:
+            self.logger.log(level, msg, *args)
+
+    def summary(self):
+        if self.title and self.counts:
+            self.logger.info("%s: %s", self.title, ', '.join(f"{kind}={n}" for kind, n in self.counts.items()))
+
+
+def key_similarity_ratios(query, choices):
+    """计算 query 与每个候选的相似度（0~1），引擎由 SIMILARITY_ENGINE 选择；difflib 为逐对计算"""
+    if use_rapid_fuzz:
+        return [rapid_fuzz.ratio(query, choice) / 100.0 for choice in choices]
+    return [SequenceMatcher(None, query, choice).ratio() for choice in choices]
+
 
 class CompleteDualDisplayTool:
     def __init__(self, root):
@@ -20,6 +78,7 @@ class CompleteDualDisplayTool:
 
         # 设置日志
         self.setup_logging()
+        self.match_log = SampledLog(self.logger, "错误码匹配")
         self.setup_ui()
 
     def setup_logging(self):
@@ -931,8 +990,7 @@ class CompleteDualDisplayTool:
         best_score = 0
         all_matches = []  # 存储所有匹配结果
 
-        self.logger.debug(f"为源文件键 '{source_key}' 查找匹配，数字: {source_numeric}")
-
+        candidates = []
         for trans_key in trans_keys:
             # 对比文件只提取带Key前缀的4位数字
             trans_digits_info = self.extract_trans_error_code(trans_key)
@@ -951,31 +1009,35 @@ class CompleteDualDisplayTool:
             )
 
             if match_found:
-                # 计算键名相似度
-                score = SequenceMatcher(None, source_key.lower(), trans_key.lower()).ratio()
-
-                # 记录所有匹配结果
-                match_info = {
-                    'trans_key': trans_key,
-                    'score': score,
-                    'source_digits': str(source_numeric),
-                    'trans_digits': f"{trans_numeric}({trans_padded})"
-                }
-                all_matches.append(match_info)
+                candidates.append((trans_key, trans_numeric, trans_padded))
+
+        # 数字匹配的候选一次性批量计算键名相似度
+        scores = key_similarity_ratios(source_key.lower(), [trans_key.lower() for trans_key, _, _ in candidates])
+
+        for (trans_key, trans_numeric, trans_padded), score in zip(candidates, scores):
+            # 记录所有匹配结果
+            match_info = {
+                'trans_key': trans_key,
+                'score': score,
+                'source_digits': str(source_numeric),
+                'trans_digits': f"{trans_numeric}({trans_padded})"
+            }
+            all_matches.append(match_info)
 
-                self.logger.debug(
-                    f"候选匹配: {source_key} -> {trans_key} (数字: {source_numeric} == {trans_numeric}({trans_padded}), 相似度: {score:.2f})")
+            self.match_log.event("候选", "候选匹配: %s -> %s (数字: %s == %s(%s), 相似度: %.2f)",
+                                 source_key, trans_key, source_numeric, trans_numeric, trans_padded, score)
 
-                if score > best_score:
-                    best_score = score
-                    best_match = trans_key
+            if score > best_score:
+                best_score = score
+                best_match = trans_key
 
         if all_matches:
-            self.logger.info(f"找到 {len(all_matches)} 个匹配: {source_key} -> {[m['trans_key'] for m in all_matches]}")
+            self.match_log.event("找到匹配", "找到 %d 个匹配: %s -> %s",
+                                 len(all_matches), source_key, [m['trans_key'] for m in all_matches])
             # 返回最佳匹配和所有匹配结果
             return best_match, all_matches
         else:
-            self.logger.debug(f"未找到匹配: {source_key}")
+            self.match_log.event("未找到匹配", "未找到匹配: %s", source_key)
             return None, []
 
     def error_code_check(self):
@@ -1204,6 +1266,10 @@ class CompleteDualDisplayTool:
             total_comparisons = 0
             total_source_keys = len(source_key_map)
 
+            # 逐键、逐语言的日志只计数和抽样，结束时各输出一行汇总
+            self.match_log = SampledLog(self.logger, "错误码匹配")
+            row_log = SampledLog(self.logger, "语言写入分布")
+
             # 将每次语言写入封装为函数，确保每语言占独立一行，避免覆盖
             def write_language_row(row_idx, write_key_info, source_key_val, trans_key_val, source_err_disp,
                                    match_type_val, lang_label, src_text, trans_text):
@@ -1262,7 +1328,6 @@ class CompleteDualDisplayTool:
                     output_ws.cell(row=row_idx, column=7).fill = RED_FILL
 
                 output_ws.cell(row=row_idx, column=8).value = result_text_local
-                self.logger.info(f"已写入第 {row_idx} 行，语言={lang_label}")
                 return row_idx + 1
 
             for i, source_key in enumerate(source_key_map.keys()):
@@ -1282,7 +1347,7 @@ class CompleteDualDisplayTool:
                 # 处理多个匹配结果
                 if all_matches and len(all_matches) > 1:
                     # 有多个匹配结果，需要显示所有匹配
-                    self.logger.info(f"源键 '{source_key}' 找到 {len(all_matches)} 个匹配结果")
+                    self.match_log.event("多个匹配", "源键 '%s' 找到 %d 个匹配结果", source_key, len(all_matches))
 
                     # 为每个匹配结果创建对比行
                     for match_idx, match_info in enumerate(all_matches):
@@ -1299,7 +1364,7 @@ class CompleteDualDisplayTool:
                             trans_col = trans_lang_map.get(lang)
 
                             if not source_col:
-                                self.logger.warning(f"源文件中未找到语言列: {lang}")
+                                row_log.once(f"源文件缺少 {lang}", logging.WARNING, "源文件中未找到语言列: %s", lang)
                                 continue
 
                             # 获取源文件内容
@@ -1323,19 +1388,13 @@ class CompleteDualDisplayTool:
                                     self.logger.error(f"读取翻译文件内容错误: {e}")
                             elif trans_row and not trans_col:
                                 trans_content = "【语言列缺失】"
-                                self.logger.warning(f"对比文件中未找到语言列: {lang}")
+                                row_log.once(f"对比文件缺少 {lang}", logging.WARNING, "对比文件中未找到语言列: %s", lang)
                             else:
                                 trans_content = "【对比文件缺失该键】"
 
-                            # 记录本次语言处理的简要信息，便于定位中文未输出问题
-                            try:
-                                sc_preview = (source_content or "")[0:30]
-                                tc_preview = (trans_content or "")[0:30]
-                                self.logger.info(
-                                    f"语言处理: lang='{lang}', 源列={source_col}, 对比列={trans_col}, 源预览='{sc_preview}', 对比预览='{tc_preview}'"
-                                )
-                            except Exception:
-                                pass
+                            # 记录本次语言处理的简要信息，便于定位中文未输出问题（抽样输出）
+                            row_log.event(lang, "语言处理: lang='%s', 源列=%s, 对比列=%s, 源预览='%.30s', 对比预览='%.30s'",
+                                          lang, source_col, trans_col, source_content, trans_content)
 
                             # 写入一行（独立行）
                             match_display = f"{trans_key} (匹配{match_idx + 1}/{len(all_matches)})"
@@ -1371,7 +1430,7 @@ class CompleteDualDisplayTool:
                         trans_col = trans_lang_map.get(lang)
 
                         if not source_col:
-                            self.logger.warning(f"源文件中未找到语言列: {lang}")
+                            row_log.once(f"源文件缺少 {lang}", logging.WARNING, "源文件中未找到语言列: %s", lang)
                             continue
 
                         # 获取源文件内容
@@ -1395,7 +1454,7 @@ class CompleteDualDisplayTool:
                                 self.logger.error(f"读取翻译文件内容错误: {e}")
                         elif trans_row and not trans_col:
                             trans_content = "【语言列缺失】"
-                            self.logger.warning(f"对比文件中未找到语言列: {lang}")
+                            row_log.once(f"对比文件缺少 {lang}", logging.WARNING, "对比文件中未找到语言列: %s", lang)
                         else:
                             trans_content = "【对比文件缺失该键】"
                             no_matches += 1
@@ -1404,15 +1463,9 @@ class CompleteDualDisplayTool:
                                 # 保留原始格式，不强制分行显示
                                 pass
 
-                        # 记录本次语言处理的简要信息，便于定位中文未输出问题
-                        try:
-                            sc_preview = (source_content or "")[0:30]
-                            tc_preview = (trans_content or "")[0:30]
-                            self.logger.info(
-                                f"语言处理: lang='{lang}', 源列={source_col}, 对比列={trans_col}, 源预览='{sc_preview}', 对比预览='{tc_preview}'"
-                            )
-                        except Exception:
-                            pass
+                        # 记录本次语言处理的简要信息，便于定位中文未输出问题（抽样输出）
+                        row_log.event(lang, "语言处理: lang='%s', 源列=%s, 对比列=%s, 源预览='%.30s', 对比预览='%.30s'",
+                                      lang, source_col, trans_col, source_content, trans_content)
 
                         # 写入一行（独立行），仅在该键的第一行写入键相关信息
                         match_type = "错误码匹配" if trans_key_match else "无匹配"
@@ -1454,17 +1507,9 @@ class CompleteDualDisplayTool:
             for i, text in enumerate(summary_data):
                 output_ws.cell(row=summary_row + 1 + i, column=1).value = text
 
-            # 统计语言写入分布，帮助定位缺失情况
-            try:
-                from collections import Counter
-                lang_counter = Counter()
-                for r in range(2, output_row):
-                    val = output_ws.cell(row=r, column=5).value
-                    if val:
-                        lang_counter[val] += 1
-                self.logger.info(f"语言写入分布: {dict(lang_counter)}")
-            except Exception as e:
-                self.logger.warning(f"统计语言分布时出错: {e}")
+            # 语言写入分布由写入时的计数得到，不再回读输出表的每一行
+            self.match_log.summary()
+            row_log.summary()
 
             self.update_progress(95, "正在保存错误码校对结果...")
             self.logger.info(f"保存错误码校对结果到: {output_file}")
@@ -0,0 +1,376 @@
+"""
+3D打印日志分析（logKeyword_crawling.py）的测试
+
+运行方式：
+    python -m pytest test_logKeyword_crawling.py -v
+"""
+
+import os
+import random
+import re
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import logKeyword_crawling
+from logKeyword_crawling import (INLINE_KEYWORD_LIMIT, PRINT_KEYWORDS, TIMESTAMP_PATTERNS, KeywordMatcher,
+                                 KeywordStats, PrintProcessAnalyzer, PrintProcessState, TimestampDecoder,
+                                 find_timestamp, split_log)
+
+STAGES = ['Starting SD card print', 'cmd_CR_BOX_CUT return None', 'slow_kiss_to_pipe',
+          'sh: restore speed factor: 1.0', 'Finished SD card print']
+
+
+def write_log(path, lines=3000, seed=7):
+    """生成覆盖各种边界情况的日志：CRLF 与单独的 CR 换行、多字节和无效的 UTF-8、无时间戳的关键字行、
+    没有会话的切料、一行多个关键字、额外关键字，文件末尾没有换行"""
+    rng = random.Random(seed)
+    moment = datetime(2024, 3, 1, 8, 0, 0)
+    parts = []
+    for i in range(lines):
+        moment += timedelta(milliseconds=rng.randint(1, 900))
+        stamp = moment.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        roll = rng.random()
+        if roll < 0.08:
+            message = rng.choice(STAGES)
+        elif roll < 0.09:
+            message = 'Starting SD card print; cmd_CR_BOX_CUT return None'
+        elif roll < 0.10:
+            message = 'Filament runout detected'
+        elif roll < 0.11:
+            parts.append(f"no timestamp {rng.choice(STAGES)}\n".encode('utf-8'))
+            continue
+        else:
+            message = f"Stats {i}: 温度={rng.uniform(55, 65):.1f}"
+        ending = rng.choice([b'\n', b'\n', b'\r\n', b'\r'])
+        line = f"[{stamp}] {message}".encode('utf-8')
+        if rng.random() < 0.01:
+            line += b' \xff\xfe broken'
+        parts.append(line + ending)
+    with open(path, 'wb') as f:
+        f.write(b''.join(parts).rstrip(b'\r\n'))
+
+
+# TimestampDecoder 可锁定的格式（TIMESTAMP_PATTERNS 序号 -> strftime 格式）
+DECODER_FORMATS = {0: '%Y-%m-%d %H:%M:%S.%f', 1: '%Y-%m-%d %H:%M:%S', 2: '%H:%M:%S.%f', 3: '%H:%M:%S'}
+NON_ASCII_DIGITS = '٠١٢٣٤٥٦٧٨٩０１２３４５６７８９'
+
+
+def random_timestamp(rng, fmt):
+    """fmt 格式的随机时间戳，小数秒为1~9位"""
+    moment = datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(366 * 86400),
+                                              microseconds=rng.randrange(10 ** 6))
+    text = moment.strftime(DECODER_FORMATS[fmt])
+    if '.' in text:
+        text = text[:-6] + ''.join(rng.choice('0123456789') for _ in range(rng.randint(1, 9)))
+    return text
+
+
+def random_timestamp_line(rng, fmt):
+    """以 fmt 格式为主的随机日志行：掺入非 ASCII 数字、无效数值、其他格式的时间戳、'-' 和没有时间戳的行"""
+    if rng.random() < 0.05:
+        return f"Stats temp={rng.uniform(55, 65):.1f}"
+    text = list(random_timestamp(rng, fmt if rng.random() < 0.8 else rng.randrange(4)))
+    digits = [i for i, char in enumerate(text) if char.isdigit()]
+    roll = rng.random()
+    if roll < 0.1:
+        text[rng.choice(digits)] = rng.choice(NON_ASCII_DIGITS)
+    elif roll < 0.2:
+        text[rng.choice(digits)] = rng.choice('0123456789')  # 可能得到13月、25时之类的无效值
+    prefix = rng.choice(['', '[', 'INFO ', 'a-b ', '01/02/2024 03:04:05 ', '03-04-2024 05:06:07 ',
+                         random_timestamp(rng, rng.randrange(4)) + ' '])
+    suffix = rng.choice(['', '] msg', ' 2024-05-06 07:08:09', ' 12:00:00', ' x-y'])
+    return prefix + ''.join(text) + suffix
+
+
+@pytest.mark.parametrize('fmt', sorted(DECODER_FORMATS))
+def test_timestamp_decoder_matches_find_timestamp(fmt):
+    """锁定格式后的快速解析与逐个格式 strptime 的结果完全一致（含回退到逐个查找的行）"""
+    rng = random.Random(fmt)
+    today = date(2024, 6, 1)
+    decoder = TimestampDecoder(today)
+    lines = [datetime(2024, 3, 1, 8).strftime(DECODER_FORMATS[fmt])]  # 第一行锁定格式
+    lines += [random_timestamp_line(rng, fmt) for _ in range(20000)]
+    mismatches = [(line, decoder.decode(line), find_timestamp(line, today)[0]) for line in lines]
+    mismatches = [item for item in mismatches if item[1] != item[2]]
+    assert mismatches == []
+    assert decoder.pattern is TIMESTAMP_PATTERNS[fmt]
+    assert decoder.fallbacks > 0
+
+
+# 互相包含、首尾重叠、文字相同的关键字（与打印流程的关键字合起来超过 INLINE_KEYWORD_LIMIT 个）
+OVERLAPPING_KEYWORDS = {
+    'sd_card': 'SD card',  # 包含在 start_print / end_print 中
+    'card_print': 'card print',
+    'print': 'print',
+    'ard_pr': 'ard pr',  # 跨 card 和 print
+    'runout': 'Filament runout',
+    'runout_again': 'Filament runout',  # 与 runout 文字相同
+    'run': 'runout',
+    'out_d': 'out d',
+    'aa': 'aa',
+    'aaa': 'aaa',
+    'aba': 'aba',
+    'bab': 'bab',
+    'e1': 'E1',
+    'e12': 'E12',
+    'e123': 'E123',
+    'factor': 'factor: 1',
+}
+
+
+def brute_force_match(keywords, line):
+    """逐个 in 查找：行中包含的关键字名（按 keywords 的顺序）"""
+    return tuple(name for name, text in keywords.items() if text in line)
+
+
+def random_keyword_lines(keywords, count, seed):
+    """由关键字片段和干扰字符拼成的随机行，多数行含重叠或截断的关键字"""
+    rng = random.Random(seed)
+    pieces = list(keywords.values()) + ['a', 'b', 'ab', 'E', '1', '2', '3', ' ', 'd', 'SD ', 'Starting ', 'x']
+    lines = []
+    for _ in range(count):
+        parts = [rng.choice(pieces) for _ in range(rng.randint(0, 6))]
+        if parts and rng.random() < 0.3:
+            parts[0] = parts[0][rng.randrange(len(parts[0])):]  # 截断的关键字
+        lines.append(''.join(parts))
+    return lines
+
+
+@pytest.mark.parametrize('keyword_count', [len(PRINT_KEYWORDS) + 5, len(PRINT_KEYWORDS) + len(OVERLAPPING_KEYWORDS)])
+def test_keyword_matcher_matches_brute_force(keyword_count):
+    """逐个 in 和合并正则两种方式都与逐个 in 查找全部关键字的结果一致，包括互相包含和重叠的关键字"""
+    keywords = dict(list(dict(PRINT_KEYWORDS, **OVERLAPPING_KEYWORDS).items())[:keyword_count])
+    matcher = KeywordMatcher(keywords)
+    assert (matcher.pattern is not None) == (len(set(keywords.values())) > INLINE_KEYWORD_LIMIT)
+
+    lines = random_keyword_lines(keywords, 20000, seed=keyword_count)
+    lines += ['[2024-03-01 08:00:00] Starting SD card print', 'Finished SD card print; E123 Filament runout',
+              'aaaa baba', 'SD card prin', 'sh: restore speed factor: 1.0', '']
+    for line in lines:
+        assert matcher.match(line) == brute_force_match(keywords, line), line
+    assert sum(1 for line in lines if matcher.match(line)) > len(lines) // 2
+
+
+def test_extra_keywords_counted_in_same_scan(tmp_path):
+    """额外关键字与打印流程的关键字在同一次扫描中统计：一行含多个关键字时计入排在前面的一个，
+    会话和换色流程不受额外关键字影响"""
+    path = str(tmp_path / 'printer.log')
+    write_log(path)
+    extra = dict(OVERLAPPING_KEYWORDS, filament_runout='Filament runout')
+    analyzer = PrintProcessAnalyzer(extra_keywords=extra)
+    assert list(analyzer.keywords) == list(PRINT_KEYWORDS) + list(extra)
+
+    state = PrintProcessState(verbose=False)
+    stats = KeywordStats(analyzer.keywords)
+    analyzer.scan_log(path, state=state, stats=stats)
+
+    expected = dict.fromkeys(analyzer.keywords, 0)
+    for _, line in analyzer.iter_log_lines(path):
+        names = brute_force_match(analyzer.keywords, line)
+        if names:
+            expected[names[0]] += 1
+    assert stats.counts == expected
+    assert expected['filament_runout'] == 0 and expected['runout'] > 0  # 文字相同时计入排在前面的
+    assert expected['sd_card'] == 0  # 总是与 start_print / end_print 同时出现
+
+    plain = PrintProcessState(verbose=False)
+    PrintProcessAnalyzer().scan_log(path, state=plain)
+    assert state.finish() == plain.finish()
+
+
+def write_baseline_fixture(path):
+    """逐行分析（readlines 实现）的回归用例：没有会话时的结束和切料、无时间戳的关键字行、一行两个关键字、
+    未完成的换色、未结束的会话、超过前10次抽样的关键字，CRLF 换行和无效的 UTF-8"""
+    seconds = iter(range(0, 10000, 7))
+
+    def line(message):
+        s = next(seconds)
+        return f"[2024-03-01 08:{s // 60:02d}:{s % 60:02d}.{s % 1000:03d}] {message}"
+
+    lines = [line("boot"), line("Finished SD card print"), line("cmd_CR_BOX_CUT return None"),
+             line("slow_kiss_to_pipe"), line("sh: restore speed factor: 1.0"), line("Starting SD card print"),
+             "Starting SD card print without timestamp",
+             line("cmd_CR_BOX_CUT return None"), line("slow_kiss_to_pipe"), line("cmd_CR_BOX_CUT return None"),
+             line("slow_kiss_to_pipe"), line("sh: restore speed factor: 1.0"), line("sh: restore speed factor: 1.0"),
+             line("Finished SD card print; sh: restore speed factor: 0.9"),
+             line("Starting SD card print; cmd_CR_BOX_CUT return None"), line("slow_kiss_to_pipe"),
+             line("Starting SD card print")]
+    for i in range(12):
+        lines += [line("cmd_CR_BOX_CUT return None"), line("slow_kiss_to_pipe")]
+        if i % 3:
+            lines.append(line(f"sh: restore speed factor: 1.{i}"))
+        lines.append(line(f"Stats {i}: temp=60"))
+    lines += [line("Finished SD card print"), line("cmd_CR_BOX_CUT return None"), line("Starting SD card print"),
+              line("slow_kiss_to_pipe")]
+    with open(path, 'wb') as f:
+        f.write(b''.join(text.encode('utf-8') + (b' \xff' if i % 9 == 4 else b'') + (b'\r\n' if i % 4 == 1 else b'\n')
+                         for i, text in enumerate(lines)))
+
+
+# 原有实现（先 debug_exact_matches 再逐行状态机，各自 readlines）在上述日志上的输出
+BASELINE_COUNTS = {'start_print': 5, 'end_print': 3, 'cut_start': 16, 'flush_start': 17, 'flush_end': 11}
+BASELINE_SAMPLES = [
+    (2, 'end_print'), (3, 'cut_start'), (4, 'flush_start'), (5, 'flush_end'), (6, 'start_print'),
+    (7, 'start_print'), (8, 'cut_start'), (9, 'flush_start'), (10, 'cut_start'), (11, 'flush_start'),
+    (12, 'flush_end'), (13, 'flush_end'), (14, 'end_print'), (15, 'start_print'), (16, 'flush_start'),
+    (17, 'start_print'), (18, 'cut_start'), (19, 'flush_start'), (21, 'cut_start'), (22, 'flush_start'),
+    (23, 'flush_end'), (25, 'cut_start'), (26, 'flush_start'), (27, 'flush_end'), (29, 'cut_start'),
+    (30, 'flush_start'), (32, 'cut_start'), (33, 'flush_start'), (34, 'flush_end'), (36, 'cut_start'),
+    (37, 'flush_start'), (38, 'flush_end'), (40, 'cut_start'), (45, 'flush_end'), (49, 'flush_end'),
+    (56, 'flush_end'), (62, 'end_print'), (64, 'start_print'),
+]
+# (会话号, 开始, 结束, [(切料, 冲刷开始, 冲刷结束), ...])
+BASELINE_SESSIONS = [
+    (1, None, None, [('08:00:14.014', '08:00:21.021', '08:00:28.028')]),
+    (2, '08:00:35.035', '08:01:24.084', [('08:00:42.042', '08:00:49.049', None),
+                                         ('08:00:56.056', '08:01:03.063', '08:01:10.070')]),
+    (3, '08:01:31.091', None, []),
+    (4, '08:01:45.105', '08:07:00.420', [
+        ('08:01:52.112', '08:01:59.119', None), ('08:02:13.133', '08:02:20.140', '08:02:27.147'),
+        ('08:02:41.161', '08:02:48.168', '08:02:55.175'), ('08:03:09.189', '08:03:16.196', None),
+        ('08:03:30.210', '08:03:37.217', '08:03:44.224'), ('08:03:58.238', '08:04:05.245', '08:04:12.252'),
+        ('08:04:26.266', '08:04:33.273', None), ('08:04:47.287', '08:04:54.294', '08:05:01.301'),
+        ('08:05:15.315', '08:05:22.322', '08:05:29.329'), ('08:05:43.343', '08:05:50.350', None),
+        ('08:06:04.364', '08:06:11.371', '08:06:18.378'), ('08:06:32.392', '08:06:39.399', '08:06:46.406')]),
+    (5, '08:07:14.434', None, []),
+]
+
+
+def session_outline(sessions):
+    def clock(moment):
+        return moment.strftime('%H:%M:%S.%f')[:-3] if moment else None
+    return [(session['session_id'], clock(session['start_time']), clock(session['end_time']),
+             [(clock(change['cut_start_time']), clock(change['flush_start_time']), clock(change['flush_end_time']))
+              for change in session['color_changes']])
+            for session in sessions]
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_single_pass_matches_baseline_output(tmp_path, capsys, monkeypatch, workers):
+    """一遍扫描（及并行扫描）的结果与原有的两遍 readlines 实现一致：
+    会话划分、关键字计数、前10次抽样和一行多个关键字的归属"""
+    path = str(tmp_path / 'fixture.log')
+    write_baseline_fixture(path)
+    monkeypatch.setattr(logKeyword_crawling, 'PARALLEL_CHUNK_SIZE', 256)
+    analyzer = PrintProcessAnalyzer()
+    sessions = analyzer.analyze_print_process(path, workers=workers)
+    output = capsys.readouterr().out
+
+    assert session_outline(sessions) == BASELINE_SESSIONS
+    samples = re.findall(r'^行(\d+) - (\w+): ', output, re.M)
+    assert [(int(line_num), key) for line_num, key in samples] == BASELINE_SAMPLES
+    assert '行7 - start_print: 无时间戳\n    内容: Starting SD card print without timestamp\n' in output
+    assert '内容: [2024-03-01 08:00:28.028] sh: restore speed factor: 1.0\n' in output  # 去掉无效字节后的空白
+    assert dict(re.findall(r'^  (\w+): (\d+) 次$', output, re.M)) == {
+        key: str(count) for key, count in BASELINE_COUNTS.items()}
+    assert '• 找到会话数: 5\n• 总换色次数: 15\n' in output
+
+    statistics = analyzer.calculate_statistics(sessions)
+    assert (statistics['total_sessions'], statistics['sessions_with_start'], statistics['sessions_with_end'],
+            statistics['total_color_changes'], statistics['completed_color_changes']) == (5, 4, 2, 15, 10)
+    assert statistics['session_durations'] == pytest.approx([49.049, 315.315])
+    assert statistics['avg_flush_duration'] == pytest.approx(7.007)
+    assert statistics['avg_color_change_duration'] == pytest.approx(14.014)
+
+
+def test_split_log_aligns_chunks_on_newlines(tmp_path):
+    path = tmp_path / 'printer.log'
+    write_log(path)
+    data = path.read_bytes()
+    chunks = split_log(str(path), 16)
+    assert len(chunks) > 1
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(data)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start
+        assert data[start - 1:start] == b'\n'
+
+
+def test_parallel_analysis_matches_serial(tmp_path, capsys, monkeypatch):
+    path = str(tmp_path / 'printer.log')
+    write_log(path)
+    analyzer = PrintProcessAnalyzer(extra_keywords={'filament_runout': 'Filament runout'})
+
+    serial = analyzer.analyze_print_process(path)
+    serial_output = capsys.readouterr().out
+
+    # 块很小时会话和换色流程几乎都跨块
+    monkeypatch.setattr(logKeyword_crawling, 'PARALLEL_CHUNK_SIZE', 2048)
+    parallel = analyzer.analyze_print_process(path, workers=3)
+    parallel_output = capsys.readouterr().out
+
+    assert len(serial) > 10
+    assert parallel == serial
+    assert parallel_output == serial_output
+    assert 'filament_runout: ' in serial_output
+    assert analyzer.calculate_statistics(parallel) == analyzer.calculate_statistics(serial)
+
+
+def test_batch_mode_aggregates_printers_and_skips_analyzed_logs(tmp_path, capsys):
+    logs = tmp_path / 'logs'
+    for printer, day, seed in [('printerA', 'day1', 1), ('printerA', 'day2', 2), ('printerB', 'day1', 3)]:
+        (logs / printer).mkdir(parents=True, exist_ok=True)
+        write_log(logs / printer / f'{day}.log', lines=800, seed=seed)
+    # 同一份日志拉取了两次
+    (logs / 'printerB' / 'copy.log').write_bytes((logs / 'printerA' / 'day1.log').read_bytes())
+    output = str(tmp_path / 'report.xlsx')
+
+    batch = logKeyword_crawling.main([str(logs), '-o', output, '-j', '2'])
+    statuses = {os.path.relpath(record['file'], logs): record['status'] for record in batch.files}
+    assert statuses == {os.path.join('printerA', 'day1.log'): '新分析', os.path.join('printerA', 'day2.log'): '新分析',
+                        os.path.join('printerB', 'copy.log'): '内容重复', os.path.join('printerB', 'day1.log'): '新分析'}
+
+    analyzer = PrintProcessAnalyzer()
+    per_file = {}
+    for printer, day in [('printerA', 'day1'), ('printerA', 'day2'), ('printerB', 'day1')]:
+        per_file[printer, day] = analyzer.calculate_statistics(
+            analyzer.analyze_print_process(str(logs / printer / f'{day}.log')))
+    printers = batch.printer_statistics()
+    assert set(printers) == {'printerA', 'printerB'}
+    assert printers['printerA'][1] == 2
+    assert printers['printerA'][0]['total_sessions'] == (per_file['printerA', 'day1']['total_sessions']
+                                                         + per_file['printerA', 'day2']['total_sessions'])
+    fleet = batch.fleet_statistics()
+    assert fleet['total_color_changes'] == sum(s['total_color_changes'] for s in per_file.values())
+    assert fleet['avg_color_change_duration'] == pytest.approx(
+        sum(sum(s['color_change_durations']) for s in per_file.values())
+        / sum(len(s['color_change_durations']) for s in per_file.values()))
+    sheets = pd.read_excel(output, sheet_name=None)
+    assert set(sheets) == {'全部打印机', '各打印机', '日志文件'}
+    assert len(sheets['日志文件']) == 4
+
+    # 再次运行：内容已分析过的日志沿用索引中的结果
+    capsys.readouterr()
+    again = logKeyword_crawling.main([str(logs), '-o', output, '-j', '2'])
+    assert sorted(record['status'] for record in again.files) == ['内容重复', '已分析过', '已分析过', '已分析过']
+    assert '需要分析 0 个' in capsys.readouterr().out
+    assert again.fleet_statistics() == fleet
+
+    # 只重新分析其中一台打印机：--force 不沿用索引，但其他打印机的结果仍保留在索引中
+    forced = logKeyword_crawling.main([str(logs / 'printerA'), '-o', output, '-j', '2', '--force'])
+    assert sorted(record['status'] for record in forced.files) == ['新分析', '新分析']
+    assert '需要分析 2 个' in capsys.readouterr().out
+    index = logKeyword_crawling.LogIndex(str(tmp_path / 'analyzed_logs.json'))
+    assert len(index.entries) == 3
+    again = logKeyword_crawling.main([str(logs), '-o', output, '-j', '2'])
+    assert '需要分析 0 个' in capsys.readouterr().out
+
+
+def test_batch_mode_continues_when_a_log_cannot_be_read(tmp_path, capsys):
+    logs = tmp_path / 'logs'
+    (logs / 'printerA').mkdir(parents=True)
+    write_log(logs / 'printerA' / 'day1.log', lines=800, seed=1)
+    # 列出目录后被轮转删除的日志：计算哈希时打开失败
+    os.symlink(str(tmp_path / 'rotated.log'), str(logs / 'printerA' / 'day2.log'))
+    output = str(tmp_path / 'report.xlsx')
+
+    batch = logKeyword_crawling.main([str(logs), '-o', output, '-j', '2'])
+    statuses = {os.path.basename(record['file']): record['status'] for record in batch.files}
+    assert statuses['day1.log'] == '新分析'
+    assert statuses['day2.log'].startswith('读取失败')
+    assert 'day2.log 读取失败' in capsys.readouterr().out
+    assert [os.path.basename(record['file']) for record in batch.counted_files()] == ['day1.log']
+    assert len(pd.read_excel(output, sheet_name='日志文件')) == 2
+    index = logKeyword_crawling.LogIndex(str(tmp_path / 'analyzed_logs.json'))
+    assert len(index.entries) == 1